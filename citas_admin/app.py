@@ -1,112 +1,131 @@
 """
 Flask App
 """
-from flask import Flask
+from importlib import import_module
+import os
+
+from flask import Flask, current_app
 from redis import Redis
 import rq
 from citas_admin.extensions import csrf, db, login_manager, moment
+from lib.consultas_sql import contar_consultas_sql
 
-from citas_admin.blueprints.autoridades.views import autoridades
-from citas_admin.blueprints.bitacoras.views import bitacoras
-from citas_admin.blueprints.boletines.views import boletines
-from citas_admin.blueprints.cit_categorias.views import cit_categorias
-from citas_admin.blueprints.cit_citas.views import cit_citas
-from citas_admin.blueprints.cit_citas_stats.views import cit_citas_stats
-from citas_admin.blueprints.cit_citas_documentos.views import cit_citas_documentos
-from citas_admin.blueprints.cit_clientes.views import cit_clientes
-from citas_admin.blueprints.cit_clientes_recuperaciones.views import cit_clientes_recuperaciones
-from citas_admin.blueprints.cit_clientes_registros.views import cit_clientes_registros
-from citas_admin.blueprints.cit_dias_inhabiles.views import cit_dias_inhabiles
-from citas_admin.blueprints.cit_horas_bloqueadas.views import cit_horas_bloqueadas
-from citas_admin.blueprints.cit_oficinas_servicios.views import cit_oficinas_servicios
-from citas_admin.blueprints.cit_servicios.views import cit_servicios
-from citas_admin.blueprints.distritos.views import distritos
-from citas_admin.blueprints.domicilios.views import domicilios
-from citas_admin.blueprints.enc_encuestas.views import enc_encuestas
-from citas_admin.blueprints.enc_servicios.views import enc_servicios
-from citas_admin.blueprints.enc_sistemas.views import enc_sistemas
-from citas_admin.blueprints.entradas_salidas.views import entradas_salidas
-from citas_admin.blueprints.materias.views import materias
-from citas_admin.blueprints.modulos.views import modulos
-from citas_admin.blueprints.municipios.views import municipios
-from citas_admin.blueprints.oficinas.views import oficinas
-from citas_admin.blueprints.pag_pagos.views import pag_pagos
-from citas_admin.blueprints.pag_tramites_servicios.views import pag_tramites_servicios
-from citas_admin.blueprints.permisos.views import permisos
-from citas_admin.blueprints.ppa_solicitudes.views import ppa_solicitudes
-from citas_admin.blueprints.roles.views import roles
-from citas_admin.blueprints.sistemas.views import sistemas
-from citas_admin.blueprints.tareas.views import tareas
-from citas_admin.blueprints.tdt_partidos.views import tdt_partidos
-from citas_admin.blueprints.tdt_solicitudes.views import tdt_solicitudes
-from citas_admin.blueprints.usuarios.views import usuarios
-from citas_admin.blueprints.usuarios_oficinas.views import usuarios_oficinas
-from citas_admin.blueprints.usuarios_roles.views import usuarios_roles
-
+from citas_admin.blueprints.usuarios.identidades import cargar_usuario
 from citas_admin.blueprints.usuarios.models import Usuario
 
+BLUEPRINTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "blueprints")
+
+# Los blueprints se importan al crear la app web, así las tareas y la línea de comandos no cargan sus vistas
+BLUEPRINTS = (
+    "autoridades",
+    "bitacoras",
+    "boletines",
+    "cit_categorias",
+    "cit_citas",
+    "cit_citas_stats",
+    "cit_citas_documentos",
+    "cit_clientes",
+    "cit_clientes_recuperaciones",
+    "cit_clientes_registros",
+    "cit_dias_inhabiles",
+    "cit_horas_bloqueadas",
+    "cit_oficinas_servicios",
+    "cit_servicios",
+    "distritos",
+    "domicilios",
+    "enc_servicios",
+    "enc_encuestas",
+    "enc_sistemas",
+    "entradas_salidas",
+    "materias",
+    "modulos",
+    "municipios",
+    "oficinas",
+    "pag_pagos",
+    "pag_tramites_servicios",
+    "permisos",
+    "ppa_solicitudes",
+    "roles",
+    "sistemas",
+    "tareas",
+    "tdt_partidos",
+    "tdt_solicitudes",
+    "usuarios",
+    "usuarios_oficinas",
+    "usuarios_roles",
+)
+
+# Además de los modelos, estos módulos registran eventos que deben escuchar todos los procesos
+MODULOS_EVENTOS = (
+    "citas_admin.blueprints.cit_citas_stats.agregador",
+    "citas_admin.blueprints.usuarios.identidades",
+)
+
 
 def create_app():
     """Crear app"""
     # Definir app
+    app = _definir_app("web")
+    # Cargar los modelos y los blueprints
+    cargar_modelos()
+    for nombre in BLUEPRINTS:
+        app.register_blueprint(getattr(import_module(f"citas_admin.blueprints.{nombre}.views"), nombre))
+    # Cargar las extensiones
+    extensions(app)
+    authentication(Usuario)
+    # Contar las consultas SQL por peticion
+    if app.config["CONTAR_CONSULTAS_SQL"]:
+        contar_consultas_sql(app)
+    # Entregar app
+    return app
+
+
+def create_worker_app():
+    """Crear app para las tareas en el fondo y la línea de comandos, solo con los modelos y la base de datos"""
+    app = _definir_app("worker")
+    db.init_app(app)
+    cargar_modelos()
+    return app
+
+
+def cargar_modelos():
+    """Importar los modelos de todos los blueprints, las relaciones entre ellos se resuelven por nombre"""
+    for nombre in sorted(os.listdir(BLUEPRINTS_DIR)):
+        if os.path.exists(os.path.join(BLUEPRINTS_DIR, nombre, "models.py")):
+            import_module(f"citas_admin.blueprints.{nombre}.models")
+    for modulo in MODULOS_EVENTOS:
+        import_module(modulo)
+
+
+def _definir_app(perfil: str):
+    """Definir la app con su configuración, el perfil del pool de conexiones y Redis"""
     app = Flask(__name__, instance_relative_config=True)
     # Cargar la configuración para producción en config/settings.py
     app.config.from_object("config.settings")
     # Cargar la configuración para desarrollo en instance/settings.py
     app.config.from_pyfile("settings.py", silent=True)
+    # Perfil del pool de conexiones, DB_PERFIL tiene prioridad, por ejemplo batch en la línea de comandos
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+        **app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {}),
+        "perfil": app.config.get("DB_PERFIL") or perfil,
+        "pgbouncer": app.config.get("DB_PGBOUNCER", False),
+    }
     # Redis
     app.redis = Redis.from_url(app.config["REDIS_URL"])
     app.task_queue = rq.Queue(app.config["TASK_QUEUE"], connection=app.redis, default_timeout=1920)
-    # Cargar los blueprints
-    app.register_blueprint(autoridades)
-    app.register_blueprint(bitacoras)
-    app.register_blueprint(boletines)
-    app.register_blueprint(cit_categorias)
-    app.register_blueprint(cit_citas)
-    app.register_blueprint(cit_citas_stats)
-    app.register_blueprint(cit_citas_documentos)
-    app.register_blueprint(cit_clientes)
-    app.register_blueprint(cit_clientes_recuperaciones)
-    app.register_blueprint(cit_clientes_registros)
-    app.register_blueprint(cit_dias_inhabiles)
-    app.register_blueprint(cit_horas_bloqueadas)
-    app.register_blueprint(cit_oficinas_servicios)
-    app.register_blueprint(cit_servicios)
-    app.register_blueprint(distritos)
-    app.register_blueprint(domicilios)
-    app.register_blueprint(enc_servicios)
-    app.register_blueprint(enc_encuestas)
-    app.register_blueprint(enc_sistemas)
-    app.register_blueprint(entradas_salidas)
-    app.register_blueprint(materias)
-    app.register_blueprint(modulos)
-    app.register_blueprint(municipios)
-    app.register_blueprint(oficinas)
-    app.register_blueprint(pag_pagos)
-    app.register_blueprint(pag_tramites_servicios)
-    app.register_blueprint(permisos)
-    app.register_blueprint(ppa_solicitudes)
-    app.register_blueprint(roles)
-    app.register_blueprint(sistemas)
-    app.register_blueprint(tareas)
-    app.register_blueprint(tdt_partidos)
-    app.register_blueprint(tdt_solicitudes)
-    app.register_blueprint(usuarios)
-    app.register_blueprint(usuarios_oficinas)
-    app.register_blueprint(usuarios_roles)
-    # Cargar las extensiones
-    extensions(app)
-    authentication(Usuario)
-    # Entregar app
     return app
 
 
 def extensions(app):
     """Incorporar las extensiones"""
+    from citas_admin.extensions import socketio  # Solo la app web usa Flask-SocketIO
+
     csrf.init_app(app)
     db.init_app(app)
     login_manager.init_app(app)
     moment.init_app(app)
+    # Con la cola de mensajes en Redis lo publicado por un proceso web llega a los sockets de todos
+    socketio.init_app(app, message_queue=app.config["SOCKETIO_MESSAGE_QUEUE"] or None)
 
 
 def authentication(user_model):
@@ -115,4 +134,6 @@ def authentication(user_model):
 
     @login_manager.user_loader
     def load_user(uid):
+        if current_app.config["IDENTIDAD_EN_SESION"]:
+            return cargar_usuario(uid)
         return user_model.query.get(uid)
@@ -3,18 +3,17 @@ Autoridades, vistas
 """
 import json
 
-from flask import Blueprint, flash, redirect, render_template, request, url_for
+from flask import Blueprint, flash, redirect, render_template, url_for
 from flask_login import current_user, login_required
 
-from lib.datatables import get_datatable_parameters, output_datatable_json
+from lib.datatables import Filtro, filtrar_datatable, get_datatable_parameters, output_datatable_json, paginar_datatable
 from lib.safe_string import safe_clave, safe_string, safe_message
 
 from citas_admin.blueprints.autoridades.models import Autoridad
 from citas_admin.blueprints.autoridades.forms import AutoridadEditForm, AutoridadNewForm, AutoridadSearchForm
-from citas_admin.blueprints.bitacoras.models import Bitacora
+from citas_admin.blueprints.bitacoras.auditoria import registrar_bitacora
 from citas_admin.blueprints.distritos.models import Distrito
 from citas_admin.blueprints.materias.models import Materia
-from citas_admin.blueprints.modulos.models import Modulo
 from citas_admin.blueprints.permisos.models import Permiso
 from citas_admin.blueprints.usuarios.decorators import permission_required
 
@@ -36,30 +35,21 @@ def datatable_json():
     # Tomar parámetros de Datatables
     draw, start, rows_per_page = get_datatable_parameters()
     # Consultar
-    consulta = Autoridad.query
-    if "estatus" in request.form:
-        consulta = consulta.filter_by(estatus=request.form["estatus"])
-    else:
-        consulta = consulta.filter_by(estatus="A")
-    if "distrito_id" in request.form:
-        consulta = consulta.filter_by(distrito_id=request.form["distrito_id"])
-    if "materia_id" in request.form:
-        consulta = consulta.filter_by(materia_id=request.form["materia_id"])
-    if "clave" in request.form:
-        consulta = consulta.filter(Autoridad.clave.contains(safe_string(request.form["clave"])))
-    if "descripcion" in request.form:
-        consulta = consulta.filter(Autoridad.descripcion.contains(safe_string(request.form["descripcion"], to_uppercase=False)))
-    if "organo_jurisdiccional" in request.form:
-        consulta = consulta.filter(Autoridad.organo_jurisdiccional == safe_string(request.form["organo_jurisdiccional"]))
-    if "caracteristicas" in request.form:
-        if request.form["caracteristicas"] == "JURISDICCIONAL":
-            consulta = consulta.filter_by(es_jurisdiccional=True)
-        elif request.form["caracteristicas"] == "NOTARIA":
-            consulta = consulta.filter_by(es_notaria=True)
-        elif request.form["caracteristicas"] == "ORGANO_ESPECIALIZADO":
-            consulta = consulta.filter_by(es_organo_especializado=True)
-    registros = consulta.order_by(Autoridad.clave).offset(start).limit(rows_per_page).all()
-    total = consulta.count()
+    consulta, _ = filtrar_datatable(
+        Autoridad.query,
+        [
+            Filtro("estatus", Autoridad.estatus, defecto="A"),
+            Filtro("distrito_id", Autoridad.distrito_id),
+            Filtro("materia_id", Autoridad.materia_id),
+            Filtro("clave", Autoridad.clave, "contiene", limpiar=safe_string),
+            Filtro("descripcion", Autoridad.descripcion, "contiene", limpiar=lambda valor: safe_string(valor, to_uppercase=False)),
+            Filtro("organo_jurisdiccional", Autoridad.organo_jurisdiccional, limpiar=safe_string),
+            Filtro("caracteristicas", funcion=_filtrar_caracteristicas),
+        ],
+    )
+    registros, total, cursor = paginar_datatable(consulta, [Autoridad.clave], start, rows_per_page, relaciones=[Autoridad.distrito, Autoridad.materia])
+    # Consultar los permisos una sola vez y no en cada renglon
+    puede_ver = {modulo: current_user.can_view(modulo) for modulo in ("DISTRITOS", "MATERIAS")}
     # Elaborar datos para DataTable
     data = []
     for resultado in registros:
@@ -73,16 +63,27 @@ def datatable_json():
                 "organo_jurisdiccional": resultado.organo_jurisdiccional,
                 "distrito": {
                     "nombre_corto": resultado.distrito.nombre_corto,
-                    "url": url_for("distritos.detail", distrito_id=resultado.distrito_id) if current_user.can_view("DISTRITOS") else "",
+                    "url": url_for("distritos.detail", distrito_id=resultado.distrito_id) if puede_ver["DISTRITOS"] else "",
                 },
                 "materia": {
                     "nombre": resultado.materia.nombre,
-                    "url": url_for("materias.detail", materia_id=resultado.materia_id) if current_user.can_view("MATERIAS") else "",
+                    "url": url_for("materias.detail", materia_id=resultado.materia_id) if puede_ver["MATERIAS"] else "",
                 },
             }
         )
     # Entregar JSON
-    return output_datatable_json(draw, total, data)
+    return output_datatable_json(draw, total, data, cursor)
+
+
+def _filtrar_caracteristicas(consulta, caracteristicas):
+    """Filtrar autoridades por sus caracteristicas"""
+    if caracteristicas == "JURISDICCIONAL":
+        return consulta.filter_by(es_jurisdiccional=True)
+    if caracteristicas == "NOTARIA":
+        return consulta.filter_by(es_notaria=True)
+    if caracteristicas == "ORGANO_ESPECIALIZADO":
+        return consulta.filter_by(es_organo_especializado=True)
+    return consulta
 
 
 @autoridades.route("/autoridades")
@@ -171,13 +172,12 @@ def new():
                 materia=form.materia.data,
             )
             autoridad.save()
-            bitacora = Bitacora(
-                modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+            bitacora = registrar_bitacora(
+                modulo=MODULO,
                 usuario=current_user,
                 descripcion=safe_message(f"Nueva autoridad {autoridad.clave}"),
                 url=url_for("autoridades.detail", autoridad_id=autoridad.id),
             )
-            bitacora.save()
             flash(bitacora.descripcion, "success")
             return redirect(bitacora.url)
     form.materia.data = Materia.query.get(1)  # Materia NO DEFINIDO
@@ -211,13 +211,12 @@ def edit(autoridad_id):
             autoridad.organo_jurisdiccional = form.organo_jurisdiccional.data
             autoridad.materia = form.materia.data
             autoridad.save()
-            bitacora = Bitacora(
-                modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+            bitacora = registrar_bitacora(
+                modulo=MODULO,
                 usuario=current_user,
                 descripcion=safe_message(f"Editada autoridad {autoridad.clave}"),
                 url=url_for("autoridades.detail", autoridad_id=autoridad.id),
             )
-            bitacora.save()
             flash(bitacora.descripcion, "success")
             return redirect(bitacora.url)
     form.distrito.data = autoridad.distrito
@@ -239,13 +238,12 @@ def delete(autoridad_id):
     autoridad = Autoridad.query.get_or_404(autoridad_id)
     if autoridad.estatus == "A":
         autoridad.delete()
-        bitacora = Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+        bitacora = registrar_bitacora(
+            modulo=MODULO,
             usuario=current_user,
             descripcion=safe_message(f"Eliminada autoridad {autoridad.clave}"),
             url=url_for("autoridades.detail", autoridad_id=autoridad.id),
         )
-        bitacora.save()
         flash(bitacora.descripcion, "success")
         return redirect(bitacora.url)
     return redirect(url_for("autoridades.detail", autoridad_id=autoridad.id))
@@ -258,13 +256,12 @@ def recover(autoridad_id):
     autoridad = Autoridad.query.get_or_404(autoridad_id)
     if autoridad.estatus == "B":
         autoridad.recover()
-        bitacora = Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+        bitacora = registrar_bitacora(
+            modulo=MODULO,
             usuario=current_user,
             descripcion=safe_message(f"Recuperada autoridad {autoridad.clave}"),
             url=url_for("autoridades.detail", autoridad_id=autoridad.id),
         )
-        bitacora.save()
         flash(bitacora.descripcion, "success")
         return redirect(bitacora.url)
     return redirect(url_for("autoridades.detail", autoridad_id=autoridad.id))
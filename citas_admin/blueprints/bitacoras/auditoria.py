@@ -0,0 +1,185 @@
+"""
+Bitácoras, escritura diferida de bitácoras y entradas/salidas
+
+Las vistas ya no consultan el módulo ni hacen commit para la bitácora:
+
+- registrar_bitacora y registrar_entrada_salida agregan el renglón al stream bitacoras:auditoria de Redis
+  y, si no hay una programada, agregan la tarea vaciar a la cola de RQ
+- vaciar lee el stream con el grupo de consumidores bitacoras:escritores, escribe cada lote con un
+  INSERT de varios renglones por tabla y solo después de confirmar la transacción los quita del stream
+- Si el worker muere a la mitad, los renglones quedan pendientes en el grupo y el siguiente vaciar
+  los escribe primero; puede repetirse un lote (al menos una vez), nunca se pierde
+- Si el INSERT de un lote falla se deshace la transacción y se escribe renglón por renglón; los que
+  fallan quedan pendientes para el siguiente vaciar y al llegar a REINTENTOS entregas se pasan al
+  stream bitacoras:auditoria:fallidos con el error, así un renglón malo no detiene a los demás;
+  reenviar_fallidos los regresa al stream una vez corregida la causa
+
+Con AUDITORIA_SINCRONA=1, o si Redis no está disponible, se escribe en la base de datos al momento.
+Los ID de los módulos se guardan en la memoria del proceso por su nombre.
+"""
+from datetime import datetime
+import json
+
+from flask import current_app
+from redis.exceptions import RedisError, ResponseError
+from sqlalchemy.exc import SQLAlchemyError
+
+from citas_admin.extensions import db
+from citas_admin.blueprints.bitacoras.models import Bitacora
+from citas_admin.blueprints.entradas_salidas.models import EntradaSalida
+from citas_admin.blueprints.modulos.models import Modulo
+
+LLAVE = "bitacoras:auditoria"
+FALLIDOS = f"{LLAVE}:fallidos"
+GRUPO = "bitacoras:escritores"
+CONSUMIDOR = "vaciar"  # Siempre el mismo para retomar los pendientes de un vaciado que no terminó
+PROGRAMADO_SEGUNDOS = 60  # Si la tarea no arranca en este tiempo, el siguiente registro la vuelve a programar
+CANDADO_SEGUNDOS = 300
+LOTE = 500
+REINTENTOS = 5  # Entregas de un renglón antes de pasarlo a FALLIDOS
+TAREA = "bitacoras.tasks.vaciar"
+MODELOS = {modelo.__tablename__: modelo for modelo in (Bitacora, EntradaSalida)}
+
+_modulos = {}  # Nombre del módulo → ID
+
+
+def obtener_modulo_id(nombre: str):
+    """Entregar el ID del módulo, al no encontrarlo vuelve a consultar todos los módulos"""
+    if nombre not in _modulos:
+        _modulos.clear()
+        _modulos.update({renglon.nombre: renglon.id for renglon in Modulo.query.with_entities(Modulo.nombre, Modulo.id)})
+    return _modulos[nombre]
+
+
+def registrar_bitacora(modulo: str, usuario, descripcion: str, url: str = ""):
+    """Registrar en la bitácora, entrega la Bitacora (sin guardar) para usar su descripción y URL"""
+    bitacora = Bitacora(modulo_id=obtener_modulo_id(modulo), usuario_id=usuario.id, descripcion=descripcion, url=url)
+    _registrar(bitacora, ("modulo_id", "usuario_id", "descripcion", "url"))
+    return bitacora
+
+
+def registrar_entrada_salida(usuario_id: int, tipo: str, direccion_ip: str):
+    """Registrar una entrada o salida del sistema"""
+    entrada_salida = EntradaSalida(usuario_id=usuario_id, tipo=tipo, direccion_ip=direccion_ip)
+    _registrar(entrada_salida, ("usuario_id", "tipo", "direccion_ip"))
+    return entrada_salida
+
+
+def _registrar(registro, columnas):
+    """Agregar el registro al stream, o guardarlo al momento si es síncrono o falla Redis"""
+    registro.creado = datetime.now()
+    if not current_app.config["AUDITORIA_SINCRONA"]:
+        renglon = {columna: getattr(registro, columna) for columna in columnas}
+        renglon["creado"] = registro.creado.isoformat()
+        try:
+            current_app.redis.xadd(LLAVE, {"tabla": registro.__tablename__, "renglon": json.dumps(renglon, ensure_ascii=False)})
+            programar()
+            return
+        except RedisError:
+            pass
+    registro.save()
+
+
+def programar():
+    """Agregar la tarea vaciar a la cola, solo si no hay una programada"""
+    if current_app.redis.set(f"{LLAVE}:programado", 1, nx=True, ex=PROGRAMADO_SEGUNDOS):
+        current_app.task_queue.enqueue(f"citas_admin.blueprints.{TAREA}")
+
+
+def _crear_grupo():
+    """Crear el stream y el grupo de consumidores si no existen"""
+    try:
+        current_app.redis.xgroup_create(LLAVE, GRUPO, id="0", mkstream=True)
+    except ResponseError as error:
+        if "BUSYGROUP" not in str(error):
+            raise
+
+
+def _insertar(entradas):
+    """Escribir las entradas con un INSERT de varios renglones por tabla"""
+    renglones = {}
+    for _, campos in entradas:
+        renglon = json.loads(campos[b"renglon"])
+        renglon["creado"] = renglon["modificado"] = datetime.fromisoformat(renglon["creado"])
+        renglones.setdefault(campos[b"tabla"].decode(), []).append(renglon)
+    for tabla, valores in renglones.items():
+        db.session.execute(MODELOS[tabla].__table__.insert().values(valores))
+    db.session.commit()
+
+
+def _escribir(entradas):
+    """Escribir el lote, si falla uno por uno; entrega los ID que ya se pueden quitar del stream y cuántos se escribieron"""
+    try:
+        _insertar(entradas)
+        return [entrada_id for entrada_id, _ in entradas], len(entradas)
+    except (SQLAlchemyError, KeyError, ValueError):
+        db.session.rollback()
+    entregas = {pendiente["message_id"]: pendiente["times_delivered"] for pendiente in current_app.redis.xpending_range(LLAVE, GRUPO, min=entradas[0][0], max=entradas[-1][0], count=len(entradas))}
+    listos = []
+    escritos = 0
+    for entrada_id, campos in entradas:
+        try:
+            _insertar([(entrada_id, campos)])
+            escritos += 1
+        except (SQLAlchemyError, KeyError, ValueError) as error:
+            db.session.rollback()
+            if entregas.get(entrada_id, 1) < REINTENTOS:
+                continue  # Queda pendiente para el siguiente vaciar
+            current_app.redis.xadd(FALLIDOS, {**campos, "error": str(error)[:1000], "id": entrada_id})
+        listos.append(entrada_id)
+    return listos, escritos
+
+
+def vaciar(lote: int = LOTE):
+    """Escribir en la base de datos lo que hay en el stream, entrega la cantidad de renglones escritos"""
+    redis = current_app.redis
+    redis.delete(f"{LLAVE}:programado")
+    if not redis.set(f"{LLAVE}:candado", 1, nx=True, ex=CANDADO_SEGUNDOS):
+        return 0  # Otro vaciado está en proceso, al terminar revisa si llegaron más
+    total = 0
+    try:
+        _crear_grupo()
+        # Primero los pendientes de un vaciado que no terminó, luego los nuevos
+        for pendientes_primero in (True, False):
+            desde = "0" if pendientes_primero else ">"
+            while True:
+                respuesta = redis.xreadgroup(GRUPO, CONSUMIDOR, {LLAVE: desde}, count=lote)
+                entradas = respuesta[0][1] if respuesta else []
+                if not entradas:
+                    break
+                ids, escritos = _escribir(entradas)
+                if ids:
+                    redis.xack(LLAVE, GRUPO, *ids)
+                    redis.xdel(LLAVE, *ids)
+                total += escritos
+                redis.expire(f"{LLAVE}:candado", CANDADO_SEGUNDOS)
+                if pendientes_primero:
+                    desde = entradas[-1][0]  # Los que siguen pendientes no se vuelven a leer en este vaciado
+    finally:
+        redis.delete(f"{LLAVE}:candado")
+    # Si llegaron registros después de la última lectura, programar otro vaciado
+    if redis.xlen(LLAVE) > 0:
+        programar()
+    return total
+
+
+def pendientes():
+    """Entregar la cantidad de registros en el stream que no se han escrito"""
+    return current_app.redis.xlen(LLAVE)
+
+
+def fallidos():
+    """Entregar la cantidad de registros que se pasaron a FALLIDOS"""
+    return current_app.redis.xlen(FALLIDOS)
+
+
+def reenviar_fallidos():
+    """Regresar los registros de FALLIDOS al stream para que el siguiente vaciar los intente de nuevo"""
+    cantidad = 0
+    for entrada_id, campos in current_app.redis.xrange(FALLIDOS):
+        current_app.redis.xadd(LLAVE, {"tabla": campos[b"tabla"], "renglon": campos[b"renglon"]})
+        current_app.redis.xdel(FALLIDOS, entrada_id)
+        cantidad += 1
+    if cantidad:
+        programar()
+    return cantidad
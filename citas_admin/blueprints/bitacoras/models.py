@@ -10,6 +10,7 @@ class Bitacora(db.Model, UniversalMixin):
 
     # Nombre de la tabla
     __tablename__ = "bitacoras"
+    __table_args__ = {"info": {"particionar_por": "creado"}}  # En PostgreSQL se parte por mes, vea lib/particiones.py
 
     # Clave primaria
     id = db.Column(db.Integer, primary_key=True)
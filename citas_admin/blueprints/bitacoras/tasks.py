@@ -0,0 +1,30 @@
+"""
+Bitácoras, tareas en el fondo
+
+- vaciar: escribe en la base de datos las bitácoras y entradas/salidas del stream de Redis
+"""
+import logging
+
+from citas_admin.blueprints.bitacoras import auditoria
+
+from citas_admin.app import create_worker_app
+from citas_admin.extensions import db
+
+bitacora = logging.getLogger(__name__)
+bitacora.setLevel(logging.INFO)
+formato = logging.Formatter("%(asctime)s:%(levelname)s:%(message)s")
+empunadura = logging.FileHandler("bitacoras.log")
+empunadura.setFormatter(formato)
+bitacora.addHandler(empunadura)
+
+app = create_worker_app()
+app.app_context().push()
+db.app = app
+
+
+def vaciar():
+    """Escribir en la base de datos los registros del stream"""
+    cantidad = auditoria.vaciar()
+    if cantidad > 0:
+        bitacora.info("Se escribieron %d registros de auditoria", cantidad)
+    return cantidad
@@ -4,10 +4,11 @@ Bitácoras, vistas
 from flask import Blueprint, render_template, url_for
 from flask_login import login_required
 
-from lib.datatables import get_datatable_parameters, output_datatable_json
+from lib.datatables import Filtro, filtrar_datatable, get_datatable_parameters, output_datatable_json, paginar_datatable
 
 from citas_admin.blueprints.bitacoras.models import Bitacora
 from citas_admin.blueprints.permisos.models import Permiso
+from citas_admin.blueprints.usuarios.models import Usuario
 from citas_admin.blueprints.usuarios.decorators import permission_required
 
 MODULO = "BITACORAS"
@@ -22,10 +23,9 @@ def datatable_json():
     """DataTable JSON para listado de listado de bitácoras"""
     # Tomar parámetros de Datatables
     draw, start, rows_per_page = get_datatable_parameters()
-    # Consultar
-    consulta = Bitacora.query
-    registros = consulta.order_by(Bitacora.id.desc()).offset(start).limit(rows_per_page).all()
-    total = consulta.count()
+    # Consultar, ordenar y filtrar por creado para que PostgreSQL solo lea las particiones necesarias
+    consulta, filtrado = filtrar_datatable(Bitacora.query, [Filtro("creado_desde", Bitacora.creado, "desde"), Filtro("creado_hasta", Bitacora.creado, "hasta")])
+    registros, total, cursor = paginar_datatable(consulta, [Bitacora.creado], start, rows_per_page, descendente=True, estimar=not filtrado, relaciones=[(Bitacora.usuario, [Usuario.email])])
     # Elaborar un listado de diccionarios
     data = []
     for bitacora in registros:
@@ -43,7 +43,7 @@ def datatable_json():
             }
         )
     # Entregar JSON
-    return output_datatable_json(draw, total, data)
+    return output_datatable_json(draw, total, data, cursor)
 
 
 @bitacoras.route("/bitacoras")
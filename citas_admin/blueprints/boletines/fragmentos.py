@@ -0,0 +1,180 @@
+"""
+Boletines, fragmentos
+
+Reparte el envío de un boletín entre varios workers de RQ
+
+- Los ID de los clientes suscritos se parten en fragmentos con la misma cantidad de clientes
+- boletines:fragmentos:<boletin_id> es un hash con
+    - limites, lista JSON; el fragmento n son los ID en (limites[n], limites[n + 1]]
+    - destinatarios, la cantidad de clientes suscritos al planear
+    - terminados:<n> por cada fragmento que ya no tiene clientes por enviar
+- boletines:fragmentos:<boletin_id>:<n> es un hash con el avance del fragmento
+    - puntero, el ID del último cliente tomado
+    - pendiente, el lote que se está enviando como "puntero_anterior:cantidad"
+    - enviados y dudosos, contadores
+- boletines:fragmentos:<boletin_id>:<n>:candado evita que dos workers envíen el mismo fragmento
+
+Para no enviar dos veces el puntero avanza ANTES de enviar el lote. Si el envío falla se regresa
+el puntero, pero si el worker muere a la mitad el lote queda como dudoso al reanudar y NO se reenvía.
+"""
+import json
+
+from flask import current_app
+
+from citas_admin.blueprints.cit_clientes.models import CitCliente
+
+LLAVE = "boletines:fragmentos"
+TTL_SEGUNDOS = 30 * 24 * 60 * 60
+CANDADO_SEGUNDOS = 1920  # Igual que default_timeout de la cola de tareas
+
+
+def _llave_plan(boletin_id: int):
+    """Llave del plan de un boletín"""
+    return f"{LLAVE}:{boletin_id}"
+
+
+def _llave_fragmento(boletin_id: int, numero: int):
+    """Llave del avance de un fragmento"""
+    return f"{LLAVE}:{boletin_id}:{numero}"
+
+
+def consultar_suscritos():
+    """Consulta de los clientes activos que quieren recibir el boletín"""
+    return CitCliente.query.filter_by(estatus="A").filter_by(enviar_boletin=True)
+
+
+def calcular_limites(cantidad: int):
+    """Partir los ID de los suscritos en fragmentos con la misma cantidad, entrega (limites, destinatarios)"""
+    consulta = consultar_suscritos().with_entities(CitCliente.id).order_by(CitCliente.id)
+    destinatarios = consulta.count()
+    if destinatarios == 0:
+        return [], 0
+    cantidad = max(1, min(cantidad, destinatarios))
+    limites = [0]
+    for numero in range(1, cantidad):
+        limites.append(consulta.offset(numero * destinatarios // cantidad - 1).limit(1).scalar())
+    limites.append(consulta.order_by(None).order_by(CitCliente.id.desc()).limit(1).scalar())
+    return limites, destinatarios
+
+
+def planear(boletin_id: int, cantidad: int):
+    """Entregar (limites, destinatarios) del plan del boletín, si no existe lo crea"""
+    plan = obtener_plan(boletin_id)
+    if plan is not None:
+        return plan
+    limites, destinatarios = calcular_limites(cantidad)
+    llave = _llave_plan(boletin_id)
+    # Si otra tarea se adelantó a planear, se usa su plan
+    if current_app.redis.hsetnx(llave, "limites", json.dumps(limites)):
+        current_app.redis.hset(llave, "destinatarios", destinatarios)
+        current_app.redis.expire(llave, TTL_SEGUNDOS)
+        return limites, destinatarios
+    return obtener_plan(boletin_id)
+
+
+def obtener_plan(boletin_id: int):
+    """Entregar (limites, destinatarios) del plan del boletín o None si no lo hay"""
+    limites, destinatarios = current_app.redis.hmget(_llave_plan(boletin_id), "limites", "destinatarios")
+    if limites is None:
+        return None
+    return json.loads(limites), int(destinatarios or 0)
+
+
+def borrar_plan(boletin_id: int):
+    """Borrar el plan y el avance de todos los fragmentos"""
+    plan = obtener_plan(boletin_id)
+    if plan is None:
+        return
+    llaves = [_llave_plan(boletin_id)]
+    for numero in range(len(plan[0]) - 1):
+        llaves += [_llave_fragmento(boletin_id, numero), _llave_fragmento(boletin_id, numero) + ":candado"]
+    current_app.redis.delete(*llaves)
+
+
+def tomar_candado(boletin_id: int, numero: int):
+    """Tomar el candado del fragmento, entrega False si lo tiene otro worker"""
+    llave = _llave_fragmento(boletin_id, numero) + ":candado"
+    return bool(current_app.redis.set(llave, 1, nx=True, ex=CANDADO_SEGUNDOS))
+
+
+def renovar_candado(boletin_id: int, numero: int):
+    """Extender el tiempo del candado mientras se envían los lotes"""
+    current_app.redis.expire(_llave_fragmento(boletin_id, numero) + ":candado", CANDADO_SEGUNDOS)
+
+
+def soltar_candado(boletin_id: int, numero: int):
+    """Soltar el candado del fragmento"""
+    current_app.redis.delete(_llave_fragmento(boletin_id, numero) + ":candado")
+
+
+def esta_ocupado(boletin_id: int, numero: int):
+    """Si un worker tiene el candado del fragmento"""
+    return current_app.redis.exists(_llave_fragmento(boletin_id, numero) + ":candado") == 1
+
+
+def esta_terminado(boletin_id: int, numero: int):
+    """Si el fragmento ya no tiene clientes por enviar"""
+    return current_app.redis.hexists(_llave_plan(boletin_id), f"terminados:{numero}")
+
+
+def leer_avance(boletin_id: int, numero: int):
+    """Entregar el avance del fragmento como diccionario"""
+    valores = current_app.redis.hgetall(_llave_fragmento(boletin_id, numero))
+    avance = {llave.decode(): valor.decode() for llave, valor in valores.items()}
+    return {
+        "puntero": int(avance.get("puntero", 0)),
+        "pendiente": avance.get("pendiente"),
+        "enviados": int(avance.get("enviados", 0)),
+        "dudosos": int(avance.get("dudosos", 0)),
+        "terminado": esta_terminado(boletin_id, numero),
+        "ocupado": esta_ocupado(boletin_id, numero),
+    }
+
+
+def resolver_pendiente(boletin_id: int, numero: int):
+    """Al reanudar, el lote que quedó a medio enviar se cuenta como dudoso, entrega su cantidad"""
+    llave = _llave_fragmento(boletin_id, numero)
+    pendiente = current_app.redis.hget(llave, "pendiente")
+    if pendiente is None:
+        return 0
+    cantidad = int(pendiente.decode().split(":")[1])
+    tuberia = current_app.redis.pipeline()
+    tuberia.hincrby(llave, "dudosos", cantidad)
+    tuberia.hdel(llave, "pendiente")
+    tuberia.execute()
+    return cantidad
+
+
+def reservar_lote(boletin_id: int, numero: int, puntero_anterior: int, puntero: int, cantidad: int):
+    """Avanzar el puntero antes de enviar el lote y dejarlo como pendiente"""
+    llave = _llave_fragmento(boletin_id, numero)
+    tuberia = current_app.redis.pipeline()
+    tuberia.hset(llave, mapping={"puntero": puntero, "pendiente": f"{puntero_anterior}:{cantidad}"})
+    tuberia.expire(llave, TTL_SEGUNDOS)
+    tuberia.execute()
+
+
+def confirmar_lote(boletin_id: int, numero: int, cantidad: int):
+    """El lote se envió, sumar los enviados y quitar el pendiente"""
+    llave = _llave_fragmento(boletin_id, numero)
+    tuberia = current_app.redis.pipeline()
+    tuberia.hincrby(llave, "enviados", cantidad)
+    tuberia.hdel(llave, "pendiente")
+    tuberia.execute()
+
+
+def cancelar_lote(boletin_id: int, numero: int, puntero_anterior: int):
+    """El envío del lote falló, regresar el puntero para enviarlo al reanudar"""
+    llave = _llave_fragmento(boletin_id, numero)
+    tuberia = current_app.redis.pipeline()
+    tuberia.hset(llave, "puntero", puntero_anterior)
+    tuberia.hdel(llave, "pendiente")
+    tuberia.execute()
+
+
+def terminar_fragmento(boletin_id: int, numero: int):
+    """Marcar el fragmento como terminado, entrega True si ya terminaron todos"""
+    llave = _llave_plan(boletin_id)
+    current_app.redis.hset(llave, f"terminados:{numero}", 1)
+    limites, _ = obtener_plan(boletin_id)
+    return all(current_app.redis.hmget(llave, [f"terminados:{n}" for n in range(len(limites) - 1)]))
@@ -33,6 +33,8 @@ class Boletin(db.Model, UniversalMixin):
     asunto = db.Column(db.String(256), nullable=False)
     contenido = db.Column(db.JSON())
     puntero = db.Column(db.Integer, nullable=False, default=0)
+    destinatarios = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    enviados = db.Column(db.Integer, nullable=False, default=0, server_default="0")
 
     def __repr__(self):
         """Representación"""
@@ -1,5 +1,9 @@
 """
 Boletines, tareas en el fondo
+
+- enviar: a un cliente o a un email de pruebas; sin ellos programa el envío a todos los suscritos
+- programar: parte a los suscritos en fragmentos y agrega una tarea por cada fragmento sin terminar
+- enviar_fragmento: envía a los clientes de un fragmento en lotes, con el avance en Redis
 """
 from datetime import datetime
 import locale
@@ -8,16 +12,16 @@ import os
 
 from delta import html
 from dotenv import load_dotenv
-from jinja2 import Environment, FileSystemLoader
-import sendgrid
-from sendgrid.helpers.mail import Email, To, Content, Mail
 
+from lib.correos import DESTINATARIOS_POR_LLAMADA, CorreoError, obtener_cartero
+from lib.plantillas import obtener_plantilla
 from lib.tasks import set_task_progress, set_task_error
 
+from citas_admin.blueprints.boletines import fragmentos
 from citas_admin.blueprints.boletines.models import Boletin
 from citas_admin.blueprints.cit_clientes.models import CitCliente
 
-from citas_admin.app import create_app
+from citas_admin.app import create_worker_app
 from citas_admin.extensions import db
 
 locale.setlocale(locale.LC_TIME, "es_MX.utf8")
@@ -29,53 +33,66 @@ empunadura = logging.FileHandler("boletines.log")
 empunadura.setFormatter(formato)
 bitacora.addHandler(empunadura)
 
-app = create_app()
+app = create_worker_app()
+app.app_context().push()
 db.app = app
 
 load_dotenv()  # Take environment variables from .env
 
-CANTIDAD = 10
-SENDGRID_API_KEY = os.getenv("SENDGRID_API_KEY", "")
-SENDGRID_FROM_EMAIL = os.getenv("SENDGRID_FROM_EMAIL", "")
+FRAGMENTOS = int(os.getenv("BOLETINES_FRAGMENTOS", "4"))
+LOTE = DESTINATARIOS_POR_LLAMADA
+SUSTITUIR_NOMBRE = "-destinatario_nombre-"
+
+
+def _consultar_boletin(boletin_id):
+    """Consultar el boletin, entrega (boletin, mensaje_error)"""
+    boletin = Boletin.query.get(boletin_id)
+    if boletin is None:
+        return None, f"El ID del boletin '{boletin_id}' NO existe"
+    if boletin.estatus != "A":
+        return None, f"El ID {boletin.id} NO tiene estatus ACTIVO"
+    return boletin, None
+
+
+def _elaborar_contenidos(boletin):
+    """Elaborar el mensaje una sola vez, el nombre de cada destinatario se sustituye al enviar"""
+    plantilla = obtener_plantilla("boletines", "email.jinja2")
+    return plantilla.render(
+        mensaje_asunto=boletin.asunto,
+        fecha_elaboracion=datetime.now().strftime("%d/%b/%Y %I:%M %p"),
+        destinatario_nombre=SUSTITUIR_NOMBRE,
+        mensaje_contenido=html.render(boletin.contenido["ops"]),
+    )
 
 
 def enviar(boletin_id, cit_cliente_id=None, email=None):
     """Enviar mensajes via correo electrónico"""
 
     # Consultar boletin
-    boletin = Boletin.query.get(boletin_id)
+    boletin, mensaje_error = _consultar_boletin(boletin_id)
     if boletin is None:
-        mensaje_error = f"El ID del boletin '{boletin_id}' NO existe"
-        set_task_error(mensaje_error)
-        bitacora.error(mensaje_error)
-        return mensaje_error
-    if boletin.estatus != "A":
-        mensaje_error = f"El ID {boletin.id} NO tiene estatus ACTIVO"
         set_task_error(mensaje_error)
         bitacora.error(mensaje_error)
         return mensaje_error
 
-    # Definir remitente para SendGrid
-    if SENDGRID_FROM_EMAIL == "":
-        mensaje_error = "La variable SENDGRID_FROM_EMAIL NO ha sido declarada"
+    # Si no viene un cliente ni un e-mail de pruebas, se envía a todos los suscritos por fragmentos
+    if cit_cliente_id is None and email is None:
+        return programar(boletin.id)
+
+    # Definir el cartero, si falta la configuración se termina
+    try:
+        cartero = obtener_cartero()
+    except CorreoError as error:
+        mensaje_error = str(error)
         set_task_error(mensaje_error)
         bitacora.error(mensaje_error)
         return mensaje_error
-    from_email = Email(SENDGRID_FROM_EMAIL)
 
-    # Inicilizar listado de destinatarios
-    destinatarios = []
-    puntero = 0
-
-    # Si viene un e-mail de pruebas
+    # Definir el destinatario
     if email is not None:
-        destinatarios.append(
-            {
-                "nombre": "Fulano de Tal",
-                "email": email,
-            }
-        )
-    elif cit_cliente_id is not None:
+        # Viene un e-mail de pruebas
+        destinatario = {"nombre": "Fulano de Tal", "email": email}
+    else:
         # Viene un ID de cliente, entonces se le enviara solo a esta persona
         cit_cliente = CitCliente.query.get(cit_cliente_id)
         if cit_cliente is None:
@@ -88,101 +105,165 @@ def enviar(boletin_id, cit_cliente_id=None, email=None):
             set_task_error(mensaje_error)
             bitacora.error(mensaje_error)
             return mensaje_error
-        if email is None:
-            destinatarios.append(
-                {
-                    "nombre": cit_cliente.nombre,
-                    "email": cit_cliente.email,
-                }
-            )
-    else:
-        # Consultar los clientes activos que quieren recibir el boletin
-        cit_clientes = CitCliente.query.filter_by(estatus="A").filter_by(enviar_boletin=True).filter(CitCliente.id > boletin.puntero).order_by(CitCliente.id).limit(CANTIDAD).all()
-        # Si hay resultados, agregarlos al listado de destinatarios
-        if cit_clientes:
-            puntero = 0
-            for cit_cliente in cit_clientes:
-                destinatarios.append(
-                    {
-                        "nombre": cit_cliente.nombre,
-                        "email": cit_cliente.email,
-                    }
-                )
-                puntero = cit_cliente.id
-            # Actualizar el boletin con el id del ultimo cliente consultado
-            boletin.puntero = puntero
-            boletin.save()
-        else:
-            # No hubo clientes
-            mensaje_final = f"No hay clientes en el salto {boletin.puntero}"
-            # Si se acabaron los clientes
-            if CitCliente.query.filter(CitCliente.id > boletin.puntero + CANTIDAD).count() == 0:
-                # Actualizar el boletin con el estado ENVIADO
-                boletin.puntero = 0
-                boletin.estado = "ENVIADO"
-                boletin.save()
-            # Terminar
-            set_task_progress(100)
-            bitacora.info(mensaje_final)
-            return mensaje_final
-
-    # Momento en que se elabora este mensaje
-    momento = datetime.now()
-    momento_str = momento.strftime("%d/%b/%Y %I:%M %p")
-
-    # Definir cliente de SendGrid
-    sendgrid_client = None
-    if SENDGRID_API_KEY != "":
-        sendgrid_client = sendgrid.SendGridAPIClient(api_key=SENDGRID_API_KEY)
-    else:
-        bitacora.warning("La variable SENDGRID_API_KEY NO ha sido declarada.")
+        destinatario = {"nombre": cit_cliente.nombre, "email": cit_cliente.email}
 
-    # Definir la plantilla
-    entorno = Environment(
-        loader=FileSystemLoader("citas_admin/blueprints/boletines/templates/boletines"),
-        trim_blocks=True,
-        lstrip_blocks=True,
-    )
-    plantilla = entorno.get_template("email.jinja2")
+    # Enviar
+    try:
+        cartero.enviar(destinatario["email"], boletin.asunto, _elaborar_contenidos(boletin).replace(SUSTITUIR_NOMBRE, destinatario["nombre"]))
+    except CorreoError as error:
+        mensaje_error = f"ERROR al enviar mensaje: {str(error)}"
+        set_task_error(mensaje_error)
+        bitacora.error(mensaje_error)
+        return mensaje_error
 
-    # Bucle destinatarios
-    for destinatario in destinatarios:
+    # Terminar tarea
+    set_task_progress(100)
+    mensaje_final = f"Boletin enviado a {destinatario['email']}"
+    bitacora.info(mensaje_final)
+    return mensaje_final
 
-        # Elaborar contenido del mensaje
-        contenidos = plantilla.render(
-            mensaje_asunto=boletin.asunto,
-            fecha_elaboracion=momento_str,
-            destinatario_nombre=destinatario["nombre"],
-            mensaje_contenido=html.render(boletin.contenido["ops"]),
-        )
 
-        # Si la variable SENDGRID_API_KEY NO ha sido declarada
-        if SENDGRID_API_KEY == "":
-            # Guardar mensaje en archivo
-            archivo_html = f"boletin_{boletin.id}_{destinatario['email']}_{momento.strftime('%Y%m%d_%H%M%S')}.html"
-            with open(archivo_html, "w", encoding="UTF-8") as puntero:
-                puntero.write(contenidos)
-            bitacora.info("Se guardó el mensaje en %s", archivo_html)
+def programar(boletin_id, cantidad=FRAGMENTOS):
+    """Partir a los suscritos en fragmentos y agregar una tarea por cada fragmento sin terminar
+
+    Se puede ejecutar de nuevo para reanudar, usa el mismo plan y omite los fragmentos terminados o en proceso
+    """
+
+    # Consultar boletin
+    boletin, mensaje_error = _consultar_boletin(boletin_id)
+    if boletin is None:
+        set_task_error(mensaje_error)
+        bitacora.error(mensaje_error)
+        return mensaje_error
+    if boletin.estado == "ENVIADO":
+        mensaje_error = f"El boletin {boletin.id} ya fue ENVIADO"
+        set_task_error(mensaje_error)
+        bitacora.error(mensaje_error)
+        return mensaje_error
+
+    # Planear los fragmentos, o tomar el plan si ya existe
+    limites, destinatarios = fragmentos.planear(boletin.id, cantidad)
+    if destinatarios == 0:
+        boletin.estado = "ENVIADO"
+        boletin.save()
+        mensaje_final = "No hay clientes suscritos al boletin"
+        set_task_progress(100, mensaje_final)
+        bitacora.info(mensaje_final)
+        return mensaje_final
+    if boletin.destinatarios != destinatarios:
+        boletin.destinatarios = destinatarios
+        boletin.save()
+
+    # Agregar las tareas de los fragmentos que faltan
+    agregados = []
+    for numero in range(len(limites) - 1):
+        if fragmentos.esta_terminado(boletin.id, numero) or fragmentos.esta_ocupado(boletin.id, numero):
             continue
+        app.task_queue.enqueue(
+            "citas_admin.blueprints.boletines.tasks.enviar_fragmento",
+            boletin_id=boletin.id,
+            numero=numero,
+        )
+        agregados.append(numero)
+
+    # Terminar tarea
+    mensaje_final = f"Boletin {boletin.id} para {destinatarios} clientes: se agregaron {len(agregados)} de {len(limites) - 1} fragmentos"
+    set_task_progress(100, mensaje_final)
+    bitacora.info(mensaje_final)
+    return mensaje_final
+
+
+def enviar_fragmento(boletin_id, numero):
+    """Enviar el boletin a los clientes de un fragmento, en lotes de LOTE destinatarios"""
+
+    # Consultar boletin
+    boletin, mensaje_error = _consultar_boletin(boletin_id)
+    if boletin is None:
+        set_task_error(mensaje_error)
+        bitacora.error(mensaje_error)
+        return mensaje_error
+
+    # Tomar el candado, si lo tiene otro worker se termina
+    if not fragmentos.tomar_candado(boletin.id, numero):
+        mensaje_final = f"El fragmento {numero} del boletin {boletin.id} lo está enviando otra tarea"
+        set_task_progress(100, mensaje_final)
+        bitacora.info(mensaje_final)
+        return mensaje_final
+    try:
+        return _enviar_fragmento(boletin, numero)
+    finally:
+        fragmentos.soltar_candado(boletin.id, numero)
 
-        # Definir destinatario para SendGrid
-        to_email = To(destinatario["email"])
 
-        # Definir contenido para SendGrid
-        content = Content("text/html", contenidos)
+def _enviar_fragmento(boletin, numero):
+    """Enviar los lotes del fragmento teniendo el candado"""
+
+    # Definir el cartero, si falta la configuración se termina
+    try:
+        cartero = obtener_cartero()
+    except CorreoError as error:
+        mensaje_error = str(error)
+        set_task_error(mensaje_error)
+        bitacora.error(mensaje_error)
+        return mensaje_error
 
-        # Enviar mensaje via SendGrid
-        mail = Mail(from_email, to_email, boletin.asunto, content)
+    # Tomar los límites del fragmento y su avance
+    plan = fragmentos.obtener_plan(boletin.id)
+    limites = plan[0] if plan is not None else []
+    if numero >= len(limites) - 1:
+        mensaje_error = f"El boletin {boletin.id} NO tiene el fragmento {numero}"
+        set_task_error(mensaje_error)
+        bitacora.error(mensaje_error)
+        return mensaje_error
+    dudosos = fragmentos.resolver_pendiente(boletin.id, numero)
+    if dudosos > 0:
+        bitacora.warning(f"Boletin {boletin.id} fragmento {numero}: {dudosos} destinatarios de un envío interrumpido NO se reenvían")
+    avance = fragmentos.leer_avance(boletin.id, numero)
+    puntero = max(avance["puntero"], limites[numero])
+    hasta = limites[numero + 1]
+    suscritos = fragmentos.consultar_suscritos().filter(CitCliente.id <= hasta)
+    total = suscritos.filter(CitCliente.id > limites[numero]).count()
+
+    # Elaborar el mensaje una sola vez para todo el fragmento
+    contenidos = _elaborar_contenidos(boletin)
+
+    # Enviar por lotes
+    enviados = avance["enviados"] + avance["dudosos"]
+    columnas = (CitCliente.id, CitCliente.nombres, CitCliente.apellido_primero, CitCliente.apellido_segundo, CitCliente.email)
+    while True:
+        clientes = suscritos.filter(CitCliente.id > puntero).with_entities(*columnas).order_by(CitCliente.id).limit(LOTE).all()
+        if not clientes:
+            break
+        puntero_anterior, puntero = puntero, clientes[-1].id
+        fragmentos.reservar_lote(boletin.id, numero, puntero_anterior, puntero, len(clientes))
         try:
-            sendgrid_client.client.mail.send.post(request_body=mail.get())
-        except Exception as error:
-            mensaje_error = f"ERROR al enviar mensaje: {str(error)}"
+            cartero.enviar_a_varios(
+                destinatarios=[cliente.email for cliente in clientes],
+                asunto=boletin.asunto,
+                contenido=contenidos,
+                sustituciones=[{SUSTITUIR_NOMBRE: f"{cliente.nombres} {cliente.apellido_primero} {cliente.apellido_segundo}"} for cliente in clientes],
+            )
+        except CorreoError as error:
+            fragmentos.cancelar_lote(boletin.id, numero, puntero_anterior)
+            mensaje_error = f"ERROR al enviar el fragmento {numero} del boletin {boletin.id} despues del cliente {puntero_anterior}: {str(error)}"
             set_task_error(mensaje_error)
             bitacora.error(mensaje_error)
             return mensaje_error
+        fragmentos.confirmar_lote(boletin.id, numero, len(clientes))
+        # Sumar en el boletin con un UPDATE para no pisar lo que suman los demás fragmentos
+        Boletin.query.filter_by(id=boletin.id).update({Boletin.enviados: Boletin.enviados + len(clientes)}, synchronize_session=False)
+        db.session.commit()
+        fragmentos.renovar_candado(boletin.id, numero)
+        enviados += len(clientes)
+        set_task_progress(min(99, 100 * enviados // max(total, 1)))
+
+    # Si es el último fragmento en terminar, el boletin queda ENVIADO
+    if fragmentos.terminar_fragmento(boletin.id, numero):
+        boletin.estado = "ENVIADO"
+        boletin.save()
 
     # Terminar tarea
-    set_task_progress(100)
-    mensaje_final = "Boletines enviados a " + ", ".join([destinatario["email"] for destinatario in destinatarios])
+    mensaje_final = f"Fragmento {numero} del boletin {boletin.id} terminado con {enviados} clientes"
+    set_task_progress(100, mensaje_final)
     bitacora.info(mensaje_final)
     return mensaje_final
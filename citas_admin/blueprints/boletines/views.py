@@ -4,17 +4,15 @@ Boletines, vistas
 from datetime import datetime
 import json
 
-from delta import html
-from flask import Blueprint, flash, redirect, render_template, request, url_for
+from flask import Blueprint, flash, redirect, render_template, url_for
 from flask_login import current_user, login_required
 
-from lib.datatables import get_datatable_parameters, output_datatable_json
+from lib.datatables import Filtro, filtrar_datatable, get_datatable_parameters, output_datatable_json, paginar_datatable
 from lib.safe_string import safe_string, safe_message
 
-from citas_admin.blueprints.bitacoras.models import Bitacora
+from citas_admin.blueprints.bitacoras.auditoria import registrar_bitacora
 from citas_admin.blueprints.boletines.forms import BoletinForm
 from citas_admin.blueprints.boletines.models import Boletin
-from citas_admin.blueprints.modulos.models import Modulo
 from citas_admin.blueprints.permisos.models import Permiso
 from citas_admin.blueprints.usuarios.decorators import permission_required
 
@@ -23,6 +21,13 @@ MODULO = "BOLETINES"
 boletines = Blueprint("boletines", __name__, template_folder="templates")
 
 
+def _convertir_html(contenido):
+    """Convertir el contenido de Quill a HTML"""
+    from delta import html  # Se carga hasta que se usa, tarda en importarse
+
+    return html.render(contenido["ops"])
+
+
 @boletines.before_request
 @login_required
 @permission_required(MODULO, Permiso.VER)
@@ -36,17 +41,15 @@ def datatable_json():
     # Tomar parámetros de Datatables
     draw, start, rows_per_page = get_datatable_parameters()
     # Consultar
-    consulta = Boletin.query
-    if "estatus" in request.form:
-        consulta = consulta.filter_by(estatus=request.form["estatus"])
-    else:
-        consulta = consulta.filter_by(estatus="A")
-    if "asunto" in request.form:
-        consulta = consulta.filter(Boletin.asunto.contains(request.form["asunto"]))
-    if "estado" in request.form:
-        consulta = consulta.filter_by(estado=request.form["estado"])
-    registros = consulta.order_by(Boletin.envio_programado.asc()).offset(start).limit(rows_per_page).all()
-    total = consulta.count()
+    consulta, _ = filtrar_datatable(
+        Boletin.query,
+        [
+            Filtro("estatus", Boletin.estatus, defecto="A"),
+            Filtro("asunto", Boletin.asunto, "contiene"),
+            Filtro("estado", Boletin.estado),
+        ],
+    )
+    registros, total, cursor = paginar_datatable(consulta, [Boletin.envio_programado], start, rows_per_page)
     # Elaborar datos para DataTable
     data = []
     for resultado in registros:
@@ -61,7 +64,7 @@ def datatable_json():
             }
         )
     # Entregar JSON
-    return output_datatable_json(draw, total, data)
+    return output_datatable_json(draw, total, data, cursor)
 
 
 @boletines.route("/boletines")
@@ -103,7 +106,7 @@ def detail(boletin_id):
     return render_template(
         "boletines/detail.jinja2",
         boletin=boletin,
-        contenido=html.render(boletin.contenido["ops"]),
+        contenido=_convertir_html(boletin.contenido),
     )
 
 
@@ -116,7 +119,7 @@ def preview(boletin_id):
         mensaje_asunto=boletin.asunto,
         fecha_elaboracion=datetime.now().strftime("%d/%b/%Y %I:%M %p"),
         destinatario_nombre="FULANO DE TAL",
-        mensaje_contenido=html.render(boletin.contenido["ops"]),
+        mensaje_contenido=_convertir_html(boletin.contenido),
     )
 
 
@@ -140,13 +143,12 @@ def new():
                 puntero=0,
             )
             boletin.save()
-            bitacora = Bitacora(
-                modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+            bitacora = registrar_bitacora(
+                modulo=MODULO,
                 usuario=current_user,
                 descripcion=safe_message(f"Nuevo Boletin {boletin.asunto}"),
                 url=url_for("boletines.detail", boletin_id=boletin.id),
             )
-            bitacora.save()
             flash(bitacora.descripcion, "success")
             return redirect(bitacora.url)
     return render_template("boletines/new.jinja2", form=form)
@@ -170,13 +172,12 @@ def edit(boletin_id):
             boletin.asunto = safe_string(form.asunto.data, to_uppercase=False, do_unidecode=False)
             boletin.contenido = form.contenido.data
             boletin.save()
-            bitacora = Bitacora(
-                modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+            bitacora = registrar_bitacora(
+                modulo=MODULO,
                 usuario=current_user,
                 descripcion=safe_message(f"Editado Boletin {boletin.asunto}"),
                 url=url_for("boletines.detail", boletin_id=boletin.id),
             )
-            bitacora.save()
             flash(bitacora.descripcion, "success")
             return redirect(bitacora.url)
     form.envio_programado.data = boletin.envio_programado
@@ -198,13 +199,12 @@ def delete(boletin_id):
     boletin = Boletin.query.get_or_404(boletin_id)
     if boletin.estatus == "A":
         boletin.delete()
-        bitacora = Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+        bitacora = registrar_bitacora(
+            modulo=MODULO,
             usuario=current_user,
             descripcion=safe_message(f"Eliminado Boletin {boletin.asunto}"),
             url=url_for("boletines.detail", boletin_id=boletin.id),
         )
-        bitacora.save()
         flash(bitacora.descripcion, "success")
     return redirect(url_for("boletines.detail", boletin_id=boletin.id))
 
@@ -216,12 +216,11 @@ def recover(boletin_id):
     boletin = Boletin.query.get_or_404(boletin_id)
     if boletin.estatus == "B":
         boletin.recover()
-        bitacora = Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+        bitacora = registrar_bitacora(
+            modulo=MODULO,
             usuario=current_user,
             descripcion=safe_message(f"Recuperado Boletin {boletin.asunto}"),
             url=url_for("boletines.detail", boletin_id=boletin.id),
         )
-        bitacora.save()
         flash(bitacora.descripcion, "success")
     return redirect(url_for("boletines.detail", boletin_id=boletin.id))
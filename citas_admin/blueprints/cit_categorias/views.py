@@ -2,16 +2,15 @@
 Cit Categorias, vistas
 """
 import json
-from flask import Blueprint, flash, redirect, render_template, request, url_for
+from flask import Blueprint, flash, redirect, render_template, url_for
 from flask_login import current_user, login_required
 
-from lib.datatables import get_datatable_parameters, output_datatable_json
+from lib.datatables import Filtro, filtrar_datatable, get_datatable_parameters, output_datatable_json, paginar_datatable
 from lib.safe_string import safe_string, safe_message
 
-from citas_admin.blueprints.bitacoras.models import Bitacora
+from citas_admin.blueprints.bitacoras.auditoria import registrar_bitacora
 from citas_admin.blueprints.cit_categorias.models import CitCategoria
 from citas_admin.blueprints.cit_categorias.forms import CitCategoriaForm
-from citas_admin.blueprints.modulos.models import Modulo
 from citas_admin.blueprints.permisos.models import Permiso
 from citas_admin.blueprints.usuarios.decorators import permission_required
 
@@ -33,13 +32,8 @@ def datatable_json():
     # Tomar parámetros de Datatables
     draw, start, rows_per_page = get_datatable_parameters()
     # Consultar
-    consulta = CitCategoria.query
-    if "estatus" in request.form:
-        consulta = consulta.filter_by(estatus=request.form["estatus"])
-    else:
-        consulta = consulta.filter_by(estatus="A")
-    registros = consulta.order_by(CitCategoria.id).offset(start).limit(rows_per_page).all()
-    total = consulta.count()
+    consulta, _ = filtrar_datatable(CitCategoria.query, [Filtro("estatus", CitCategoria.estatus, defecto="A")])
+    registros, total, cursor = paginar_datatable(consulta, [CitCategoria.id], start, rows_per_page)
     # Elaborar datos para DataTable
     data = []
     for resultado in registros:
@@ -52,7 +46,7 @@ def datatable_json():
             }
         )
     # Entregar JSON
-    return output_datatable_json(draw, total, data)
+    return output_datatable_json(draw, total, data, cursor)
 
 
 @cit_categorias.route("/cit_categorias")
@@ -98,13 +92,12 @@ def new():
         else:
             cit_categoria = CitCategoria(nombre=nombre)
             cit_categoria.save()
-            bitacora = Bitacora(
-                modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+            bitacora = registrar_bitacora(
+                modulo=MODULO,
                 usuario=current_user,
                 descripcion=safe_message(f"Nueva Categoria {cit_categoria.nombre}"),
                 url=url_for("cit_categorias.detail", cit_categoria_id=cit_categoria.id),
             )
-            bitacora.save()
             flash(bitacora.descripcion, "success")
             return redirect(bitacora.url)
     return render_template("cit_categorias/new.jinja2", form=form)
@@ -129,13 +122,12 @@ def edit(cit_categoria_id):
         if es_valido:
             cit_categoria.nombre = nombre
             cit_categoria.save()
-            bitacora = Bitacora(
-                modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+            bitacora = registrar_bitacora(
+                modulo=MODULO,
                 usuario=current_user,
                 descripcion=safe_message(f"Editado Categoria {cit_categoria.nombre}"),
                 url=url_for("cit_categorias.detail", cit_categoria_id=cit_categoria.id),
             )
-            bitacora.save()
             flash(bitacora.descripcion, "success")
             return redirect(bitacora.url)
     form.nombre.data = cit_categoria.nombre
@@ -149,13 +141,12 @@ def delete(cit_categoria_id):
     cit_categoria = CitCategoria.query.get_or_404(cit_categoria_id)
     if cit_categoria.estatus == "A":
         cit_categoria.delete()
-        bitacora = Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+        bitacora = registrar_bitacora(
+            modulo=MODULO,
             usuario=current_user,
             descripcion=safe_message(f"Eliminado Categoria {cit_categoria.nombre}"),
             url=url_for("cit_categorias.detail", cit_categoria_id=cit_categoria.id),
         )
-        bitacora.save()
         flash(bitacora.descripcion, "success")
     return redirect(url_for("cit_categorias.detail", cit_categoria_id=cit_categoria.id))
 
@@ -167,12 +158,11 @@ def recover(cit_categoria_id):
     cit_categoria = CitCategoria.query.get_or_404(cit_categoria_id)
     if cit_categoria.estatus == "B":
         cit_categoria.recover()
-        bitacora = Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+        bitacora = registrar_bitacora(
+            modulo=MODULO,
             usuario=current_user,
             descripcion=safe_message(f"Recuperado Categoria {cit_categoria.nombre}"),
             url=url_for("cit_categorias.detail", cit_categoria_id=cit_categoria.id),
         )
-        bitacora.save()
         flash(bitacora.descripcion, "success")
     return redirect(url_for("cit_categorias.detail", cit_categoria_id=cit_categoria.id))
@@ -0,0 +1,245 @@
+"""
+Cit Citas, disponibilidad de horarios
+
+Mantiene en Redis un arreglo de ocupacion por oficina y fecha para que horarios_json
+no tenga que consultar la base de datos en cada peticion.
+
+- cit_citas:disponibilidad:<oficina_id>:<YYYY-MM-DD> es un hash con
+    - apertura, cierre y limite_personas de la oficina (en minutos y personas)
+    - bloqueos, lista JSON de rangos [inicio, termino) en minutos
+    - citas:HH:MM contadores de citas que ocupan ese horario
+- cit_citas:disponibilidad:servicio:<cit_servicio_id> es un hash con desde, hasta y duracion en minutos
+
+- <llave>:generacion es un contador que sube con cada ajuste o descarte de esa llave
+
+Los contadores se ajustan al crear, eliminar, recuperar o cambiar el estado de una cita.
+Quien construye un arreglo lee antes la generacion y solo lo guarda si la llave sigue sin existir
+y la generacion no cambio, asi un ajuste hecho durante la construccion no se pierde con un arreglo viejo.
+Como el sistema de clientes tambien agenda citas en la misma base de datos, las llaves
+caducan despues de TTL_SEGUNDOS y se reconstruyen con la siguiente peticion.
+Si Redis no esta disponible, se calcula directamente desde la base de datos.
+"""
+from datetime import date, datetime, time
+import json
+
+from flask import current_app
+from redis.exceptions import RedisError
+
+from citas_admin.blueprints.cit_citas.models import CitCita
+from citas_admin.blueprints.cit_horas_bloqueadas.models import CitHoraBloqueada
+from citas_admin.blueprints.cit_servicios.models import CitServicio
+from citas_admin.blueprints.oficinas.models import Oficina
+
+LLAVE = "cit_citas:disponibilidad"
+LIMITE_EXTRA_PERSONAS = 2
+TTL_SEGUNDOS = 600
+
+# Subir la generacion e incrementar el contador solo si el arreglo ya fue construido, de lo contrario se construira completo
+INCREMENTAR_SI_EXISTE = """
+redis.call("INCR", KEYS[2])
+redis.call("EXPIRE", KEYS[2], ARGV[3])
+if redis.call("EXISTS", KEYS[1]) == 1 then
+    return redis.call("HINCRBY", KEYS[1], ARGV[1], ARGV[2])
+end
+return nil
+"""
+
+# Guardar el arreglo solo si sigue sin existir y la generacion es la leida antes de construirlo
+GUARDAR_SI_NO_CAMBIO = """
+if redis.call("EXISTS", KEYS[1]) == 0 and (redis.call("GET", KEYS[2]) or "") == ARGV[1] then
+    redis.call("HSET", KEYS[1], unpack(ARGV, 3))
+    redis.call("EXPIRE", KEYS[1], ARGV[2])
+    return 1
+end
+return 0
+"""
+
+
+def _llave_oficina_fecha(oficina_id: int, fecha: date):
+    """Llave del arreglo de ocupacion de una oficina en una fecha"""
+    return f"{LLAVE}:{oficina_id}:{fecha.isoformat()}"
+
+
+def _llave_servicio(cit_servicio_id: int):
+    """Llave de la configuracion de un servicio"""
+    return f"{LLAVE}:servicio:{cit_servicio_id}"
+
+
+def _llave_generacion(llave: str):
+    """Llave del contador de generacion de un arreglo"""
+    return f"{llave}:generacion"
+
+
+def _minutos(tiempo: time):
+    """Convertir un time a minutos desde la medianoche"""
+    return tiempo.hour * 60 + tiempo.minute
+
+
+def _hora_minutos(minutos: int):
+    """Convertir minutos desde la medianoche a texto HH:MM"""
+    return f"{minutos // 60:02d}:{minutos % 60:02d}"
+
+
+def ocupa_horario(estatus: str, estado: str):
+    """Una cita ocupa su horario si no esta eliminada ni cancelada"""
+    return estatus == "A" and estado != "CANCELO"
+
+
+def _construir_oficina_fecha(oficina_id: int, fecha: date):
+    """Construir desde la base de datos el arreglo de ocupacion de una oficina en una fecha"""
+
+    # Consultar la oficina
+    oficina = Oficina.query.get(oficina_id)
+    if oficina is None:
+        return None
+    arreglo = {
+        "apertura": _minutos(oficina.apertura),
+        "cierre": _minutos(oficina.cierre),
+        "limite_personas": oficina.limite_personas,
+    }
+
+    # Consultar las horas bloqueadas, el termino no se incluye en el bloqueo
+    bloqueos = []
+    cit_horas_bloqueadas = CitHoraBloqueada.query.filter_by(oficina_id=oficina_id).filter_by(fecha=fecha).filter_by(estatus="A")
+    for cit_hora_bloqueada in cit_horas_bloqueadas.all():
+        bloqueos.append([_minutos(cit_hora_bloqueada.inicio), _minutos(cit_hora_bloqueada.termino)])
+    arreglo["bloqueos"] = json.dumps(bloqueos)
+
+    # Contar las citas por su horario de inicio
+    inicio_dt = datetime.combine(fecha, time(0, 0, 0))
+    termino_dt = datetime.combine(fecha, time(23, 59, 59))
+    cit_citas = CitCita.query.with_entities(CitCita.inicio).filter_by(oficina_id=oficina_id).filter_by(estatus="A")
+    cit_citas = cit_citas.filter(CitCita.inicio >= inicio_dt).filter(CitCita.inicio <= termino_dt)
+    cit_citas = cit_citas.filter(CitCita.termino <= termino_dt).filter(CitCita.estado != "CANCELO")
+    for (inicio,) in cit_citas.all():
+        campo = f"citas:{inicio.strftime('%H:%M')}"
+        arreglo[campo] = arreglo.get(campo, 0) + 1
+
+    # Entregar
+    return arreglo
+
+
+def _construir_servicio(cit_servicio_id: int):
+    """Construir desde la base de datos la configuracion de un servicio"""
+    cit_servicio = CitServicio.query.get(cit_servicio_id)
+    if cit_servicio is None:
+        return None
+    return {
+        "desde": _minutos(cit_servicio.desde) if cit_servicio.desde else -1,
+        "hasta": _minutos(cit_servicio.hasta) if cit_servicio.hasta else -1,
+        "duracion": _minutos(cit_servicio.duracion),
+    }
+
+
+def _obtener(llave: str, construir):
+    """Obtener un hash de Redis, si no existe se construye y se guarda con caducidad"""
+    try:
+        pipeline = current_app.redis.pipeline(transaction=False)
+        pipeline.hgetall(llave)
+        pipeline.get(_llave_generacion(llave))
+        datos, generacion = pipeline.execute()
+    except RedisError:
+        return construir()
+    if datos:
+        return {campo.decode(): valor.decode() for campo, valor in datos.items()}
+    datos = construir()
+    if datos is None:
+        return None
+    campos_valores = [elemento for campo, valor in datos.items() for elemento in (campo, valor)]
+    try:
+        current_app.redis.eval(GUARDAR_SI_NO_CAMBIO, 2, llave, _llave_generacion(llave), generacion.decode() if generacion else "", TTL_SEGUNDOS, *campos_valores)
+    except RedisError:
+        pass
+    return datos
+
+
+def obtener_horarios(oficina_id: int, cit_servicio_id: int, fecha: date, desde_minutos: int = 0):
+    """Entregar los horarios de una oficina y servicio en una fecha, a partir de desde_minutos"""
+
+    # Obtener el arreglo de ocupacion de la oficina y la configuracion del servicio
+    oficina = _obtener(_llave_oficina_fecha(oficina_id, fecha), lambda: _construir_oficina_fecha(oficina_id, fecha))
+    servicio = _obtener(_llave_servicio(cit_servicio_id), lambda: _construir_servicio(cit_servicio_id))
+    if oficina is None or servicio is None:
+        return []
+
+    # Tomar los tiempos de la oficina, acotados por los del servicio
+    apertura = int(oficina["apertura"])
+    cierre = int(oficina["cierre"])
+    if int(servicio["desde"]) >= 0 and apertura < int(servicio["desde"]):
+        apertura = int(servicio["desde"])
+    if int(servicio["hasta"]) >= 0 and cierre > int(servicio["hasta"]):
+        cierre = int(servicio["hasta"])
+    duracion = int(servicio["duracion"])
+    if duracion <= 0:
+        return []
+    limite = int(oficina["limite_personas"]) + LIMITE_EXTRA_PERSONAS
+    bloqueos = json.loads(oficina["bloqueos"])
+
+    # Bucle por los intervalos
+    horarios = []
+    for minutos in range(apertura, cierre, duracion):
+        # Quitar las horas bloqueadas
+        if any(inicio <= minutos < termino for inicio, termino in bloqueos):
+            continue
+        # Quitar las horas que ya pasaron
+        if minutos <= desde_minutos:
+            continue
+        # Quitar las horas que alcanzaron el limite de personas
+        hora_minutos = _hora_minutos(minutos)
+        citas_agendadas = int(oficina.get(f"citas:{hora_minutos}", 0))
+        if citas_agendadas >= limite:
+            continue
+        # Acumular
+        horarios.append(
+            {
+                "value": hora_minutos,
+                "text": f"{hora_minutos} - {citas_agendadas} personas",
+                "disabled": False,
+            }
+        )
+
+    # Entregar
+    return horarios
+
+
+def ajustar_cita(cit_cita: CitCita, ocupaba: bool):
+    """Ajustar el contador del horario de una cita despues de crearla o cambiarla"""
+    ocupa = ocupa_horario(cit_cita.estatus, cit_cita.estado)
+    if ocupa == ocupaba:
+        return
+    llave = _llave_oficina_fecha(cit_cita.oficina_id, cit_cita.inicio.date())
+    campo = f"citas:{cit_cita.inicio.strftime('%H:%M')}"
+    try:
+        current_app.redis.eval(INCREMENTAR_SI_EXISTE, 2, llave, _llave_generacion(llave), campo, 1 if ocupa else -1, TTL_SEGUNDOS)
+    except RedisError:
+        invalidar_oficina(cit_cita.oficina_id, cit_cita.inicio.date())
+
+
+def _descartar(llaves: list):
+    """Borrar los arreglos y subir sus generaciones, asi no se guarda uno que se este construyendo"""
+    pipeline = current_app.redis.pipeline()
+    for llave in llaves:
+        pipeline.delete(llave)
+        pipeline.incr(_llave_generacion(llave))
+        pipeline.expire(_llave_generacion(llave), TTL_SEGUNDOS)
+    pipeline.execute()
+
+
+def invalidar_oficina(oficina_id: int, fecha: date = None):
+    """Descartar el arreglo de una oficina en una fecha o en todas las fechas"""
+    try:
+        if fecha is not None:
+            _descartar([_llave_oficina_fecha(oficina_id, fecha)])
+        else:
+            llaves = {llave.decode().removesuffix(":generacion") for llave in current_app.redis.scan_iter(f"{LLAVE}:{oficina_id}:*")}
+            _descartar(sorted(llaves))
+    except RedisError:
+        pass
+
+
+def invalidar_servicio(cit_servicio_id: int):
+    """Descartar la configuracion de un servicio"""
+    try:
+        _descartar([_llave_servicio(cit_servicio_id)])
+    except RedisError:
+        pass
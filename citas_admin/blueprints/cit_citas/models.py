@@ -24,6 +24,7 @@ class CitCita(db.Model, UniversalMixin):
 
     # Nombre de la tabla
     __tablename__ = "cit_citas"
+    __table_args__ = (db.Index("ix_cit_citas_pendientes_inicio", "inicio", postgresql_where=db.text("estado = 'PENDIENTE' AND estatus = 'A'")),)
 
     # Clave primaria
     id = db.Column(db.Integer, primary_key=True)
@@ -59,6 +60,11 @@ class CitCita(db.Model, UniversalMixin):
             return ahora_sin_tz < self.inicio
         return ahora_sin_tz < self.cancelar_antes
 
+    @classmethod
+    def condiciones_inasistencia(cls, fecha_limite):
+        """Condiciones de las citas PENDIENTES que pasan a INASISTENCIA, las que inician hasta fecha_limite"""
+        return [cls.estado == "PENDIENTE", cls.inicio <= fecha_limite, cls.estatus == "A"]
+
     def __repr__(self):
         """Representación"""
         return f"<CitCita {self.id}>"
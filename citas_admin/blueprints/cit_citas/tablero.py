@@ -0,0 +1,107 @@
+"""
+Cit Citas, tablero en vivo por oficina
+
+En lugar de recargar el listado de citas, el navegador de la oficina abre un socket (Flask-SocketIO)
+y se suscribe a la sala oficina:<oficina_id>:<YYYY-MM-DD>
+
+- Al suscribirse recibe el tablero: las citas del día con su hora, estado, cliente y servicio
+- Al crear una cita, marcar ASISTIO, regresarla a PENDIENTE, eliminarla o recuperarla, la vista
+  publica solo esa cita en la sala y el navegador recalcula las citas por horario,
+  las asistencias y las próximas llegadas
+- Con SOCKETIO_MESSAGE_QUEUE (por defecto REDIS_URL) lo publicado por cualquier proceso web llega
+  a los sockets conectados en todos los demás
+
+Las citas que agenda el sistema de clientes no se publican, por eso el navegador vuelve a pedir
+el tablero cada TABLERO_SEGUNDOS y al reconectarse.
+"""
+from datetime import date, datetime, time
+
+from flask import url_for
+from flask_login import current_user
+from flask_socketio import join_room, leave_room
+from redis.exceptions import RedisError
+from sqlalchemy.orm import joinedload
+
+from citas_admin.extensions import socketio
+from citas_admin.blueprints.cit_citas.disponibilidad import ocupa_horario
+from citas_admin.blueprints.cit_citas.models import CitCita
+
+MODULO = "CIT CITAS"
+EVENTO = "cita"
+TABLERO_SEGUNDOS = 600
+
+
+def sala(oficina_id: int, fecha: date):
+    """Nombre de la sala de una oficina en una fecha"""
+    return f"oficina:{oficina_id}:{fecha.isoformat()}"
+
+
+def puede_ver_oficina(oficina_id: int):
+    """¿El usuario puede ver las citas de la oficina?"""
+    if current_user.can_admin(MODULO) or current_user.oficina_id == oficina_id:
+        return True
+    return oficina_id in current_user.oficinas_ids
+
+
+def elaborar_cita(cit_cita: CitCita):
+    """Datos de una cita para el tablero"""
+    return {
+        "id": cit_cita.id,
+        "hora": cit_cita.inicio.strftime("%H:%M"),
+        "inicio": cit_cita.inicio.isoformat(),
+        "estado": cit_cita.estado,
+        "ocupa": ocupa_horario(cit_cita.estatus, cit_cita.estado),
+        "cliente": cit_cita.cit_cliente.nombre,
+        "servicio": cit_cita.cit_servicio.clave,
+        "url": url_for("cit_citas.detail", cit_cita_id=cit_cita.id),
+    }
+
+
+def elaborar_tablero(oficina_id: int, fecha: date):
+    """Tablero de una oficina en una fecha, con una sola consulta"""
+    cit_citas = (
+        CitCita.query.options(joinedload(CitCita.cit_cliente), joinedload(CitCita.cit_servicio))
+        .filter(CitCita.oficina_id == oficina_id)
+        .filter(CitCita.inicio >= datetime.combine(fecha, time.min))
+        .filter(CitCita.inicio <= datetime.combine(fecha, time.max))
+        .filter(CitCita.estatus == "A")
+        .order_by(CitCita.inicio, CitCita.id)
+    )
+    return {
+        "oficina_id": oficina_id,
+        "fecha": fecha.isoformat(),
+        "citas": [elaborar_cita(cit_cita) for cit_cita in cit_citas],
+    }
+
+
+def publicar_cita(cit_cita: CitCita):
+    """Publicar en la sala de su oficina y fecha la cita que cambió, una eliminada se publica sin ocupar"""
+    try:
+        socketio.emit(EVENTO, elaborar_cita(cit_cita), to=sala(cit_cita.oficina_id, cit_cita.inicio.date()))
+    except RedisError:
+        pass  # Los tableros se ponen al día la siguiente vez que piden el tablero
+
+
+@socketio.on("suscribir")
+def suscribir(datos):
+    """Entrar a la sala de una oficina y fecha, entrega el tablero"""
+    if not current_user.is_authenticated or not current_user.can_view(MODULO):
+        return {"error": "No autorizado"}
+    try:
+        oficina_id = int(datos["oficina_id"])
+        fecha = date.fromisoformat(datos["fecha"])
+    except (KeyError, TypeError, ValueError):
+        return {"error": "Oficina o fecha no válidas"}
+    if not puede_ver_oficina(oficina_id):
+        return {"error": "No autorizado"}
+    join_room(sala(oficina_id, fecha))
+    return elaborar_tablero(oficina_id, fecha)
+
+
+@socketio.on("abandonar")
+def abandonar(datos):
+    """Salir de la sala de una oficina y fecha"""
+    try:
+        leave_room(sala(int(datos["oficina_id"]), date.fromisoformat(datos["fecha"])))
+    except (KeyError, TypeError, ValueError):
+        pass
@@ -1,20 +1,20 @@
 """
 Cit Citas, tareas para ejecutar en el fondo
 """
-from datetime import datetime, timedelta
+from datetime import date, datetime, time, timedelta
 import locale
 import logging
 import os
-import sendgrid
 
 from dotenv import load_dotenv
-from sendgrid.helpers.mail import Email, To, Content, Mail
-from jinja2 import Environment, FileSystemLoader
-from sqlalchemy import text
+from sqlalchemy.orm import joinedload
 
+from lib.correos import CorreoError, obtener_cartero
+from lib.plantillas import obtener_plantilla
 from lib.tasks import set_task_progress, set_task_error
+from lib import transiciones
 
-from citas_admin.app import create_app
+from citas_admin.app import create_worker_app
 from citas_admin.extensions import db
 
 from citas_admin.blueprints.cit_citas.models import CitCita
@@ -29,15 +29,14 @@ empunadura = logging.FileHandler("cit_citas.log")
 empunadura.setFormatter(formato)
 bitacora.addHandler(empunadura)
 
-app = create_app()
+app = create_worker_app()
 db.app = app
 
 load_dotenv()  # Take environment variables from .env
 
-SENDGRID_API_KEY = os.getenv("SENDGRID_API_KEY", "")
-SENDGRID_FROM_EMAIL = os.getenv("SENDGRID_FROM_EMAIL", "")
 HOST = os.getenv("HOST", "")
 SUBJECT_PREFIX = "PJECZ Sistema de Citas - "
+NOTIFICACIONES_POR_TAREA = 200
 
 
 def enviar_pendiente(cit_cita_id, to_email=None):
@@ -82,8 +81,7 @@ def enviar_pendiente(cit_cita_id, to_email=None):
     # Enviar mensaje por correo electronico
     to_email = cit_cliente.email if to_email is None else to_email
     subject = SUBJECT_PREFIX + "Cita agendada"
-    content = Content("text/html", contenidos)
-    if _enviar_email(to_email=to_email, subject=subject, content=content):
+    if _enviar_email(to_email=to_email, subject=subject, content=contenidos):
         if va_a_incluir_qr:
             mensaje_final = f"Mensaje con QR a {to_email} por cita PENDIENTE {cit_cita.id}, URL: {asistencia_url}"
         else:
@@ -124,8 +122,7 @@ def enviar_cancelado(cit_cita_id, to_email=None):
     # Enviar mensaje por correo electronico
     to_email = cit_cliente.email if to_email is None else to_email
     subject = SUBJECT_PREFIX + "Cita cancelada"
-    content = Content("text/html", contenidos)
-    if _enviar_email(to_email=to_email, subject=subject, content=content):
+    if _enviar_email(to_email=to_email, subject=subject, content=contenidos):
         mensaje_final = f"Mensaje a {to_email} por cita CANCELADA {cit_cita.id}"
         bitacora.info(mensaje_final)
     else:
@@ -163,8 +160,7 @@ def enviar_asistio(cit_cita_id, to_email=None):
     # Enviar mensaje por correo electronico
     to_email = cit_cliente.email if to_email is None else to_email
     subject = SUBJECT_PREFIX + "Asistencia a cita"
-    content = Content("text/html", contenidos)
-    if _enviar_email(to_email=to_email, subject=subject, content=content):
+    if _enviar_email(to_email=to_email, subject=subject, content=contenidos):
         mensaje_final = f"Mensaje a {to_email} por cita ASISTIO {cit_cita.id}"
         bitacora.info(mensaje_final)
     else:
@@ -202,8 +198,7 @@ def enviar_inasistencia(cit_cita_id, to_email=None):
     # Enviar mensaje por correo electronico
     to_email = cit_cliente.email if to_email is None else to_email
     subject = SUBJECT_PREFIX + "Cita agendada"
-    content = Content("text/html", contenidos)
-    if _enviar_email(to_email=to_email, subject=subject, content=content):
+    if _enviar_email(to_email=to_email, subject=subject, content=contenidos):
         mensaje_final = f"Mensaje a {to_email} por cita INASISTENCIA {cit_cita.id}"
         bitacora.info(mensaje_final)
     else:
@@ -217,36 +212,72 @@ def enviar_inasistencia(cit_cita_id, to_email=None):
     return mensaje_final
 
 
-def marcar_inasistencia(test=True):
-    """Actualizar el estado de las citas a PENDIENTE a INASISTENCIA"""
+def enviar_inasistencias(cit_citas_ids):
+    """Enviar los mensajes de inasistencia de un grupo de citas, con una consulta y en paralelo"""
 
-    # Calcular fecha de vencimiento
-    fecha_actual = datetime.now()
-    fecha_limite = datetime(
-        year=fecha_actual.year,
-        month=fecha_actual.month,
-        day=fecha_actual.day,
-        hour=23,
-        minute=59,
-        second=59,
-    )
-    fecha_limite = fecha_limite - timedelta(days=1)
-
-    # Si no esta en modo prueba, se ejecutan las actualizaciones
-    if test is False:
-        engine = db.engine
-        actualizacion = text(
-            f"UPDATE cit_citas \
-                SET estado = 'INASISTENCIA' \
-                WHERE estado = 'PENDIENTE' AND inicio <= '{fecha_limite.strftime('%y%m%d %H:%M')}' \
-                AND estatus = 'A'"
-        )
-        res = engine.execute(actualizacion)
-        mensaje_final = f"Se pasaron {res.rowcount} citas al estado de INASISTENCIA"
+    # Definir el cartero, si falta la configuración se termina
+    try:
+        cartero = obtener_cartero()
+    except CorreoError as error:
+        mensaje_error = str(error)
+        set_task_error(mensaje_error)
+        bitacora.error(mensaje_error)
+        return mensaje_error
+
+    # Consultar las citas con sus clientes y elaborar los mensajes con la misma plantilla
+    citas = CitCita.query.options(joinedload(CitCita.cit_cliente)).filter(CitCita.id.in_(cit_citas_ids)).filter_by(estatus="A").order_by(CitCita.id).all()
+    citas = [cit_cita for cit_cita in citas if cit_cita.cit_cliente.estatus == "A"]
+    plantilla = _cargar_plantilla("email_no_assistance.jinja2")
+    fecha_elaboracion = datetime.now().strftime("%d/%b/%Y %I:%M %p")
+    subject = SUBJECT_PREFIX + "Cita agendada"
+    mensajes = [(cit_cita.cit_cliente.email, subject, plantilla.render(fecha_elaboracion=fecha_elaboracion, cit_cliente=cit_cita.cit_cliente, cit_cita=cit_cita)) for cit_cita in citas]
+    errores = cartero.enviar_lote(mensajes)
+
+    # Contar los enviados
+    contador = 0
+    for cit_cita, mensaje, error in zip(citas, mensajes, errores):
+        if error is not None:
+            bitacora.error("ERROR al enviar la inasistencia de la cita %s a %s: %s", cit_cita.id, mensaje[0], str(error))
+            continue
+        contador += 1
+
+    # Se termina la tarea y se entrega el mensaje final
+    set_task_progress(100)
+    mensaje_final = f"Se enviaron {contador} de {len(cit_citas_ids)} mensajes de INASISTENCIA"
+    bitacora.info(mensaje_final)
+    return mensaje_final
+
+
+def marcar_inasistencia(test=True, enviar=False):
+    """Actualizar el estado de las citas a PENDIENTE a INASISTENCIA
+
+    - test: solo contar las citas
+    - enviar: agregar una tarea enviar_inasistencias por cada grupo de NOTIFICACIONES_POR_TAREA citas cambiadas
+    """
+
+    # Calcular fecha de vencimiento, el fin del día de ayer
+    fecha_limite = datetime.combine(date.today() - timedelta(days=1), time(23, 59, 59))
+    condiciones = CitCita.condiciones_inasistencia(fecha_limite)
+
+    # Si esta en modo de prueba, solo se cuentan
+    if test is True:
+        mensaje_final = f"MODO DE PRUEBA: Se pasarían {transiciones.contar(CitCita, condiciones)} citas al estado de INASISTENCIA"
         bitacora.info(mensaje_final)
+        set_task_progress(100)
+        return mensaje_final
+
+    # Cambiar por lotes y, si se pide, agregar las tareas para enviar los mensajes
+    contador = 0
+    for ids in transiciones.transicionar(CitCita, condiciones, {"estado": "INASISTENCIA"}):
+        contador += len(ids)
+        if enviar is True:
+            for grupo in transiciones.en_grupos(ids, NOTIFICACIONES_POR_TAREA):
+                app.task_queue.enqueue("citas_admin.blueprints.cit_citas.tasks.enviar_inasistencias", cit_citas_ids=grupo)
 
     # Se termina la tarea y se entrega el mensaje final
     set_task_progress(100)
+    mensaje_final = f"Se pasaron {contador} citas al estado de INASISTENCIA"
+    bitacora.info(mensaje_final)
     return mensaje_final
 
 
@@ -288,36 +319,15 @@ def _validar_cliente(cit_cliente_id):
 
 
 def _cargar_plantilla(nombre_plantilla):
-    """Cargar la plantilla Jinja2"""
-    entorno = Environment(
-        loader=FileSystemLoader("citas_admin/blueprints/cit_citas/templates/cit_citas"),
-        trim_blocks=True,
-        lstrip_blocks=True,
-    )
-    plantilla = entorno.get_template(nombre_plantilla)
-    return plantilla
+    """Cargar la plantilla Jinja2, compilada una sola vez por proceso"""
+    return obtener_plantilla("cit_citas", nombre_plantilla)
 
 
 def _enviar_email(to_email, subject, content) -> bool:
-    """Enviar el mensaje con SendGrid"""
-
-    # Validar remitente
-    from_email = None
-    if SENDGRID_FROM_EMAIL != "":
-        from_email = Email(SENDGRID_FROM_EMAIL)
-    else:
-        return False
-
-    # Validar SendGrid
-    sendgrid_client = None
-    if SENDGRID_API_KEY != "":
-        sendgrid_client = sendgrid.SendGridAPIClient(api_key=SENDGRID_API_KEY)
-    else:
+    """Enviar el mensaje con el cartero compartido"""
+    try:
+        obtener_cartero().enviar(to_email, subject, content)
+    except CorreoError as error:
+        bitacora.error(str(error))
         return False
-
-    # Enviar mensaje
-    mail = Mail(from_email, To(to_email), subject, content)
-    sendgrid_client.client.mail.send.post(request_body=mail.get())
-
-    # Entregar verdadero
     return True
@@ -7,29 +7,26 @@ import json
 from flask import Blueprint, flash, redirect, render_template, request, url_for, abort
 from flask_login import current_user, login_required
 from pytz import timezone
-from sqlalchemy import or_
 
-from lib.datatables import get_datatable_parameters, output_datatable_json
+from lib.datatables import Filtro, filtrar_datatable, get_datatable_parameters, output_datatable_json, paginar_datatable
 from lib.safe_string import safe_message, safe_string, safe_text
 from lib.pwgen import generar_codigo_asistencia
 
-from citas_admin.blueprints.bitacoras.models import Bitacora
+from citas_admin.blueprints.bitacoras.auditoria import registrar_bitacora
 from citas_admin.blueprints.cit_citas.models import CitCita
 from citas_admin.blueprints.cit_clientes.models import CitCliente
-from citas_admin.blueprints.cit_horas_bloqueadas.models import CitHoraBloqueada
 from citas_admin.blueprints.cit_oficinas_servicios.models import CitOficinaServicio
 from citas_admin.blueprints.cit_servicios.models import CitServicio
-from citas_admin.blueprints.modulos.models import Modulo
 from citas_admin.blueprints.oficinas.models import Oficina
 from citas_admin.blueprints.permisos.models import Permiso
 from citas_admin.blueprints.usuarios.decorators import permission_required
 from citas_admin.blueprints.usuarios_oficinas.models import UsuarioOficina
 
+from citas_admin.blueprints.cit_citas import disponibilidad, tablero
 from citas_admin.blueprints.cit_citas.forms import CitCitaSearchForm, CitCitaSearchAdminForm, CitCitaAssistance, CitCitaNew
 
 HUSO_HORARIO = "America/Mexico_City"
 LIMITE_CITAS = 5
-LIMITE_EXTRA_PERSONAS = 2
 MODULO = "CIT CITAS"
 MINUTOS_MARGEN = 5
 
@@ -51,51 +48,32 @@ def datatable_json():
     draw, start, rows_per_page = get_datatable_parameters()
 
     # Consultar
-    consulta = CitCita.query
-    if "estatus" in request.form:
-        consulta = consulta.filter_by(estatus=request.form["estatus"])
-    else:
-        consulta = consulta.filter_by(estatus="A")
-    if "id" in request.form:
-        consulta = consulta.filter_by(id=request.form["id"])
-    if "cit_cliente_id" in request.form:
-        consulta = consulta.filter_by(cit_cliente_id=request.form["cit_cliente_id"])
-    if "cit_cliente" in request.form:
-        consulta = consulta.join(CitCliente)
-        consulta = consulta.filter(CitCliente.nombres.contains(request.form["cit_cliente"]))
-    if "cit_cliente_email" in request.form:
-        consulta = consulta.join(CitCliente)
-        consulta = consulta.filter(CitCliente.email.contains(request.form["cit_cliente_email"]))
-    if "oficina_id" in request.form:
-        consulta = consulta.filter_by(oficina_id=request.form["oficina_id"])
-    if "nombre_completo" in request.form:
-        palabras = safe_string(request.form["nombre_completo"]).split(" ")
-        consulta = consulta.join(CitCliente)
-        for palabra in palabras:
-            consulta = consulta.filter(or_(CitCliente.nombres.contains(palabra), CitCliente.apellido_primero.contains(palabra), CitCliente.apellido_segundo.contains(palabra)))
-    if "cit_servicio_id" in request.form:
-        consulta = consulta.filter_by(cit_servicio_id=request.form["cit_servicio_id"])
-    else:
-        if "distrito_id" in request.form:
-            consulta = consulta.join(Oficina)
-            consulta = consulta.filter_by(distrito_id=request.form["distrito_id"])
-    if "fecha" in request.form and request.form["fecha"] != "":
-        fecha = datetime.strptime(request.form["fecha"], "%Y-%m-%d")
-        inicio_dt = datetime(year=fecha.year, month=fecha.month, day=fecha.day, hour=0, minute=0, second=0)
-        termino_dt = datetime(year=fecha.year, month=fecha.month, day=fecha.day, hour=23, minute=59, second=59)
-        consulta = consulta.filter(CitCita.inicio >= inicio_dt).filter(CitCita.inicio <= termino_dt)
+    consulta, filtrado = filtrar_datatable(
+        CitCita.query,
+        [
+            Filtro("estatus", CitCita.estatus, defecto="A"),
+            Filtro("id", CitCita.id),
+            Filtro("cit_cliente_id", CitCita.cit_cliente_id),
+            Filtro("cit_cliente", [CitCliente.nombres, CitCliente.busqueda], "campos", unir=CitCliente),
+            Filtro("cit_cliente_email", [CitCliente.email, CitCliente.busqueda], "campos", unir=CitCliente),
+            Filtro("oficina_id", CitCita.oficina_id),
+            Filtro("nombre_completo", [CitCliente.nombres, CitCliente.apellido_primero, CitCliente.apellido_segundo, CitCliente.busqueda], "campos", unir=CitCliente),
+            Filtro("cit_servicio_id", CitCita.cit_servicio_id),
+            Filtro("distrito_id", Oficina.distrito_id, unir=Oficina),
+            Filtro("fecha", CitCita.inicio, "fecha"),
+        ],
+    )
 
     # Si es admin, ordenar por id, si es juzgado ordenar por fecha
     if current_user.can_admin(MODULO):
-        registros = consulta.order_by(CitCita.id.desc()).offset(start).limit(rows_per_page).all()
+        registros, total, cursor = paginar_datatable(consulta, [CitCita.id], start, rows_per_page, descendente=True, estimar=not filtrado, relaciones=[CitCita.cit_cliente, CitCita.cit_servicio, CitCita.oficina])
     else:
         # No mostrar a los juzgados la citas canceladas
         consulta = consulta.filter(CitCita.estado != "CANCELO")
-        if rows_per_page == -1:
-            registros = consulta.order_by(CitCita.inicio).all()
-        else:
-            registros = consulta.order_by(CitCita.inicio).offset(start).limit(rows_per_page).all()
-    total = consulta.count()
+        registros, total, cursor = paginar_datatable(consulta, [CitCita.inicio], start, rows_per_page, relaciones=[CitCita.cit_cliente, CitCita.cit_servicio, CitCita.oficina])
+
+    # Consultar los permisos una sola vez y no en cada renglon
+    puede_ver = {modulo: current_user.can_view(modulo) for modulo in ("CIT CLIENTES", "CIT SERVICIOS", "OFICINAS")}
 
     # Elaborar datos para DataTable
     data = []
@@ -108,16 +86,16 @@ def datatable_json():
                 },
                 "cit_cliente": {
                     "nombre": cita.cit_cliente.nombre,
-                    "url": url_for("cit_clientes.detail", cit_cliente_id=cita.cit_cliente.id) if current_user.can_view("CIT CLIENTES") else "",
+                    "url": url_for("cit_clientes.detail", cit_cliente_id=cita.cit_cliente.id) if puede_ver["CIT CLIENTES"] else "",
                 },
                 "cit_servicio": {
                     "clave": cita.cit_servicio.clave,
-                    "url": url_for("cit_servicios.detail", cit_servicio_id=cita.cit_servicio.id) if current_user.can_view("CIT SERVICIOS") else "",
+                    "url": url_for("cit_servicios.detail", cit_servicio_id=cita.cit_servicio.id) if puede_ver["CIT SERVICIOS"] else "",
                     "descripcion": cita.cit_servicio.descripcion,
                 },
                 "oficina": {
                     "clave": cita.oficina.clave,
-                    "url": url_for("oficinas.detail", oficina_id=cita.oficina.id) if current_user.can_view("OFICINAS") else "",
+                    "url": url_for("oficinas.detail", oficina_id=cita.oficina.id) if puede_ver["OFICINAS"] else "",
                     "descripcion": cita.oficina.descripcion,
                 },
                 "creado": cita.creado.strftime("%Y-%m-%d %H:%M"),
@@ -130,7 +108,7 @@ def datatable_json():
         )
 
     # Entregar JSON
-    return output_datatable_json(draw, total, data)
+    return output_datatable_json(draw, total, data, cursor)
 
 
 @cit_citas.route("/cit_citas", methods=["POST", "GET"])
@@ -171,7 +149,7 @@ def list_active():
         )
 
     # Verificamos si tiene asignadas varias oficinas
-    oficinas_usr = UsuarioOficina.query.join(Oficina).filter(UsuarioOficina.usuario_id == current_user.id).filter_by(estatus="A").order_by(Oficina.descripcion_corta).all()
+    oficinas_usr = Oficina.query.filter(Oficina.id.in_(current_user.oficinas_ids)).order_by(Oficina.descripcion_corta).all()
 
     # NO es administrador, entregar las citas de su propia oficina
     return render_template(
@@ -186,6 +164,37 @@ def list_active():
     )
 
 
+@cit_citas.route("/cit_citas/tablero")
+def board():
+    """Tablero en vivo de las citas del día de una oficina"""
+
+    # Oficinas que puede ver
+    if current_user.can_admin(MODULO):
+        oficinas = Oficina.query.filter_by(estatus="A").filter_by(puede_agendar_citas=True).order_by(Oficina.clave).all()
+    else:
+        oficinas = Oficina.query.filter(Oficina.id.in_(current_user.oficinas_ids)).order_by(Oficina.descripcion_corta).all()
+        if current_user.oficina_id not in current_user.oficinas_ids:
+            oficinas.insert(0, Oficina.query.get(current_user.oficina_id))
+
+    # La oficina puede venir como argumento, si no es la del usuario
+    oficina_id = request.args.get("oficina_id", current_user.oficina_id, type=int)
+    if not any(oficina.id == oficina_id for oficina in oficinas):
+        abort(403)
+
+    # La fecha es la de hoy en el huso horario de las oficinas
+    fecha = datetime.now(timezone("UTC")).astimezone(timezone(HUSO_HORARIO)).date()
+
+    # Entregar
+    return render_template(
+        "cit_citas/board.jinja2",
+        titulo="Tablero de citas",
+        oficinas=oficinas,
+        oficina_id=oficina_id,
+        fecha=fecha.isoformat(),
+        tablero_segundos=tablero.TABLERO_SEGUNDOS,
+    )
+
+
 @cit_citas.route("/cit_citas/inactivos")
 @permission_required(MODULO, Permiso.MODIFICAR)
 def list_inactive():
@@ -250,13 +259,8 @@ def detail(cit_cita_id):
     if current_user.can_admin(MODULO):
         return render_template("cit_citas/detail.jinja2", cit_cita=cit_cita, marcar_asistencia=marcar_asistencia)
 
-    # Si no es administrador, solo puede ver los detalles de una cita de su propia oficina
-    if cit_cita.oficina == current_user.oficina:
-        return render_template("cit_citas/detail.jinja2", cit_cita=cit_cita, marcar_asistencia=marcar_asistencia)
-
-    # Si tiene acceso a varias oficinas
-    oficinas = UsuarioOficina.query.filter_by(usuario=current_user).filter_by(oficina=cit_cita.oficina).filter_by(estatus="A").first()
-    if oficinas is not None:
+    # Si no es administrador, solo puede ver los detalles de una cita de su propia oficina o de las que tiene asignadas
+    if cit_cita.oficina_id == current_user.oficina_id or cit_cita.oficina_id in current_user.oficinas_ids:
         return render_template("cit_citas/detail.jinja2", cit_cita=cit_cita, marcar_asistencia=marcar_asistencia)
 
     # No puede ver la cita
@@ -272,19 +276,21 @@ def delete(cit_cita_id):
     cit_cita = CitCita.query.get_or_404(cit_cita_id)
 
     # Si no es administrador, no puede eliminar un cita de otra oficina
-    if not current_user.can_admin(MODULO) and cit_cita.oficina != current_user.oficina:
+    if not current_user.can_admin(MODULO) and cit_cita.oficina_id != current_user.oficina_id:
         abort(403)
 
     # Si tiene estatus "A", eliminar
     if cit_cita.estatus == "A":
+        ocupaba = disponibilidad.ocupa_horario(cit_cita.estatus, cit_cita.estado)
         cit_cita.delete()
-        bitacora = Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+        disponibilidad.ajustar_cita(cit_cita, ocupaba)
+        tablero.publicar_cita(cit_cita)
+        bitacora = registrar_bitacora(
+            modulo=MODULO,
             usuario=current_user,
             descripcion=safe_message(f"Eliminado Cita {cit_cita.id}"),
             url=url_for("cit_citas.detail", cit_cita_id=cit_cita.id),
         )
-        bitacora.save()
         flash(bitacora.descripcion, "success")
     return redirect(url_for("cit_citas.detail", cit_cita_id=cit_cita.id))
 
@@ -298,19 +304,21 @@ def recover(cit_cita_id):
     cit_cita = CitCita.query.get_or_404(cit_cita_id)
 
     # Si no es administrador, no puede eliminar un cita de otra oficina
-    if not current_user.can_admin(MODULO) and cit_cita.oficina != current_user.oficina:
+    if not current_user.can_admin(MODULO) and cit_cita.oficina_id != current_user.oficina_id:
         abort(403)
 
     # Si tiene estatus "B", recuperar
     if cit_cita.estatus == "B":
+        ocupaba = disponibilidad.ocupa_horario(cit_cita.estatus, cit_cita.estado)
         cit_cita.recover()
-        bitacora = Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+        disponibilidad.ajustar_cita(cit_cita, ocupaba)
+        tablero.publicar_cita(cit_cita)
+        bitacora = registrar_bitacora(
+            modulo=MODULO,
             usuario=current_user,
             descripcion=safe_message(f"Recuperado Cita {cit_cita.id}"),
             url=url_for("cit_citas.detail", cit_cita_id=cit_cita.id),
         )
-        bitacora.save()
         flash(bitacora.descripcion, "success")
     return redirect(url_for("cit_citas.detail", cit_cita_id=cit_cita.id))
 
@@ -348,16 +356,18 @@ def assistance(cit_cita_id, qr=False):
             return redirect(url_for("cit_citas.assistance", cit_cita_id=cit_cita.id))
 
         # Actualizar la cita
+        ocupaba = disponibilidad.ocupa_horario(cit_cita.estatus, cit_cita.estado)
         cit_cita.estado = "ASISTIO"
         cit_cita.asistencia = True
         cit_cita.save()
-        bitacora = Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+        disponibilidad.ajustar_cita(cit_cita, ocupaba)
+        tablero.publicar_cita(cit_cita)
+        bitacora = registrar_bitacora(
+            modulo=MODULO,
             usuario=current_user,
             descripcion=safe_message(f"Asistencia correcta en la Cita {cit_cita.id}"),
             url=url_for("cit_citas.detail", cit_cita_id=cit_cita.id),
         )
-        bitacora.save()
         flash(bitacora.descripcion, "success")
 
         # Lanzar tarea en el fondo
@@ -387,7 +397,7 @@ def pending(cit_cita_id):
     cit_cita = CitCita.query.get_or_404(cit_cita_id)
 
     # Si no es administrador, no puede desmarcar una asistencia de una cita de otra oficina
-    if not current_user.can_admin(MODULO) and cit_cita.oficina != current_user.oficina:
+    if not current_user.can_admin(MODULO) and cit_cita.oficina_id != current_user.oficina_id:
         abort(403)
 
     # No se puede marcar la des-asistencia de una cita que no este en estado de asistio
@@ -397,16 +407,18 @@ def pending(cit_cita_id):
 
     # Si el estatus es "A"
     if cit_cita.estatus == "A":
+        ocupaba = disponibilidad.ocupa_horario(cit_cita.estatus, cit_cita.estado)
         cit_cita.estado = "PENDIENTE"
         cit_cita.asistencia = False
         cit_cita.save()
-        bitacora = Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+        disponibilidad.ajustar_cita(cit_cita, ocupaba)
+        tablero.publicar_cita(cit_cita)
+        bitacora = registrar_bitacora(
+            modulo=MODULO,
             usuario=current_user,
             descripcion=safe_message(f"Cambiado estado de la Cita {cit_cita.id} a Pendiente"),
             url=url_for("cit_citas.detail", cit_cita_id=cit_cita.id),
         )
-        bitacora.save()
         flash(bitacora.descripcion, "success")
 
     # Entregar
@@ -424,7 +436,7 @@ def search():
         busqueda = {"estatus": "A"}
         titulos = []
         if form_search.cliente.data:
-            cliente = safe_string(form_search.cliente.data)
+            cliente = safe_string(form_search.cliente.data, save_enie=True)
             if cliente != "":
                 busqueda["cit_cliente"] = cliente
                 titulos.append("cit_cliente " + cliente)
@@ -556,13 +568,14 @@ def new(cit_cliente_id):
             codigo_asistencia=generar_codigo_asistencia(),
         )
         cit_cita.save()
-        bitacora = Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+        disponibilidad.ajustar_cita(cit_cita, ocupaba=False)
+        tablero.publicar_cita(cit_cita)
+        registrar_bitacora(
+            modulo=MODULO,
             usuario=current_user,
             descripcion=safe_message(f"Cita Inmediata Creada {cit_cita.id}"),
             url=url_for("cit_citas.detail", cit_cita_id=cit_cita.id),
         )
-        bitacora.save()
 
         # Mostrar resultado
         flash(
@@ -612,132 +625,9 @@ def horarios_json(oficina_id, servicio_id):
     ahora_utc = datetime.now(timezone("UTC"))
     ahora_mx_coah = ahora_utc.astimezone(timezone(HUSO_HORARIO))
 
-    # Validar oficina
-    oficina = Oficina.query.get_or_404(oficina_id)
-    if oficina is None:
-        return {"results": []}
-
-    # Validar Servicio
-    cit_servicio = CitServicio.query.get_or_404(servicio_id)
-    if cit_servicio is None:
-        return {"results": []}
-
-    # Tomar tiempos de inicio y termino de la oficina
-    apertura = oficina.apertura
-    cierre = oficina.cierre
-
-    # Si el servicio tiene un tiempo desde
-    if cit_servicio.desde and apertura < cit_servicio.desde:
-        apertura = cit_servicio.desde
-    # Si el cit_servicio tiene un tiempo hasta
-    if cit_servicio.hasta and cierre > cit_servicio.hasta:
-        cierre = cit_servicio.hasta
-
-    # Definimos la hora actual y damos este momento como el inicio
-    fecha = ahora_mx_coah
-
-    # Definir los tiempos de inicio, de final y el timedelta de la duración
-    tiempo_inicial = datetime(
-        year=fecha.year,
-        month=fecha.month,
-        day=fecha.day,
-        hour=apertura.hour,
-        minute=apertura.minute,
-        second=0,
-    )
-    tiempo_final = datetime(
-        year=fecha.year,
-        month=fecha.month,
-        day=fecha.day,
-        hour=cierre.hour,
-        minute=cierre.minute,
-        second=0,
-    )
-    duracion = timedelta(
-        hours=cit_servicio.duracion.hour,
-        minutes=cit_servicio.duracion.minute,
-    )
-
-    # Consultar las horas bloqueadas y convertirlas a datetime para compararlas
-    tiempos_bloqueados = []
-    cit_horas_bloqueadas = CitHoraBloqueada.query.filter_by(oficina_id=oficina.id).filter_by(fecha=fecha).filter_by(estatus="A")
-    for cit_hora_bloqueada in cit_horas_bloqueadas:
-        tiempo_bloquedo_inicia = datetime(
-            year=fecha.year,
-            month=fecha.month,
-            day=fecha.day,
-            hour=cit_hora_bloqueada.inicio.hour,
-            minute=cit_hora_bloqueada.inicio.minute,
-            second=0,
-        )
-        tiempo_bloquedo_termina = datetime(
-            year=fecha.year,
-            month=fecha.month,
-            day=fecha.day,
-            hour=cit_hora_bloqueada.termino.hour,
-            minute=cit_hora_bloqueada.termino.minute,
-            second=0,
-        ) - timedelta(minutes=1)
-        tiempos_bloqueados.append((tiempo_bloquedo_inicia, tiempo_bloquedo_termina))
-
-    # Acumular las citas agendadas en un diccionario de tiempos y cantidad de citas, para la oficina en la fecha
-    # { 08:30: 2, 08:45: 1, 10:00: 2,... }
-    citas_ya_agendadas = {}
-    cit_citas_anonimas = CitCita.query.filter_by(oficina_id=oficina.id)
-    inicio_dt = datetime(year=fecha.year, month=fecha.month, day=fecha.day, hour=0, minute=0, second=0)
-    termino_dt = datetime(year=fecha.year, month=fecha.month, day=fecha.day, hour=23, minute=59, second=59)
-    cit_citas_anonimas = cit_citas_anonimas.filter(CitCita.inicio >= inicio_dt).filter(CitCita.inicio <= termino_dt)
-
-    # Filtro por tiempo de termino
-    hasta_tiempo = datetime(
-        year=fecha.year,
-        month=fecha.month,
-        day=fecha.day,
-        hour=23,
-        minute=59,
-        second=59,
-    )
-    cit_citas_anonimas = cit_citas_anonimas.filter(CitCita.termino <= hasta_tiempo).filter(CitCita.estado != "CANCELO")
-    cit_citas_anonimas = cit_citas_anonimas.filter_by(estatus="A").order_by(CitCita.id).all()
-    for cit_cita in cit_citas_anonimas:
-        if cit_cita.inicio not in citas_ya_agendadas:
-            citas_ya_agendadas[cit_cita.inicio] = 1
-        else:
-            citas_ya_agendadas[cit_cita.inicio] += 1
-
-    # Bucle por los intervalos
-    horas_minutos_disponibles = []
-    tiempo = tiempo_inicial
-
-    # Bucle para quitar segmentos de tiempos
-    while tiempo < tiempo_final:
-        # Bandera
-        es_hora_disponible = True
-        citas_agendadas = 0
-        disabled = False
-        # Quitar las horas bloqueadas
-        for tiempo_bloqueado in tiempos_bloqueados:
-            if tiempo_bloqueado[0] <= tiempo <= tiempo_bloqueado[1]:
-                es_hora_disponible = False
-                break
-        # Quitar las horas ocupadas
-        if tiempo in citas_ya_agendadas:
-            citas_agendadas = citas_ya_agendadas[tiempo]
-            if citas_ya_agendadas[tiempo] >= oficina.limite_personas + LIMITE_EXTRA_PERSONAS:
-                es_hora_disponible = False
-                disabled = True
-        # Acumular si es hora disponible
-        if es_hora_disponible:
-            if tiempo > fecha.replace(tzinfo=None) - timedelta(minutes=MINUTOS_MARGEN):
-                horas_minutos_disponibles.append(
-                    {
-                        "value": tiempo.time().strftime("%H:%M"),
-                        "text": f"{tiempo.time().strftime('%H:%M')} - {citas_agendadas} personas",
-                        "disabled": disabled,
-                    }
-                )
-        # Siguiente intervalo
-        tiempo = tiempo + duracion
+    # Solo se entregan los horarios posteriores a este momento menos el margen
+    desde = ahora_mx_coah - timedelta(minutes=MINUTOS_MARGEN)
+    desde_minutos = desde.hour * 60 + desde.minute if desde.date() == ahora_mx_coah.date() else -1
 
-    # Entregar
-    return {"results": horas_minutos_disponibles}
+    # Entregar desde el arreglo de disponibilidad de la oficina en la fecha
+    return {"results": disponibilidad.obtener_horarios(oficina_id, servicio_id, ahora_mx_coah.date(), desde_minutos)}
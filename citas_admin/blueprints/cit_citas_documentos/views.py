@@ -2,10 +2,10 @@
 Cit Citas Documentos, vistas
 """
 import json
-from flask import Blueprint, flash, redirect, render_template, request, url_for
+from flask import Blueprint, flash, redirect, render_template, url_for
 from flask_login import current_user, login_required
 
-from lib.datatables import get_datatable_parameters, output_datatable_json
+from lib.datatables import Filtro, filtrar_datatable, get_datatable_parameters, output_datatable_json, paginar_datatable
 from lib.safe_string import safe_string, safe_message
 
 from citas_admin.blueprints.bitacoras.models import Bitacora
@@ -32,26 +32,26 @@ def datatable_json():
     # Tomar parámetros de Datatables
     draw, start, rows_per_page = get_datatable_parameters()
     # Consultar
-    consulta = CitCitaDocumento.query
-    if "estatus" in request.form:
-        consulta = consulta.filter_by(estatus=request.form["estatus"])
-    else:
-        consulta = consulta.filter_by(estatus="A")
-    registros = consulta.order_by(CitCitaDocumento.id).offset(start).limit(rows_per_page).all()
-    total = consulta.count()
+    consulta, _ = filtrar_datatable(CitCitaDocumento.query, [Filtro("estatus", CitCitaDocumento.estatus, defecto="A")])
+    registros, total, cursor = paginar_datatable(consulta, [CitCitaDocumento.id], start, rows_per_page)
     # Elaborar datos para DataTable
     data = []
     for resultado in registros:
         data.append(
             {
                 "detalle": {
-                    "nombre": resultado.nombre,
-                    "url": url_for("cit_citas_documentos.detail", cit_cita_documento_id=resultado.id),
+                    "id": resultado.id,
+                    "url": url_for("cit_citas_documentos.detail", cit_citas_documentos_id=resultado.id),
                 },
+                "cita": {
+                    "id": resultado.cit_cita_id,
+                    "url": url_for("cit_citas.detail", cit_cita_id=resultado.cit_cita_id),
+                },
+                "descripcion": resultado.descripcion,
             }
         )
     # Entregar JSON
-    return output_datatable_json(draw, total, data)
+    return output_datatable_json(draw, total, data, cursor)
 
 
 @cit_citas_documentos.route("/cit_citas_documentos")
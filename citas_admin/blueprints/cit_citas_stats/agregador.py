@@ -0,0 +1,241 @@
+"""
+Cit Citas Stats, agregador
+
+- actualizar_diarias mantiene la tabla cit_citas_diarias, solo recalcula los días de las citas
+  creadas o modificadas desde la marca de la actualización anterior, se ejecuta en el fondo
+  con la tarea cit_citas_stats.tasks.actualizar
+- Solo corre una actualización a la vez, la que no obtiene el candado en Redis no hace nada
+- Cuando una cita cambia de inicio a otro día, o se borra, el día anterior se anota en Redis
+  para recalcularlo también; se anota al confirmar la transacción de la sesión
+- contar_citas hace una sola consulta GROUP BY: por hora sobre cit_citas, por día o por estado
+  sobre cit_citas_diarias, con la opción de desglosar o filtrar por oficina o por distrito
+"""
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+import uuid
+
+from flask import current_app
+from redis.exceptions import RedisError
+from sqlalchemy import event, func, insert, literal_column, select
+from sqlalchemy.orm import Session, attributes
+
+from citas_admin.extensions import db
+from citas_admin.blueprints.cit_citas.models import CitCita
+from citas_admin.blueprints.cit_citas_stats.models import CitCitaDiaria
+from citas_admin.blueprints.oficinas.models import Oficina
+from citas_admin.blueprints.tareas.models import Tarea
+
+CANDADO = "cit_citas_stats:candado"
+CANDADO_SEGUNDOS = 1920  # El tiempo límite de las tareas en el fondo
+TAREA = "cit_citas_stats.tasks.actualizar"
+
+MARCA = "cit_citas_stats:marca"
+FECHAS = "cit_citas_stats:fechas"  # Días anteriores de las citas que cambiaron de inicio o se borraron
+MARGEN = timedelta(minutes=10)  # modificado lo pone la base de datos al iniciar la transacción, puede confirmarse después
+
+
+def obtener_marca():
+    """Entrega la marca (el mayor modificado de cit_citas ya procesado) o None si no la hay"""
+    try:
+        valor = current_app.redis.get(MARCA)
+    except RedisError:
+        return None
+    if valor is None:
+        return None
+    return datetime.fromisoformat(valor.decode())
+
+
+# Borrar el candado solo si todavía es el de esta actualización
+LIBERAR_CANDADO = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("DEL", KEYS[1])
+end
+return 0
+"""
+
+
+def hay_actualizacion_en_proceso():
+    """¿Hay una actualización corriendo o una tarea para actualizar sin terminar?"""
+    try:
+        if current_app.redis.exists(CANDADO):
+            return True
+    except RedisError:
+        pass
+    desde = datetime.now() - timedelta(seconds=CANDADO_SEGUNDOS)
+    return Tarea.query.filter_by(nombre=TAREA, ha_terminado=False).filter(Tarea.creado >= desde).first() is not None
+
+
+def guardar_marca(marca: datetime):
+    """Guardar la marca, sin Redis la siguiente actualización recalcula toda la tabla"""
+    try:
+        current_app.redis.set(MARCA, marca.isoformat())
+    except RedisError:
+        pass
+
+
+def obtener_fechas_anteriores():
+    """Entrega los días anotados de las citas que cambiaron de inicio o se borraron"""
+    try:
+        return {datetime.fromisoformat(valor.decode()).date() for valor in current_app.redis.smembers(FECHAS)}
+    except RedisError:
+        return set()
+
+
+def describir_marca():
+    """Entrega el subtítulo para las gráficas con la fecha de los datos"""
+    marca = obtener_marca()
+    if marca is None:
+        return None
+    return marca.strftime("Datos al: %Y/%m/%d a las %H:%M")
+
+
+def actualizar_diarias(reconstruir: bool = False):
+    """Actualizar cit_citas_diarias, entrega la cantidad de renglones escritos o None si ya hay otra actualización corriendo
+
+    Toma el candado en Redis; sin Redis actualiza sin candado.
+
+    Se recalculan completos los días de las citas creadas o modificadas desde la marca,
+    así un cambio de estado deja de contar en el estado anterior,
+    y los días anotados de las citas que cambiaron de inicio o se borraron.
+    Si no hay marca o se pide reconstruir, se recalcula toda la tabla.
+    """
+    ficha = uuid.uuid4().hex
+    try:
+        if not current_app.redis.set(CANDADO, ficha, nx=True, ex=CANDADO_SEGUNDOS):
+            return None
+    except RedisError:
+        pass
+    try:
+        return _actualizar_diarias(reconstruir)
+    finally:
+        try:
+            current_app.redis.eval(LIBERAR_CANDADO, 1, CANDADO, ficha)
+        except RedisError:
+            pass
+
+
+def _actualizar_diarias(reconstruir: bool):
+    """Recalcular los días con cambios, o toda la tabla si se pide reconstruir"""
+    marca = None if reconstruir else obtener_marca()
+    anteriores = obtener_fechas_anteriores()
+    nueva_marca = db.session.query(func.max(CitCita.modificado)).scalar()
+    if nueva_marca is None:
+        return 0
+
+    # Consulta GROUP BY que alimenta la tabla
+    fecha = func.date(CitCita.inicio, type_=db.Date)
+    origen = select(fecha, CitCita.oficina_id, CitCita.cit_servicio_id, CitCita.estado, func.count(CitCita.id))
+    borrar = CitCitaDiaria.query
+
+    # Limitar a los días con cambios desde la marca
+    if marca is not None:
+        fechas = {renglon[0] for renglon in db.session.query(fecha).filter(CitCita.modificado >= marca - MARGEN).distinct().all()}
+        fechas = sorted(fechas | anteriores)
+        if len(fechas) == 0:
+            guardar_marca(nueva_marca)
+            return 0
+        origen = origen.where(CitCita.inicio >= min(fechas)).where(CitCita.inicio < max(fechas) + timedelta(days=1)).where(fecha.in_(fechas))
+        borrar = borrar.filter(CitCitaDiaria.fecha.in_(fechas))
+
+    # Reemplazar los renglones de esos días en una sola transacción
+    borrar.delete(synchronize_session=False)
+    columnas = [CitCitaDiaria.fecha, CitCitaDiaria.oficina_id, CitCitaDiaria.cit_servicio_id, CitCitaDiaria.estado, CitCitaDiaria.cantidad]
+    resultado = db.session.execute(insert(CitCitaDiaria).from_select(columnas, origen.group_by(fecha, CitCita.oficina_id, CitCita.cit_servicio_id, CitCita.estado)))
+    db.session.commit()
+
+    # Guardar la marca y olvidar los días anotados hasta confirmar la transacción
+    guardar_marca(nueva_marca)
+    if anteriores:
+        try:
+            current_app.redis.srem(FECHAS, *[anterior.isoformat() for anterior in anteriores])
+        except RedisError:
+            pass
+    return resultado.rowcount
+
+
+def contar_citas(agrupar: str, desde=None, hasta=None, dimension: str = None, oficina_id: int = None, distrito_id: int = None):
+    """Contar las citas en una sola consulta GROUP BY
+
+    - agrupar: hour para agrupar por la hora del inicio (sobre cit_citas), day o estado (sobre cit_citas_diarias)
+    - desde, hasta: rango [desde, hasta) de las fechas
+    - dimension: None para el total, oficina o distrito para desglosar
+    - oficina_id, distrito_id: para filtrar
+
+    Entrega {clave: Counter({grupo: cantidad})}, la clave es None cuando no se desglosa
+    """
+    if agrupar == "hour":
+        modelo = CitCita
+        fecha = CitCita.inicio
+        cantidad = func.count(CitCita.id)
+        # Se usa una literal para que el SELECT y el GROUP BY tengan la misma expresión
+        if db.engine.dialect.name == "sqlite":
+            grupo = func.strftime(literal_column("'%Y-%m-%d %H:00:00'"), CitCita.inicio, type_=db.DateTime)
+        else:
+            grupo = func.date_trunc(literal_column("'hour'"), CitCita.inicio, type_=db.DateTime)
+    elif agrupar in ("day", "estado"):
+        modelo = CitCitaDiaria
+        fecha = CitCitaDiaria.fecha
+        cantidad = func.sum(CitCitaDiaria.cantidad)
+        grupo = CitCitaDiaria.fecha if agrupar == "day" else CitCitaDiaria.estado
+    else:
+        raise ValueError(f"No se puede agrupar por {agrupar}")
+    columnas = [grupo]
+    if dimension == "oficina":
+        columnas.insert(0, modelo.oficina_id)
+    elif dimension == "distrito":
+        columnas.insert(0, Oficina.distrito_id)
+    elif dimension is not None:
+        raise ValueError(f"No se puede desglosar por {dimension}")
+    consulta = db.session.query(*columnas, cantidad)
+    if dimension == "distrito" or distrito_id is not None:
+        consulta = consulta.join(Oficina, Oficina.id == modelo.oficina_id)
+    if distrito_id is not None:
+        consulta = consulta.filter(Oficina.distrito_id == distrito_id)
+    if oficina_id is not None:
+        consulta = consulta.filter(modelo.oficina_id == oficina_id)
+    if desde is not None:
+        consulta = consulta.filter(fecha >= desde)
+    if hasta is not None:
+        consulta = consulta.filter(fecha < hasta)
+    conteos = defaultdict(Counter)
+    if dimension is None:
+        conteos[None] = Counter()  # El total existe aunque no haya citas
+    for renglon in consulta.group_by(*columnas).all():
+        clave = renglon[0] if dimension is not None else None
+        conteos[clave][renglon[-2]] += int(renglon[-1])
+    return conteos
+
+
+def _revisar_inicios(session, flush_context, instances):
+    """Antes de cada flush, anotar los días anteriores de las citas que cambian de inicio o se borran"""
+    anteriores = set()
+    for instancia in session.dirty:
+        if isinstance(instancia, CitCita):
+            anteriores.update(inicio.date() for inicio in attributes.get_history(instancia, "inicio").deleted if inicio is not None)
+    for instancia in session.deleted:
+        if isinstance(instancia, CitCita) and instancia.inicio is not None:
+            anteriores.add(instancia.inicio.date())
+    if anteriores:
+        session.info.setdefault("cit_citas_stats_fechas", set()).update(anteriores)
+
+
+def _confirmar_inicios(session):
+    """Al confirmar la transacción, guardar en Redis los días anotados"""
+    anteriores = session.info.pop("cit_citas_stats_fechas", None)
+    if anteriores:
+        try:
+            current_app.redis.sadd(FECHAS, *[anterior.isoformat() for anterior in anteriores])
+        except (RuntimeError, RedisError):
+            # Sin contexto de la aplicación (scripts) o sin Redis, se recalculan con reconstruir
+            pass
+
+
+def _descartar_inicios(session):
+    """Al deshacer la transacción, olvidar los días anotados"""
+    session.info.pop("cit_citas_stats_fechas", None)
+
+
+if not event.contains(Session, "before_flush", _revisar_inicios):
+    event.listen(Session, "before_flush", _revisar_inicios)
+    event.listen(Session, "after_commit", _confirmar_inicios)
+    event.listen(Session, "after_rollback", _descartar_inicios)
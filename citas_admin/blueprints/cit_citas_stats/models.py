@@ -51,3 +51,29 @@ class CitCitaStats(db.Model, UniversalMixin):
     def __repr__(self):
         """Representación"""
         return f"<CitCitaStat {self.id}>"
+
+
+class CitCitaDiaria(db.Model, UniversalMixin):
+    """Cantidad de citas por día, oficina, servicio y estado, se mantiene de forma incremental"""
+
+    # Nombre de la tabla
+    __tablename__ = "cit_citas_diarias"
+    __table_args__ = (db.UniqueConstraint("fecha", "oficina_id", "cit_servicio_id", "estado", name="cit_citas_diarias_llave"),)
+
+    # Clave primaria
+    id = db.Column(db.Integer, primary_key=True)
+
+    # Claves foráneas
+    oficina_id = db.Column(db.Integer, db.ForeignKey("oficinas.id"), index=True, nullable=False)
+    oficina = db.relationship("Oficina", back_populates="cit_citas_diarias")
+    cit_servicio_id = db.Column(db.Integer, db.ForeignKey("cit_servicios.id"), index=True, nullable=False)
+    cit_servicio = db.relationship("CitServicio", back_populates="cit_citas_diarias")
+
+    # Columnas
+    fecha = db.Column(db.Date(), index=True, nullable=False)
+    estado = db.Column(db.String(16))
+    cantidad = db.Column(db.Integer(), nullable=False)
+
+    def __repr__(self):
+        """Representación"""
+        return f"<CitCitaDiaria {self.id}>"
@@ -0,0 +1,42 @@
+"""
+Cit Citas Stats, tareas para ejecutar en el fondo
+"""
+import logging
+
+from lib.tasks import set_task_progress
+
+from citas_admin.app import create_worker_app
+from citas_admin.extensions import db
+
+from citas_admin.blueprints.cit_citas_stats.agregador import actualizar_diarias
+
+bitacora = logging.getLogger(__name__)
+bitacora.setLevel(logging.INFO)
+formato = logging.Formatter("%(asctime)s:%(levelname)s:%(message)s")
+empunadura = logging.FileHandler("cit_citas_stats.log")
+empunadura.setFormatter(formato)
+bitacora.addHandler(empunadura)
+
+app = create_worker_app()
+app.app_context().push()
+db.app = app
+
+
+def actualizar(reconstruir=False):
+    """Actualizar cit_citas_diarias con las citas creadas o modificadas desde la última actualización"""
+
+    # Iniciar la tarea
+    bitacora.info("Inicia actualizar cit_citas_diarias")
+    set_task_progress(0)
+
+    # Recalcular los días con cambios, o toda la tabla si se pide reconstruir
+    renglones = actualizar_diarias(reconstruir)
+
+    # Terminar la tarea
+    if renglones is None:
+        mensaje_final = "No se actualizó cit_citas_diarias porque ya hay otra actualización en proceso"
+    else:
+        mensaje_final = f"Se escribieron {renglones} renglones en cit_citas_diarias"
+    set_task_progress(100, mensaje_final)
+    bitacora.info(mensaje_final)
+    return mensaje_final
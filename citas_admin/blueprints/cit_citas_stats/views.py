@@ -2,18 +2,19 @@
 Cit Citas Stats, vistas
 """
 
-from flask import Blueprint, flash, redirect, render_template, url_for
+from flask import Blueprint, flash, redirect, render_template, request, url_for
 from flask_login import current_user, login_required
 
 from lib.safe_string import safe_message
 
-from citas_admin.blueprints.bitacoras.models import Bitacora
-from citas_admin.blueprints.modulos.models import Modulo
+from citas_admin.blueprints.bitacoras.auditoria import registrar_bitacora
+from citas_admin.blueprints.distritos.models import Distrito
 from citas_admin.blueprints.permisos.models import Permiso
 from citas_admin.blueprints.usuarios.decorators import permission_required
 
-from .stats_citas_totales import obtener_stats_json_citas_totales, actualizar_stats_citas_totales
-from .stats_estados import obtener_stats_json_estados, actualizar_stats_estados
+from .agregador import TAREA, hay_actualizacion_en_proceso
+from .stats_citas_totales import obtener_stats_json_citas_totales
+from .stats_estados import obtener_stats_json_estados
 from .models import CitCitaStats
 
 MODULO = "CIT CITAS STATS"
@@ -32,7 +33,10 @@ def before_request():
 def detail():
     """Estadísticas del módulo citas"""
 
-    return render_template("cit_citas_stats/detail.jinja2")
+    return render_template(
+        "cit_citas_stats/detail.jinja2",
+        distritos=Distrito.query.filter_by(es_distrito_judicial=True).filter_by(estatus="A").all(),
+    )
 
 
 @cit_citas_stats.route("/cit_citas_stats/stats/<string:categoria>", methods=["GET"])
@@ -40,7 +44,10 @@ def stats(categoria):
     """Muestra la estadística indicada"""
 
     if categoria == CitCitaStats.CAT_CITAS_ESTADO:
-        return render_template("cit_citas_stats/citas_estado.jinja2")
+        return render_template(
+            "cit_citas_stats/citas_estado.jinja2",
+            distritos=Distrito.query.filter_by(es_distrito_judicial=True).filter_by(estatus="A").all(),
+        )
 
     return redirect("/cit_citas_stats")
 
@@ -49,11 +56,14 @@ def stats(categoria):
 def stats_json(categoria, subcategoria):
     """Entrega los datos para gráficas"""
 
+    # Opcionalmente solo las citas de un distrito
+    distrito_id = request.args.get("distrito_id", None, type=int)
+
     # Entregar JSON
     if categoria == CitCitaStats.CAT_CITAS_TOTALES:
-        return obtener_stats_json_citas_totales(subcategoria)
+        return obtener_stats_json_citas_totales(subcategoria, distrito_id)
     elif categoria == CitCitaStats.CAT_CITAS_ESTADO:
-        return obtener_stats_json_estados(subcategoria)
+        return obtener_stats_json_estados(subcategoria, distrito_id)
 
     return None
 
@@ -61,27 +71,33 @@ def stats_json(categoria, subcategoria):
 @cit_citas_stats.route("/cit_citas_stats/actualizar/<string:categoria>", methods=["GET"])
 @permission_required(MODULO, Permiso.MODIFICAR)
 def actualizar_stats(categoria):
+    """Lanzar la tarea en el fondo que actualiza cit_citas_diarias"""
 
-    if categoria == CitCitaStats.CAT_CITAS_TOTALES:
-        actualizar_stats_citas_totales()
-        flash(f"Actualización individual de los datos estadísticos de citas, categoría: {categoria}", "success")
-        Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
-            usuario=current_user,
-            descripcion=safe_message(f"Actualización individual de los datos estadísticos de citas, categoría: {categoria}"),
-            url=url_for("cit_citas_stats.detail"),
-        ).save()
+    if categoria not in (CitCitaStats.CAT_CITAS_TOTALES, CitCitaStats.CAT_CITAS_ESTADO):
+        flash(f"No se pudo actalizar la estadística de esa categoria: {categoria}", "warning")
         return redirect("/cit_citas_stats")
-    elif categoria == CitCitaStats.CAT_CITAS_ESTADO:
-        actualizar_stats_estados()
-        flash(f"Actualización individual de los datos estadísticos de citas, categoría: {categoria}", "success")
-        Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
-            usuario=current_user,
-            descripcion=safe_message(f"Actualización individual de los datos estadísticos de citas, categoría: {categoria}"),
-            url=url_for("cit_citas_stats.detail"),
-        ).save()
-        return redirect(url_for("cit_citas_stats.stats", categoria=categoria))
-
-    flash(f"No se pudo actalizar la estadística de esa categoria: {categoria}", "warning")
-    return redirect("/cit_citas_stats")
+
+    # Después se regresa a la estadística
+    if categoria == CitCitaStats.CAT_CITAS_ESTADO:
+        destino = url_for("cit_citas_stats.stats", categoria=categoria)
+    else:
+        destino = "/cit_citas_stats"
+
+    # Si ya se está actualizando, no lanzar otra tarea
+    if hay_actualizacion_en_proceso():
+        flash("Ya se están actualizando los datos estadísticos de citas, espere a que termine", "warning")
+        return redirect(destino)
+
+    # Lanzar tarea en el fondo, ambas categorías se leen de cit_citas_diarias
+    current_user.launch_task(
+        nombre=TAREA,
+        descripcion=f"Actualizar los datos estadísticos de citas, categoría: {categoria}",
+    )
+    flash(f"Se están actualizando en el fondo los datos estadísticos de citas, categoría: {categoria}", "info")
+    registrar_bitacora(
+        modulo=MODULO,
+        usuario=current_user,
+        descripcion=safe_message(f"Actualización individual de los datos estadísticos de citas, categoría: {categoria}"),
+        url=url_for("cit_citas_stats.detail"),
+    )
+    return redirect(destino)
@@ -0,0 +1,69 @@
+"""
+Cit Clientes, almacén del reporte de avisos
+
+El reporte lo elabora la tarea refresh_report, lo sube a Google Storage y lo publica en Redis
+
+- cit_clientes:reporte:version es la versión del reporte (el momento en que se elaboró)
+- cit_clientes:reporte:datos es el JSON del reporte
+
+Cada proceso guarda en memoria la última versión que leyó; en cada petición solo consulta
+la versión en Redis y vuelve a leer el reporte cuando refresh_report publica uno nuevo.
+Si Redis no tiene el reporte, se descarga de Google Storage una vez y se publica.
+"""
+import json
+
+from flask import current_app
+from redis.exceptions import RedisError
+
+from lib.storage import GoogleCloudStorage
+
+LLAVE = "cit_clientes:reporte"
+BLOB = "json/cit_clientes_reporte.json"
+
+_reporte = {"version": None, "datos": None}
+
+
+def _version(datos: dict):
+    """Versión del reporte, los reportes anteriores solo tienen fecha_creacion"""
+    return datos.get("version", datos.get("fecha_creacion", ""))
+
+
+def publicar_reporte(datos: dict):
+    """Publicar el reporte en Redis para los procesos de la aplicación web"""
+    tuberia = current_app.redis.pipeline()
+    tuberia.set(f"{LLAVE}:datos", json.dumps(datos, ensure_ascii=False))
+    tuberia.set(f"{LLAVE}:version", _version(datos))
+    tuberia.execute()
+
+
+def obtener_reporte():
+    """Entregar el reporte, causa NotConfiguredError u otra excepción si no se puede descargar"""
+    try:
+        version = current_app.redis.get(f"{LLAVE}:version")
+        if version is not None:
+            version = version.decode()
+            if version != _reporte["version"]:
+                contenido = current_app.redis.get(f"{LLAVE}:datos")
+                if contenido is not None:
+                    _reporte["datos"], _reporte["version"] = json.loads(contenido), version
+            if version == _reporte["version"]:
+                return _reporte["datos"]
+    except RedisError:
+        return json.loads(GoogleCloudStorage("/").download_as_string(BLOB))
+
+    # Redis no tiene el reporte, descargarlo de Google Storage y publicarlo
+    datos = json.loads(GoogleCloudStorage("/").download_as_string(BLOB))
+    _reporte["datos"], _reporte["version"] = datos, _version(datos)
+    try:
+        publicar_reporte(datos)
+    except RedisError:
+        pass
+    return datos
+
+
+def paginar_resultados(reporte: dict, start: int, rows_per_page: int):
+    """Entregar una página de los resultados de un reporte y su total"""
+    resultados = reporte["resultados"]
+    if rows_per_page > 0:
+        return resultados[start : start + rows_per_page], len(resultados)
+    return resultados[start:], len(resultados)
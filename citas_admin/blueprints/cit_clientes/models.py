@@ -1,7 +1,15 @@
 """
 Cit Clientes, modelos
+
+La columna busqueda la mantiene la base de datos: en PostgreSQL un disparador la elabora en cada INSERT
+y UPDATE, así también quedan al día los clientes que escribe el sistema de clientes o un UPDATE masivo.
+Normaliza igual que lib/busqueda.py (unaccent en lugar de unidecode). En otras bases de datos,
+como SQLite en las pruebas, la elabora el evento before_insert/before_update del ORM.
 """
+from sqlalchemy import DDL, event
+
 from citas_admin.extensions import db
+from lib.busqueda import concatenar
 from lib.universal_mixin import UniversalMixin
 
 
@@ -10,6 +18,7 @@ class CitCliente(db.Model, UniversalMixin):
 
     # Nombre de la tabla
     __tablename__ = "cit_clientes"
+    __table_args__ = (db.Index("ix_cit_clientes_busqueda_trgm", "busqueda", postgresql_using="gin", postgresql_ops={"busqueda": "gin_trgm_ops"}),)
 
     # Clave primaria
     id = db.Column(db.Integer, primary_key=True)
@@ -25,6 +34,7 @@ class CitCliente(db.Model, UniversalMixin):
     contrasena_sha256 = db.Column(db.String(256), nullable=False)
     renovacion = db.Column(db.Date(), nullable=False)
     limite_citas_pendientes = db.Column(db.Integer(), nullable=False)
+    busqueda = db.Column(db.String(1024), nullable=False, default="", server_default="")  # Vea lib/busqueda.py
 
     # Columnas booleanas
     autoriza_mensajes = db.Column(db.Boolean(), nullable=False, default=True)
@@ -56,6 +66,49 @@ class CitCliente(db.Model, UniversalMixin):
             return self.telefono
         return f"({self.telefono[:3]}) {self.telefono[3:6]}-{self.telefono[6:]}"
 
+    def elaborar_busqueda(self):
+        """Columna de búsqueda con nombres, apellidos, CURP y email normalizados"""
+        return concatenar(self.nombres, self.apellido_primero, self.apellido_segundo, self.curp, self.email)
+
     def __repr__(self):
         """Representación"""
         return f"<CitCliente {self.email}>"
+
+
+@event.listens_for(CitCliente, "before_insert")
+@event.listens_for(CitCliente, "before_update")
+def actualizar_busqueda(mapper, connection, cit_cliente):
+    """Mantener la columna de búsqueda al insertar o modificar"""
+    cit_cliente.busqueda = cit_cliente.elaborar_busqueda()
+
+
+DISPARADOR_BUSQUEDA = (
+    "CREATE EXTENSION IF NOT EXISTS unaccent",
+    """
+    CREATE OR REPLACE FUNCTION cit_clientes_busqueda() RETURNS trigger AS $$
+    BEGIN
+        NEW.busqueda := btrim(regexp_replace(
+            upper(unaccent(concat_ws(' ', NEW.nombres, NEW.apellido_primero, NEW.apellido_segundo, NEW.curp, NEW.email))),
+            '[^A-Z0-9@._-]+', ' ', 'g'
+        ));
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS cit_clientes_busqueda ON cit_clientes",
+    """
+    CREATE TRIGGER cit_clientes_busqueda
+    BEFORE INSERT OR UPDATE OF nombres, apellido_primero, apellido_segundo, curp, email, busqueda ON cit_clientes
+    FOR EACH ROW EXECUTE FUNCTION cit_clientes_busqueda()
+    """,
+)
+
+
+def instalar_disparador_busqueda(connection):
+    """Crear o reemplazar en PostgreSQL el disparador que mantiene la columna de búsqueda"""
+    if connection.dialect.name == "postgresql":
+        for sentencia in DISPARADOR_BUSQUEDA:
+            connection.execute(DDL(sentencia))
+
+
+event.listen(CitCliente.__table__, "after_create", lambda target, connection, **kw: instalar_disparador_busqueda(connection))
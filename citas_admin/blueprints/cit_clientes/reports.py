@@ -1,11 +1,54 @@
 """
 Cit Clientes, reportes
+
+recorrer lee cit_clientes una sola vez con un cursor del lado del servidor y entrega cada registro
+a todos los reportes. Si el cliente no tiene citas viene en la misma consulta (un LEFT JOIN anti-join)
+y los repetidos se detectan con índices en memoria, así agregar un reporte no agrega consultas.
 """
 import re
 
+from citas_admin.extensions import db
 from citas_admin.blueprints.cit_citas.models import CitCita
 from citas_admin.blueprints.cit_clientes.models import CitCliente
 
+LOTE = 5000
+COLUMNAS = (
+    CitCliente.id,
+    CitCliente.nombres,
+    CitCliente.apellido_primero,
+    CitCliente.apellido_segundo,
+    CitCliente.curp,
+    CitCliente.telefono,
+)
+
+
+class Registro:
+    """Renglón de cit_clientes con las columnas que usan los reportes"""
+
+    __slots__ = ("id", "nombres", "apellido_primero", "apellido_segundo", "curp", "telefono", "sin_citas")
+
+    def __init__(self, renglon):
+        """Constructor"""
+        for columna in self.__slots__:
+            setattr(self, columna, getattr(renglon, columna))
+
+    @property
+    def nombre(self):
+        """Junta nombres, apellido_primero y apellido segundo"""
+        return self.nombres + " " + self.apellido_primero + " " + self.apellido_segundo
+
+
+def recorrer(reportes: list, limite: int):
+    """Recorrer los clientes una sola vez aplicando los reportes, cada uno hasta juntar limite resultados"""
+    con_citas = db.session.query(CitCita.cit_cliente_id).distinct().subquery()
+    consulta = db.session.query(*COLUMNAS, con_citas.c.cit_cliente_id.is_(None).label("sin_citas")).outerjoin(con_citas, con_citas.c.cit_cliente_id == CitCliente.id).order_by(CitCliente.id).execution_options(stream_results=True).yield_per(LOTE)
+    for renglon in consulta:
+        registro = Registro(renglon)
+        for reporte in reportes:
+            if reporte.cantidad < limite:
+                reporte.check(registro)
+    return reportes
+
 
 class Reporte:
     """Clase padre para Reportes"""
@@ -102,16 +145,17 @@ class ReporteNombreApellidoRepetidos(Reporte):
             "Clientes con el mismo nombre y apellido primero que otro. Posiblemente se registro más de una vez",
         )
 
+        self.anteriores = {}  # Índice (nombres, apellido_primero) -> (id, nombre) del último visto
+
     def check(self, registro):
-        """Valida si el apellido segundo en vacío o Nulo"""
-        # Query de consulta
-        consulta = CitCliente.query
-        consulta = consulta.filter(CitCliente.nombres == registro.nombres).filter(CitCliente.apellido_primero == registro.apellido_primero)
-        consulta = consulta.filter(CitCliente.id > registro.id).first()
-        if consulta:
+        """Valida si un registro anterior tiene el mismo nombre y apellido primero"""
+        llave = (registro.nombres, registro.apellido_primero)
+        anterior = self.anteriores.get(llave)
+        if anterior is not None:
             self.cantidad += 1
-            result = {"id": registro.id, "nombre": registro.nombre, "id_copia": consulta.id, "nombre_parecido": consulta.nombre}
+            result = {"id": anterior[0], "nombre": anterior[1], "id_copia": registro.id, "nombre_parecido": registro.nombre}
             self.resultados.append(result)
+        self.anteriores[llave] = (registro.id, registro.nombre)
 
 
 class ReporteTelefonoRepetido(Reporte):
@@ -124,23 +168,25 @@ class ReporteTelefonoRepetido(Reporte):
             "Clientes con el mismo número telefónico",
         )
 
+        self.anteriores = {}  # Índice telefono -> (id, nombre) del último visto
+
     def check(self, registro):
-        """Valida si el apellido segundo en vacío o Nulo"""
-        # Query de consulta
-        consulta = CitCliente.query
-        consulta = consulta.filter(CitCliente.telefono == registro.telefono)
-        consulta = consulta.filter(CitCliente.id > registro.id).first()
-        if consulta:
+        """Valida si un registro anterior tiene el mismo teléfono, los vacíos los cuenta ReporteTelefonoVacio"""
+        if registro.telefono == "" or registro.telefono is None:
+            return
+        anterior = self.anteriores.get(registro.telefono)
+        if anterior is not None:
             self.cantidad += 1
             result = {
-                "id": registro.id,
-                "nombre": registro.nombre,
+                "id": anterior[0],
+                "nombre": anterior[1],
                 "telefono": registro.telefono,
-                "id_copia": consulta.id,
-                "nombre_copia": consulta.nombre,
-                "telefono_copia": consulta.telefono,
+                "id_copia": registro.id,
+                "nombre_copia": registro.nombre,
+                "telefono_copia": registro.telefono,
             }
             self.resultados.append(result)
+        self.anteriores[registro.telefono] = (registro.id, registro.nombre)
 
 
 class ReporteTelefonoVacio(Reporte):
@@ -200,11 +246,8 @@ class ReporteClientesSinCitas(Reporte):
         )
 
     def check(self, registro):
-        """Valida si el apellido segundo en vacío o Nulo"""
-        # Query de consulta
-        consulta = CitCita.query
-        consulta = consulta.filter(CitCita.cit_cliente_id == registro.id).first()
-        if consulta is None:
+        """Valida si el cliente no tiene citas, viene de la consulta de recorrer"""
+        if registro.sin_citas:
             self.cantidad += 1
             result = {
                 "id": registro.id,
@@ -6,16 +6,16 @@ import json
 import locale
 import logging
 
+from redis.exceptions import RedisError
 from sqlalchemy.sql import func
 
-from lib import database
 from lib.tasks import set_task_progress
 from lib.storage import GoogleCloudStorage, NotConfiguredError
 
-from citas_admin.blueprints.cit_clientes.models import CitCliente
 from citas_admin.blueprints.cit_citas.models import CitCita
+from citas_admin.blueprints.cit_clientes.almacen import publicar_reporte
 
-from citas_admin.app import create_app
+from citas_admin.app import create_worker_app
 from citas_admin.extensions import db
 
 from .reports import (
@@ -27,6 +27,7 @@ from .reports import (
     ReporteTelefonoVacio,
     ReporteTelefonoFormato,
     ReporteClientesSinCitas,
+    recorrer,
 )
 
 locale.setlocale(locale.LC_TIME, "es_MX.utf8")
@@ -38,7 +39,8 @@ empunadura = logging.FileHandler("cit_clientes_reportes.log")
 empunadura.setFormatter(formato)
 bitacora.addHandler(empunadura)
 
-app = create_app()
+app = create_worker_app()
+app.app_context().push()
 db.app = app
 
 LIMITE_VERIFICACION = 30
@@ -66,6 +68,7 @@ def refresh_report():
     # Momento en que se elabora este mensaje
     momento = datetime.now()
     data["fecha_creacion"] = momento.strftime("%Y/%m/%d %H:%M")
+    data["version"] = momento.isoformat()
 
     # Llamar a los reportes por recorrido
     data["total_errores"], data["reportes"] = recorrer_registros()
@@ -74,6 +77,12 @@ def refresh_report():
     with open("/tmp/" + FILE_NAME, "w", encoding="utf-8") as file:
         json.dump(data, file, ensure_ascii=False, indent=4)
 
+    # Publicar en Redis la nueva versión para la aplicación web
+    try:
+        publicar_reporte(data)
+    except RedisError:
+        bitacora.warning("No se pudo publicar el reporte en Redis.")
+
     # Preparar Google Storage
     storage = GoogleCloudStorage("/")
     url = None
@@ -96,9 +105,6 @@ def refresh_report():
 def recorrer_registros():
     """Recorre uno aun todos los registros de la tabla cit_clientes"""
 
-    # Query de consulta
-    registros = CitCliente.query.order_by(CitCliente.id).all()
-
     # Arreglo con todos lo reportes a consultar
     reportes = []
     reportes.append(ReporteCurpParecidos())
@@ -110,11 +116,8 @@ def recorrer_registros():
     reportes.append(ReporteTelefonoFormato())
     reportes.append(ReporteClientesSinCitas())
 
-    # Revisamos registro por registro todos lo posibles errores
-    for registro in registros:
-        for reporte in reportes:
-            if reporte.cantidad < LIMITE_VERIFICACION:
-                reporte.check(registro)
+    # Revisamos en una sola lectura de cit_clientes todos lo posibles errores
+    recorrer(reportes, LIMITE_VERIFICACION)
 
     # Regresamos la cantidad total de errores
     data_reportes = []
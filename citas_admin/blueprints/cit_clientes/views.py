@@ -5,19 +5,19 @@ import json
 import os
 from datetime import datetime, timedelta
 
-from flask import Blueprint, render_template, request, url_for, flash, redirect
+from flask import Blueprint, abort, render_template, request, url_for, flash, redirect
 from flask_login import login_required, current_user
 
-from lib.datatables import get_datatable_parameters, output_datatable_json
-from lib.safe_string import safe_string, safe_text, safe_message, safe_email, safe_curp, safe_tel
-from lib.storage import GoogleCloudStorage, NotConfiguredError
+from lib.busqueda import buscar
+from lib.datatables import Filtro, filtrar_datatable, get_datatable_parameters, output_datatable_json, paginar_datatable
+from lib.safe_string import safe_string, safe_message, safe_email, safe_curp, safe_tel
+from lib.storage import NotConfiguredError
 from citas_admin.extensions import pwd_context
-from sqlalchemy import or_
 
+from citas_admin.blueprints.cit_clientes.almacen import obtener_reporte, paginar_resultados
 from citas_admin.blueprints.cit_clientes.models import CitCliente
 from citas_admin.blueprints.cit_clientes_recuperaciones.models import CitClienteRecuperacion
-from citas_admin.blueprints.bitacoras.models import Bitacora
-from citas_admin.blueprints.modulos.models import Modulo
+from citas_admin.blueprints.bitacoras.auditoria import registrar_bitacora
 from citas_admin.blueprints.permisos.models import Permiso
 from citas_admin.blueprints.usuarios.decorators import permission_required
 
@@ -26,6 +26,7 @@ from config.settings import LIMITE_CITAS_PENDIENTES
 
 FILE_NAME = "cit_clientes_reporte.json"
 MODULO = "CIT CLIENTES"
+LIMITE_BUSQUEDA = 50
 RECOVER_ACCOUNT_CONFIRM_URL = os.getenv("RECOVER_ACCOUNT_CONFIRM_URL", "")
 
 cit_clientes = Blueprint("cit_clientes", __name__, template_folder="templates")
@@ -44,27 +45,27 @@ def datatable_json():
     # Tomar parámetros de Datatables
     draw, start, rows_per_page = get_datatable_parameters()
     # Consultar
-    consulta = CitCliente.query
-    if "estatus" in request.form:
-        consulta = consulta.filter_by(estatus=request.form["estatus"])
-    else:
-        consulta = consulta.filter_by(estatus="A")
-    if "email" in request.form:
-        consulta = consulta.filter(CitCliente.email.contains(safe_text(request.form["email"], to_uppercase=False)))
-    if "nombres" in request.form:
-        consulta = consulta.filter(CitCliente.nombres.contains(safe_string(request.form["nombres"])))
-    if "apellido_primero" in request.form:
-        consulta = consulta.filter(CitCliente.apellido_primero.contains(safe_string(request.form["apellido_primero"])))
-    if "curp" in request.form:
-        consulta = consulta.filter(CitCliente.curp.contains(safe_string(request.form["curp"])))
-    if "telefono" in request.form:
-        consulta = consulta.filter(CitCliente.telefono.contains(safe_tel(request.form["telefono"])))
-    if "nombre_completo" in request.form:
-        palabras = safe_string(request.form["nombre_completo"]).split(" ")
-        for palabra in palabras:
-            consulta = consulta.filter(or_(CitCliente.nombres.contains(palabra), CitCliente.apellido_primero.contains(palabra), CitCliente.apellido_segundo.contains(palabra)))
-    registros = consulta.order_by(CitCliente.modificado.desc()).offset(start).limit(rows_per_page).all()
-    total = consulta.count()
+    consulta, filtrado = filtrar_datatable(
+        CitCliente.query,
+        [
+            Filtro("estatus", CitCliente.estatus, defecto="A"),
+            Filtro("email", [CitCliente.email, CitCliente.busqueda], "campos"),
+            Filtro("nombres", [CitCliente.nombres, CitCliente.busqueda], "campos"),
+            Filtro("apellido_primero", [CitCliente.apellido_primero, CitCliente.busqueda], "campos"),
+            Filtro("curp", [CitCliente.curp, CitCliente.busqueda], "campos"),
+            Filtro("telefono", CitCliente.telefono, "contiene", limpiar=safe_tel),
+            Filtro("nombre_completo", [CitCliente.nombres, CitCliente.apellido_primero, CitCliente.apellido_segundo, CitCliente.busqueda], "campos"),
+        ],
+    )
+    registros, total, cursor = paginar_datatable(
+        consulta,
+        [CitCliente.modificado],
+        start,
+        rows_per_page,
+        descendente=True,
+        estimar=not filtrado,
+        columnas=[CitCliente.email, CitCliente.nombres, CitCliente.apellido_primero, CitCliente.apellido_segundo, CitCliente.curp, CitCliente.telefono],
+    )
     # Elaborar datos para DataTable
     data = []
     for resultado in registros:
@@ -80,7 +81,31 @@ def datatable_json():
             }
         )
     # Entregar JSON
-    return output_datatable_json(draw, total, data)
+    return output_datatable_json(draw, total, data, cursor)
+
+
+@cit_clientes.route("/cit_clientes/buscar_json", methods=["GET", "POST"])
+def search_json():
+    """JSON con los Clientes más parecidos al texto, ordenados por similitud"""
+    texto = request.values.get("texto", "")
+    try:
+        limite = min(max(int(request.values.get("limite", 10)), 1), LIMITE_BUSQUEDA)
+    except ValueError:
+        limite = 10
+    resultados = []
+    if len(texto.strip()) >= 3:
+        for cit_cliente, similitud in buscar(CitCliente.query.filter_by(estatus="A"), CitCliente.busqueda, texto, limite):
+            resultados.append(
+                {
+                    "id": cit_cliente.id,
+                    "nombre": cit_cliente.nombre,
+                    "email": cit_cliente.email,
+                    "curp": cit_cliente.curp,
+                    "url": url_for("cit_clientes.detail", cit_cliente_id=cit_cliente.id),
+                    "similitud": round(similitud, 3),
+                }
+            )
+    return {"texto": texto, "resultados": resultados}
 
 
 @cit_clientes.route("/cit_clientes")
@@ -195,13 +220,12 @@ def edit(cit_cliente_id):
         cliente.limite_citas_pendientes = form.limite_citas.data
         cliente.enviar_boletin = form.recibir_boletin.data
         cliente.save()
-        bitacora = Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+        bitacora = registrar_bitacora(
+            modulo=MODULO,
             usuario=current_user,
             descripcion=safe_message(f"Editado Cliente {cliente.nombre}"),
             url=url_for("cit_clientes.detail", cit_cliente_id=cliente.id),
         )
-        bitacora.save()
         flash(bitacora.descripcion, "success")
         return redirect(bitacora.url)
 
@@ -218,21 +242,15 @@ def edit(cit_cliente_id):
 
 
 def _read_file_report():
-    """Rutina para abrir y leer el archivo de reportes"""
-    # Preparar Google Storage
-    storage = GoogleCloudStorage("/")
-    contenido_json = ""
-    # Subir el archivo a la nube (Google Storage)
+    """Rutina para leer el reporte, de la memoria o de Redis si no ha cambiado"""
     try:
-        contenido_json = storage.download_as_string("json/" + FILE_NAME)
+        return obtener_reporte()
     except NotConfiguredError:
         flash("No se ha configurado el almacenamiento en la nube.", "warning")
         return None
     except Exception:
         flash("Error al leer el archivo.", "warning")
         return None
-    # Abrimos el archivo de reporte JSON
-    return json.loads(contenido_json)
 
 
 @cit_clientes.route("/cit_clientes/avisos")
@@ -254,28 +272,46 @@ def report_list():
 
 @cit_clientes.route("/cit_clientes/aviso/<int:reporte_id>", methods=["GET", "POST"])
 def report_detail(reporte_id):
-    """Lectura a detalle del reporte"""
+    """Lectura a detalle del reporte, los resultados se piden por páginas a report_datatable_json"""
     data = _read_file_report()
-    # Construir tabla de resultados
-    resultados = []
-    renglon = {}
-    for resultado in data["reportes"][reporte_id]["resultados"]:
-        renglon = {}
-        renglon["valor"] = ""
-        for llave, valor in resultado.items():
-            if llave == "id":
-                renglon["id"] = valor
-            else:
-                renglon["valor"] += "<strong>" + str(llave) + ":</strong> " + str(valor) + "<br/>"
-        resultados.append(renglon)
+    if data is None:
+        return redirect(url_for("cit_clientes.report_list"))
+    if reporte_id >= len(data["reportes"]):
+        abort(404)
     return render_template(
         "cit_clientes/report_detail.jinja2",
         fecha_creacion=data["fecha_creacion"],
         reporte=data["reportes"][reporte_id],
-        resultados=resultados,
+        reporte_id=reporte_id,
     )
 
 
+@cit_clientes.route("/cit_clientes/aviso/<int:reporte_id>/datatable_json", methods=["GET", "POST"])
+def report_datatable_json(reporte_id):
+    """DataTable JSON para los resultados de un reporte"""
+    # Tomar parámetros de Datatables
+    draw, start, rows_per_page = get_datatable_parameters()
+    # Tomar la página de resultados del reporte
+    data = _read_file_report()
+    if data is None or reporte_id >= len(data["reportes"]):
+        return output_datatable_json(draw, 0, [])
+    resultados, total = paginar_resultados(data["reportes"][reporte_id], start, rows_per_page)
+    # Elaborar datos para DataTable
+    renglones = []
+    for resultado in resultados:
+        renglones.append(
+            {
+                "detalle": {
+                    "id": resultado["id"],
+                    "url": url_for("cit_clientes.detail", cit_cliente_id=resultado["id"]),
+                },
+                "valores": [[llave, str(valor)] for llave, valor in resultado.items() if llave != "id"],
+            }
+        )
+    # Entregar JSON
+    return output_datatable_json(draw, total, renglones)
+
+
 @cit_clientes.route("/cit_clientes/actualizar_reporte/")
 @permission_required(MODULO, Permiso.ADMINISTRAR)
 def refresh_report():
@@ -344,13 +380,12 @@ def new():
             limite_citas_pendientes=LIMITE_CITAS_PENDIENTES,
         )
         cliente.save()
-        bitacora = Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+        bitacora = registrar_bitacora(
+            modulo=MODULO,
             usuario=current_user,
             descripcion=safe_message(f"Nuevo cliente {cliente.email}: {cliente.nombre}"),
             url=url_for("cit_clientes.detail", cit_cliente_id=cliente.id),
         )
-        bitacora.save()
         flash(bitacora.descripcion, "success")
         return redirect(bitacora.url)
     # Entregar
@@ -3,10 +3,10 @@ Cit Clientes Recuperaciones, vistas
 """
 import json
 
-from flask import Blueprint, render_template, request, url_for
+from flask import Blueprint, render_template, url_for
 from flask_login import login_required
 
-from lib.datatables import get_datatable_parameters, output_datatable_json
+from lib.datatables import Filtro, filtrar_datatable, get_datatable_parameters, output_datatable_json, paginar_datatable
 
 from citas_admin.blueprints.cit_clientes.models import CitCliente
 from citas_admin.blueprints.cit_clientes_recuperaciones.models import CitClienteRecuperacion
@@ -31,19 +31,15 @@ def datatable_json():
     # Tomar parámetros de Datatables
     draw, start, rows_per_page = get_datatable_parameters()
     # Consultar
-    consulta = CitClienteRecuperacion.query
-    if "estatus" in request.form:
-        consulta = consulta.filter_by(estatus=request.form["estatus"])
-    else:
-        consulta = consulta.filter_by(estatus="A")
-    if "email" in request.form:
-        consulta = consulta.join(CitCliente)
-        consulta = consulta.filter(CitCliente.email.contains(request.form["email"]))
-    if "ya_recuperado" in request.form:
-        consulta = consulta.filter(CitClienteRecuperacion.ya_recuperado == request.form["ya_recuperado"])
-
-    registros = consulta.order_by(CitClienteRecuperacion.id.desc()).offset(start).limit(rows_per_page).all()
-    total = consulta.count()
+    consulta, _ = filtrar_datatable(
+        CitClienteRecuperacion.query,
+        [
+            Filtro("estatus", CitClienteRecuperacion.estatus, defecto="A"),
+            Filtro("email", [CitCliente.email, CitCliente.busqueda], "campos", unir=CitCliente),
+            Filtro("ya_recuperado", CitClienteRecuperacion.ya_recuperado),
+        ],
+    )
+    registros, total, cursor = paginar_datatable(consulta, [CitClienteRecuperacion.id], start, rows_per_page, descendente=True, relaciones=[CitClienteRecuperacion.cit_cliente])
     # Elaborar datos para DataTable
     data = []
     for resultado in registros:
@@ -62,7 +58,7 @@ def datatable_json():
             }
         )
     # Entregar JSON
-    return output_datatable_json(draw, total, data)
+    return output_datatable_json(draw, total, data, cursor)
 
 
 @cit_clientes_recuperaciones.route("/cit_clientes_recuperaciones")
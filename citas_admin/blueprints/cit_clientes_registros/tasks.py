@@ -6,13 +6,12 @@ import locale
 import logging
 import os
 
-import sendgrid
 from dotenv import load_dotenv
-from sendgrid.helpers.mail import Email, To, Content, Mail
 
+from lib.correos import CorreoError, obtener_cartero
 from lib.tasks import set_task_progress, set_task_error
 
-from citas_admin.app import create_app
+from citas_admin.app import create_worker_app
 from citas_admin.extensions import db
 
 from citas_admin.blueprints.cit_clientes_registros.models import CitClienteRegistro
@@ -26,15 +25,13 @@ empunadura = logging.FileHandler("cit_clientes_registros.log")
 empunadura.setFormatter(formato)
 bitacora.addHandler(empunadura)
 
-app = create_app()
+app = create_worker_app()
 db.app = app
 
 load_dotenv()  # Take environment variables from .env
 
 EXPIRACION_HORAS = 48
 NEW_ACCOUNT_CONFIRM_URL = os.getenv("NEW_ACCOUNT_CONFIRM_URL", "")
-SENDGRID_API_KEY = os.getenv("SENDGRID_API_KEY", "")
-SENDGRID_FROM_EMAIL = os.getenv("SENDGRID_FROM_EMAIL", "")
 
 
 def enviar(cit_cliente_registro_id):
@@ -53,66 +50,32 @@ def enviar(cit_cliente_registro_id):
         bitacora.warning(mensaje_error)
         return mensaje_error
 
-    # Bandera para saber si se tienen todos los elementos necesarios
-    bandera = True
-
-    # Momento en que se elabora este mensaje
-    momento = datetime.now()
-    momento_str = momento.strftime("%d/%B/%Y %I:%M%p")
-
-    # URL
-    url = None
-    if NEW_ACCOUNT_CONFIRM_URL != "":
-        url = f"{NEW_ACCOUNT_CONFIRM_URL}?hashid={cit_cliente_registro.encode_id()}&cadena_validar={cit_cliente_registro.cadena_validar}"
-    else:
-        bandera = False
-
-    # Contenidos
-    contenidos = [
-        "<h1>Sistema de Citas</h1>",
-        "<h2>PODER JUDICIAL DEL ESTADO DE COAHUILA DE ZARAGOZA</h2>",
-        f"<p>Fecha de elaboración: {momento_str}.</p>",
-        f"Antes de {EXPIRACION_HORAS} horas vaya a este URL para validar su registro y definir su contraseña:",
-        url,
-        "<p>ESTE MENSAJE ES ELABORADO POR UN PROGRAMA. FAVOR DE NO RESPONDER.</p>",
-    ]
-    content = Content("text/html", "<br>".join(contenidos))
-
-    # Remitente
-    from_email = None
-    if SENDGRID_FROM_EMAIL != "":
-        from_email = Email(SENDGRID_FROM_EMAIL)
-    else:
-        bandera = False
-
-    # Destinatario
-    to_email = To(cit_cliente_registro.email)
-
-    # Asunto
-    subject = "Verificar su cuenta en el Sistema de Citas"
-
-    # SendGrid
-    sendgrid_client = None
-    if SENDGRID_API_KEY != "":
-        sendgrid_client = sendgrid.SendGridAPIClient(api_key=SENDGRID_API_KEY)
-    else:
-        bandera = False
+    # Validar que se tienen todos los elementos necesarios
+    try:
+        cartero = obtener_cartero()
+    except CorreoError as error:
+        cartero = None
+        bitacora.warning(str(error))
+    if cartero is None or NEW_ACCOUNT_CONFIRM_URL == "":
+        mensaje_final = f"Se omite el envio a {cit_cliente_registro.email} por que faltan elementos"
+        bitacora.warning(mensaje_final)
+        set_task_progress(100)
+        return mensaje_final
 
     # Enviar mensaje
-    mensaje_final = ""
-    if bandera:
-        mail = Mail(from_email, to_email, subject, content)
-        sendgrid_client.client.mail.send.post(request_body=mail.get())
-        mensaje_final = f"Se ha enviado el mensaje {cit_cliente_registro.mensajes_cantidad} a {cit_cliente_registro.email}"
-        bitacora.info(mensaje_final)
-    else:
-        mensaje_final = f"Se omite el envio a {cit_cliente_registro.email} por que faltan elementos"
-        bitacora.warning()
+    try:
+        cartero.enviar(*_elaborar_mensaje(cit_cliente_registro))
+    except CorreoError as error:
+        mensaje_error = f"ERROR al enviar mensaje: {str(error)}"
+        set_task_error(mensaje_error)
+        bitacora.error(mensaje_error)
+        return mensaje_error
+    mensaje_final = f"Se ha enviado el mensaje {cit_cliente_registro.mensajes_cantidad} a {cit_cliente_registro.email}"
+    bitacora.info(mensaje_final)
 
     # Incrementar contador
-    if bandera:
-        cit_cliente_registro.mensajes_cantidad += 1
-        cit_cliente_registro.save()
+    cit_cliente_registro.mensajes_cantidad += 1
+    cit_cliente_registro.save()
 
     # Terminar tarea
     set_task_progress(100)
@@ -132,26 +95,60 @@ def reenviar():
         bitacora.info(mensaje_final)
         return mensaje_final
 
-    # Bucle para enviar los mensajes
+    # Validar que se tienen todos los elementos necesarios
+    try:
+        cartero = obtener_cartero()
+    except CorreoError as error:
+        mensaje_error = str(error)
+        set_task_error(mensaje_error)
+        bitacora.error(mensaje_error)
+        return mensaje_error
+    if NEW_ACCOUNT_CONFIRM_URL == "":
+        mensaje_error = "La variable NEW_ACCOUNT_CONFIRM_URL NO ha sido declarada"
+        set_task_error(mensaje_error)
+        bitacora.error(mensaje_error)
+        return mensaje_error
+
+    # Si ya expiró, no se envía y de da de baja
     bajas_cantidad = 0
-    envios_cantidad = 0
+    pendientes = []
     for registro in consulta:
-
-        # Si ya expiró, no se envía y de da de baja
         if registro.expiracion <= datetime.now():
             registro.estatus = "B"
-            registro.save()
             bajas_cantidad += 1
-            continue
+        else:
+            pendientes.append(registro)
 
-        # Enviar el mensaje
-        enviar(registro.id)
+    # Enviar los mensajes en paralelo
+    errores = cartero.enviar_lote([_elaborar_mensaje(registro) for registro in pendientes])
 
-        # Incrementar
+    # Incrementar los contadores de los enviados y guardar todo en una sola transacción
+    envios_cantidad = 0
+    for registro, error in zip(pendientes, errores):
+        if error is not None:
+            bitacora.error("ERROR al enviar el mensaje %s: %s", registro.id, str(error))
+            continue
+        registro.mensajes_cantidad += 1
         envios_cantidad += 1
+    db.session.commit()
 
     # Terminar tarea
     set_task_progress(100)
     mensaje_final = f"Se han reenviado {envios_cantidad} mensajes de registros y se dieron de baja {bajas_cantidad}"
     bitacora.info(mensaje_final)
     return mensaje_final
+
+
+def _elaborar_mensaje(cit_cliente_registro):
+    """Elaborar el mensaje, entrega (destinatario, asunto, contenido)"""
+    momento_str = datetime.now().strftime("%d/%B/%Y %I:%M%p")
+    url = f"{NEW_ACCOUNT_CONFIRM_URL}?hashid={cit_cliente_registro.encode_id()}&cadena_validar={cit_cliente_registro.cadena_validar}"
+    contenidos = [
+        "<h1>Sistema de Citas</h1>",
+        "<h2>PODER JUDICIAL DEL ESTADO DE COAHUILA DE ZARAGOZA</h2>",
+        f"<p>Fecha de elaboración: {momento_str}.</p>",
+        f"Antes de {EXPIRACION_HORAS} horas vaya a este URL para validar su registro y definir su contraseña:",
+        url,
+        "<p>ESTE MENSAJE ES ELABORADO POR UN PROGRAMA. FAVOR DE NO RESPONDER.</p>",
+    ]
+    return cit_cliente_registro.email, "Verificar su cuenta en el Sistema de Citas", "<br>".join(contenidos)
@@ -5,15 +5,14 @@ import json
 import os
 
 from dotenv import load_dotenv
-from flask import Blueprint, flash, redirect, render_template, request, url_for
+from flask import Blueprint, flash, redirect, render_template, url_for
 from flask_login import current_user, login_required
 
-from lib.datatables import get_datatable_parameters, output_datatable_json
+from lib.datatables import Filtro, filtrar_datatable, get_datatable_parameters, output_datatable_json, paginar_datatable
 from lib.safe_string import safe_string, safe_message
 
-from citas_admin.blueprints.bitacoras.models import Bitacora
+from citas_admin.blueprints.bitacoras.auditoria import registrar_bitacora
 from citas_admin.blueprints.cit_clientes_registros.models import CitClienteRegistro
-from citas_admin.blueprints.modulos.models import Modulo
 from citas_admin.blueprints.permisos.models import Permiso
 from citas_admin.blueprints.usuarios.decorators import permission_required
 
@@ -35,22 +34,17 @@ def datatable_json():
     # Tomar parámetros de Datatables
     draw, start, rows_per_page = get_datatable_parameters()
     # Consultar
-    consulta = CitClienteRegistro.query
-    if "estatus" in request.form:
-        consulta = consulta.filter_by(estatus=request.form["estatus"])
-    else:
-        consulta = consulta.filter_by(estatus="A")
-    if "email" in request.form:
-        consulta = consulta.filter(CitClienteRegistro.email.contains(request.form["email"]))
-    if "nombres" in request.form:
-        consulta = consulta.filter(CitClienteRegistro.nombres.contains(safe_string(request.form["nombres"])))
-    if "apellido_primero" in request.form:
-        consulta = consulta.filter(CitClienteRegistro.apellido_primero.contains(safe_string(request.form["apellido_primero"])))
-    if "ya_registrado" in request.form:
-        consulta = consulta.filter_by(ya_registrado=request.form["ya_registrado"])
-
-    registros = consulta.order_by(CitClienteRegistro.id.desc()).offset(start).limit(rows_per_page).all()
-    total = consulta.count()
+    consulta, _ = filtrar_datatable(
+        CitClienteRegistro.query,
+        [
+            Filtro("estatus", CitClienteRegistro.estatus, defecto="A"),
+            Filtro("email", CitClienteRegistro.email, "contiene"),
+            Filtro("nombres", CitClienteRegistro.nombres, "contiene", limpiar=safe_string),
+            Filtro("apellido_primero", CitClienteRegistro.apellido_primero, "contiene", limpiar=safe_string),
+            Filtro("ya_registrado", CitClienteRegistro.ya_registrado),
+        ],
+    )
+    registros, total, cursor = paginar_datatable(consulta, [CitClienteRegistro.id], start, rows_per_page, descendente=True)
     # Elaborar datos para DataTable
     data = []
     for resultado in registros:
@@ -69,7 +63,7 @@ def datatable_json():
             }
         )
     # Entregar JSON
-    return output_datatable_json(draw, total, data)
+    return output_datatable_json(draw, total, data, cursor)
 
 
 @cit_clientes_registros.route("/cit_clientes_registros")
@@ -112,13 +106,12 @@ def delete(cit_cliente_registro_id):
     cit_cliente_registro = CitClienteRegistro.query.get_or_404(cit_cliente_registro_id)
     if cit_cliente_registro.estatus == "A":
         cit_cliente_registro.delete()
-        bitacora = Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+        bitacora = registrar_bitacora(
+            modulo=MODULO,
             usuario=current_user,
             descripcion=safe_message(f"Eliminado Registro {cit_cliente_registro.email}"),
             url=url_for("cit_clientes_registros.detail", cit_cliente_registro_id=cit_cliente_registro.id),
         )
-        bitacora.save()
         flash(bitacora.descripcion, "success")
     return redirect(url_for("cit_clientes_registros.detail", cit_cliente_registro_id=cit_cliente_registro.id))
 
@@ -130,12 +123,11 @@ def recover(cit_cliente_registro_id):
     cit_cliente_registro = CitClienteRegistro.query.get_or_404(cit_cliente_registro_id)
     if cit_cliente_registro.estatus == "B":
         cit_cliente_registro.recover()
-        bitacora = Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+        bitacora = registrar_bitacora(
+            modulo=MODULO,
             usuario=current_user,
             descripcion=safe_message(f"Recuperado Registro {cit_cliente_registro.email}"),
             url=url_for("cit_clientes_registros.detail", cit_cliente_registro_id=cit_cliente_registro.id),
         )
-        bitacora.save()
         flash(bitacora.descripcion, "success")
     return redirect(url_for("cit_clientes_registros.detail", cit_cliente_registro_id=cit_cliente_registro.id))
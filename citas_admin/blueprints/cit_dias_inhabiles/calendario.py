@@ -0,0 +1,51 @@
+"""
+Cit Días Inhabiles, calendario de días hábiles
+
+CalendarioHabil calcula de una vez el día hábil en o antes de cada fecha de un rango,
+con una sola consulta a cit_dias_inhabiles. Son inhábiles los sábados, los domingos
+y los días inhábiles con estatus activo.
+"""
+from datetime import date, datetime, timedelta
+
+from dateutil.relativedelta import relativedelta
+
+from citas_admin.blueprints.cit_dias_inhabiles.models import CitDiaInhabil
+
+MESES = 6
+RETROCESO_DIAS = 31  # Días antes del rango donde se busca el primer día hábil
+
+
+class CalendarioHabil:
+    """Día hábil en o antes de cada fecha del rango [desde, hasta]"""
+
+    def __init__(self, desde: date = None, hasta: date = None, meses: int = MESES):
+        self.desde = desde if desde is not None else date.today()
+        self.hasta = hasta if hasta is not None else self.desde + relativedelta(months=meses)
+        inicio = self.desde - timedelta(days=RETROCESO_DIAS)
+
+        # Consultar las fechas de los días inhábiles del rango
+        consulta = CitDiaInhabil.query.with_entities(CitDiaInhabil.fecha).filter_by(estatus="A")
+        inhabiles = {renglon.fecha for renglon in consulta.filter(CitDiaInhabil.fecha >= inicio).filter(CitDiaInhabil.fecha <= self.hasta)}
+
+        # Recorrer los días llevando el último día hábil
+        self.habiles = {}
+        habil = None
+        fecha = inicio
+        while fecha <= self.hasta:
+            if fecha.weekday() < 5 and fecha not in inhabiles:
+                habil = fecha
+            if fecha >= self.desde:
+                self.habiles[fecha] = habil
+            fecha += timedelta(days=1)
+
+    def habil(self, fecha: date):
+        """Entregar el día hábil en o antes de la fecha"""
+        habil = self.habiles.get(fecha)
+        if habil is None:
+            raise ValueError(f"La fecha {fecha} está fuera del calendario {self.desde} a {self.hasta}")
+        return habil
+
+    def cancelar_antes(self, inicio: datetime):
+        """Entregar 24 horas antes del inicio, si cae en día inhábil a la misma hora del día hábil anterior"""
+        limite = inicio - timedelta(hours=24)
+        return datetime.combine(self.habil(limite.date()), limite.time())
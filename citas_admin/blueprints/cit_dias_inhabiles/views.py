@@ -2,14 +2,13 @@
 Cit Dias Inhabiles, vistas
 """
 import json
-from flask import Blueprint, flash, redirect, render_template, request, url_for
+from flask import Blueprint, flash, redirect, render_template, url_for
 from flask_login import current_user, login_required
 
-from lib.datatables import get_datatable_parameters, output_datatable_json
+from lib.datatables import Filtro, filtrar_datatable, get_datatable_parameters, output_datatable_json, paginar_datatable
 from lib.safe_string import safe_string, safe_message
 
-from citas_admin.blueprints.bitacoras.models import Bitacora
-from citas_admin.blueprints.modulos.models import Modulo
+from citas_admin.blueprints.bitacoras.auditoria import registrar_bitacora
 from citas_admin.blueprints.permisos.models import Permiso
 from citas_admin.blueprints.usuarios.decorators import permission_required
 from citas_admin.blueprints.cit_dias_inhabiles.models import CitDiaInhabil
@@ -33,13 +32,8 @@ def datatable_json():
     # Tomar parámetros de Datatables
     draw, start, rows_per_page = get_datatable_parameters()
     # Consultar
-    consulta = CitDiaInhabil.query
-    if "estatus" in request.form:
-        consulta = consulta.filter_by(estatus=request.form["estatus"])
-    else:
-        consulta = consulta.filter_by(estatus="A")
-    registros = consulta.order_by(CitDiaInhabil.fecha.desc()).offset(start).limit(rows_per_page).all()
-    total = consulta.count()
+    consulta, _ = filtrar_datatable(CitDiaInhabil.query, [Filtro("estatus", CitDiaInhabil.estatus, defecto="A")])
+    registros, total, cursor = paginar_datatable(consulta, [CitDiaInhabil.fecha], start, rows_per_page, descendente=True)
     # Elaborar datos para DataTable
     data = []
     for resultado in registros:
@@ -53,7 +47,7 @@ def datatable_json():
             }
         )
     # Entregar JSON
-    return output_datatable_json(draw, total, data)
+    return output_datatable_json(draw, total, data, cursor)
 
 
 @cit_dias_inhabiles.route("/cit_dias_inhabiles")
@@ -97,13 +91,12 @@ def new():
             descripcion=safe_string(form.descripcion.data),
         )
         cit_dia_inhabil.save()
-        bitacora = Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+        bitacora = registrar_bitacora(
+            modulo=MODULO,
             usuario=current_user,
             descripcion=safe_message(f"Nuevo Dia en {cit_dia_inhabil.descripcion}"),
             url=url_for("cit_dias_inhabiles.detail", cit_dia_inhabil_id=cit_dia_inhabil.id),
         )
-        bitacora.save()
         flash(bitacora.descripcion, "success")
         return redirect(bitacora.url)
     return render_template("cit_dias_inhabiles/new.jinja2", form=form)
@@ -119,13 +112,12 @@ def edit(cit_dia_inhabil_id):
         cit_dia_inhabil.fecha = form.fecha.data
         cit_dia_inhabil.descripcion = safe_string(form.descripcion.data)
         cit_dia_inhabil.save()
-        bitacora = Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+        bitacora = registrar_bitacora(
+            modulo=MODULO,
             usuario=current_user,
             descripcion=safe_message(f"Editado Dia Inhabil {cit_dia_inhabil.descripcion}"),
             url=url_for("cit_dias_inhabiles.detail", cit_dia_inhabil_id=cit_dia_inhabil.id),
         )
-        bitacora.save()
         flash(bitacora.descripcion, "success")
         return redirect(bitacora.url)
     form.fecha.data = cit_dia_inhabil.fecha
@@ -140,13 +132,12 @@ def delete(cit_dia_inhabil_id):
     cit_dia_inhabil = CitDiaInhabil.query.get_or_404(cit_dia_inhabil_id)
     if cit_dia_inhabil.estatus == "A":
         cit_dia_inhabil.delete()
-        bitacora = Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+        bitacora = registrar_bitacora(
+            modulo=MODULO,
             usuario=current_user,
             descripcion=safe_message(f"Eliminado Dia  {cit_dia_inhabil.descripcion}"),
             url=url_for("cit_dias_inhabiles.detail", cit_dia_inhabil_id=cit_dia_inhabil.id),
         )
-        bitacora.save()
         flash(bitacora.descripcion, "success")
     return redirect(url_for("cit_dias_inhabiles.detail", cit_dia_inhabil_id=cit_dia_inhabil.id))
 
@@ -158,12 +149,11 @@ def recover(cit_dia_inhabil_id):
     cit_dia_inhabil = CitDiaInhabil.query.get_or_404(cit_dia_inhabil_id)
     if cit_dia_inhabil.estatus == "B":
         cit_dia_inhabil.recover()
-        bitacora = Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+        bitacora = registrar_bitacora(
+            modulo=MODULO,
             usuario=current_user,
             descripcion=safe_message(f"Recuperado Dia In {cit_dia_inhabil.descripcion}"),
             url=url_for("cit_dias_inhabiles.detail", cit_dia_inhabil_id=cit_dia_inhabil.id),
         )
-        bitacora.save()
         flash(bitacora.descripcion, "success")
     return redirect(url_for("cit_dias_inhabiles.detail", cit_dia_inhabil_id=cit_dia_inhabil.id))
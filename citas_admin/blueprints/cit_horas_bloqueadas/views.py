@@ -3,14 +3,14 @@ Cit Horas Bloqueadas, vistas
 """
 import json
 from datetime import datetime, time
-from flask import Blueprint, flash, redirect, render_template, request, url_for, abort
+from flask import Blueprint, flash, redirect, render_template, url_for, abort
 from flask_login import current_user, login_required
 
-from lib.datatables import get_datatable_parameters, output_datatable_json
+from lib.datatables import Filtro, filtrar_datatable, get_datatable_parameters, output_datatable_json, paginar_datatable
 from lib.safe_string import safe_string, safe_message
 
-from citas_admin.blueprints.bitacoras.models import Bitacora
-from citas_admin.blueprints.modulos.models import Modulo
+from citas_admin.blueprints.bitacoras.auditoria import registrar_bitacora
+from citas_admin.blueprints.cit_citas import disponibilidad
 from citas_admin.blueprints.permisos.models import Permiso
 from citas_admin.blueprints.usuarios.decorators import permission_required
 from citas_admin.blueprints.cit_horas_bloqueadas.models import CitHoraBloqueada
@@ -34,18 +34,17 @@ def datatable_json():
     # Tomar parámetros de Datatables
     draw, start, rows_per_page = get_datatable_parameters()
     # Consultar
-    consulta = CitHoraBloqueada.query
-    if "estatus" in request.form:
-        consulta = consulta.filter_by(estatus=request.form["estatus"])
-    else:
-        consulta = consulta.filter_by(estatus="A")
-    if "oficina_id" in request.form:
-        consulta = consulta.filter_by(oficina_id=request.form["oficina_id"])
+    consulta, _ = filtrar_datatable(
+        CitHoraBloqueada.query,
+        [
+            Filtro("estatus", CitHoraBloqueada.estatus, defecto="A"),
+            Filtro("oficina_id", CitHoraBloqueada.oficina_id),
+        ],
+    )
     # Omitir las horas bloqueadas ya pasadas
     consulta = consulta.filter(CitHoraBloqueada.fecha >= datetime.now().date())
     # Ordenar
-    registros = consulta.order_by(CitHoraBloqueada.fecha, CitHoraBloqueada.inicio).offset(start).limit(rows_per_page).all()
-    total = consulta.count()
+    registros, total, cursor = paginar_datatable(consulta, [CitHoraBloqueada.fecha, CitHoraBloqueada.inicio], start, rows_per_page, relaciones=[CitHoraBloqueada.oficina])
     # Elaborar datos para DataTable
     data = []
     for resultado in registros:
@@ -59,7 +58,7 @@ def datatable_json():
             }
         )
     # Entregar JSON
-    return output_datatable_json(draw, total, data)
+    return output_datatable_json(draw, total, data, cursor)
 
 
 @cit_horas_bloqueadas.route("/cit_horas_bloqueadas")
@@ -109,7 +108,7 @@ def detail(cit_hora_bloqueada_id):
     cit_hora_bloqueada = CitHoraBloqueada.query.get_or_404(cit_hora_bloqueada_id)
     if not current_user.can_admin(MODULO):
         # Si no es administrador, no puede ver los detalles de una hora bloqueada de otra oficina
-        if cit_hora_bloqueada.oficina != current_user.oficina:
+        if cit_hora_bloqueada.oficina_id != current_user.oficina_id:
             return redirect(url_for("cit_horas_bloqueadas.list_active"))
     return render_template("cit_horas_bloqueadas/detail.jinja2", cit_hora_bloqueada=cit_hora_bloqueada)
 
@@ -150,13 +149,13 @@ def new():
                 descripcion=safe_string(form.descripcion.data),
             )
             cit_hora_bloqueada.save()
-            bitacora = Bitacora(
-                modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+            disponibilidad.invalidar_oficina(cit_hora_bloqueada.oficina_id, cit_hora_bloqueada.fecha)
+            bitacora = registrar_bitacora(
+                modulo=MODULO,
                 usuario=current_user,
                 descripcion=safe_message(f"Nuevo Hora Bloqueada {cit_hora_bloqueada.fecha}"),
                 url=url_for("cit_horas_bloqueadas.detail", cit_hora_bloqueada_id=cit_hora_bloqueada.id),
             )
-            bitacora.save()
             flash(bitacora.descripcion, "success")
             return redirect(bitacora.url)
     # Si es administrador, puede elegir la oficina
@@ -202,19 +201,20 @@ def edit(cit_hora_bloqueada_id):
             es_valido = False
         # Si es valido, actualizar
         if es_valido:
+            disponibilidad.invalidar_oficina(cit_hora_bloqueada.oficina_id, cit_hora_bloqueada.fecha)
             cit_hora_bloqueada.oficina_id = oficina_id
             cit_hora_bloqueada.fecha = form.fecha.data
             cit_hora_bloqueada.inicio = form.inicio_tiempo.data
             cit_hora_bloqueada.termino = form.termino_tiempo.data
             cit_hora_bloqueada.descripcion = safe_string(form.descripcion.data)
             cit_hora_bloqueada.save()
-            bitacora = Bitacora(
-                modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+            disponibilidad.invalidar_oficina(cit_hora_bloqueada.oficina_id, cit_hora_bloqueada.fecha)
+            bitacora = registrar_bitacora(
+                modulo=MODULO,
                 usuario=current_user,
                 descripcion=safe_message(f"Editado Hora Bloqueada {cit_hora_bloqueada.fecha} a las {cit_hora_bloqueada.inicio}"),
                 url=url_for("cit_horas_bloqueadas.detail", cit_hora_bloqueada_id=cit_hora_bloqueada.id),
             )
-            bitacora.save()
             flash(bitacora.descripcion, "success")
             return redirect(bitacora.url)
     # Cargar datos al formulario
@@ -238,18 +238,18 @@ def delete(cit_hora_bloqueada_id):
     cit_hora_bloqueada = CitHoraBloqueada.query.get_or_404(cit_hora_bloqueada_id)
     if not current_user.can_admin(MODULO):
         # Si no es administrador, no puede ver los detalles de una hora bloqueada de otra oficina
-        if cit_hora_bloqueada.oficina != current_user.oficina:
+        if cit_hora_bloqueada.oficina_id != current_user.oficina_id:
             return redirect(url_for("cit_horas_bloqueadas.list_active"))
 
     if cit_hora_bloqueada.estatus == "A":
         cit_hora_bloqueada.delete()
-        bitacora = Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+        disponibilidad.invalidar_oficina(cit_hora_bloqueada.oficina_id, cit_hora_bloqueada.fecha)
+        bitacora = registrar_bitacora(
+            modulo=MODULO,
             usuario=current_user,
             descripcion=safe_message(f"Eliminado Hora  {cit_hora_bloqueada.fecha}"),
             url=url_for("cit_horas_bloqueadas.detail", cit_hora_bloqueada_id=cit_hora_bloqueada.id),
         )
-        bitacora.save()
         flash(bitacora.descripcion, "success")
     return redirect(url_for("cit_horas_bloqueadas.detail", cit_hora_bloqueada_id=cit_hora_bloqueada.id))
 
@@ -261,17 +261,17 @@ def recover(cit_hora_bloqueada_id):
     cit_hora_bloqueada = CitHoraBloqueada.query.get_or_404(cit_hora_bloqueada_id)
     if not current_user.can_admin(MODULO):
         # Si no es administrador, no puede ver los detalles de una hora bloqueada de otra oficina
-        if cit_hora_bloqueada.oficina != current_user.oficina:
+        if cit_hora_bloqueada.oficina_id != current_user.oficina_id:
             return redirect(url_for("cit_horas_bloqueadas.list_inactive"))
 
     if cit_hora_bloqueada.estatus == "B":
         cit_hora_bloqueada.recover()
-        bitacora = Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+        disponibilidad.invalidar_oficina(cit_hora_bloqueada.oficina_id, cit_hora_bloqueada.fecha)
+        bitacora = registrar_bitacora(
+            modulo=MODULO,
             usuario=current_user,
             descripcion=safe_message(f"Recuperado Hora  {cit_hora_bloqueada.fecha}"),
             url=url_for("cit_horas_bloqueadas.detail", cit_hora_bloqueada_id=cit_hora_bloqueada.id),
         )
-        bitacora.save()
         flash(bitacora.descripcion, "success")
     return redirect(url_for("cit_horas_bloqueadas.detail", cit_hora_bloqueada_id=cit_hora_bloqueada.id))
@@ -5,7 +5,7 @@ import logging
 
 from lib.tasks import set_task_progress, set_task_error
 
-from citas_admin.app import create_app
+from citas_admin.app import create_worker_app
 from citas_admin.extensions import db
 
 from citas_admin.blueprints.cit_categorias.models import CitCategoria
@@ -19,7 +19,7 @@ empunadura = logging.FileHandler("cit_oficinas_servicios.log")
 empunadura.setFormatter(formato)
 bitacora.addHandler(empunadura)
 
-app = create_app()
+app = create_worker_app()
 app.app_context().push()
 db.app = app
 
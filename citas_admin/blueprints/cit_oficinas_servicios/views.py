@@ -2,19 +2,19 @@
 Cit Oficinas-Servicios, vistas
 """
 import json
-from flask import Blueprint, current_app, flash, redirect, render_template, request, url_for
+from flask import Blueprint, current_app, flash, redirect, render_template, url_for
 from flask_login import current_user, login_required
+from sqlalchemy.orm import joinedload
 
-from lib.datatables import get_datatable_parameters, output_datatable_json
+from lib.datatables import Filtro, filtrar_datatable, get_datatable_parameters, output_datatable_json, paginar_datatable
 from lib.safe_string import safe_message, safe_string
 
-from citas_admin.blueprints.bitacoras.models import Bitacora
+from citas_admin.blueprints.bitacoras.auditoria import registrar_bitacora
 from citas_admin.blueprints.cit_categorias.models import CitCategoria
 from citas_admin.blueprints.cit_oficinas_servicios.models import CitOficinaServicio
 from citas_admin.blueprints.cit_oficinas_servicios.forms import CitOficinaServicioFormWithOficina, CitOficinaServicioFormWithCitServicio, CitOficinaServicioFormWithCitCategoria, CitOficinaServicioFormWithDistrito
 from citas_admin.blueprints.cit_servicios.models import CitServicio
 from citas_admin.blueprints.distritos.models import Distrito
-from citas_admin.blueprints.modulos.models import Modulo
 from citas_admin.blueprints.oficinas.models import Oficina
 from citas_admin.blueprints.permisos.models import Permiso
 from citas_admin.blueprints.usuarios.decorators import permission_required
@@ -37,17 +37,17 @@ def datatable_json():
     # Tomar parámetros de Datatables
     draw, start, rows_per_page = get_datatable_parameters()
     # Consultar
-    consulta = CitOficinaServicio.query
-    if "estatus" in request.form:
-        consulta = consulta.filter_by(estatus=request.form["estatus"])
-    else:
-        consulta = consulta.filter_by(estatus="A")
-    if "oficina_id" in request.form:
-        consulta = consulta.filter_by(oficina_id=request.form["oficina_id"])
-    if "cit_servicio_id" in request.form:
-        consulta = consulta.filter_by(cit_servicio_id=request.form["cit_servicio_id"])
-    registros = consulta.order_by(CitOficinaServicio.id).offset(start).limit(rows_per_page).all()
-    total = consulta.count()
+    consulta, _ = filtrar_datatable(
+        CitOficinaServicio.query,
+        [
+            Filtro("estatus", CitOficinaServicio.estatus, defecto="A"),
+            Filtro("oficina_id", CitOficinaServicio.oficina_id),
+            Filtro("cit_servicio_id", CitOficinaServicio.cit_servicio_id),
+        ],
+    )
+    registros, total, cursor = paginar_datatable(
+        consulta, [CitOficinaServicio.id], start, rows_per_page, relaciones=[joinedload(CitOficinaServicio.oficina).joinedload(Oficina.distrito), joinedload(CitOficinaServicio.cit_servicio).joinedload(CitServicio.cit_categoria)]
+    )
     # Elaborar datos para DataTable
     data = []
     for resultado in registros:
@@ -76,7 +76,7 @@ def datatable_json():
             }
         )
     # Entregar JSON
-    return output_datatable_json(draw, total, data)
+    return output_datatable_json(draw, total, data, cursor)
 
 
 @cit_oficinas_servicios.route("/cit_oficinas_servicios")
@@ -128,13 +128,12 @@ def new_with_oficina(oficina_id):
             descripcion=descripcion,
         )
         cit_oficina_servicio.save()
-        bitacora = Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+        bitacora = registrar_bitacora(
+            modulo=MODULO,
             usuario=current_user,
             descripcion=safe_message(f"Nuevo Oficina-Servicio {descripcion}"),
             url=url_for("cit_oficinas_servicios.detail", cit_oficina_servicio_id=cit_oficina_servicio.id),
         )
-        bitacora.save()
         flash(bitacora.descripcion, "success")
         return redirect(bitacora.url)
     form.oficina.data = oficina.compuesto  # Read only
@@ -164,13 +163,12 @@ def new_with_cit_servicio(cit_servicio_id):
             descripcion=descripcion,
         )
         cit_oficina_servicio.save()
-        bitacora = Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+        bitacora = registrar_bitacora(
+            modulo=MODULO,
             usuario=current_user,
             descripcion=safe_message(f"Nuevo Oficina-Servicio {descripcion}"),
             url=url_for("cit_oficinas_servicios.detail", cit_oficina_servicio_id=cit_oficina_servicio.id),
         )
-        bitacora.save()
         flash(bitacora.descripcion, "success")
         return redirect(bitacora.url)
     form.cit_servicio.data = cit_servicio.compuesto  # Read only
@@ -226,13 +224,12 @@ def delete(cit_oficina_servicio_id):
     cit_oficina_servicio = CitOficinaServicio.query.get_or_404(cit_oficina_servicio_id)
     if cit_oficina_servicio.estatus == "A":
         cit_oficina_servicio.delete()
-        bitacora = Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+        bitacora = registrar_bitacora(
+            modulo=MODULO,
             usuario=current_user,
             descripcion=safe_message(f"Eliminado Oficina-Servicio {cit_oficina_servicio.descripcion}"),
             url=url_for("cit_oficinas_servicios.detail", cit_oficina_servicio_id=cit_oficina_servicio.id),
         )
-        bitacora.save()
         flash(bitacora.descripcion, "success")
     return redirect(url_for("cit_oficinas_servicios.detail", cit_oficina_servicio_id=cit_oficina_servicio.id))
 
@@ -244,12 +241,11 @@ def recover(cit_oficina_servicio_id):
     cit_oficina_servicio = CitOficinaServicio.query.get_or_404(cit_oficina_servicio_id)
     if cit_oficina_servicio.estatus == "B":
         cit_oficina_servicio.recover()
-        bitacora = Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+        bitacora = registrar_bitacora(
+            modulo=MODULO,
             usuario=current_user,
             descripcion=safe_message(f"Recuperado Oficina-Servicio {cit_oficina_servicio.descripcion}"),
             url=url_for("cit_oficinas_servicios.detail", cit_oficina_servicio_id=cit_oficina_servicio.id),
         )
-        bitacora.save()
         flash(bitacora.descripcion, "success")
     return redirect(url_for("cit_oficinas_servicios.detail", cit_oficina_servicio_id=cit_oficina_servicio.id))
@@ -29,6 +29,7 @@ class CitServicio(db.Model, UniversalMixin):
 
     # Hijos
     cit_citas = db.relationship("CitCita", back_populates="cit_servicio")
+    cit_citas_diarias = db.relationship("CitCitaDiaria", back_populates="cit_servicio")
     cit_oficinas_servicios = db.relationship("CitOficinaServicio", back_populates="cit_servicio")
 
     @property
@@ -3,17 +3,17 @@ Cit Servicios, vistas
 """
 import json
 from datetime import time
-from flask import Blueprint, flash, redirect, render_template, request, url_for
+from flask import Blueprint, flash, redirect, render_template, url_for
 from flask_login import current_user, login_required
 
-from lib.datatables import get_datatable_parameters, output_datatable_json
+from lib.datatables import Filtro, filtrar_datatable, get_datatable_parameters, output_datatable_json, paginar_datatable
 from lib.safe_string import safe_clave, safe_string, safe_message
 
-from citas_admin.blueprints.bitacoras.models import Bitacora
+from citas_admin.blueprints.bitacoras.auditoria import registrar_bitacora
 from citas_admin.blueprints.cit_categorias.models import CitCategoria
+from citas_admin.blueprints.cit_citas import disponibilidad
 from citas_admin.blueprints.cit_servicios.models import CitServicio
 from citas_admin.blueprints.cit_servicios.forms import CitServicioForm
-from citas_admin.blueprints.modulos.models import Modulo
 from citas_admin.blueprints.permisos.models import Permiso
 from citas_admin.blueprints.usuarios.decorators import permission_required
 
@@ -35,15 +35,14 @@ def datatable_json():
     # Tomar parámetros de Datatables
     draw, start, rows_per_page = get_datatable_parameters()
     # Consultar
-    consulta = CitServicio.query
-    if "estatus" in request.form:
-        consulta = consulta.filter_by(estatus=request.form["estatus"])
-    else:
-        consulta = consulta.filter_by(estatus="A")
-    if "cit_categoria_id" in request.form:
-        consulta = consulta.filter_by(cit_categoria_id=request.form["cit_categoria_id"])
-    registros = consulta.order_by(CitServicio.clave).offset(start).limit(rows_per_page).all()
-    total = consulta.count()
+    consulta, _ = filtrar_datatable(
+        CitServicio.query,
+        [
+            Filtro("estatus", CitServicio.estatus, defecto="A"),
+            Filtro("cit_categoria_id", CitServicio.cit_categoria_id),
+        ],
+    )
+    registros, total, cursor = paginar_datatable(consulta, [CitServicio.clave], start, rows_per_page, relaciones=[CitServicio.cit_categoria])
     # Elaborar datos para DataTable
     data = []
     for resultado in registros:
@@ -66,7 +65,7 @@ def datatable_json():
             }
         )
     # Entregar JSON
-    return output_datatable_json(draw, total, data)
+    return output_datatable_json(draw, total, data, cursor)
 
 
 @cit_servicios.route("/cit_servicios")
@@ -155,13 +154,12 @@ def new(cit_categoria_id):
                 dias_habilitados=_conversion_dias_habilitados_letra_numero(form.dias_habilitados.data),
             )
             cit_servicio.save()
-            bitacora = Bitacora(
-                modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+            bitacora = registrar_bitacora(
+                modulo=MODULO,
                 usuario=current_user,
                 descripcion=safe_message(f"Nuevo Servicio {cit_servicio.descripcion}"),
                 url=url_for("cit_servicios.detail", cit_servicio_id=cit_servicio.id),
             )
-            bitacora.save()
             flash(bitacora.descripcion, "success")
             return redirect(bitacora.url)
     # Llenar el campo con el nombre de la categoria
@@ -211,13 +209,13 @@ def edit(cit_servicio_id):
                 dias_habilitados = ""
             cit_servicio.dias_habilitados = dias_habilitados
             cit_servicio.save()
-            bitacora = Bitacora(
-                modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+            disponibilidad.invalidar_servicio(cit_servicio.id)
+            bitacora = registrar_bitacora(
+                modulo=MODULO,
                 usuario=current_user,
                 descripcion=safe_message(f"Editado Servicio: {cit_servicio.descripcion}"),
                 url=url_for("cit_servicios.detail", cit_servicio_id=cit_servicio.id),
             )
-            bitacora.save()
             flash(bitacora.descripcion, "success")
             return redirect(bitacora.url)
     # Llenar los campos del formulario
@@ -315,13 +313,12 @@ def delete(cit_servicio_id):
     cit_servicio = CitServicio.query.get_or_404(cit_servicio_id)
     if cit_servicio.estatus == "A":
         cit_servicio.delete()
-        bitacora = Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+        bitacora = registrar_bitacora(
+            modulo=MODULO,
             usuario=current_user,
             descripcion=safe_message(f"Eliminado Servi {cit_servicio.descripcion}"),
             url=url_for("cit_servicios.detail", cit_servicio_id=cit_servicio.id),
         )
-        bitacora.save()
         flash(bitacora.descripcion, "success")
     return redirect(url_for("cit_servicios.detail", cit_servicio_id=cit_servicio.id))
 
@@ -333,12 +330,11 @@ def recover(cit_servicio_id):
     cit_servicio = CitServicio.query.get_or_404(cit_servicio_id)
     if cit_servicio.estatus == "B":
         cit_servicio.recover()
-        bitacora = Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+        bitacora = registrar_bitacora(
+            modulo=MODULO,
             usuario=current_user,
             descripcion=safe_message(f"Recuperado Servicio {cit_servicio.descripcion}"),
             url=url_for("cit_servicios.detail", cit_servicio_id=cit_servicio.id),
         )
-        bitacora.save()
         flash(bitacora.descripcion, "success")
     return redirect(url_for("cit_servicios.detail", cit_servicio_id=cit_servicio.id))
@@ -3,16 +3,15 @@ Distritos, vistas
 """
 import json
 
-from flask import Blueprint, flash, render_template, redirect, request, url_for
+from flask import Blueprint, flash, render_template, redirect, url_for
 from flask_login import current_user, login_required
 
-from lib.datatables import get_datatable_parameters, output_datatable_json
+from lib.datatables import Filtro, filtrar_datatable, get_datatable_parameters, output_datatable_json, paginar_datatable
 from lib.safe_string import safe_clave, safe_message, safe_string
 
-from citas_admin.blueprints.bitacoras.models import Bitacora
+from citas_admin.blueprints.bitacoras.auditoria import registrar_bitacora
 from citas_admin.blueprints.distritos.models import Distrito
 from citas_admin.blueprints.distritos.forms import DistritoForm
-from citas_admin.blueprints.modulos.models import Modulo
 from citas_admin.blueprints.permisos.models import Permiso
 from citas_admin.blueprints.usuarios.decorators import permission_required
 
@@ -36,13 +35,8 @@ def datatable_json():
     # Tomar parámetros de Datatables
     draw, start, rows_per_page = get_datatable_parameters()
     # Consultar
-    consulta = Distrito.query
-    if "estatus" in request.form:
-        consulta = consulta.filter_by(estatus=request.form["estatus"])
-    else:
-        consulta = consulta.filter_by(estatus="A")
-    registros = consulta.order_by(Distrito.clave).offset(start).limit(rows_per_page).all()
-    total = consulta.count()
+    consulta, _ = filtrar_datatable(Distrito.query, [Filtro("estatus", Distrito.estatus, defecto="A")])
+    registros, total, cursor = paginar_datatable(consulta, [Distrito.clave], start, rows_per_page)
     # Elaborar datos para DataTable
     data = []
     for resultado in registros:
@@ -60,7 +54,7 @@ def datatable_json():
             }
         )
     # Entregar JSON
-    return output_datatable_json(draw, total, data)
+    return output_datatable_json(draw, total, data, cursor)
 
 
 @distritos.route("/distritos")
@@ -121,13 +115,12 @@ def new():
                 es_jurisdiccional=form.es_jurisdiccional.data,
             )
             distrito.save()
-            bitacora = Bitacora(
-                modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+            bitacora = registrar_bitacora(
+                modulo=MODULO,
                 usuario=current_user,
                 descripcion=safe_message(f"Nuevo distrito {distrito.nombre}"),
                 url=url_for("distritos.detail", distrito_id=distrito.id),
             )
-            bitacora.save()
             flash(bitacora.descripcion, "success")
             return redirect(bitacora.url)
     return render_template("distritos/new.jinja2", form=form)
@@ -164,13 +157,12 @@ def edit(distrito_id):
             distrito.es_distrito = form.es_distrito.data
             distrito.es_jurisdiccional = form.es_jurisdiccional.data
             distrito.save()
-            bitacora = Bitacora(
-                modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+            bitacora = registrar_bitacora(
+                modulo=MODULO,
                 usuario=current_user,
                 descripcion=safe_message(f"Editado distrito {distrito.nombre}"),
                 url=url_for("distritos.detail", distrito_id=distrito.id),
             )
-            bitacora.save()
             flash(bitacora.descripcion, "success")
             return redirect(bitacora.url)
     form.clave.data = distrito.clave
@@ -189,13 +181,12 @@ def delete(distrito_id):
     distrito = Distrito.query.get_or_404(distrito_id)
     if distrito.estatus == "A":
         distrito.delete()
-        bitacora = Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+        bitacora = registrar_bitacora(
+            modulo=MODULO,
             usuario=current_user,
             descripcion=safe_message(f"Eliminado distrito {distrito.nombre}"),
             url=url_for("distritos.detail", distrito_id=distrito.id),
         )
-        bitacora.save()
         flash(bitacora.descripcion, "success")
         return redirect(bitacora.url)
     return redirect(url_for("distritos.detail", distrito_id=distrito.id))
@@ -208,13 +199,12 @@ def recover(distrito_id):
     distrito = Distrito.query.get_or_404(distrito_id)
     if distrito.estatus == "B":
         distrito.recover()
-        bitacora = Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+        bitacora = registrar_bitacora(
+            modulo=MODULO,
             usuario=current_user,
             descripcion=safe_message(f"Recuperado distrito {distrito.nombre}"),
             url=url_for("distritos.detail", distrito_id=distrito.id),
         )
-        bitacora.save()
         flash(bitacora.descripcion, "success")
         return redirect(bitacora.url)
     return redirect(url_for("distritos.detail", distrito_id=distrito.id))
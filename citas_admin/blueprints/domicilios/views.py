@@ -3,16 +3,15 @@ Domicilios, vistas
 """
 import json
 
-from flask import Blueprint, flash, redirect, render_template, request, url_for
+from flask import Blueprint, flash, redirect, render_template, url_for
 from flask_login import current_user, login_required
 
-from lib.datatables import get_datatable_parameters, output_datatable_json
+from lib.datatables import Filtro, filtrar_datatable, get_datatable_parameters, output_datatable_json, paginar_datatable
 from lib.safe_string import safe_string, safe_message
 
-from citas_admin.blueprints.bitacoras.models import Bitacora
+from citas_admin.blueprints.bitacoras.auditoria import registrar_bitacora
 from citas_admin.blueprints.domicilios.forms import DomicilioForm, DomicilioSearchForm
 from citas_admin.blueprints.domicilios.models import Domicilio
-from citas_admin.blueprints.modulos.models import Modulo
 from citas_admin.blueprints.permisos.models import Permiso
 from citas_admin.blueprints.usuarios.decorators import permission_required
 
@@ -34,23 +33,18 @@ def datatable_json():
     # Tomar parámetros de Datatables
     draw, start, rows_per_page = get_datatable_parameters()
     # Consultar
-    consulta = Domicilio.query
-    if "estatus" in request.form:
-        consulta = consulta.filter_by(estatus=request.form["estatus"])
-    else:
-        consulta = consulta.filter_by(estatus="A")
-    if "estado" in request.form:
-        consulta = consulta.filter(Domicilio.estado.contains(safe_string(request.form["estado"])))
-    if "municipio" in request.form:
-        consulta = consulta.filter(Domicilio.municipio.contains(safe_string(request.form["municipio"])))
-    if "calle" in request.form:
-        consulta = consulta.filter(Domicilio.calle.contains(safe_string(request.form["calle"])))
-    if "colonia" in request.form:
-        consulta = consulta.filter(Domicilio.colonia.contains(safe_string(request.form["colonia"])))
-    if "cp" in request.form:
-        consulta = consulta.filter_by(colonia=int(request.form["cp"]))
-    registros = consulta.order_by(Domicilio.id.desc()).offset(start).limit(rows_per_page).all()
-    total = consulta.count()
+    consulta, _ = filtrar_datatable(
+        Domicilio.query,
+        [
+            Filtro("estatus", Domicilio.estatus, defecto="A"),
+            Filtro("estado", Domicilio.estado, "contiene", limpiar=safe_string),
+            Filtro("municipio", Domicilio.municipio, "contiene", limpiar=safe_string),
+            Filtro("calle", Domicilio.calle, "contiene", limpiar=safe_string),
+            Filtro("colonia", Domicilio.colonia, "contiene", limpiar=safe_string),
+            Filtro("cp", Domicilio.cp, limpiar=int),
+        ],
+    )
+    registros, total, cursor = paginar_datatable(consulta, [Domicilio.id], start, rows_per_page, descendente=True)
     # Elaborar datos para DataTable
     data = []
     for resultado in registros:
@@ -70,7 +64,7 @@ def datatable_json():
             }
         )
     # Entregar JSON
-    return output_datatable_json(draw, total, data)
+    return output_datatable_json(draw, total, data, cursor)
 
 
 @domicilios.route("/domicilios")
@@ -168,13 +162,12 @@ def new():
             cp=cp,
             completo=completo,
         ).save()
-        bitacora = Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+        bitacora = registrar_bitacora(
+            modulo=MODULO,
             usuario=current_user,
             descripcion=safe_message(f"Nuevo Domicilio {completo}"),
             url=url_for("domicilios.detail", domicilio_id=domicilio.id),
         )
-        bitacora.save()
         flash(bitacora.descripcion, "success")
         return redirect(bitacora.url)
     return render_template("domicilios/new.jinja2", form=form)
@@ -196,13 +189,12 @@ def edit(domicilio_id):
         domicilio.cp = form.cp.data
         domicilio.completo = f"{domicilio.calle} #{domicilio.num_ext} {domicilio.num_int}, {domicilio.colonia}, {domicilio.municipio}, {domicilio.estado}, C.P. {domicilio.cp}"
         domicilio.save()
-        bitacora = Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+        bitacora = registrar_bitacora(
+            modulo=MODULO,
             usuario=current_user,
             descripcion=safe_message(f"Editado el Domicilio {domicilio.completo}"),
             url=url_for("domicilios.detail", domicilio_id=domicilio.id),
         )
-        bitacora.save()
         flash(bitacora.descripcion, "success")
         return redirect(bitacora.url)
     form.estado.data = domicilio.estado
@@ -222,13 +214,12 @@ def delete(domicilio_id):
     domicilio = Domicilio.query.get_or_404(domicilio_id)
     if domicilio.estatus == "A":
         domicilio.delete()
-        bitacora = Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+        bitacora = registrar_bitacora(
+            modulo=MODULO,
             usuario=current_user,
             descripcion=safe_message(f"Eliminado el Domicilio {domicilio.calle}"),
             url=url_for("domicilios.detail", domicilio_id=domicilio.id),
         )
-        bitacora.save()
         flash(bitacora.descripcion, "success")
     return redirect(url_for("domicilios.detail", domicilio_id=domicilio_id))
 
@@ -240,12 +231,11 @@ def recover(domicilio_id):
     domicilio = Domicilio.query.get_or_404(domicilio_id)
     if domicilio.estatus == "B":
         domicilio.recover()
-        bitacora = Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+        bitacora = registrar_bitacora(
+            modulo=MODULO,
             usuario=current_user,
             descripcion=safe_message(f"Recuperado el Servicio {domicilio.calle}"),
             url=url_for("domicilios.detail", domicilio_id=domicilio.id),
         )
-        bitacora.save()
         flash(bitacora.descripcion, "success")
     return redirect(url_for("domicilios.detail", domicilio_id=domicilio_id))
@@ -10,10 +10,10 @@ from flask import Blueprint, flash, redirect, render_template, request, url_for
 from flask_login import current_user, login_required
 
 from sqlalchemy.sql import func
-from lib.database import SessionLocal
 
-from lib.datatables import get_datatable_parameters, output_datatable_json
+from lib.datatables import Filtro, filtrar_datatable, get_datatable_parameters, output_datatable_json, paginar_datatable
 
+from citas_admin.extensions import db
 from citas_admin.blueprints.bitacoras.models import Bitacora
 from citas_admin.blueprints.modulos.models import Modulo
 from citas_admin.blueprints.permisos.models import Permiso
@@ -21,7 +21,6 @@ from citas_admin.blueprints.usuarios.decorators import permission_required
 
 from citas_admin.blueprints.enc_servicios.models import EncServicio
 from citas_admin.blueprints.oficinas.models import Oficina
-from citas_admin.blueprints.distritos.models import Distrito
 
 MODULO = "ENC SERVICIOS"
 
@@ -41,33 +40,21 @@ def datatable_json():
     # Tomar parámetros de Datatables
     draw, start, rows_per_page = get_datatable_parameters()
     # Consultar
-    consulta = EncServicio.query
-    if "estatus" in request.form:
-        consulta = consulta.filter_by(estatus=request.form["estatus"])
-    else:
-        consulta = consulta.filter_by(estatus="A")
-    if "desde" in request.form:
-        consulta = consulta.filter(EncServicio.modificado >= request.form["desde"])
-    if "hasta" in request.form:
-        consulta = consulta.filter(EncServicio.modificado <= request.form["hasta"])
-    if "respuesta_01" in request.form:
-        consulta = consulta.filter_by(respuesta_01=request.form["respuesta_01"])
-    if "respuesta_02" in request.form:
-        consulta = consulta.filter_by(respuesta_02=request.form["respuesta_02"])
-    if "respuesta_03" in request.form:
-        consulta = consulta.filter_by(respuesta_03=request.form["respuesta_03"])
-    if "estado" in request.form:
-        consulta = consulta.filter_by(estado=request.form["estado"])
-    if "oficina_id" in request.form:
-        consulta = consulta.filter_by(oficina_id=request.form["oficina_id"])
-    else:
-        if "distrito_id" in request.form:
-            consulta = consulta.join(Oficina)
-            consulta = consulta.join(Distrito)
-            consulta = consulta.filter(Distrito.id == request.form["distrito_id"])
-    # Hace el query de listado
-    registros = consulta.order_by(EncServicio.modificado.desc()).offset(start).limit(rows_per_page).all()
-    total = consulta.count()
+    consulta, filtrado = filtrar_datatable(
+        EncServicio.query,
+        [
+            Filtro("estatus", EncServicio.estatus, defecto="A"),
+            Filtro("desde", EncServicio.modificado, "desde"),
+            Filtro("hasta", EncServicio.modificado, "hasta"),
+            Filtro("respuesta_01", EncServicio.respuesta_01),
+            Filtro("respuesta_02", EncServicio.respuesta_02),
+            Filtro("respuesta_03", EncServicio.respuesta_03),
+            Filtro("estado", EncServicio.estado),
+            Filtro("oficina_id", EncServicio.oficina_id),
+            Filtro("distrito_id", Oficina.distrito_id, unir=Oficina),
+        ],
+    )
+    registros, total, cursor = paginar_datatable(consulta, [EncServicio.modificado], start, rows_per_page, descendente=True, estimar=not filtrado, relaciones=[EncServicio.oficina])
     # Elaborar datos para DataTable
     data = []
     for registro in registros:
@@ -91,7 +78,7 @@ def datatable_json():
             }
         )
     # Entregar JSON
-    return output_datatable_json(draw, total, data)
+    return output_datatable_json(draw, total, data, cursor)
 
 
 @enc_servicios.route("/encuestas/servicios")
@@ -161,8 +148,7 @@ def report():
                 oficina_nombre = request.form["oficina_nombre"]
 
     # Query de consulta de cantidad de encuestados
-    db = SessionLocal()
-    enc_servicios_cantidades = db.query(
+    enc_servicios_cantidades = db.session.query(
         EncServicio.estado.label("estado"),
         func.count("*").label("cantidad"),
     ).group_by(EncServicio.estado)
@@ -202,7 +188,7 @@ def report():
     # Conteo de respuestas
     # Respuesta 01
     enc_servicios_cantidades = (
-        db.query(
+        db.session.query(
             EncServicio.respuesta_01,
             func.count("*").label("cantidad"),
         )
@@ -212,7 +198,7 @@ def report():
     formula_result_01, valores_01 = _count_votes(enc_servicios_cantidades, votos_total, desde_date, hasta_date, distrito_id, oficina_id)
     # Respuesta 02
     enc_servicios_cantidades = (
-        db.query(
+        db.session.query(
             EncServicio.respuesta_02,
             func.count("*").label("cantidad"),
         )
@@ -222,7 +208,7 @@ def report():
     formula_result_02, valores_02 = _count_votes(enc_servicios_cantidades, votos_total, desde_date, hasta_date, distrito_id, oficina_id)
     # Respuesta 03
     enc_servicios_cantidades = (
-        db.query(
+        db.session.query(
             EncServicio.respuesta_03,
             func.count("*").label("cantidad"),
         )
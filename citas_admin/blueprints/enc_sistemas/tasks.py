@@ -6,14 +6,13 @@ import locale
 import logging
 import os
 
-import sendgrid
 from dotenv import load_dotenv
-from sendgrid.helpers.mail import Email, To, Content, Mail
-from jinja2 import Environment, FileSystemLoader
 
+from lib.correos import CorreoError, obtener_cartero
+from lib.plantillas import obtener_plantilla
 from lib.tasks import set_task_progress, set_task_error
 
-from citas_admin.app import create_app
+from citas_admin.app import create_worker_app
 from citas_admin.extensions import db
 
 from citas_admin.blueprints.enc_sistemas.models import EncSistema
@@ -28,14 +27,12 @@ empunadura = logging.FileHandler("enc_sistemas.log")
 empunadura.setFormatter(formato)
 bitacora.addHandler(empunadura)
 
-app = create_app()
+app = create_worker_app()
 db.app = app
 
 load_dotenv()  # Take environment variables from .env
 
 POLL_SYSTEM_URL = os.getenv("POLL_SYSTEM_URL", "")
-SENDGRID_API_KEY = os.getenv("SENDGRID_API_KEY", "")
-SENDGRID_FROM_EMAIL = os.getenv("SENDGRID_FROM_EMAIL", "")
 
 
 def enviar(enc_sistemas_id):
@@ -86,45 +83,21 @@ def enviar(enc_sistemas_id):
     url = f"{POLL_SYSTEM_URL}?hashid={encuesta.encode_id()}"
 
     # Importar plantilla Jinja2
-    entorno = Environment(
-        loader=FileSystemLoader("citas_admin/blueprints/enc_sistemas/templates/enc_sistemas"),
-        trim_blocks=True,
-        lstrip_blocks=True,
-    )
-    plantilla = entorno.get_template("email.jinja2")
+    plantilla = obtener_plantilla("enc_sistemas", "email.jinja2")
     contenidos = plantilla.render(
         fecha_elaboracion=momento_str,
         cliente_nombre=cliente.nombre,
         url_encuesta=url,
     )
-    content = Content("text/html", contenidos)
-
-    # Remitente
-    if SENDGRID_FROM_EMAIL == "":
-        mensaje_error = "La variable SENDGRID_FROM_EMAIL NO ha sido declarada"
-        set_task_error(mensaje_error)
-        bitacora.error(mensaje_error)
-        return mensaje_error
-    from_email = Email(SENDGRID_FROM_EMAIL)
 
-    # Destinatario
-    to_email = To(cliente.email)
-
-    # Asunto
-    subject = "Encuesta de Sistema de Citas"
-
-    # SendGrid
-    sendgrid_client = None
-    if SENDGRID_API_KEY == "":
-        mensaje_error = "La variable SENDGRID_API_KEY NO ha sido declarada"
+    # Enviar mensaje
+    try:
+        obtener_cartero().enviar(cliente.email, "Encuesta de Sistema de Citas", contenidos)
+    except CorreoError as error:
+        mensaje_error = f"ERROR al enviar mensaje: {str(error)}"
         set_task_error(mensaje_error)
         bitacora.error(mensaje_error)
         return mensaje_error
-    sendgrid_client = sendgrid.SendGridAPIClient(api_key=SENDGRID_API_KEY)
-
-    # Enviar mensaje
-    mail = Mail(from_email, to_email, subject, content)
-    sendgrid_client.client.mail.send.post(request_body=mail.get())
 
     # Terminar tarea
     set_task_progress(100)
@@ -10,10 +10,10 @@ from flask import Blueprint, flash, redirect, render_template, request, url_for
 from flask_login import current_user, login_required
 
 from sqlalchemy.sql import func
-from lib.database import SessionLocal
 
-from lib.datatables import get_datatable_parameters, output_datatable_json
+from lib.datatables import Filtro, filtrar_datatable, get_datatable_parameters, output_datatable_json, paginar_datatable
 
+from citas_admin.extensions import db
 from citas_admin.blueprints.bitacoras.models import Bitacora
 from citas_admin.blueprints.modulos.models import Modulo
 from citas_admin.blueprints.permisos.models import Permiso
@@ -39,22 +39,17 @@ def datatable_json():
     # Tomar parámetros de Datatables
     draw, start, rows_per_page = get_datatable_parameters()
     # Consultar
-    consulta = EncSistema.query
-    if "estatus" in request.form:
-        consulta = consulta.filter_by(estatus=request.form["estatus"])
-    else:
-        consulta = consulta.filter_by(estatus="A")
-    if "desde" in request.form:
-        consulta = consulta.filter(EncSistema.modificado >= request.form["desde"])
-    if "hasta" in request.form:
-        consulta = consulta.filter(EncSistema.modificado <= request.form["hasta"])
-    if "respuesta_01" in request.form:
-        consulta = consulta.filter_by(respuesta_01=request.form["respuesta_01"])
-    if "estado" in request.form:
-        consulta = consulta.filter_by(estado=request.form["estado"])
-    # Hace el query de listado
-    registros = consulta.order_by(EncSistema.id.desc()).offset(start).limit(rows_per_page).all()
-    total = consulta.count()
+    consulta, filtrado = filtrar_datatable(
+        EncSistema.query,
+        [
+            Filtro("estatus", EncSistema.estatus, defecto="A"),
+            Filtro("desde", EncSistema.modificado, "desde"),
+            Filtro("hasta", EncSistema.modificado, "hasta"),
+            Filtro("respuesta_01", EncSistema.respuesta_01),
+            Filtro("estado", EncSistema.estado),
+        ],
+    )
+    registros, total, cursor = paginar_datatable(consulta, [EncSistema.id], start, rows_per_page, descendente=True, estimar=not filtrado)
     # Elaborar datos para DataTable
     data = []
     for registro in registros:
@@ -72,7 +67,7 @@ def datatable_json():
             }
         )
     # Entregar JSON
-    return output_datatable_json(draw, total, data)
+    return output_datatable_json(draw, total, data, cursor)
 
 
 @enc_sistemas.route("/encuestas/sistemas")
@@ -127,8 +122,7 @@ def report():
     else:
         hasta_date = datetime.now()
     # Query de consulta de cantidad de encuestados
-    db = SessionLocal()
-    enc_sistemas_cantidades = db.query(
+    enc_sistemas_cantidades = db.session.query(
         EncSistema.estado.label("estado"),
         func.count("*").label("cantidad"),
     ).group_by(EncSistema.estado)
@@ -156,7 +150,7 @@ def report():
     votos_total = encuestados_contestados
 
     enc_sistemas_cantidades = (
-        db.query(
+        db.session.query(
             EncSistema.respuesta_01,
             func.count("*").label("cantidad"),
         )
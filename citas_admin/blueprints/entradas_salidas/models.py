@@ -18,6 +18,7 @@ class EntradaSalida(db.Model, UniversalMixin):
 
     # Nombre de la tabla
     __tablename__ = "entradas_salidas"
+    __table_args__ = {"info": {"particionar_por": "creado"}}  # En PostgreSQL se parte por mes, vea lib/particiones.py
 
     # Clave primaria
     id = db.Column(db.Integer, primary_key=True)
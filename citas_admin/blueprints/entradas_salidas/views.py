@@ -5,10 +5,11 @@ from flask import Blueprint, render_template
 from flask.helpers import url_for
 from flask_login import login_required
 
-from lib.datatables import get_datatable_parameters, output_datatable_json
+from lib.datatables import Filtro, filtrar_datatable, get_datatable_parameters, output_datatable_json, paginar_datatable
 
 from citas_admin.blueprints.entradas_salidas.models import EntradaSalida
 from citas_admin.blueprints.permisos.models import Permiso
+from citas_admin.blueprints.usuarios.models import Usuario
 from citas_admin.blueprints.usuarios.decorators import permission_required
 
 MODULO = "ENTRADAS SALIDAS"
@@ -23,10 +24,9 @@ def datatable_json():
     """DataTable JSON para listado de entradas y salidas"""
     # Tomar parámetros de Datatables
     draw, start, rows_per_page = get_datatable_parameters()
-    # Consultar
-    consulta = EntradaSalida.query
-    registros = consulta.order_by(EntradaSalida.id.desc()).offset(start).limit(rows_per_page).all()
-    total = consulta.count()
+    # Consultar, ordenar y filtrar por creado para que PostgreSQL solo lea las particiones necesarias
+    consulta, filtrado = filtrar_datatable(EntradaSalida.query, [Filtro("creado_desde", EntradaSalida.creado, "desde"), Filtro("creado_hasta", EntradaSalida.creado, "hasta")])
+    registros, total, cursor = paginar_datatable(consulta, [EntradaSalida.creado], start, rows_per_page, descendente=True, estimar=not filtrado, relaciones=[(EntradaSalida.usuario, [Usuario.email])])
     # Elaborar datos para DataTable
     data = []
     for entrada_salida in registros:
@@ -41,7 +41,7 @@ def datatable_json():
             }
         )
     # Entregar JSON
-    return output_datatable_json(draw, total, data)
+    return output_datatable_json(draw, total, data, cursor)
 
 
 @entradas_salidas.route("/entradas_salidas")
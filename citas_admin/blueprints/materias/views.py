@@ -3,16 +3,15 @@ Materias, vistas
 """
 import json
 
-from flask import Blueprint, flash, redirect, render_template, request, url_for
+from flask import Blueprint, flash, redirect, render_template, url_for
 from flask_login import current_user, login_required
 
-from lib.datatables import get_datatable_parameters, output_datatable_json
+from lib.datatables import Filtro, filtrar_datatable, get_datatable_parameters, output_datatable_json, paginar_datatable
 from lib.safe_string import safe_message, safe_string
 
-from citas_admin.blueprints.bitacoras.models import Bitacora
+from citas_admin.blueprints.bitacoras.auditoria import registrar_bitacora
 from citas_admin.blueprints.materias.models import Materia
 from citas_admin.blueprints.materias.forms import MateriaForm
-from citas_admin.blueprints.modulos.models import Modulo
 from citas_admin.blueprints.permisos.models import Permiso
 from citas_admin.blueprints.usuarios.decorators import permission_required
 
@@ -34,13 +33,8 @@ def datatable_json():
     # Tomar parámetros de Datatables
     draw, start, rows_per_page = get_datatable_parameters()
     # Consultar
-    consulta = Materia.query
-    if "estatus" in request.form:
-        consulta = consulta.filter_by(estatus=request.form["estatus"])
-    else:
-        consulta = consulta.filter_by(estatus="A")
-    registros = consulta.order_by(Materia.nombre).offset(start).limit(rows_per_page).all()
-    total = consulta.count()
+    consulta, _ = filtrar_datatable(Materia.query, [Filtro("estatus", Materia.estatus, defecto="A")])
+    registros, total, cursor = paginar_datatable(consulta, [Materia.nombre], start, rows_per_page)
     # Elaborar datos para DataTable
     data = []
     for resultado in registros:
@@ -53,7 +47,7 @@ def datatable_json():
             }
         )
     # Entregar JSON
-    return output_datatable_json(draw, total, data)
+    return output_datatable_json(draw, total, data, cursor)
 
 
 @materias.route("/materias")
@@ -99,13 +93,12 @@ def new():
         else:
             materia = Materia(nombre=nombre)
             materia.save()
-            bitacora = Bitacora(
-                modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+            bitacora = registrar_bitacora(
+                modulo=MODULO,
                 usuario=current_user,
                 descripcion=safe_message(f"Nueva materia {materia.nombre}"),
                 url=url_for("materias.detail", materia_id=materia.id),
             )
-            bitacora.save()
             flash(bitacora.descripcion, "success")
             return redirect(bitacora.url)
     return render_template("materias/new.jinja2", form=form)
@@ -130,13 +123,12 @@ def edit(materia_id):
         if es_valido:
             materia.nombre = nombre
             materia.save()
-            bitacora = Bitacora(
-                modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+            bitacora = registrar_bitacora(
+                modulo=MODULO,
                 usuario=current_user,
                 descripcion=safe_message(f"Editada materia {materia.nombre}"),
                 url=url_for("materias.detail", materia_id=materia.id),
             )
-            bitacora.save()
             flash(bitacora.descripcion, "success")
             return redirect(bitacora.url)
     form.nombre.data = materia.nombre
@@ -150,13 +142,12 @@ def delete(materia_id):
     materia = Materia.query.get_or_404(materia_id)
     if materia.estatus == "A":
         materia.delete()
-        bitacora = Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+        bitacora = registrar_bitacora(
+            modulo=MODULO,
             usuario=current_user,
             descripcion=safe_message(f"Eliminada materia {materia.nombre}"),
             url=url_for("materias.detail", materia_id=materia.id),
         )
-        bitacora.save()
         flash(bitacora.descripcion, "success")
     return redirect(url_for("materias.detail", materia_id=materia.id))
 
@@ -168,12 +159,11 @@ def recover(materia_id):
     materia = Materia.query.get_or_404(materia_id)
     if materia.estatus == "B":
         materia.recover()
-        bitacora = Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+        bitacora = registrar_bitacora(
+            modulo=MODULO,
             usuario=current_user,
             descripcion=safe_message(f"Recuperada materia {materia.nombre}"),
             url=url_for("materias.detail", materia_id=materia.id),
         )
-        bitacora.save()
         flash(bitacora.descripcion, "success")
     return redirect(url_for("materias.detail", materia_id=materia.id))
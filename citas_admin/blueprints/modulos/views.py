@@ -3,13 +3,13 @@ Modulos, vistas
 """
 import json
 
-from flask import Blueprint, flash, redirect, render_template, request, url_for
+from flask import Blueprint, flash, redirect, render_template, url_for
 from flask_login import current_user, login_required
 
-from lib.datatables import get_datatable_parameters, output_datatable_json
+from lib.datatables import Filtro, filtrar_datatable, get_datatable_parameters, output_datatable_json, paginar_datatable
 from lib.safe_string import safe_message, safe_string
 
-from citas_admin.blueprints.bitacoras.models import Bitacora
+from citas_admin.blueprints.bitacoras.auditoria import registrar_bitacora
 from citas_admin.blueprints.modulos.models import Modulo
 from citas_admin.blueprints.modulos.forms import ModuloForm
 from citas_admin.blueprints.permisos.models import Permiso
@@ -33,13 +33,8 @@ def datatable_json():
     # Tomar parámetros de Datatables
     draw, start, rows_per_page = get_datatable_parameters()
     # Consultar
-    consulta = Modulo.query
-    if "estatus" in request.form:
-        consulta = consulta.filter_by(estatus=request.form["estatus"])
-    else:
-        consulta = consulta.filter_by(estatus="A")
-    registros = consulta.order_by(Modulo.nombre).offset(start).limit(rows_per_page).all()
-    total = consulta.count()
+    consulta, _ = filtrar_datatable(Modulo.query, [Filtro("estatus", Modulo.estatus, defecto="A")])
+    registros, total, cursor = paginar_datatable(consulta, [Modulo.nombre], start, rows_per_page)
     # Elaborar datos para DataTable
     data = []
     for resultado in registros:
@@ -54,7 +49,7 @@ def datatable_json():
             }
         )
     # Entregar JSON
-    return output_datatable_json(draw, total, data)
+    return output_datatable_json(draw, total, data, cursor)
 
 
 @modulos.route("/modulos")
@@ -106,13 +101,12 @@ def new():
                 en_navegacion=form.en_navegacion.data == 1,
             )
             modulo.save()
-            bitacora = Bitacora(
-                modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+            bitacora = registrar_bitacora(
+                modulo=MODULO,
                 usuario=current_user,
                 descripcion=safe_message(f"Nuevo módulo {modulo.nombre}"),
                 url=url_for("modulos.detail", modulo_id=modulo.id),
             )
-            bitacora.save()
             flash(bitacora.descripcion, "success")
             return redirect(bitacora.url)
     return render_template("modulos/new.jinja2", form=form)
@@ -141,13 +135,12 @@ def edit(modulo_id):
             modulo.ruta = form.ruta.data
             modulo.en_navegacion = form.en_navegacion.data == 1
             modulo.save()
-            bitacora = Bitacora(
-                modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+            bitacora = registrar_bitacora(
+                modulo=MODULO,
                 usuario=current_user,
                 descripcion=safe_message(f"Editado módulo {modulo.nombre}"),
                 url=url_for("modulos.detail", modulo_id=modulo.id),
             )
-            bitacora.save()
             flash(bitacora.descripcion, "success")
             return redirect(bitacora.url)
     form.nombre.data = modulo.nombre
@@ -168,13 +161,12 @@ def delete(modulo_id):
     modulo = Modulo.query.get_or_404(modulo_id)
     if modulo.estatus == "A":
         modulo.delete()
-        bitacora = Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+        bitacora = registrar_bitacora(
+            modulo=MODULO,
             usuario=current_user,
             descripcion=safe_message(f"Eliminado módulo {modulo.nombre}"),
             url=url_for("modulos.detail", modulo_id=modulo.id),
         )
-        bitacora.save()
         flash(bitacora.descripcion, "success")
         return redirect(bitacora.url)
     return redirect(url_for("modulos.detail", modulo_id=modulo.id))
@@ -187,13 +179,12 @@ def recover(modulo_id):
     modulo = Modulo.query.get_or_404(modulo_id)
     if modulo.estatus == "B":
         modulo.recover()
-        bitacora = Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+        bitacora = registrar_bitacora(
+            modulo=MODULO,
             usuario=current_user,
             descripcion=safe_message(f"Recuperado módulo {modulo.nombre}"),
             url=url_for("modulos.detail", modulo_id=modulo.id),
         )
-        bitacora.save()
         flash(bitacora.descripcion, "success")
         return redirect(bitacora.url)
     return redirect(url_for("modulos.detail", modulo_id=modulo.id))
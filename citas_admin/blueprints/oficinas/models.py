@@ -34,6 +34,7 @@ class Oficina(db.Model, UniversalMixin):
     # Hijos
     usuarios = db.relationship("Usuario", back_populates="oficina")
     cit_citas = db.relationship("CitCita", back_populates="oficina")
+    cit_citas_diarias = db.relationship("CitCitaDiaria", back_populates="oficina")
     cit_horas_bloqueadas = db.relationship("CitHoraBloqueada", back_populates="oficina")
     cit_oficinas_servicios = db.relationship("CitOficinaServicio", back_populates="oficina")
     enc_servicios = db.relationship("EncServicio", back_populates="oficina")
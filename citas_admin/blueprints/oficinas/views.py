@@ -7,11 +7,11 @@ from flask import Blueprint, flash, redirect, render_template, request, url_for
 from flask_login import current_user, login_required
 from sqlalchemy.sql import or_
 
-from lib.datatables import get_datatable_parameters, output_datatable_json
+from lib.datatables import Filtro, filtrar_datatable, get_datatable_parameters, output_datatable_json, paginar_datatable
 from lib.safe_string import safe_clave, safe_message, safe_string
 
-from citas_admin.blueprints.bitacoras.models import Bitacora
-from citas_admin.blueprints.modulos.models import Modulo
+from citas_admin.blueprints.bitacoras.auditoria import registrar_bitacora
+from citas_admin.blueprints.cit_citas import disponibilidad
 from citas_admin.blueprints.oficinas.forms import OficinaForm, OficinaSearchForm
 from citas_admin.blueprints.oficinas.models import Oficina
 from citas_admin.blueprints.permisos.models import Permiso
@@ -35,21 +35,19 @@ def datatable_json():
     # Tomar parámetros de Datatables
     draw, start, rows_per_page = get_datatable_parameters()
     # Consultar
-    consulta = Oficina.query
-    if "estatus" in request.form:
-        consulta = consulta.filter_by(estatus=request.form["estatus"])
-    else:
-        consulta = consulta.filter_by(estatus="A")
-    if "distrito_id" in request.form:
-        consulta = consulta.filter(Oficina.distrito_id == request.form["distrito_id"])
-    if "domicilio_id" in request.form:
-        consulta = consulta.filter_by(domicilio_id=request.form["domicilio_id"])
-    if "clave" in request.form:
-        consulta = consulta.filter(Oficina.clave.contains(safe_string(request.form["clave"])))
-    if "descripcion" in request.form:
-        consulta = consulta.filter(Oficina.descripcion.contains(safe_string(request.form["descripcion"])))
-    registros = consulta.order_by(Oficina.clave).offset(start).limit(rows_per_page).all()
-    total = consulta.count()
+    consulta, _ = filtrar_datatable(
+        Oficina.query,
+        [
+            Filtro("estatus", Oficina.estatus, defecto="A"),
+            Filtro("distrito_id", Oficina.distrito_id),
+            Filtro("domicilio_id", Oficina.domicilio_id),
+            Filtro("clave", Oficina.clave, "contiene", limpiar=safe_string),
+            Filtro("descripcion", Oficina.descripcion, "contiene", limpiar=safe_string),
+        ],
+    )
+    registros, total, cursor = paginar_datatable(consulta, [Oficina.clave], start, rows_per_page, relaciones=[Oficina.domicilio, Oficina.distrito])
+    # Consultar los permisos una sola vez y no en cada renglon
+    puede_ver = {modulo: current_user.can_view(modulo) for modulo in ("DOMICILIOS", "DISTRITOS")}
     # Elaborar datos para DataTable
     data = []
     for resultado in registros:
@@ -62,11 +60,11 @@ def datatable_json():
                 "descripcion_corta": resultado.descripcion_corta,
                 "domicilio": {
                     "completo": resultado.domicilio.completo,
-                    "url": url_for("domicilios.detail", domicilio_id=resultado.domicilio_id) if current_user.can_view("DOMICILIOS") else "",
+                    "url": url_for("domicilios.detail", domicilio_id=resultado.domicilio_id) if puede_ver["DOMICILIOS"] else "",
                 },
                 "distrito": {
                     "nombre_corto": resultado.distrito.nombre_corto,
-                    "url": url_for("distritos.detail", distrito_id=resultado.distrito_id) if current_user.can_view("DISTRITOS") else "",
+                    "url": url_for("distritos.detail", distrito_id=resultado.distrito_id) if puede_ver["DISTRITOS"] else "",
                 },
                 "apertura": resultado.apertura.strftime("%H:%M"),
                 "cierre": resultado.cierre.strftime("%H:%M"),
@@ -77,7 +75,7 @@ def datatable_json():
             }
         )
     # Entregar JSON
-    return output_datatable_json(draw, total, data)
+    return output_datatable_json(draw, total, data, cursor)
 
 
 @oficinas.route("/oficinas")
@@ -169,13 +167,12 @@ def new():
                 puede_enviar_qr=form.puede_enviar_qr.data,
             )
             oficina.save()
-            bitacora = Bitacora(
-                modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+            bitacora = registrar_bitacora(
+                modulo=MODULO,
                 usuario=current_user,
                 descripcion=safe_message(f"Nueva Oficina {oficina.clave}"),
                 url=url_for("oficinas.detail", oficina_id=oficina.id),
             )
-            bitacora.save()
             flash(bitacora.descripcion, "success")
             return redirect(bitacora.url)
     return render_template("oficinas/new.jinja2", form=form)
@@ -211,13 +208,13 @@ def edit(oficina_id):
             oficina.limite_personas = form.limite_personas.data
             oficina.puede_enviar_qr = form.puede_enviar_qr.data
             oficina.save()
-            bitacora = Bitacora(
-                modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+            disponibilidad.invalidar_oficina(oficina.id)
+            bitacora = registrar_bitacora(
+                modulo=MODULO,
                 usuario=current_user,
                 descripcion=safe_message(f"Editado la Oficina {oficina.clave}"),
                 url=url_for("oficinas.detail", oficina_id=oficina.id),
             )
-            bitacora.save()
             flash(bitacora.descripcion, "success")
             return redirect(bitacora.url)
     form.distrito.data = oficina.distrito
@@ -242,13 +239,12 @@ def delete(oficina_id):
     oficina = Oficina.query.get_or_404(oficina_id)
     if oficina.estatus == "A":
         oficina.delete()
-        bitacora = Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+        bitacora = registrar_bitacora(
+            modulo=MODULO,
             usuario=current_user,
             descripcion=safe_message(f"Eliminado el servicio {oficina.clave}"),
             url=url_for("oficinas.detail", oficina_id=oficina.id),
         )
-        bitacora.save()
         flash(bitacora.descripcion, "success")
     return redirect(url_for("oficinas.detail", oficina_id=oficina_id))
 
@@ -261,13 +257,12 @@ def recover(oficina_id):
     oficina = Oficina.query.get_or_404(oficina_id)
     if oficina.estatus == "B":
         oficina.recover()
-        bitacora = Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+        bitacora = registrar_bitacora(
+            modulo=MODULO,
             usuario=current_user,
             descripcion=safe_message(f"Recuperado el Servicio {oficina.clave}"),
             url=url_for("oficinas.detail", oficina_id=oficina.id),
         )
-        bitacora.save()
         flash(bitacora.descripcion, "success")
     return redirect(url_for("oficinas.detail", oficina_id=oficina_id))
 
@@ -21,6 +21,7 @@ class PagPago(db.Model, UniversalMixin):
 
     # Nombre de la tabla
     __tablename__ = "pag_pagos"
+    __table_args__ = (db.Index("ix_pag_pagos_solicitados_creado", "creado", postgresql_where=db.text("estado = 'SOLICITADO' AND estatus = 'A'")),)
 
     # Clave primaria
     id = db.Column(db.Integer, primary_key=True)
@@ -47,6 +48,11 @@ class PagPago(db.Model, UniversalMixin):
     total = db.Column(db.Numeric(precision=8, scale=2, decimal_return_scale=2), nullable=False)
     ya_se_envio_comprobante = db.Column(db.Boolean, nullable=False, default=False, server_default="false")
 
+    @classmethod
+    def condiciones_expirados(cls, before_creado):
+        """Condiciones de los pagos SOLICITADOS creados hasta before_creado, los que pasan a CANCELADO"""
+        return [cls.estado == "SOLICITADO", cls.creado <= before_creado, cls.estatus == "A"]
+
     def __repr__(self):
         """Representación"""
         return f"<PagPago {self.descripcion} ${self.total}>"
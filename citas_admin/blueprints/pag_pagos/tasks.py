@@ -7,16 +7,16 @@ import logging
 import os
 
 from dotenv import load_dotenv
-from jinja2 import Environment, FileSystemLoader
-import sendgrid
-from sendgrid.helpers.mail import Email, To, Content, Mail
 
+from lib.correos import CorreoError, obtener_cartero
+from lib.plantillas import obtener_plantilla
 from lib.tasks import set_task_progress, set_task_error
 from lib.hashids import cifrar_id
+from lib import transiciones
 
 from citas_admin.blueprints.pag_pagos.models import PagPago
 
-from citas_admin.app import create_app
+from citas_admin.app import create_worker_app
 from citas_admin.extensions import db
 
 locale.setlocale(locale.LC_TIME, "es_MX.utf8")
@@ -28,14 +28,12 @@ empunadura = logging.FileHandler("pag_pagos.log")
 empunadura.setFormatter(formato)
 bitacora.addHandler(empunadura)
 
-app = create_app()
+app = create_worker_app()
 db.app = app
 
 load_dotenv()  # Take environment variables from .env
 
 CANTIDAD = 10
-SENDGRID_API_KEY = os.getenv("SENDGRID_API_KEY", "")
-SENDGRID_FROM_EMAIL = os.getenv("SENDGRID_FROM_EMAIL", "")
 PAGO_VERIFY_URL = os.getenv("PAGO_VERIFY_URL", "")
 
 
@@ -60,69 +58,30 @@ def enviar_mensaje_pagado(pag_pago_id, to_email=None):
         bitacora.error(mensaje_error)
         return mensaje_error
 
-    # Definir remitente para SendGrid
-    if SENDGRID_FROM_EMAIL == "":
-        mensaje_error = "La variable SENDGRID_FROM_EMAIL NO ha sido declarada"
-        set_task_error(mensaje_error)
-        bitacora.error(mensaje_error)
-        return mensaje_error
-    from_email = Email(SENDGRID_FROM_EMAIL)
-
-    # Definir cliente de SendGrid
-    if SENDGRID_API_KEY == "":
-        mensaje_error = "La variable SENDGRID_API_KEY NO ha sido declarada"
+    # Definir el cartero, si falta la configuración se termina
+    try:
+        cartero = obtener_cartero()
+    except CorreoError as error:
+        mensaje_error = str(error)
         set_task_error(mensaje_error)
         bitacora.error(mensaje_error)
         return mensaje_error
-    sendgrid_client = sendgrid.SendGridAPIClient(api_key=SENDGRID_API_KEY)
-
-    # Momento en que se elabora este mensaje
-    momento = datetime.now()
-    momento_str = momento.strftime("%d/%b/%Y %I:%M %p")
 
-    # Definir la plantilla
-    entorno = Environment(
-        loader=FileSystemLoader("citas_admin/blueprints/pag_pagos/templates/pag_pagos"),
-        trim_blocks=True,
-        lstrip_blocks=True,
-    )
-    plantilla = entorno.get_template("email.jinja2")
-
-    # Generación de la URL de confirmación
+    # Validar la URL de confirmación
     if PAGO_VERIFY_URL == "":
         mensaje_error = "La variable PAGO_VERIFY_URL NO ha sido declarada"
         set_task_error(mensaje_error)
         bitacora.error(mensaje_error)
         return mensaje_error
-    url = PAGO_VERIFY_URL + "/" + cifrar_id(pag_pago.id)
 
-    # Elaborar contenido del mensaje
-    contenidos = plantilla.render(
-        mensaje_asunto="Comprobante de Pago",
-        fecha_elaboracion=momento_str,
-        fecha_caducidad=pag_pago.caducidad.strftime("%d/%b/%Y"),
-        destinatario_nombre=pag_pago.cit_cliente.nombre,
-        pag_pago=pag_pago,
-        url=url,
-    )
-
-    # Si no se indicó un email de prueba se utilizará el registrado en el pago
-    actualizar_registro = False
-    if to_email is None:
-        to_email = pag_pago.email
-        actualizar_registro = True
-
-    # Definir destinatario para SendGrid
-    to_email = To(to_email)
+    # Elaborar el mensaje, si no se indicó un email de prueba se utilizará el registrado en el pago
+    actualizar_registro = to_email is None
+    to_email, asunto, contenidos = _elaborar_mensaje_pagado(_cargar_plantilla(), pag_pago, to_email)
 
-    # Definir contenido para SendGrid
-    content = Content("text/html", contenidos)
-
-    # Enviar mensaje via SendGrid
-    mail = Mail(from_email, to_email, "Comprobante de Pago PJECZ", content)
+    # Enviar mensaje
     try:
-        sendgrid_client.client.mail.send.post(request_body=mail.get())
-    except Exception as error:
+        cartero.enviar(to_email, asunto, contenidos)
+    except CorreoError as error:
         mensaje_error = f"ERROR al enviar mensaje: {str(error)}"
         set_task_error(mensaje_error)
         bitacora.error(mensaje_error)
@@ -146,11 +105,37 @@ def enviar_mensajes_comprobantes(before_creado, to_email=None):
     # Consultar Pagos
     pagos = PagPago.query.filter_by(estatus="A").filter_by(estado="PAGADO").filter_by(ya_se_envio_comprobante=False).filter(PagPago.creado <= before_creado).all()
 
-    # Enviamos los mensajes pendientes
+    # Definir el cartero, si falta la configuración se termina
+    try:
+        cartero = obtener_cartero()
+    except CorreoError as error:
+        mensaje_error = str(error)
+        set_task_error(mensaje_error)
+        bitacora.error(mensaje_error)
+        return mensaje_error
+
+    # Validar la URL de confirmación
+    if PAGO_VERIFY_URL == "":
+        mensaje_error = "La variable PAGO_VERIFY_URL NO ha sido declarada"
+        set_task_error(mensaje_error)
+        bitacora.error(mensaje_error)
+        return mensaje_error
+
+    # Elaborar todos los mensajes con la misma plantilla y enviarlos en paralelo
+    plantilla = _cargar_plantilla()
+    mensajes = [_elaborar_mensaje_pagado(plantilla, pago, to_email) for pago in pagos]
+    errores = cartero.enviar_lote(mensajes)
+
+    # Marcar los pagos cuyos comprobantes se enviaron al correo registrado, en una sola transacción
     count = 0
-    for pago in pagos:
-        enviar_mensaje_pagado(pago.id, to_email)
+    for pago, mensaje, error in zip(pagos, mensajes, errores):
+        if error is not None:
+            bitacora.error("ERROR al enviar el comprobante %s a %s: %s", pago.id, mensaje[0], str(error))
+            continue
+        if to_email is None:
+            pago.ya_se_envio_comprobante = True
         count += 1
+    db.session.commit()
 
     # Terminar tarea
     set_task_progress(100)
@@ -162,18 +147,31 @@ def enviar_mensajes_comprobantes(before_creado, to_email=None):
 def cancelar_solicitados_expirados(before_creado):
     """Cambia el estado a CANCELADO de los pagos SOLICITADOS creados antes de before_creado"""
 
-    # Selecciona Pagos con estado SOLICITADO y menor a before_creado en su tiempo de creado
-    pagos = PagPago.query.filter_by(estatus="A").filter_by(estado="SOLICITADO").filter(PagPago.creado <= before_creado).all()
-
-    # Cambia su estado a CANCELADO
+    # Cambia a CANCELADO por lotes los pagos SOLICITADOS creados antes de before_creado
     count = 0
-    for pago in pagos:
-        pago.estado = "CANCELADO"
-        pago.save()
-        count += 1
+    for ids in transiciones.transicionar(PagPago, PagPago.condiciones_expirados(before_creado), {"estado": "CANCELADO"}):
+        count += len(ids)
 
     # Terminar tarea
     set_task_progress(100)
     mensaje_final = f"Se cancelaron {count} pagos creados antes del {before_creado.strftime('%Y-%m-%d %H:%M:%S')}"
     bitacora.info(mensaje_final)
     return mensaje_final
+
+
+def _cargar_plantilla():
+    """Cargar la plantilla Jinja2, compilada una sola vez por proceso"""
+    return obtener_plantilla("pag_pagos", "email.jinja2")
+
+
+def _elaborar_mensaje_pagado(plantilla, pag_pago, to_email=None):
+    """Elaborar el mensaje del comprobante de pago, entrega (destinatario, asunto, contenidos)"""
+    contenidos = plantilla.render(
+        mensaje_asunto="Comprobante de Pago",
+        fecha_elaboracion=datetime.now().strftime("%d/%b/%Y %I:%M %p"),
+        fecha_caducidad=pag_pago.caducidad.strftime("%d/%b/%Y"),
+        destinatario_nombre=pag_pago.cit_cliente.nombre,
+        pag_pago=pag_pago,
+        url=PAGO_VERIFY_URL + "/" + cifrar_id(pag_pago.id),
+    )
+    return pag_pago.email if to_email is None else to_email, "Comprobante de Pago PJECZ", contenidos
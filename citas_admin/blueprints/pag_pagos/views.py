@@ -2,17 +2,14 @@
 Pagos Pagos, vistas
 """
 import json
-from flask import Blueprint, flash, redirect, render_template, request, url_for
+from flask import Blueprint, flash, redirect, render_template, url_for
 from flask_login import current_user, login_required
-from sqlalchemy import or_
-from datetime import datetime
 
 from config.settings import PAGO_VERIFY_URL
-from lib.datatables import get_datatable_parameters, output_datatable_json
-from lib.safe_string import safe_message, safe_string
+from lib.datatables import Filtro, filtrar_datatable, get_datatable_parameters, output_datatable_json, paginar_datatable
+from lib.safe_string import safe_message
 
-from citas_admin.blueprints.bitacoras.models import Bitacora
-from citas_admin.blueprints.modulos.models import Modulo
+from citas_admin.blueprints.bitacoras.auditoria import registrar_bitacora
 from citas_admin.blueprints.permisos.models import Permiso
 from citas_admin.blueprints.usuarios.decorators import permission_required
 from citas_admin.blueprints.pag_pagos.models import PagPago
@@ -37,29 +34,20 @@ def datatable_json():
     # Tomar parámetros de Datatables
     draw, start, rows_per_page = get_datatable_parameters()
     # Consultar
-    consulta = PagPago.query
-    if "estatus" in request.form:
-        consulta = consulta.filter_by(estatus=request.form["estatus"])
-    else:
-        consulta = consulta.filter_by(estatus="A")
-    if "id" in request.form:
-        consulta = consulta.filter_by(id=request.form["id"])
-    if "fecha" in request.form:
-        fecha = datetime.strptime(request.form["fecha"], "%Y-%m-%d")
-        inicio_dt = datetime(year=fecha.year, month=fecha.month, day=fecha.day, hour=0, minute=0, second=0)
-        termino_dt = datetime(year=fecha.year, month=fecha.month, day=fecha.day, hour=23, minute=59, second=59)
-        consulta = consulta.filter(PagPago.creado >= inicio_dt).filter(PagPago.creado <= termino_dt)
-    if "pag_tramite_servicio_id" in request.form:
-        consulta = consulta.filter_by(pag_tramite_servicio_id=request.form["pag_tramite_servicio_id"])
-    if "estado" in request.form:
-        consulta = consulta.filter_by(estado=request.form["estado"])
-    if "nombre_completo" in request.form:
-        palabras = safe_string(request.form["nombre_completo"]).split(" ")
-        consulta = consulta.join(CitCliente)
-        for palabra in palabras:
-            consulta = consulta.filter(or_(CitCliente.nombres.contains(palabra), CitCliente.apellido_primero.contains(palabra), CitCliente.apellido_segundo.contains(palabra)))
-    registros = consulta.order_by(PagPago.id.desc()).offset(start).limit(rows_per_page).all()
-    total = consulta.count()
+    consulta, filtrado = filtrar_datatable(
+        PagPago.query,
+        [
+            Filtro("estatus", PagPago.estatus, defecto="A"),
+            Filtro("id", PagPago.id),
+            Filtro("fecha", PagPago.creado, "fecha"),
+            Filtro("pag_tramite_servicio_id", PagPago.pag_tramite_servicio_id),
+            Filtro("estado", PagPago.estado),
+            Filtro("nombre_completo", [CitCliente.nombres, CitCliente.apellido_primero, CitCliente.apellido_segundo, CitCliente.busqueda], "campos", unir=CitCliente),
+        ],
+    )
+    registros, total, cursor = paginar_datatable(consulta, [PagPago.id], start, rows_per_page, descendente=True, estimar=not filtrado, relaciones=[PagPago.cit_cliente, PagPago.distrito, PagPago.pag_tramite_servicio, PagPago.autoridad])
+    # Consultar los permisos una sola vez y no en cada renglon
+    puede_ver = {modulo: current_user.can_view(modulo) for modulo in ("CIT CLIENTES", "DISTRITOS", "PAG TRAMITES SERVICIOS", "AUTORIDADES")}
     # Elaborar datos para DataTable
     data = []
     for resultado in registros:
@@ -72,24 +60,24 @@ def datatable_json():
                 "fecha": resultado.creado,
                 "cit_cliente": {
                     "nombre": f"{resultado.cit_cliente.nombre}",
-                    "url": url_for("cit_clientes.detail", cit_cliente_id=resultado.cit_cliente_id) if current_user.can_view("CIT CLIENTES") else "",
+                    "url": url_for("cit_clientes.detail", cit_cliente_id=resultado.cit_cliente_id) if puede_ver["CIT CLIENTES"] else "",
                 },
                 "email": resultado.cit_cliente.email,
                 "distrito": {
                     "clave": resultado.distrito.clave,
                     "nombre_corto": resultado.distrito.nombre_corto,
-                    "url": url_for("distritos.detail", distrito_id=resultado.distrito_id) if current_user.can_view("DISTRITOS") else "",
+                    "url": url_for("distritos.detail", distrito_id=resultado.distrito_id) if puede_ver["DISTRITOS"] else "",
                 },
                 "cantidad": resultado.cantidad,
                 "pag_tramite_servicio": {
                     "clave": resultado.pag_tramite_servicio.clave,
                     "descripcion": resultado.pag_tramite_servicio.descripcion,
-                    "url": url_for("pag_tramites_servicios.detail", pag_tramite_servicio_id=resultado.pag_tramite_servicio_id) if current_user.can_view("PAG TRAMITES SERVICIOS") else "",
+                    "url": url_for("pag_tramites_servicios.detail", pag_tramite_servicio_id=resultado.pag_tramite_servicio_id) if puede_ver["PAG TRAMITES SERVICIOS"] else "",
                 },
                 "autoridad": {
                     "clave": resultado.autoridad.clave,
                     "descripcion": resultado.autoridad.descripcion_corta,
-                    "url": url_for("autoridades.detail", autoridad_id=resultado.autoridad_id) if current_user.can_view("AUTORIDADES") else "",
+                    "url": url_for("autoridades.detail", autoridad_id=resultado.autoridad_id) if puede_ver["AUTORIDADES"] else "",
                 },
                 "estado": resultado.estado,
                 "folio": resultado.folio,
@@ -97,7 +85,7 @@ def datatable_json():
             }
         )
     # Entregar JSON
-    return output_datatable_json(draw, total, data)
+    return output_datatable_json(draw, total, data, cursor)
 
 
 @pag_pagos.route("/pag_pagos")
@@ -146,13 +134,12 @@ def delete(pag_pago_id):
     pag_pago = PagPago.query.get_or_404(pag_pago_id)
     if pag_pago.estatus == "A":
         pag_pago.delete()
-        bitacora = Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+        bitacora = registrar_bitacora(
+            modulo=MODULO,
             usuario=current_user,
             descripcion=safe_message(f"Eliminado pago {pag_pago.id}"),
             url=url_for("pag_pagos.detail", pag_pago_id=pag_pago.id),
         )
-        bitacora.save()
         flash(bitacora.descripcion, "success")
     return redirect(url_for("pag_pagos.detail", pag_pago_id=pag_pago.id))
 
@@ -164,13 +151,12 @@ def recover(pag_pago_id):
     pag_pago = PagPago.query.get_or_404(pag_pago_id)
     if pag_pago.estatus == "B":
         pag_pago.recover()
-        bitacora = Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+        bitacora = registrar_bitacora(
+            modulo=MODULO,
             usuario=current_user,
             descripcion=safe_message(f"Recuperado pago {pag_pago.id}"),
             url=url_for("pag_pagos.detail", pag_pago_id=pag_pago.id),
         )
-        bitacora.save()
         flash(bitacora.descripcion, "success")
     return redirect(url_for("pag_pagos.detail", pag_pago_id=pag_pago.id))
 
@@ -183,13 +169,12 @@ def deliver(pag_pago_id):
     if pag_pago.estatus == "A" and pag_pago.estado == "PAGADO":
         pag_pago.estado = "ENTREGADO"
         pag_pago.save()
-        bitacora = Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+        bitacora = registrar_bitacora(
+            modulo=MODULO,
             usuario=current_user,
             descripcion=safe_message(f"Entregado el pago {pag_pago.id}"),
             url=url_for("pag_pagos.detail", pag_pago_id=pag_pago.id),
         )
-        bitacora.save()
         flash(bitacora.descripcion, "success")
     return redirect(url_for("pag_pagos.detail", pag_pago_id=pag_pago.id))
 
@@ -202,12 +187,11 @@ def paid(pag_pago_id):
     if pag_pago.estatus == "A" and pag_pago.estado == "ENTREGADO":
         pag_pago.estado = "PAGADO"
         pag_pago.save()
-        bitacora = Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+        bitacora = registrar_bitacora(
+            modulo=MODULO,
             usuario=current_user,
             descripcion=safe_message(f"Pagado el pago {pag_pago.id}"),
             url=url_for("pag_pagos.detail", pag_pago_id=pag_pago.id),
         )
-        bitacora.save()
         flash(bitacora.descripcion, "success")
     return redirect(url_for("pag_pagos.detail", pag_pago_id=pag_pago.id))
@@ -3,13 +3,13 @@ Permisos, vistas
 """
 import json
 
-from flask import Blueprint, flash, redirect, render_template, request, url_for
+from flask import Blueprint, flash, redirect, render_template, url_for
 from flask_login import current_user, login_required
 
-from lib.datatables import get_datatable_parameters, output_datatable_json
+from lib.datatables import Filtro, filtrar_datatable, get_datatable_parameters, output_datatable_json, paginar_datatable
 from lib.safe_string import safe_message
 
-from citas_admin.blueprints.bitacoras.models import Bitacora
+from citas_admin.blueprints.bitacoras.auditoria import registrar_bitacora
 from citas_admin.blueprints.modulos.models import Modulo
 from citas_admin.blueprints.permisos.forms import PermisoNewWithModuloForm, PermisoNewWithRolForm, PermisoEditForm
 from citas_admin.blueprints.permisos.models import Permiso
@@ -34,17 +34,17 @@ def datatable_json():
     # Tomar parámetros de Datatables
     draw, start, rows_per_page = get_datatable_parameters()
     # Consultar
-    consulta = Permiso.query
-    if "estatus" in request.form:
-        consulta = consulta.filter_by(estatus=request.form["estatus"])
-    else:
-        consulta = consulta.filter_by(estatus="A")
-    if "modulo_id" in request.form:
-        consulta = consulta.filter_by(modulo_id=request.form["modulo_id"])
-    if "rol_id" in request.form:
-        consulta = consulta.filter_by(rol_id=request.form["rol_id"])
-    registros = consulta.order_by(Permiso.nombre).offset(start).limit(rows_per_page).all()
-    total = consulta.count()
+    consulta, _ = filtrar_datatable(
+        Permiso.query,
+        [
+            Filtro("estatus", Permiso.estatus, defecto="A"),
+            Filtro("modulo_id", Permiso.modulo_id),
+            Filtro("rol_id", Permiso.rol_id),
+        ],
+    )
+    registros, total, cursor = paginar_datatable(consulta, [Permiso.nombre], start, rows_per_page, relaciones=[Permiso.modulo, Permiso.rol])
+    # Consultar los permisos una sola vez y no en cada renglon
+    puede_ver = {modulo: current_user.can_view(modulo) for modulo in ("MODULOS", "ROLES")}
     # Elaborar datos para DataTable
     data = []
     for resultado in registros:
@@ -57,16 +57,16 @@ def datatable_json():
                 "nivel": resultado.nivel_descrito,
                 "modulo": {
                     "nombre": resultado.modulo.nombre,
-                    "url": url_for("modulos.detail", modulo_id=resultado.modulo_id) if current_user.can_view("MODULOS") else "",
+                    "url": url_for("modulos.detail", modulo_id=resultado.modulo_id) if puede_ver["MODULOS"] else "",
                 },
                 "rol": {
                     "nombre": resultado.rol.nombre,
-                    "url": url_for("roles.detail", rol_id=resultado.rol_id) if current_user.can_view("ROLES") else "",
+                    "url": url_for("roles.detail", rol_id=resultado.rol_id) if puede_ver["ROLES"] else "",
                 },
             }
         )
     # Entregar JSON
-    return output_datatable_json(draw, total, data)
+    return output_datatable_json(draw, total, data, cursor)
 
 
 @permisos.route("/permisos")
@@ -171,13 +171,12 @@ def edit(permiso_id):
         permiso.nivel = form.nivel.data
         permiso.nombre = f"{permiso.rol.nombre} puede {Permiso.NIVELES[permiso.nivel]} en {permiso.modulo.nombre}"
         permiso.save()
-        bitacora = Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+        bitacora = registrar_bitacora(
+            modulo=MODULO,
             usuario=current_user,
             descripcion=safe_message(f"Editado permiso {permiso.nombre}"),
             url=url_for("permisos.detail", permiso_id=permiso.id),
         )
-        bitacora.save()
         flash(bitacora.descripcion, "success")
         return redirect(bitacora.url)
     form.nivel.data = permiso.nivel
@@ -191,13 +190,12 @@ def delete(permiso_id):
     permiso = Permiso.query.get_or_404(permiso_id)
     if permiso.estatus == "A":
         permiso.delete()
-        bitacora = Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+        bitacora = registrar_bitacora(
+            modulo=MODULO,
             usuario=current_user,
             descripcion=safe_message(f"Eliminado permiso {permiso.nombre}"),
             url=url_for("permisos.detail", permiso_id=permiso.id),
         )
-        bitacora.save()
         flash(bitacora.descripcion, "success")
         return redirect(bitacora.url)
     return redirect(url_for("permisos.detail", permiso_id=permiso.id))
@@ -210,13 +208,12 @@ def recover(permiso_id):
     permiso = Permiso.query.get_or_404(permiso_id)
     if permiso.estatus == "B":
         permiso.recover()
-        bitacora = Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+        bitacora = registrar_bitacora(
+            modulo=MODULO,
             usuario=current_user,
             descripcion=safe_message(f"Recuperado permiso {permiso.nombre}"),
             url=url_for("permisos.detail", permiso_id=permiso.id),
         )
-        bitacora.save()
         flash(bitacora.descripcion, "success")
         return redirect(bitacora.url)
     return redirect(url_for("permisos.detail", permiso_id=permiso.id))
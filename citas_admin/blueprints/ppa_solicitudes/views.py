@@ -2,20 +2,23 @@
 Pago de Pensiones Alimenticias - Solicitudes, vistas
 """
 import json
-from flask import Blueprint, flash, redirect, render_template, request, url_for
+from flask import Blueprint, abort, flash, redirect, render_template, url_for
 from flask_login import current_user, login_required
+from sqlalchemy.orm import joinedload
 
 from config.settings import PPA_SOLICITUD_VERIFY_URL
-from lib.datatables import get_datatable_parameters, output_datatable_json
+from lib.datatables import Filtro, filtrar_datatable, get_datatable_parameters, output_datatable_json, paginar_datatable
 from lib.safe_string import safe_message
+from lib.storage import entregar_archivo
 
-from citas_admin.blueprints.bitacoras.models import Bitacora
-from citas_admin.blueprints.modulos.models import Modulo
+from citas_admin.blueprints.bitacoras.auditoria import registrar_bitacora
+from citas_admin.blueprints.autoridades.models import Autoridad
 from citas_admin.blueprints.permisos.models import Permiso
 from citas_admin.blueprints.usuarios.decorators import permission_required
 from citas_admin.blueprints.ppa_solicitudes.models import PpaSolicitud
 
 MODULO = "PPA SOLICITUDES"
+DOCUMENTOS = ("identificacion_oficial", "comprobante_domicilio", "autorizacion")
 
 ppa_solicitudes = Blueprint("ppa_solicitudes", __name__, template_folder="templates")
 
@@ -33,13 +36,8 @@ def datatable_json():
     # Tomar parámetros de Datatables
     draw, start, rows_per_page = get_datatable_parameters()
     # Consultar
-    consulta = PpaSolicitud.query
-    if "estatus" in request.form:
-        consulta = consulta.filter_by(estatus=request.form["estatus"])
-    else:
-        consulta = consulta.filter_by(estatus="A")
-    registros = consulta.order_by(PpaSolicitud.id.desc()).offset(start).limit(rows_per_page).all()
-    total = consulta.count()
+    consulta, _ = filtrar_datatable(PpaSolicitud.query, [Filtro("estatus", PpaSolicitud.estatus, defecto="A")])
+    registros, total, cursor = paginar_datatable(consulta, [PpaSolicitud.id], start, rows_per_page, descendente=True, relaciones=[PpaSolicitud.cit_cliente, joinedload(PpaSolicitud.autoridad).joinedload(Autoridad.distrito)])
     # Elaborar datos para DataTable
     data = []
     for resultado in registros:
@@ -57,7 +55,7 @@ def datatable_json():
             }
         )
     # Entregar JSON
-    return output_datatable_json(draw, total, data)
+    return output_datatable_json(draw, total, data, cursor)
 
 
 @ppa_solicitudes.route("/ppa_solicitudes")
@@ -95,6 +93,15 @@ def detail(ppa_solicitud_id):
     )
 
 
+@ppa_solicitudes.route("/ppa_solicitudes/<int:ppa_solicitud_id>/<documento>")
+def download(ppa_solicitud_id, documento):
+    """Descargar un documento de una solicitud con una URL firmada que vence pronto"""
+    if documento not in DOCUMENTOS:
+        abort(404)
+    ppa_solicitud = PpaSolicitud.query.get_or_404(ppa_solicitud_id)
+    return entregar_archivo(getattr(ppa_solicitud, f"{documento}_url"))
+
+
 @ppa_solicitudes.route("/ppa_solicitudes/eliminar/<int:ppa_solicitud_id>")
 @permission_required(MODULO, Permiso.MODIFICAR)
 def delete(ppa_solicitud_id):
@@ -102,13 +109,12 @@ def delete(ppa_solicitud_id):
     ppa_solicitud = PpaSolicitud.query.get_or_404(ppa_solicitud_id)
     if ppa_solicitud.estatus == "A":
         ppa_solicitud.delete()
-        bitacora = Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+        bitacora = registrar_bitacora(
+            modulo=MODULO,
             usuario=current_user,
             descripcion=safe_message(f"Eliminado solicitud {ppa_solicitud.id}"),
             url=url_for("ppa_solicitudes.detail", ppa_solicitud_id=ppa_solicitud.id),
         )
-        bitacora.save()
         flash(bitacora.descripcion, "success")
     return redirect(url_for("ppa_solicitudes.detail", ppa_solicitud_id=ppa_solicitud.id))
 
@@ -120,12 +126,11 @@ def recover(ppa_solicitud_id):
     ppa_solicitud = PpaSolicitud.query.get_or_404(ppa_solicitud_id)
     if ppa_solicitud.estatus == "B":
         ppa_solicitud.recover()
-        bitacora = Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+        bitacora = registrar_bitacora(
+            modulo=MODULO,
             usuario=current_user,
             descripcion=safe_message(f"Recuperado solicitud {ppa_solicitud.id}"),
             url=url_for("ppa_solicitudes.detail", ppa_solicitud_id=ppa_solicitud.id),
         )
-        bitacora.save()
         flash(bitacora.descripcion, "success")
     return redirect(url_for("ppa_solicitudes.detail", ppa_solicitud_id=ppa_solicitud.id))
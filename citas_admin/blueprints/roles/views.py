@@ -3,14 +3,13 @@ Roles, vistas
 """
 import json
 
-from flask import Blueprint, flash, redirect, render_template, request, url_for
+from flask import Blueprint, flash, redirect, render_template, url_for
 from flask_login import current_user, login_required
 
-from lib.datatables import get_datatable_parameters, output_datatable_json
+from lib.datatables import Filtro, filtrar_datatable, get_datatable_parameters, output_datatable_json, paginar_datatable
 from lib.safe_string import safe_message, safe_string
 
-from citas_admin.blueprints.bitacoras.models import Bitacora
-from citas_admin.blueprints.modulos.models import Modulo
+from citas_admin.blueprints.bitacoras.auditoria import registrar_bitacora
 from citas_admin.blueprints.permisos.models import Permiso
 from citas_admin.blueprints.roles.models import Rol
 from citas_admin.blueprints.roles.forms import RolForm
@@ -34,13 +33,8 @@ def datatable_json():
     # Tomar parámetros de Datatables
     draw, start, rows_per_page = get_datatable_parameters()
     # Consultar
-    consulta = Rol.query
-    if "estatus" in request.form:
-        consulta = consulta.filter_by(estatus=request.form["estatus"])
-    else:
-        consulta = consulta.filter_by(estatus="A")
-    registros = consulta.order_by(Rol.nombre).offset(start).limit(rows_per_page).all()
-    total = consulta.count()
+    consulta, _ = filtrar_datatable(Rol.query, [Filtro("estatus", Rol.estatus, defecto="A")])
+    registros, total, cursor = paginar_datatable(consulta, [Rol.nombre], start, rows_per_page)
     # Elaborar datos para DataTable
     data = []
     for resultado in registros:
@@ -53,7 +47,7 @@ def datatable_json():
             }
         )
     # Entregar JSON
-    return output_datatable_json(draw, total, data)
+    return output_datatable_json(draw, total, data, cursor)
 
 
 @roles.route("/roles")
@@ -99,13 +93,12 @@ def new():
         else:
             rol = Rol(nombre=nombre)
             rol.save()
-            bitacora = Bitacora(
-                modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+            bitacora = registrar_bitacora(
+                modulo=MODULO,
                 usuario=current_user,
                 descripcion=safe_message(f"Nuevo rol {rol.nombre}"),
                 url=url_for("roles.detail", rol_id=rol.id),
             )
-            bitacora.save()
             flash(bitacora.descripcion, "success")
             return redirect(bitacora.url)
     return render_template("roles/new.jinja2", form=form)
@@ -130,13 +123,12 @@ def edit(rol_id):
         if es_valido:
             rol.nombre = nombre
             rol.save()
-            bitacora = Bitacora(
-                modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+            bitacora = registrar_bitacora(
+                modulo=MODULO,
                 usuario=current_user,
                 descripcion=safe_message(f"Editado rol {rol.nombre}"),
                 url=url_for("roles.detail", rol_id=rol.id),
             )
-            bitacora.save()
             flash(bitacora.descripcion, "success")
             return redirect(bitacora.url)
     form.nombre.data = rol.nombre
@@ -150,13 +142,12 @@ def delete(rol_id):
     rol = Rol.query.get_or_404(rol_id)
     if rol.estatus == "A":
         rol.delete()
-        bitacora = Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+        bitacora = registrar_bitacora(
+            modulo=MODULO,
             usuario=current_user,
             descripcion=safe_message(f"Eliminado rol {rol.nombre}"),
             url=url_for("roles.detail", rol_id=rol.id),
         )
-        bitacora.save()
         flash(bitacora.descripcion, "success")
         return redirect(bitacora.url)
     return redirect(url_for("rol.detail", rol_id=rol.id))
@@ -169,13 +160,12 @@ def recover(rol_id):
     rol = Rol.query.get_or_404(rol_id)
     if rol.estatus == "B":
         rol.recover()
-        bitacora = Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+        bitacora = registrar_bitacora(
+            modulo=MODULO,
             usuario=current_user,
             descripcion=safe_message(f"Recuperado rol {rol.nombre}"),
             url=url_for("roles.detail", rol_id=rol.id),
         )
-        bitacora.save()
         flash(bitacora.descripcion, "success")
         return redirect(bitacora.url)
     return redirect(url_for("roles.detail", rol_id=rol.id))
@@ -5,6 +5,7 @@ from flask import current_app
 import redis
 import rq
 from citas_admin.extensions import db
+from lib.tasks import leer_progresos
 from lib.universal_mixin import UniversalMixin
 
 
@@ -13,6 +14,7 @@ class Tarea(db.Model, UniversalMixin):
 
     # Nombre de la tabla
     __tablename__ = "tareas"
+    __table_args__ = {"info": {"particionar_por": "creado"}}  # En PostgreSQL se parte por mes, vea lib/particiones.py
 
     # Clave primaria
     id = db.Column(db.String(36), primary_key=True)
@@ -34,10 +36,26 @@ class Tarea(db.Model, UniversalMixin):
             return None
         return rq_job
 
+    @classmethod
+    def cargar_progresos(cls, tareas: list):
+        """Leer de Redis el progreso de varias tareas con una sola ida, entrega las mismas tareas"""
+        progresos = leer_progresos([tarea.id for tarea in tareas])
+        for tarea in tareas:
+            tarea._progreso = progresos.get(tarea.id)
+        return tareas
+
+    @property
+    def progreso(self):
+        """Progreso en Redis como diccionario, si ya no está usa lo guardado en la tabla"""
+        if "_progreso" not in self.__dict__:
+            self.cargar_progresos([self])
+        if self._progreso is not None:
+            return self._progreso
+        return {"progreso": 100 if self.ha_terminado else 0, "mensaje": self.descripcion, "terminado": self.ha_terminado}
+
     def get_progress(self):
         """Returns the progress percentage for the task"""
-        job = self.get_rq_job()
-        return job.meta.get("progress", 0) if job is not None else 100
+        return self.progreso["progreso"]
 
     def __repr__(self):
         """Representación"""
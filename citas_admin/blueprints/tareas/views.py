@@ -4,15 +4,17 @@ Tareas, vistas
 import json
 
 from flask import Blueprint, render_template, request
-from flask_login import login_required
+from flask_login import current_user, login_required
 
-from lib.datatables import get_datatable_parameters, output_datatable_json
+from lib.datatables import Filtro, filtrar_datatable, get_datatable_parameters, output_datatable_json, paginar_datatable
+from lib.tasks import leer_progresos
 
 from citas_admin.blueprints.permisos.models import Permiso
 from citas_admin.blueprints.usuarios.decorators import permission_required
 from citas_admin.blueprints.tareas.models import Tarea
 
 MODULO = "TAREAS"
+MAXIMO_PROGRESOS = 100
 
 tareas = Blueprint("tareas", __name__, template_folder="templates")
 
@@ -30,13 +32,16 @@ def datatable_json():
     # Tomar parámetros de Datatables
     draw, start, rows_per_page = get_datatable_parameters()
     # Consultar
-    consulta = Tarea.query
-    if "estatus" in request.form:
-        consulta = consulta.filter_by(estatus=request.form["estatus"])
-    else:
-        consulta = consulta.filter_by(estatus="A")
-    registros = consulta.order_by(Tarea.id).offset(start).limit(rows_per_page).all()
-    total = consulta.count()
+    consulta, _ = filtrar_datatable(
+        Tarea.query,
+        [
+            Filtro("estatus", Tarea.estatus, defecto="A"),
+            Filtro("creado_desde", Tarea.creado, "desde"),
+            Filtro("creado_hasta", Tarea.creado, "hasta"),
+        ],
+    )
+    # Ordenar por creado para que PostgreSQL solo lea las particiones necesarias
+    registros, total, cursor = paginar_datatable(consulta, [Tarea.creado], start, rows_per_page, descendente=True)
     # Elaborar datos para DataTable
     data = []
     for resultado in registros:
@@ -49,7 +54,23 @@ def datatable_json():
             }
         )
     # Entregar JSON
-    return output_datatable_json(draw, total, data)
+    return output_datatable_json(draw, total, data, cursor)
+
+
+@tareas.route("/tareas/progresos_json", methods=["GET", "POST"])
+def progresos_json():
+    """JSON con el progreso de varias tareas, ids separados por comas, sin ids las del usuario en proceso"""
+    ids = [tarea_id.strip() for tarea_id in request.values.get("ids", "").split(",") if tarea_id.strip()][:MAXIMO_PROGRESOS]
+    if not ids:
+        return {tarea.id: tarea.progreso for tarea in current_user.get_tasks_in_progress()}
+    # Una sola ida a Redis, solo las que ya no estén ahí se consultan en la base de datos
+    progresos = leer_progresos(ids)
+    faltantes = [tarea_id for tarea_id in ids if tarea_id not in progresos]
+    if faltantes:
+        for tarea in Tarea.query.filter(Tarea.id.in_(faltantes)):
+            tarea._progreso = None
+            progresos[tarea.id] = tarea.progreso
+    return progresos
 
 
 @tareas.route("/tareas")
@@ -2,20 +2,21 @@
 Tres de Tres - Solicitudes, vistas
 """
 import json
-from flask import Blueprint, flash, redirect, render_template, request, url_for
+from flask import Blueprint, abort, flash, redirect, render_template, url_for
 from flask_login import current_user, login_required
 
 from config.settings import TDT_SOLICITUD_VERIFY_URL
-from lib.datatables import get_datatable_parameters, output_datatable_json
+from lib.datatables import Filtro, filtrar_datatable, get_datatable_parameters, output_datatable_json, paginar_datatable
 from lib.safe_string import safe_message
+from lib.storage import entregar_archivo
 
-from citas_admin.blueprints.bitacoras.models import Bitacora
-from citas_admin.blueprints.modulos.models import Modulo
+from citas_admin.blueprints.bitacoras.auditoria import registrar_bitacora
 from citas_admin.blueprints.permisos.models import Permiso
 from citas_admin.blueprints.usuarios.decorators import permission_required
 from citas_admin.blueprints.tdt_solicitudes.models import TdtSolicitud
 
 MODULO = "TDT SOLICITUDES"
+DOCUMENTOS = ("identificacion_oficial", "comprobante_domicilio", "autorizacion")
 
 tdt_solicitudes = Blueprint("tdt_solicitudes", __name__, template_folder="templates")
 
@@ -33,13 +34,8 @@ def datatable_json():
     # Tomar parámetros de Datatables
     draw, start, rows_per_page = get_datatable_parameters()
     # Consultar
-    consulta = TdtSolicitud.query
-    if "estatus" in request.form:
-        consulta = consulta.filter_by(estatus=request.form["estatus"])
-    else:
-        consulta = consulta.filter_by(estatus="A")
-    registros = consulta.order_by(TdtSolicitud.id.desc()).offset(start).limit(rows_per_page).all()
-    total = consulta.count()
+    consulta, _ = filtrar_datatable(TdtSolicitud.query, [Filtro("estatus", TdtSolicitud.estatus, defecto="A")])
+    registros, total, cursor = paginar_datatable(consulta, [TdtSolicitud.id], start, rows_per_page, descendente=True, relaciones=[TdtSolicitud.cit_cliente, TdtSolicitud.tdt_partido, TdtSolicitud.municipio])
     # Elaborar datos para DataTable
     data = []
     for resultado in registros:
@@ -58,7 +54,7 @@ def datatable_json():
             }
         )
     # Entregar JSON
-    return output_datatable_json(draw, total, data)
+    return output_datatable_json(draw, total, data, cursor)
 
 
 @tdt_solicitudes.route("/tdt_solicitudes")
@@ -96,6 +92,15 @@ def detail(tdt_solicitud_id):
     )
 
 
+@tdt_solicitudes.route("/tdt_solicitudes/<int:tdt_solicitud_id>/<documento>")
+def download(tdt_solicitud_id, documento):
+    """Descargar un documento de una solicitud con una URL firmada que vence pronto"""
+    if documento not in DOCUMENTOS:
+        abort(404)
+    tdt_solicitud = TdtSolicitud.query.get_or_404(tdt_solicitud_id)
+    return entregar_archivo(getattr(tdt_solicitud, f"{documento}_url"))
+
+
 @tdt_solicitudes.route("/tdt_solicitudes/eliminar/<int:tdt_solicitud_id>")
 @permission_required(MODULO, Permiso.MODIFICAR)
 def delete(tdt_solicitud_id):
@@ -103,13 +108,12 @@ def delete(tdt_solicitud_id):
     tdt_solicitud = TdtSolicitud.query.get_or_404(tdt_solicitud_id)
     if tdt_solicitud.estatus == "A":
         tdt_solicitud.delete()
-        bitacora = Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+        bitacora = registrar_bitacora(
+            modulo=MODULO,
             usuario=current_user,
             descripcion=safe_message(f"Eliminado solicitud {tdt_solicitud.id}"),
             url=url_for("tdt_solicitudes.detail", tdt_solicitud_id=tdt_solicitud.id),
         )
-        bitacora.save()
         flash(bitacora.descripcion, "success")
     return redirect(url_for("tdt_solicitudes.detail", tdt_solicitud_id=tdt_solicitud.id))
 
@@ -121,12 +125,11 @@ def recover(tdt_solicitud_id):
     tdt_solicitud = TdtSolicitud.query.get_or_404(tdt_solicitud_id)
     if tdt_solicitud.estatus == "B":
         tdt_solicitud.recover()
-        bitacora = Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+        bitacora = registrar_bitacora(
+            modulo=MODULO,
             usuario=current_user,
             descripcion=safe_message(f"Recuperado solicitud {tdt_solicitud.id}"),
             url=url_for("tdt_solicitudes.detail", tdt_solicitud_id=tdt_solicitud.id),
         )
-        bitacora.save()
         flash(bitacora.descripcion, "success")
     return redirect(url_for("tdt_solicitudes.detail", tdt_solicitud_id=tdt_solicitud.id))
@@ -0,0 +1,206 @@
+"""
+Usuarios, caché de permisos y menú principal
+
+Los permisos (módulo → nivel) y el menú principal de cada usuario se resuelven con una sola consulta
+y se guardan como JSON en Redis y en la memoria del proceso, junto con la versión con que se elaboraron
+
+- usuarios:autorizaciones:version es la versión vigente, se incrementa al confirmar cualquier cambio
+  en modulos, permisos, roles o usuarios_roles
+- usuarios:autorizaciones:<usuario_id> es el registro del usuario, con vencimiento
+- usuarios:epoca es un valor al azar que va por delante de todas las versiones, se crea cuando falta;
+  si Redis se vacía o reinicia los contadores vuelven a empezar, pero con otra época, así ningún
+  registro o instantánea anterior vuelve a coincidir
+- Además de los flush del ORM, los UPDATE y DELETE masivos hechos con la sesión (query.update(),
+  db.session.execute(update(...))) sobre las tablas vigiladas incrementan su versión
+
+En cada petición solo se consulta la versión en Redis una vez. Si Redis no está disponible se consulta
+la base de datos, sin guardar en la caché.
+"""
+import json
+import uuid
+
+from flask import current_app, g, has_request_context
+from redis.exceptions import RedisError
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+
+from citas_admin.extensions import db
+from citas_admin.blueprints.modulos.models import Modulo
+from citas_admin.blueprints.permisos.models import Permiso
+from citas_admin.blueprints.usuarios_roles.models import UsuarioRol
+
+LLAVE = "usuarios:autorizaciones"
+EPOCA = "usuarios:epoca"
+TTL_SEGUNDOS = 60 * 60  # También acota lo que dura un registro viejo si no se pudo incrementar la versión
+
+_registros = {}
+_vigiladas = {}  # Nombre de la tabla → llave de la versión
+
+
+def consultar_autorizacion(usuario_id: int):
+    """Elaborar los permisos y el menú principal del usuario con una sola consulta"""
+    consulta = (
+        db.session.query(Modulo.nombre, Modulo.nombre_corto, Modulo.icono, Modulo.ruta, Modulo.en_navegacion, func.max(Permiso.nivel))
+        .select_from(Permiso)
+        .join(Modulo, Permiso.modulo_id == Modulo.id)
+        .join(UsuarioRol, UsuarioRol.rol_id == Permiso.rol_id)
+        .filter(UsuarioRol.usuario_id == usuario_id)
+        .filter(UsuarioRol.estatus == "A")
+        .filter(Permiso.estatus == "A")
+        .group_by(Modulo.id, Modulo.nombre, Modulo.nombre_corto, Modulo.icono, Modulo.ruta, Modulo.en_navegacion)
+    )
+    permisos = {}
+    menu = []
+    for nombre, nombre_corto, icono, ruta, en_navegacion, nivel in consulta:
+        permisos[nombre] = nivel
+        if nivel > 0 and en_navegacion:
+            menu.append({"nombre": nombre, "nombre_corto": nombre_corto, "icono": icono, "ruta": ruta})
+    menu.sort(key=lambda modulo: modulo["nombre_corto"])
+    return {"permisos": permisos, "menu": menu}
+
+
+def leer_versiones(*llaves):
+    """Entregar las versiones de las llaves con la época por delante, con una sola consulta a Redis"""
+    epoca, *valores = current_app.redis.mget(EPOCA, *llaves)
+    if epoca is None:
+        current_app.redis.set(EPOCA, uuid.uuid4().hex, nx=True)
+        epoca = current_app.redis.get(EPOCA)
+    return [f"{epoca.decode()}.{valor.decode() if valor is not None else '0'}" for valor in valores]
+
+
+def _version():
+    """Versión vigente, se consulta una vez por petición"""
+    if has_request_context() and "autorizaciones_version" in g:
+        return g.autorizaciones_version
+    version = leer_versiones(f"{LLAVE}:version")[0]
+    if has_request_context():
+        g.autorizaciones_version = version
+    return version
+
+
+def obtener_autorizacion(usuario_id: int):
+    """Entregar el diccionario con permisos y menu del usuario"""
+    try:
+        version = _version()
+    except RedisError:
+        return consultar_autorizacion(usuario_id)
+
+    # En la memoria del proceso
+    registro = _registros.get(usuario_id)
+    if registro is not None and registro["version"] == version:
+        return registro
+
+    # En Redis
+    try:
+        contenido = current_app.redis.get(f"{LLAVE}:{usuario_id}")
+    except RedisError:
+        contenido = None
+    if contenido is not None:
+        registro = json.loads(contenido)
+        if registro["version"] == version:
+            _registros[usuario_id] = registro
+            return registro
+
+    # Consultar y guardar
+    registro = consultar_autorizacion(usuario_id)
+    registro["version"] = version
+    _registros[usuario_id] = registro
+    try:
+        current_app.redis.set(f"{LLAVE}:{usuario_id}", json.dumps(registro, ensure_ascii=False), ex=TTL_SEGUNDOS)
+    except RedisError:
+        pass
+    return registro
+
+
+class AutorizacionMixin:
+    """Permisos y menú principal a partir de la caché, requiere el atributo id"""
+
+    @property
+    def autorizacion(self):
+        """Permisos y menú principal de la caché, se memoriza en la instancia"""
+        if "_autorizacion" not in self.__dict__:
+            self._autorizacion = obtener_autorizacion(self.id)
+        return self._autorizacion
+
+    @property
+    def modulos_menu_principal(self):
+        """Elaborar listado con los modulos ordenados para el menu principal"""
+        return self.autorizacion["menu"]
+
+    @property
+    def permisos(self):
+        """Entrega un diccionario con todos los permisos"""
+        return self.autorizacion["permisos"]
+
+    def can(self, modulo_nombre: str, permission: int):
+        """¿Tiene permiso?"""
+        if modulo_nombre in self.permisos:
+            return self.permisos[modulo_nombre] >= permission
+        return False
+
+    def can_view(self, modulo_nombre: str):
+        """¿Tiene permiso para ver?"""
+        return self.can(modulo_nombre, Permiso.VER)
+
+    def can_edit(self, modulo_nombre: str):
+        """¿Tiene permiso para editar?"""
+        return self.can(modulo_nombre, Permiso.MODIFICAR)
+
+    def can_insert(self, modulo_nombre: str):
+        """¿Tiene permiso para agregar?"""
+        return self.can(modulo_nombre, Permiso.CREAR)
+
+    def can_admin(self, modulo_nombre: str):
+        """¿Tiene permiso para administrar?"""
+        return self.can(modulo_nombre, Permiso.ADMINISTRAR)
+
+
+def vigilar(tablas, llave: str):
+    """Incrementar la versión en llave al confirmar cambios en cualquiera de las tablas"""
+    for tabla in tablas:
+        _vigiladas[tabla] = llave
+
+
+def incrementar_version(llave: str):
+    """Incrementar una versión, los registros anteriores dejan de valer en todos los procesos"""
+    try:
+        current_app.redis.incr(llave)
+    except (RuntimeError, RedisError):
+        # Sin contexto de la aplicación (scripts) o sin Redis, los registros vencen con TTL_SEGUNDOS
+        pass
+
+
+def _revisar_cambios(session, flush_context):
+    """Después de cada flush, anotar las versiones de las tablas que cambiaron"""
+    for instancia in list(session.new) + list(session.dirty) + list(session.deleted):
+        llave = _vigiladas.get(getattr(instancia, "__tablename__", None))
+        if llave is not None:
+            session.info.setdefault("versiones_cambiaron", set()).add(llave)
+
+
+def _revisar_masivos(orm_execute_state):
+    """Anotar las versiones de las tablas vigiladas que cambian con un UPDATE o DELETE masivo"""
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete) or orm_execute_state.bind_mapper is None:
+        return
+    llave = _vigiladas.get(orm_execute_state.bind_mapper.local_table.name)
+    if llave is not None:
+        orm_execute_state.session.info.setdefault("versiones_cambiaron", set()).add(llave)
+
+
+def _confirmar_cambios(session):
+    """Al confirmar la transacción, incrementar las versiones anotadas"""
+    for llave in session.info.pop("versiones_cambiaron", set()):
+        incrementar_version(llave)
+
+
+def _descartar_cambios(session):
+    """Al deshacer la transacción, olvidar los cambios anotados"""
+    session.info.pop("versiones_cambiaron", None)
+
+
+vigilar(("modulos", "permisos", "roles", "usuarios_roles"), f"{LLAVE}:version")
+if not event.contains(Session, "after_flush", _revisar_cambios):
+    event.listen(Session, "after_flush", _revisar_cambios)
+    event.listen(Session, "do_orm_execute", _revisar_masivos)
+    event.listen(Session, "after_commit", _confirmar_cambios)
+    event.listen(Session, "after_rollback", _descartar_cambios)
@@ -0,0 +1,106 @@
+"""
+Usuarios, identidad en la sesión
+
+Para no consultar al usuario en cada petición, la sesión (firmada con SECRET_KEY) guarda una instantánea
+con su id, oficina_id, los ID de sus oficinas, su estatus y la versión de identidades con que se elaboró
+
+- usuarios:identidades:version se incrementa al confirmar cualquier cambio en usuarios o usuarios_oficinas,
+  también con UPDATE masivos; lleva por delante la época (vea autorizaciones.py), si Redis se vacía
+  o reinicia cambia la época y todas las instantáneas se renuevan
+- Si la versión de la instantánea es la vigente, current_user es una Identidad que no consulta la base de datos
+- Si no, se consulta al usuario y se renueva la instantánea
+
+Identidad resuelve los permisos y el menú con la caché de autorizaciones, y la oficina por su ID;
+cualquier otro atributo (autoridad, email, etc.) consulta al usuario la primera vez que se usa.
+Las vistas comparan oficinas con current_user.oficina_id y current_user.oficinas_ids.
+Las versiones de identidades y autorizaciones se leen de Redis con una sola consulta.
+"""
+from flask import g, has_request_context, session
+from flask_login import UserMixin
+from redis.exceptions import RedisError
+
+from citas_admin.extensions import db
+from citas_admin.blueprints.oficinas.models import Oficina
+from citas_admin.blueprints.usuarios.autorizaciones import LLAVE as LLAVE_AUTORIZACIONES, AutorizacionMixin, leer_versiones as leer_versiones_epoca, vigilar
+from citas_admin.blueprints.usuarios.models import Usuario
+
+LLAVE = "usuarios:identidades"
+SESION = "identidad"
+
+
+class Identidad(UserMixin, AutorizacionMixin):
+    """Usuario de la sesión, consulta al Usuario solo si se necesita"""
+
+    def __init__(self, instantanea: dict):
+        self.id = instantanea["id"]
+        self.oficina_id = instantanea["oficina_id"]
+        self.oficinas_ids = instantanea["oficinas_ids"]
+        self.estatus = instantanea["estatus"]
+
+    @property
+    def is_active(self):
+        """¿Es activo?"""
+        return self.estatus == "A"
+
+    @property
+    def oficina(self):
+        """Oficina del usuario por su ID, sin consultar al Usuario"""
+        return Oficina.query.get(self.oficina_id)
+
+    @property
+    def usuario(self):
+        """Usuario de la base de datos, se consulta la primera vez"""
+        if "_usuario" not in self.__dict__:
+            # Sin autoflush porque puede consultarse a la mitad de crear un registro con usuario=current_user
+            with db.session.no_autoflush:
+                self._usuario = Usuario.query.get(self.id)
+        return self._usuario
+
+    def __getattr__(self, nombre):
+        """Los demás atributos y métodos son los del Usuario"""
+        if nombre.startswith("__"):
+            raise AttributeError(nombre)
+        return getattr(self.usuario, nombre)
+
+    def __repr__(self):
+        """Representación"""
+        return f"<Identidad {self.id}>"
+
+
+def elaborar_instantanea(usuario: Usuario, version: str):
+    """Elaborar la instantánea del usuario para guardarla en la sesión"""
+    return {
+        "id": usuario.id,
+        "oficina_id": usuario.oficina_id,
+        "oficinas_ids": usuario.oficinas_ids,
+        "estatus": usuario.estatus,
+        "version": version,
+    }
+
+
+def leer_versiones():
+    """Entregar la versión de identidades y dejar en g la de autorizaciones, con una sola consulta a Redis"""
+    identidades, autorizaciones = leer_versiones_epoca(f"{LLAVE}:version", f"{LLAVE_AUTORIZACIONES}:version")
+    if has_request_context():
+        g.autorizaciones_version = autorizaciones
+    return identidades
+
+
+def cargar_usuario(uid):
+    """Entregar la Identidad de la sesión si está vigente, si no consultar al Usuario y renovar la instantánea"""
+    try:
+        version = leer_versiones()
+    except RedisError:
+        return Usuario.query.get(uid)
+    instantanea = session.get(SESION)
+    if instantanea is not None and str(instantanea.get("id")) == str(uid) and instantanea.get("version") == version:
+        return Identidad(instantanea)
+    usuario = Usuario.query.get(uid)
+    if usuario is None:
+        session.pop(SESION, None)
+        return None
+    session[SESION] = elaborar_instantanea(usuario, version)
+    return usuario
+
+
+vigilar(("usuarios", "usuarios_oficinas"), f"{LLAVE}:version")
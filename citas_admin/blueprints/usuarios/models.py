@@ -1,18 +1,22 @@
 """
 Usuarios, modelos
 """
+from datetime import datetime, timedelta
+
 from flask import current_app
 from flask_login import UserMixin
 
 from lib.universal_mixin import UniversalMixin
 from citas_admin.extensions import db, pwd_context
 
-from citas_admin.blueprints.permisos.models import Permiso
 from citas_admin.blueprints.tareas.models import Tarea
+from citas_admin.blueprints.usuarios.autorizaciones import AutorizacionMixin
 from citas_admin.blueprints.usuarios_roles.models import UsuarioRol
 
+TAREAS_EN_PROCESO_DIAS = 7  # Las tareas sin terminar más antiguas se consideran abandonadas, así solo se leen las particiones recientes
+
 
-class Usuario(db.Model, UserMixin, UniversalMixin):
+class Usuario(db.Model, UserMixin, UniversalMixin, AutorizacionMixin):
     """Usuario"""
 
     # Nombre de la tabla
@@ -48,46 +52,11 @@ class Usuario(db.Model, UserMixin, UniversalMixin):
     usuarios_roles = db.relationship("UsuarioRol", back_populates="usuario")  # Sin lazy="noload" para que funcione el menu
     usuarios_oficinas = db.relationship("UsuarioOficina", back_populates="usuario")
 
-    # Propiedades
-    modulos_menu_principal_consultados = []
-    permisos_consultados = {}
-
     @property
     def nombre(self):
         """Junta nombres, apellido_paterno y apellido materno"""
         return self.nombres + " " + self.apellido_paterno + " " + self.apellido_materno
 
-    @property
-    def modulos_menu_principal(self):
-        """Elaborar listado con los modulos ordenados para el menu principal"""
-        if len(self.modulos_menu_principal_consultados) > 0:
-            return self.modulos_menu_principal_consultados
-        modulos = []
-        modulos_nombres = []
-        for usuario_rol in self.usuarios_roles:
-            if usuario_rol.estatus == "A":
-                for permiso in usuario_rol.rol.permisos:
-                    if permiso.modulo.nombre not in modulos_nombres and permiso.estatus == "A" and permiso.nivel > 0 and permiso.modulo.en_navegacion:
-                        modulos.append(permiso.modulo)
-                        modulos_nombres.append(permiso.modulo.nombre)
-        self.modulos_menu_principal_consultados = sorted(modulos, key=lambda x: x.nombre_corto)
-        return self.modulos_menu_principal_consultados
-
-    @property
-    def permisos(self):
-        """Entrega un diccionario con todos los permisos"""
-        if len(self.permisos_consultados) > 0:
-            return self.permisos_consultados
-        self.permisos_consultados = {}
-        for usuario_rol in self.usuarios_roles:
-            if usuario_rol.estatus == "A":
-                for permiso in usuario_rol.rol.permisos:
-                    if permiso.estatus == "A":
-                        etiqueta = permiso.modulo.nombre
-                        if etiqueta not in self.permisos_consultados or permiso.nivel > self.permisos_consultados[etiqueta]:
-                            self.permisos_consultados[etiqueta] = permiso.nivel
-        return self.permisos_consultados
-
     @classmethod
     def find_by_identity(cls, identity):
         """Encontrar a un usuario por su correo electrónico"""
@@ -104,43 +73,27 @@ class Usuario(db.Model, UserMixin, UniversalMixin):
             return pwd_context.verify(password, self.contrasena)
         return True
 
-    def can(self, modulo_nombre: str, permission: int):
-        """¿Tiene permiso?"""
-        if modulo_nombre in self.permisos:
-            return self.permisos[modulo_nombre] >= permission
-        return False
-
-    def can_view(self, modulo_nombre: str):
-        """¿Tiene permiso para ver?"""
-        return self.can(modulo_nombre, Permiso.VER)
-
-    def can_edit(self, modulo_nombre: str):
-        """¿Tiene permiso para editar?"""
-        return self.can(modulo_nombre, Permiso.MODIFICAR)
-
-    def can_insert(self, modulo_nombre: str):
-        """¿Tiene permiso para agregar?"""
-        return self.can(modulo_nombre, Permiso.CREAR)
-
-    def can_admin(self, modulo_nombre: str):
-        """¿Tiene permiso para administrar?"""
-        return self.can(modulo_nombre, Permiso.ADMINISTRAR)
-
     def launch_task(self, nombre, descripcion, *args, **kwargs):
         """Arrancar tarea"""
         rq_job = current_app.task_queue.enqueue("citas_admin.blueprints." + nombre, *args, **kwargs)
-        tarea = Tarea(id=rq_job.get_id(), nombre=nombre, descripcion=descripcion, usuario=self)
+        tarea = Tarea(id=rq_job.id, nombre=nombre, descripcion=descripcion, usuario=self)
         tarea.save()
         return tarea
 
     def get_tasks_in_progress(self):
         """Obtener tareas"""
-        return Tarea.query.filter_by(usuario=self, ha_terminado=False).all()
+        desde = datetime.now() - timedelta(days=TAREAS_EN_PROCESO_DIAS)
+        return Tarea.cargar_progresos(Tarea.query.filter_by(usuario_id=self.id, ha_terminado=False).filter(Tarea.creado >= desde).all())
 
     def get_task_in_progress(self, nombre):
         """Obtener progreso de una tarea"""
         return Tarea.query.filter_by(nombre=nombre, usuario=self, ha_terminado=False).first()
 
+    @property
+    def oficinas_ids(self):
+        """IDs de las oficinas activas asignadas, los mismos que guarda la instantánea de la sesión"""
+        return sorted(usuario_oficina.oficina_id for usuario_oficina in self.usuarios_oficinas if usuario_oficina.estatus == "A")
+
     def get_roles(self):
         """Obtener roles"""
         usuarios_roles = UsuarioRol.query.filter_by(usuario_id=self.id).filter_by(estatus="A").all()
@@ -6,13 +6,10 @@ import os
 import re
 from datetime import datetime, timedelta
 
-import google.auth.transport.requests
-import google.oauth2.id_token
-from flask import Blueprint, flash, redirect, render_template, request, url_for
+from flask import Blueprint, flash, redirect, render_template, request, session, url_for
 from flask_login import current_user, login_required, login_user, logout_user
-from sqlalchemy import or_
 
-from lib.datatables import get_datatable_parameters, output_datatable_json
+from lib.datatables import Filtro, filtrar_datatable, get_datatable_parameters, output_datatable_json, paginar_datatable
 from lib.firebase_auth import firebase_auth
 from lib.pwgen import generar_api_key, generar_contrasena
 from lib.safe_next_url import safe_next_url
@@ -23,20 +20,25 @@ from citas_admin.blueprints.usuarios.decorators import anonymous_required, permi
 from citas_admin.extensions import pwd_context
 
 from citas_admin.blueprints.autoridades.models import Autoridad
-from citas_admin.blueprints.bitacoras.models import Bitacora
+from citas_admin.blueprints.bitacoras.auditoria import registrar_bitacora, registrar_entrada_salida
 from citas_admin.blueprints.distritos.models import Distrito
-from citas_admin.blueprints.entradas_salidas.models import EntradaSalida
-from citas_admin.blueprints.modulos.models import Modulo
+from citas_admin.blueprints.usuarios.identidades import SESION
 from citas_admin.blueprints.usuarios.forms import AccesoForm, UsuarioNewForm, UsuarioEditForm, UsuarioEditAdminForm, UsuarioSearchForm
 from citas_admin.blueprints.usuarios.models import Usuario
 
-HTTP_REQUEST = google.auth.transport.requests.Request()
-
 MODULO = "USUARIOS"
 
 usuarios = Blueprint("usuarios", __name__, template_folder="templates")
 
 
+def _verificar_token_firebase(token: str):
+    """Verificar el token de Firebase"""
+    import google.auth.transport.requests  # Se carga hasta que se usa, tarda en importarse
+    import google.oauth2.id_token
+
+    return google.oauth2.id_token.verify_firebase_token(token, google.auth.transport.requests.Request())
+
+
 @usuarios.route("/login", methods=["GET", "POST"])
 @anonymous_required()
 def login():
@@ -53,17 +55,17 @@ def login():
             # Entonces debe ingresar con Google/Microsoft/GitHub
             if re.fullmatch(TOKEN_REGEXP, token) is not None:
                 # Acceso por Firebase Auth
-                claims = google.oauth2.id_token.verify_firebase_token(token, HTTP_REQUEST)
+                claims = _verificar_token_firebase(token)
                 if claims:
                     email = claims.get("email", "Unknown")
                     usuario = Usuario.find_by_identity(email)
                     if usuario and usuario.authenticated(with_password=False):
                         if login_user(usuario, remember=True) and usuario.is_active:
-                            EntradaSalida(
+                            registrar_entrada_salida(
                                 usuario_id=usuario.id,
                                 tipo="INGRESO",
                                 direccion_ip=request.remote_addr,
-                            ).save()
+                            )
                             if siguiente_url:
                                 return redirect(safe_next_url(siguiente_url))
                             return redirect(url_for("sistemas.start"))
@@ -85,11 +87,11 @@ def login():
                 usuario = Usuario.find_by_identity(identidad)
                 if usuario and usuario.authenticated(password=contrasena):
                     if login_user(usuario, remember=True) and usuario.is_active:
-                        EntradaSalida(
+                        registrar_entrada_salida(
                             usuario_id=usuario.id,
                             tipo="INGRESO",
                             direccion_ip=request.remote_addr,
-                        ).save()
+                        )
                         if siguiente_url:
                             return redirect(safe_next_url(siguiente_url))
                         return redirect(url_for("sistemas.start"))
@@ -104,12 +106,13 @@ def login():
 @login_required
 def logout():
     """Salir del Sistema"""
-    EntradaSalida(
+    registrar_entrada_salida(
         usuario_id=current_user.id,
         tipo="SALIO",
         direccion_ip=request.remote_addr,
-    ).save()
+    )
     logout_user()
+    session.pop(SESION, None)
     flash("Ha salido de este sistema.", "success")
     return redirect(url_for("usuarios.login"))
 
@@ -199,33 +202,24 @@ def datatable_json():
     # Tomar parámetros de Datatables
     draw, start, rows_per_page = get_datatable_parameters()
     # Consultar
-    consulta = Usuario.query
-    if "estatus" in request.form:
-        consulta = consulta.filter_by(estatus=request.form["estatus"])
-    else:
-        consulta = consulta.filter_by(estatus="A")
-    if "autoridad_id" in request.form:
-        consulta = consulta.filter_by(autoridad_id=request.form["autoridad_id"])
-    if "oficina_id" in request.form:
-        consulta = consulta.filter_by(oficina_id=request.form["oficina_id"])
-    if "nombres" in request.form:
-        consulta = consulta.filter(Usuario.nombres.contains(safe_string(request.form["nombres"])))
-    if "apellido_paterno" in request.form:
-        consulta = consulta.filter(Usuario.apellido_paterno.contains(safe_string(request.form["apellido_paterno"])))
-    if "apellido_materno" in request.form:
-        consulta = consulta.filter(Usuario.apellido_materno.contains(safe_string(request.form["apellido_materno"])))
-    if "curp" in request.form:
-        consulta = consulta.filter(Usuario.curp.contains(safe_string(request.form["curp"])))
-    if "puesto" in request.form:
-        consulta = consulta.filter(Usuario.puesto.contains(safe_string(request.form["puesto"])))
-    if "email" in request.form:
-        consulta = consulta.filter(Usuario.email.contains(safe_email(request.form["email"], search_fragment=True)))
-    if "nombre_completo" in request.form:
-        palabras = safe_string(request.form["nombre_completo"]).split(" ")
-        for palabra in palabras:
-            consulta = consulta.filter(or_(Usuario.nombres.contains(palabra), Usuario.apellido_paterno.contains(palabra), Usuario.apellido_materno.contains(palabra)))
-    registros = consulta.order_by(Usuario.email).offset(start).limit(rows_per_page).all()
-    total = consulta.count()
+    consulta, _ = filtrar_datatable(
+        Usuario.query,
+        [
+            Filtro("estatus", Usuario.estatus, defecto="A"),
+            Filtro("autoridad_id", Usuario.autoridad_id),
+            Filtro("oficina_id", Usuario.oficina_id),
+            Filtro("nombres", Usuario.nombres, "contiene", limpiar=safe_string),
+            Filtro("apellido_paterno", Usuario.apellido_paterno, "contiene", limpiar=safe_string),
+            Filtro("apellido_materno", Usuario.apellido_materno, "contiene", limpiar=safe_string),
+            Filtro("curp", Usuario.curp, "contiene", limpiar=safe_string),
+            Filtro("puesto", Usuario.puesto, "contiene", limpiar=safe_string),
+            Filtro("email", Usuario.email, "contiene", limpiar=lambda valor: safe_email(valor, search_fragment=True)),
+            Filtro("nombre_completo", [Usuario.nombres, Usuario.apellido_paterno, Usuario.apellido_materno], "palabras", limpiar=safe_string),
+        ],
+    )
+    registros, total, cursor = paginar_datatable(consulta, [Usuario.email], start, rows_per_page, relaciones=[Usuario.autoridad, Usuario.oficina])
+    # Consultar los permisos una sola vez y no en cada renglon
+    puede_ver = {modulo: current_user.can_view(modulo) for modulo in ("AUTORIDADES", "OFICINAS")}
     # Elaborar datos para DataTable
     data = []
     for resultado in registros:
@@ -239,16 +233,16 @@ def datatable_json():
                 "puesto": resultado.puesto,
                 "autoridad": {
                     "clave": resultado.autoridad.clave,
-                    "url": url_for("autoridades.detail", autoridad_id=resultado.autoridad_id) if current_user.can_view("AUTORIDADES") else "",
+                    "url": url_for("autoridades.detail", autoridad_id=resultado.autoridad_id) if puede_ver["AUTORIDADES"] else "",
                 },
                 "oficina": {
                     "clave": resultado.oficina.clave,
-                    "url": url_for("oficinas.detail", oficina_id=resultado.oficina_id) if current_user.can_view("OFICINAS") else "",
+                    "url": url_for("oficinas.detail", oficina_id=resultado.oficina_id) if puede_ver["OFICINAS"] else "",
                 },
             }
         )
     # Entregar JSON
-    return output_datatable_json(draw, total, data)
+    return output_datatable_json(draw, total, data, cursor)
 
 
 @usuarios.route("/usuarios/<int:usuario_id>")
@@ -293,13 +287,12 @@ def new():
                 api_key_expiracion=datetime(year=2000, month=1, day=1),
             )
             usuario.save()
-            bitacora = Bitacora(
-                modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+            bitacora = registrar_bitacora(
+                modulo=MODULO,
                 usuario=current_user,
                 descripcion=safe_message(f"Nuevo usuario {usuario.email}: {usuario.nombre}"),
                 url=url_for("usuarios.detail", usuario_id=usuario.id),
             )
-            bitacora.save()
             flash(bitacora.descripcion, "success")
             return redirect(bitacora.url)
     distritos = Distrito.query.order_by(Distrito.nombre).all()  # Todos los distritos, inclusive los eliminados
@@ -322,13 +315,12 @@ def edit(usuario_id):
         usuario.puesto = safe_string(form.puesto.data)
         usuario.oficina = form.oficina.data
         usuario.save()
-        bitacora = Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+        bitacora = registrar_bitacora(
+            modulo=MODULO,
             usuario=current_user,
             descripcion=safe_message(f"Editado usuario {usuario.email}: {usuario.nombre}"),
             url=url_for("usuarios.detail", usuario_id=usuario.id),
         )
-        bitacora.save()
         flash(bitacora.descripcion, "success")
         return redirect(bitacora.url)
     form.distrito.data = usuario.autoridad.distrito.nombre  # Read only
@@ -372,13 +364,12 @@ def edit_admin(usuario_id):
             if form.contrasena.data != "":
                 usuario.contrasena = pwd_context.hash(form.contrasena.data)
             usuario.save()
-            bitacora = Bitacora(
-                modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+            bitacora = registrar_bitacora(
+                modulo=MODULO,
                 usuario=current_user,
                 descripcion=safe_message(f"Editado usuario {usuario.email}: {usuario.nombre}"),
                 url=url_for("usuarios.detail", usuario_id=usuario.id),
             )
-            bitacora.save()
             flash(bitacora.descripcion, "success")
             return redirect(bitacora.url)
     form.distrito.data = usuario.autoridad.distrito
@@ -446,13 +437,12 @@ def request_api_key_json(usuario_id):
         usuario.api_key_expiracion = datetime(year=2000, month=1, day=1)
         usuario.save()
         mensaje = f"La API Key de {usuario.email} fue eliminada"
-        bitacora = Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+        registrar_bitacora(
+            modulo=MODULO,
             usuario=current_user,
             descripcion=mensaje,
             url=url_for("usuarios.detail", usuario_id=usuario.id),
         )
-        bitacora.save()
         return {"success": True, "message": mensaje, "api_key": usuario.api_key, "api_key_expiracion": usuario.api_key_expiracion}
 
     # Si se recibe action con new, se va a crear una nueva
@@ -465,13 +455,12 @@ def request_api_key_json(usuario_id):
         usuario.api_key_expiracion = datetime.now() + timedelta(days=days)
         usuario.save()
         mensaje = f"Nueva API Key para {usuario.email} con expiración en {days} días"
-        bitacora = Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+        registrar_bitacora(
+            modulo=MODULO,
             usuario=current_user,
             descripcion=mensaje,
             url=url_for("usuarios.detail", usuario_id=usuario.id),
         )
-        bitacora.save()
         return {"success": True, "message": mensaje, "api_key": usuario.api_key, "api_key_expiracion": usuario.api_key_expiracion}
 
     # Si no se recibe nada, entregar la actual
@@ -486,13 +475,12 @@ def delete(usuario_id):
     usuario = Usuario.query.get_or_404(usuario_id)
     if usuario.estatus == "A":
         usuario.delete()
-        bitacora = Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+        bitacora = registrar_bitacora(
+            modulo=MODULO,
             usuario=current_user,
             descripcion=safe_message(f"Eliminado usuario {usuario.email}: {usuario.nombre}"),
             url=url_for("usuarios.detail", usuario_id=usuario.id),
         )
-        bitacora.save()
         flash(bitacora.descripcion, "success")
     return redirect(url_for("usuarios.detail", usuario_id=usuario_id))
 
@@ -505,12 +493,11 @@ def recover(usuario_id):
     usuario = Usuario.query.get_or_404(usuario_id)
     if usuario.estatus == "B":
         usuario.recover()
-        bitacora = Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+        bitacora = registrar_bitacora(
+            modulo=MODULO,
             usuario=current_user,
             descripcion=safe_message(f"Recuperado usuario {usuario.email}: {usuario.nombre}"),
             url=url_for("usuarios.detail", usuario_id=usuario.id),
         )
-        bitacora.save()
         flash(bitacora.descripcion, "success")
     return redirect(url_for("usuarios.detail", usuario_id=usuario_id))
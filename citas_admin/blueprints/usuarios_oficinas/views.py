@@ -3,14 +3,13 @@ Usuarios Oficinas, vistas
 """
 import json
 
-from flask import Blueprint, flash, redirect, render_template, request, url_for
+from flask import Blueprint, flash, redirect, render_template, url_for
 from flask_login import current_user, login_required
 
-from lib.datatables import get_datatable_parameters, output_datatable_json
+from lib.datatables import Filtro, filtrar_datatable, get_datatable_parameters, output_datatable_json, paginar_datatable
 from lib.safe_string import safe_string, safe_message
 
-from citas_admin.blueprints.bitacoras.models import Bitacora
-from citas_admin.blueprints.modulos.models import Modulo
+from citas_admin.blueprints.bitacoras.auditoria import registrar_bitacora
 from citas_admin.blueprints.permisos.models import Permiso
 from citas_admin.blueprints.usuarios.models import Usuario
 from citas_admin.blueprints.usuarios.decorators import permission_required
@@ -35,17 +34,17 @@ def datatable_json():
     # Tomar parámetros de Datatables
     draw, start, rows_per_page = get_datatable_parameters()
     # Consultar
-    consulta = UsuarioOficina.query
-    if "estatus" in request.form:
-        consulta = consulta.filter_by(estatus=request.form["estatus"])
-    else:
-        consulta = consulta.filter_by(estatus="A")
-    if "oficina_id" in request.form:
-        consulta = consulta.filter_by(oficina_id=request.form["oficina_id"])
-    if "usuario_id" in request.form:
-        consulta = consulta.filter_by(usuario_id=request.form["usuario_id"])
-    registros = consulta.order_by(UsuarioOficina.id).offset(start).limit(rows_per_page).all()
-    total = consulta.count()
+    consulta, _ = filtrar_datatable(
+        UsuarioOficina.query,
+        [
+            Filtro("estatus", UsuarioOficina.estatus, defecto="A"),
+            Filtro("oficina_id", UsuarioOficina.oficina_id),
+            Filtro("usuario_id", UsuarioOficina.usuario_id),
+        ],
+    )
+    registros, total, cursor = paginar_datatable(consulta, [UsuarioOficina.id], start, rows_per_page, relaciones=[UsuarioOficina.usuario, UsuarioOficina.oficina])
+    # Consultar los permisos una sola vez y no en cada renglon
+    puede_ver = {modulo: current_user.can_view(modulo) for modulo in ("USUARIOS", "OFICINAS")}
     # Elaborar datos para DataTable
     data = []
     for resultado in registros:
@@ -57,12 +56,12 @@ def datatable_json():
                 },
                 "usuario": {
                     "email": resultado.usuario.email,
-                    "url": url_for("usuarios.detail", usuario_id=resultado.usuario_id) if current_user.can_view("USUARIOS") else "",
+                    "url": url_for("usuarios.detail", usuario_id=resultado.usuario_id) if puede_ver["USUARIOS"] else "",
                 },
                 "usuario_nombre": resultado.usuario.nombre,
                 "oficina": {
                     "clave": resultado.oficina.clave,
-                    "url": url_for("oficinas.detail", oficina_id=resultado.oficina_id) if current_user.can_view("OFICINAS") else "",
+                    "url": url_for("oficinas.detail", oficina_id=resultado.oficina_id) if puede_ver["OFICINAS"] else "",
                 },
                 "oficina_descripcion_corta": resultado.oficina.descripcion_corta,
                 "oficina_limite_personas": resultado.oficina.limite_personas,
@@ -71,7 +70,7 @@ def datatable_json():
             }
         )
     # Entregar JSON
-    return output_datatable_json(draw, total, data)
+    return output_datatable_json(draw, total, data, cursor)
 
 
 @usuarios_oficinas.route("/usuarios_oficinas")
@@ -141,13 +140,12 @@ def delete(usuario_oficina_id):
     usuario_oficina = UsuarioOficina.query.get_or_404(usuario_oficina_id)
     if usuario_oficina.estatus == "A":
         usuario_oficina.delete()
-        bitacora = Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+        bitacora = registrar_bitacora(
+            modulo=MODULO,
             usuario=current_user,
             descripcion=safe_message(f"Eliminado Usuario Oficina {usuario_oficina.descripcion}"),
             url=url_for("usuarios_oficinas.detail", usuario_oficina_id=usuario_oficina.id),
         )
-        bitacora.save()
         flash(bitacora.descripcion, "success")
     return redirect(url_for("usuarios_oficinas.detail", usuario_oficina_id=usuario_oficina.id))
 
@@ -159,12 +157,11 @@ def recover(usuario_oficina_id):
     usuario_oficina = UsuarioOficina.query.get_or_404(usuario_oficina_id)
     if usuario_oficina.estatus == "B":
         usuario_oficina.recover()
-        bitacora = Bitacora(
-            modulo=Modulo.query.filter_by(nombre=MODULO).first(),
+        bitacora = registrar_bitacora(
+            modulo=MODULO,
             usuario=current_user,
             descripcion=safe_message(f"Recuperado Usuario Oficina {usuario_oficina.descripcion}"),
             url=url_for("usuarios_oficinas.detail", usuario_oficina_id=usuario_oficina.id),
         )
-        bitacora.save()
         flash(bitacora.descripcion, "success")
     return redirect(url_for("usuarios_oficinas.detail", usuario_oficina_id=usuario_oficina.id))
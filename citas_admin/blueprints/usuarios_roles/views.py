@@ -3,10 +3,11 @@ Usuarios Roles, vistas
 """
 import json
 
-from flask import Blueprint, flash, redirect, render_template, request, url_for
+from flask import Blueprint, flash, redirect, render_template, url_for
 from flask_login import current_user, login_required
+from sqlalchemy.orm import joinedload
 
-from lib.datatables import get_datatable_parameters, output_datatable_json
+from lib.datatables import Filtro, filtrar_datatable, get_datatable_parameters, output_datatable_json, paginar_datatable
 from lib.safe_string import safe_message
 
 from citas_admin.blueprints.permisos.models import Permiso
@@ -34,17 +35,17 @@ def datatable_json():
     # Tomar parámetros de Datatables
     draw, start, rows_per_page = get_datatable_parameters()
     # Consultar
-    consulta = UsuarioRol.query
-    if "estatus" in request.form:
-        consulta = consulta.filter_by(estatus=request.form["estatus"])
-    else:
-        consulta = consulta.filter_by(estatus="A")
-    if "usuario_id" in request.form:
-        consulta = consulta.filter_by(usuario_id=request.form["usuario_id"])
-    if "rol_id" in request.form:
-        consulta = consulta.filter_by(rol_id=request.form["rol_id"])
-    registros = consulta.order_by(UsuarioRol.id.desc()).offset(start).limit(rows_per_page).all()
-    total = consulta.count()
+    consulta, _ = filtrar_datatable(
+        UsuarioRol.query,
+        [
+            Filtro("estatus", UsuarioRol.estatus, defecto="A"),
+            Filtro("usuario_id", UsuarioRol.usuario_id),
+            Filtro("rol_id", UsuarioRol.rol_id),
+        ],
+    )
+    registros, total, cursor = paginar_datatable(consulta, [UsuarioRol.id], start, rows_per_page, descendente=True, relaciones=[joinedload(UsuarioRol.usuario).joinedload(Usuario.oficina), UsuarioRol.rol])
+    # Consultar los permisos una sola vez y no en cada renglon
+    puede_ver = {modulo: current_user.can_view(modulo) for modulo in ("USUARIOS", "ROLES", "OFICINAS")}
     # Elaborar datos para DataTable
     data = []
     for resultado in registros:
@@ -56,22 +57,22 @@ def datatable_json():
                 },
                 "usuario": {
                     "email": resultado.usuario.email,
-                    "url": url_for("usuarios.detail", usuario_id=resultado.usuario_id) if current_user.can_view("USUARIOS") else "",
+                    "url": url_for("usuarios.detail", usuario_id=resultado.usuario_id) if puede_ver["USUARIOS"] else "",
                 },
                 "usuario_nombre": resultado.usuario.nombre,
                 "usuario_puesto": resultado.usuario.puesto,
                 "rol": {
                     "nombre": resultado.rol.nombre,
-                    "url": url_for("roles.detail", rol_id=resultado.rol_id) if current_user.can_view("ROLES") else "",
+                    "url": url_for("roles.detail", rol_id=resultado.rol_id) if puede_ver["ROLES"] else "",
                 },
                 "oficina": {
                     "nombre": resultado.usuario.oficina.clave,
-                    "url": url_for("oficinas.detail", oficina_id=resultado.usuario.oficina_id) if current_user.can_view("OFICINAS") else "",
+                    "url": url_for("oficinas.detail", oficina_id=resultado.usuario.oficina_id) if puede_ver["OFICINAS"] else "",
                 },
             }
         )
     # Entregar JSON
-    return output_datatable_json(draw, total, data)
+    return output_datatable_json(draw, total, data, cursor)
 
 
 @usuarios_roles.route("/usuarios_roles")
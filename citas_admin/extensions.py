@@ -3,12 +3,23 @@ Extensiones
 """
 from flask_login import LoginManager
 from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
 from flask_wtf import CSRFProtect
 from passlib.context import CryptContext
 
+from lib.database import BaseDatos
+
 csrf = CSRFProtect()
-db = SQLAlchemy()
+db = BaseDatos()
 login_manager = LoginManager()
 moment = Moment()
 pwd_context = CryptContext(schemes=["pbkdf2_sha256", "des_crypt"], deprecated="auto")
+
+
+def __getattr__(nombre):
+    """socketio se crea hasta que se usa, así las tareas y la línea de comandos no importan Flask-SocketIO"""
+    if nombre == "socketio":
+        from flask_socketio import SocketIO
+
+        globals()["socketio"] = SocketIO()
+        return globals()["socketio"]
+    raise AttributeError(nombre)
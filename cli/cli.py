@@ -5,6 +5,9 @@ import os
 import click
 
 
+# Las órdenes usan el perfil batch del pool de conexiones, salvo que se indique otro
+os.environ.setdefault("DB_PERFIL", "batch")
+
 CMD_FOLDER = os.path.join(os.path.dirname(__file__), "commands")
 CMD_PREFIX = "cmd_"
 
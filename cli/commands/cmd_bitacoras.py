@@ -0,0 +1,58 @@
+"""
+Bitacoras
+
+- pendientes: Mostrar cuantos registros de auditoria faltan por escribir y cuantos fallaron
+- reenviar_fallidos: Regresar los registros de auditoria que fallaron para intentarlos de nuevo
+- vaciar: Escribir en la base de datos los registros de auditoria de Redis
+"""
+import click
+
+from citas_admin.blueprints.bitacoras import auditoria
+
+from citas_admin.app import create_worker_app
+from citas_admin.extensions import db
+
+app = create_worker_app()
+db.app = app
+
+
+@click.group()
+@click.pass_context
+def cli(ctx):
+    """Bitacoras"""
+
+
+@click.command()
+@click.pass_context
+def pendientes(ctx):
+    """Mostrar cuantos registros de auditoria faltan por escribir"""
+    with app.app_context():
+        click.echo(f"Hay {auditoria.pendientes()} registros de auditoria por escribir")
+        click.echo(f"Hay {auditoria.fallidos()} registros de auditoria que fallaron")
+    ctx.exit(0)
+
+
+@click.command()
+@click.option("--lote", default=auditoria.LOTE, help="Renglones por INSERT", type=int)
+@click.pass_context
+def vaciar(ctx, lote):
+    """Escribir en la base de datos los registros de auditoria de Redis"""
+    with app.app_context():
+        cantidad = auditoria.vaciar(lote)
+    click.echo(f"Se escribieron {cantidad} registros de auditoria")
+    ctx.exit(0)
+
+
+@click.command()
+@click.pass_context
+def reenviar_fallidos(ctx):
+    """Regresar los registros de auditoria que fallaron para intentarlos de nuevo"""
+    with app.app_context():
+        cantidad = auditoria.reenviar_fallidos()
+    click.echo(f"Se regresaron {cantidad} registros de auditoria al stream")
+    ctx.exit(0)
+
+
+cli.add_command(pendientes)
+cli.add_command(reenviar_fallidos)
+cli.add_command(vaciar)
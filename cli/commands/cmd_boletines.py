@@ -1,20 +1,22 @@
 """
 Boletines
 
-- consultar: Consultar boletines
+- avance: Mostrar el avance de los fragmentos de un boletin
 - enviar: Enviar mensajes con boletines
+- programados: Mostrar los boletines programados
 """
 from datetime import datetime
 
 import click
 from tabulate import tabulate
 
+from citas_admin.blueprints.boletines import fragmentos
 from citas_admin.blueprints.boletines.models import Boletin
 
-from citas_admin.app import create_app
+from citas_admin.app import create_worker_app
 from citas_admin.extensions import db
 
-app = create_app()
+app = create_worker_app()
 db.app = app
 
 
@@ -54,7 +56,7 @@ def enviar(ctx, boletin_id=None, cit_cliente_id=None, email=None):
     # Agregar tarea en el fondo para enviar boletines
     app.task_queue.enqueue(
         "citas_admin.blueprints.boletines.tasks.enviar",
-        boletin_id=boletin_id,
+        boletin_id=boletin.id,
         cit_cliente_id=cit_cliente_id,
         email=email,
     )
@@ -62,11 +64,11 @@ def enviar(ctx, boletin_id=None, cit_cliente_id=None, email=None):
     # Mostrar mensaje de termino
     mensaje = "Se ha agregado una tarea en el fondo"
     if email is not None:
-        mensaje += f" para enviar el boletin {boletin_id} al email {email}"
+        mensaje += f" para enviar el boletin {boletin.id} al email {email}"
     elif cit_cliente_id is None:
-        mensaje += f" para enviar el boletin {boletin_id} a todos los clientes activos"
+        mensaje += f" para enviar el boletin {boletin.id} a todos los clientes activos, o reanudar los fragmentos sin terminar"
     else:
-        mensaje += f" para guardar el boletin {boletin_id} en un archivo"
+        mensaje += f" para enviar el boletin {boletin.id} al cliente {cit_cliente_id}"
     click.echo(mensaje)
     ctx.exit(0)
 
@@ -83,8 +85,8 @@ def programados(ctx):
         click.echo(f"Boletines programados para enviar hoy {hoy.strftime('%Y-%m-%d')}")
         renglones = []
         for boletin in boletines:
-            renglones.append([boletin.id, boletin.envio_programado.strftime("%Y-%m-%d"), boletin.asunto[:48], boletin.estado, boletin.puntero])
-        encabezados = ["ID", "Envio P.", "Asunto", "Estado", "Puntero"]
+            renglones.append([boletin.id, boletin.envio_programado.strftime("%Y-%m-%d"), boletin.asunto[:48], boletin.estado, f"{boletin.enviados}/{boletin.destinatarios}"])
+        encabezados = ["ID", "Envio P.", "Asunto", "Estado", "Enviados"]
         click.echo(tabulate(renglones, headers=encabezados))
     else:
         click.echo("NO HAY boletines para enviar hoy")
@@ -96,8 +98,8 @@ def programados(ctx):
         click.echo("Boletines para enviar en el FUTURO")
         renglones = []
         for boletin in boletines:
-            renglones.append([boletin.id, boletin.envio_programado.strftime("%Y-%m-%d"), boletin.asunto[:48], boletin.estado, boletin.puntero])
-        encabezados = ["ID", "Envio P.", "Asunto", "Estado", "Puntero"]
+            renglones.append([boletin.id, boletin.envio_programado.strftime("%Y-%m-%d"), boletin.asunto[:48], boletin.estado, f"{boletin.enviados}/{boletin.destinatarios}"])
+        encabezados = ["ID", "Envio P.", "Asunto", "Estado", "Enviados"]
         click.echo(tabulate(renglones, headers=encabezados))
     else:
         click.echo("NO HAY boletines para enviar en el FUTURO")
@@ -107,5 +109,54 @@ def programados(ctx):
     ctx.exit(0)
 
 
+@click.command()
+@click.option("--boletin_id", required=True, help="ID del boletin", type=int)
+@click.option("--reiniciar", is_flag=True, help="Borrar el plan para volver a partir a los suscritos")
+@click.pass_context
+def avance(ctx, boletin_id, reiniciar):
+    """Mostrar el avance de los fragmentos de un boletin"""
+    boletin = Boletin.query.get(boletin_id)
+    if boletin is None:
+        click.echo(f"ERROR: El ID del boletin '{boletin_id}' NO existe")
+        ctx.exit(1)
+    click.echo(f"Boletin {boletin.id}: {boletin.asunto[:48]} ({boletin.estado}) enviados {boletin.enviados} de {boletin.destinatarios}")
+
+    with app.app_context():
+        # Borrar el plan, solo si no hay fragmentos en proceso
+        plan = fragmentos.obtener_plan(boletin.id)
+        if reiniciar and plan is not None:
+            if any(fragmentos.esta_ocupado(boletin.id, numero) for numero in range(len(plan[0]) - 1)):
+                click.echo("ERROR: Hay fragmentos en proceso, no se puede reiniciar")
+                ctx.exit(1)
+            fragmentos.borrar_plan(boletin.id)
+            click.echo("Se borró el plan, el siguiente envío partirá de nuevo a los suscritos")
+            ctx.exit(0)
+        if plan is None:
+            click.echo("No tiene plan de fragmentos")
+            ctx.exit(0)
+
+        # Mostrar el avance de cada fragmento
+        limites, _ = plan
+        renglones = []
+        for numero in range(len(limites) - 1):
+            avance_fragmento = fragmentos.leer_avance(boletin.id, numero)
+            renglones.append(
+                [
+                    numero,
+                    f"{limites[numero] + 1}-{limites[numero + 1]}",
+                    avance_fragmento["puntero"],
+                    avance_fragmento["enviados"],
+                    avance_fragmento["dudosos"],
+                    "TERMINADO" if avance_fragmento["terminado"] else "EN PROCESO" if avance_fragmento["ocupado"] else "PENDIENTE",
+                ]
+            )
+        encabezados = ["Fragmento", "IDs", "Puntero", "Enviados", "Dudosos", "Estado"]
+        click.echo(tabulate(renglones, headers=encabezados))
+
+    # Terminar
+    ctx.exit(0)
+
+
+cli.add_command(avance)
 cli.add_command(enviar)
 cli.add_command(programados)
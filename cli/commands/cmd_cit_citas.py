@@ -11,20 +11,25 @@ Cit Citas
 - contar_citas_dobles: Cuenta las citas que se crearon más de una vez
 """
 import click
-from datetime import date, datetime, timedelta
+from datetime import date, datetime, time, timedelta
+from sqlalchemy import cast, column, func, update, values
 from tabulate import tabulate
 
-from citas_admin.app import create_app
+from lib.duplicados import buscar_duplicados, dar_de_baja, guardar_reporte
+from lib import transiciones
+
+from citas_admin.app import create_worker_app
 from citas_admin.extensions import db
 
 from citas_admin.blueprints.cit_citas.models import CitCita
-from citas_admin.blueprints.cit_dias_inhabiles.models import CitDiaInhabil
+from citas_admin.blueprints.cit_dias_inhabiles.calendario import CalendarioHabil
 
-app = create_app()
+app = create_worker_app()
 db.app = app
 
 OFFSET = 0
 LIMIT = 40
+LOTE = 5000
 
 
 @click.group()
@@ -34,38 +39,45 @@ def cli(ctx):
 
 
 @click.command()
+@click.option("--lote", default=LOTE, help="Citas por cada UPDATE", type=int)
 @click.pass_context
-def actualizar_cancelar_antes(ctx):
+def actualizar_cancelar_antes(ctx, lote):
     """Actualizar el campo cancelar_antes"""
     click.echo("Actualizar el campo cancelar_antes")
 
-    # Consultar dias inhabiles
-    dias_inhabiles = CitDiaInhabil.query.filter(CitDiaInhabil.fecha >= date.today()).filter_by(estatus="A").all()
-
-    # Bucle en todas las citas en el futuro que no tienen cancelar_antes
-    contador = 0
-    for cit_cita in CitCita.query.filter(CitCita.inicio > datetime.now()).filter(CitCita.cancelar_antes == None).all():
-
-        # Definir cancelar_antes con 24 horas antes de la cita
-        cancelar_antes = cit_cita.inicio - timedelta(hours=24)
+    # Consultar el rango de las citas en el futuro que no tienen cancelar_antes
+    ahora = datetime.now()
+    pendientes = CitCita.query.filter(CitCita.inicio > ahora).filter(CitCita.cancelar_antes == None)
+    primera, ultima = pendientes.with_entities(func.min(CitCita.inicio), func.max(CitCita.inicio)).one()
+    if primera is None:
+        click.echo("No hay citas por actualizar")
+        ctx.exit(0)
 
-        # Si cancelar_antes es un dia inhabil, domingo o sabado, se busca el dia habil anterior
-        while cancelar_antes.date() in dias_inhabiles or cancelar_antes.weekday() == 6 or cancelar_antes.weekday() == 5:
-            if cancelar_antes.date() in dias_inhabiles:
-                cancelar_antes = cancelar_antes - timedelta(days=1)
-            if cancelar_antes.weekday() == 6:  # Si es domingo, se cambia a viernes
-                cancelar_antes = cancelar_antes - timedelta(days=2)
-            if cancelar_antes.weekday() == 5:  # Si es sábado, se cambia a viernes
-                cancelar_antes = cancelar_antes - timedelta(days=1)
+    # Calendario con el dia habil de un dia antes de cada fecha de las citas
+    calendario = CalendarioHabil(primera.date() - timedelta(days=1), ultima.date() - timedelta(days=1))
+    dias = values(column("fecha", db.Date), column("habil", db.Date), name="dias")
+    dias = dias.data([(fecha + timedelta(days=1), habil) for fecha, habil in calendario.habiles.items()])
 
-        # Actualizar
-        cit_cita.cancelar_antes = cancelar_antes
-        cit_cita.save()
-
-        # Incrementar contador
-        contador += 1
-        if contador % 100 == 0:
-            click.echo(f"Van {contador} citas actualizadas...")
+    # Actualizar por lotes de ID, cancelar_antes es el dia habil a la misma hora del inicio
+    contador = 0
+    ultimo_id = 0
+    while True:
+        ids = [renglon.id for renglon in pendientes.with_entities(CitCita.id).filter(CitCita.id > ultimo_id).order_by(CitCita.id).limit(lote)]
+        if not ids:
+            break
+        resultado = db.session.execute(
+            update(CitCita)
+            .where(CitCita.id.between(ids[0], ids[-1]))
+            .where(CitCita.inicio > ahora)
+            .where(CitCita.cancelar_antes == None)
+            .where(cast(CitCita.inicio, db.Date) == dias.c.fecha)
+            .values(cancelar_antes=dias.c.habil + cast(CitCita.inicio, db.Time))
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        contador += resultado.rowcount
+        ultimo_id = ids[-1]
+        click.echo(f"Van {contador} citas actualizadas...")
 
     click.echo(f"Se actualizaron {contador} citas")
     ctx.exit(0)
@@ -250,82 +262,59 @@ def marcar_inasistencia(ctx, test, enviar):
     """Marca citas pasadas y PENDIENTES como 'INASISTENCIA'"""
     click.echo("Marcar las citas pasadas y PENDIENTES con INASISTENCIA")
 
-    # Calcular fecha de vencimiento
-    fecha_actual = datetime.now()
-    fecha_limite = datetime(
-        year=fecha_actual.year,
-        month=fecha_actual.month,
-        day=fecha_actual.day,
-        hour=23,
-        minute=59,
-        second=59,
-    )
-    fecha_limite = fecha_limite - timedelta(days=1)
+    # Calcular fecha de vencimiento, el fin del día de ayer
+    fecha_limite = datetime.combine(date.today() - timedelta(days=1), time(23, 59, 59))
     click.echo(f"Fecha de Vencimiento: {fecha_limite}, citas anteriores a esta fecha.")
 
     # Conteo de citas para cambiar de PENDIENTE a INASISTENCIA
-    citas_count = CitCita.query.filter_by(estado="PENDIENTE").filter(CitCita.inicio <= fecha_limite).filter_by(estatus="A").count()
+    citas_count = transiciones.contar(CitCita, CitCita.condiciones_inasistencia(fecha_limite))
 
     if test:
         click.echo(f"MODO DE PRUEBA - citas a cambiar {citas_count}, No se hizo ningún cambio permanente.")
-    else:
-        # Enviar mensaje de INASISTENCIA al cliente
         if enviar is True:
-            citas = CitCita.query.filter_by(estado="PENDIENTE").filter(CitCita.inicio <= fecha_limite).filter_by(estatus="A").all()
-            for cita in citas:
-                # Agregar tarea en el fondo para enviar el mensaje de inasistencia
-                app.task_queue.enqueue(
-                    "citas_admin.blueprints.cit_citas.tasks.enviar_inasistencia",
-                    cit_cita_id=cita.id,
-                )
-            click.echo(f"Se han enviado {len(citas)} mensajes de INASISTENCIA")
-        else:
-            citas_count = CitCita.query.filter_by(estado="PENDIENTE").filter(CitCita.inicio <= fecha_limite).filter_by(estatus="A").count()
-            click.echo(f"SIN ENVÍO: Se podrían enviar {citas_count} mensajes de correo a los clientes.")
+            click.echo(f"Se enviarían {citas_count} mensajes de correo a los clientes.")
+        ctx.exit(0)
 
     if citas_count > 0:
-        # Agregar tarea en el fondo para marcar las citas vencidas
+        # Agregar tarea en el fondo para marcar las citas vencidas por lotes, la cual agrega las tareas para enviar los mensajes por grupos
         app.task_queue.enqueue(
             "citas_admin.blueprints.cit_citas.tasks.marcar_inasistencia",
-            test=test,
+            test=False,
+            enviar=enviar is True,
         )
-        click.echo(f"Se han cambiado {citas_count} citas a estado de INASISTENCIA")
+        click.echo(f"Se ha agregado la tarea para cambiar {citas_count} citas a estado de INASISTENCIA")
+        if enviar is True:
+            click.echo("Los mensajes de INASISTENCIA se enviarán por grupos de citas")
 
     ctx.exit(0)
 
 
 @click.command()
+@click.option("--salida", default="", help="Archivo para el reporte, .csv o .json", type=str)
+@click.option("--test", default=True, help="Modo de pruebas en el que no se guardan los cambios")
 @click.pass_context
-def contar_citas_dobles(ctx):
+def contar_citas_dobles(ctx, salida, test):
     """Cuenta las citas que se crearon más de una vez"""
     click.echo("=== Reporte de citas dobles ===")
 
-    # Recorrido de las citas
-    citas = CitCita.query.filter_by(estatus="A").order_by(CitCita.id).all()
-
-    contador = 0
-    count_citas_dobles = 0
-    for cita in citas:
-        contador += 1
-        # Buscar cita repetida
-        cita_repetida = (
-            CitCita.query.filter(CitCita.id > cita.id)
-            .filter_by(creado=cita.creado)
-            .filter_by(inicio=cita.inicio)
-            .filter_by(cit_cliente=cita.cit_cliente)
-            .filter_by(oficina_id=cita.oficina_id)
-            .filter_by(cit_servicio_id=cita.cit_servicio_id)
-            .order_by(CitCita.id)
-            .first()
-        )
-        if cita_repetida:
-            click.echo(f"! CITA REPETIDA: {cita.id} y {cita_repetida.id}")
-            count_citas_dobles += 1
-        # Muestra de avance
-        if contador % 1000 == 0:
-            click.echo("Progreso [{porcentaje:.2f}%] : conteo {contador}".format(porcentaje=((contador * 100) / len(citas)), contador=count_citas_dobles))
-
-    click.echo(f"= RESULTADO: Se han encontrado {count_citas_dobles} citas dobles")
+    # Buscar los grupos de citas con el mismo creado, inicio, cliente, oficina y servicio
+    llaves = [CitCita.creado, CitCita.inicio, CitCita.cit_cliente_id, CitCita.oficina_id, CitCita.cit_servicio_id]
+    duplicados = list(buscar_duplicados(CitCita, llaves))
+    sobrantes = [cit_cita_id for duplicado in duplicados for cit_cita_id in duplicado.sobrantes]
+    for duplicado in duplicados:
+        click.echo(f"! CITA REPETIDA: {duplicado.conservar} y {', '.join(str(cit_cita_id) for cit_cita_id in duplicado.sobrantes)}")
+    click.echo(f"= RESULTADO: Se han encontrado {len(sobrantes)} citas dobles en {len(duplicados)} grupos")
+
+    # Guardar el reporte
+    if salida != "":
+        guardar_reporte(duplicados, [llave.key for llave in llaves], salida)
+        click.echo(f"Reporte guardado en {salida}")
+
+    # Dar de baja las citas sobrantes, se conserva la de menor ID
+    if test is True:
+        click.echo(f"MODO DE PRUEBAS: Se podrían eliminar {len(sobrantes)} citas")
+    else:
+        click.echo(f"Se eliminaron {dar_de_baja(CitCita, sobrantes)} citas")
 
     ctx.exit(0)
 
@@ -0,0 +1,50 @@
+"""
+Cit Citas Stats
+
+- actualizar: Actualizar cit_citas_diarias con las citas creadas o modificadas desde la última vez (para el cron)
+- reconstruir: Crear si no existe y recalcular toda la tabla cit_citas_diarias
+"""
+import sys
+
+import click
+
+from citas_admin.app import create_worker_app
+from citas_admin.extensions import db
+
+from citas_admin.blueprints.cit_citas_stats.agregador import actualizar_diarias, hay_actualizacion_en_proceso
+from citas_admin.blueprints.cit_citas_stats.models import CitCitaDiaria
+
+app = create_worker_app()
+db.app = app
+
+
+@click.group()
+def cli():
+    """Cit Citas Stats"""
+
+
+@click.command()
+def actualizar():
+    """Actualizar cit_citas_diarias con las citas creadas o modificadas desde la última vez"""
+    with app.app_context():
+        if hay_actualizacion_en_proceso():
+            click.echo("Ya hay otra actualización en proceso, no se agrega otra.")
+            return
+    app.task_queue.enqueue("citas_admin.blueprints.cit_citas_stats.tasks.actualizar")
+    click.echo("Actualizar se está ejecutando en el fondo.")
+
+
+@click.command()
+def reconstruir():
+    """Crear si no existe y recalcular toda la tabla cit_citas_diarias"""
+    CitCitaDiaria.__table__.create(db.engine, checkfirst=True)
+    with app.app_context():
+        renglones = actualizar_diarias(reconstruir=True)
+    if renglones is None:
+        click.echo("Ya hay otra actualización en proceso, intente más tarde")
+        sys.exit(1)
+    click.echo(f"Se escribieron {renglones} renglones en cit_citas_diarias")
+
+
+cli.add_command(actualizar)
+cli.add_command(reconstruir)
@@ -1,8 +1,10 @@
 """
 Cit Clientes
 
+- actualizar_busqueda: Instalar el disparador de la columna de búsqueda (PostgreSQL) y elaborarla en todos los clientes
 - agregar: Agregar un nuevo cliente
 - cambiar_contrasena: Cambiar contraseña de un cliente
+- contar_duplicados: Cuenta los clientes repetidos por CURP, e-mail o nombre
 - eliminar_abandonados: Eliminar los clientes que han abandonado su cuenta
 - definir_booleanos: Define los booleanos es_adulto_mayor, es_mujer, etc
 - evaluar_asistencia: Penaliza o Premia al cliente dependiendo de su asistencia
@@ -11,28 +13,78 @@ from datetime import datetime, timedelta
 
 import click
 from tabulate import tabulate
-from sqlalchemy import text, update
+from sqlalchemy import func, text, update
 
-from lib import database
+from lib.busqueda import concatenar
+from lib.duplicados import buscar_duplicados, con_hijos, dar_de_baja, guardar_reporte
 from lib.pwgen import generar_contrasena
 from lib.safe_string import safe_string
 
-from citas_admin.app import create_app
+from citas_admin.app import create_worker_app
 from citas_admin.extensions import db, pwd_context
 
-from citas_admin.blueprints.cit_clientes.models import CitCliente
+from citas_admin.blueprints.cit_clientes.models import CitCliente, instalar_disparador_busqueda
 from citas_admin.blueprints.cit_citas.models import CitCita
 from citas_admin.blueprints.pag_pagos.models import PagPago
 
-app = create_app()
+app = create_worker_app()
 db.app = app
 
+# Llaves para buscar clientes repetidos, normalizadas porque curp y email ya son únicos
+LLAVES_DUPLICADOS = {
+    "curp": {"curp": func.upper(func.trim(CitCliente.curp))},
+    "email": {"email": func.lower(func.trim(CitCliente.email))},
+    "nombre": {
+        "nombres": func.upper(func.trim(CitCliente.nombres)),
+        "apellido_primero": func.upper(func.trim(CitCliente.apellido_primero)),
+        "apellido_segundo": func.upper(func.trim(CitCliente.apellido_segundo)),
+    },
+}
+
+# Un cliente repetido con citas o pagos activos no se da de baja, se reporta para revisarlo
+HIJOS_DUPLICADOS = [CitCita.cit_cliente_id, PagPago.cit_cliente_id]
+
 
 @click.group()
 def cli():
     """Cit Clientes"""
 
 
+@click.command()
+@click.option("--lote", default=1000, help="Clientes por UPDATE", type=int)
+def actualizar_busqueda(lote):
+    """Elaborar la columna de búsqueda de todos los clientes"""
+    click.echo("Elaborar la columna de búsqueda de los clientes")
+    if db.engine.dialect.name == "postgresql":
+        # Instalar el disparador y que él elabore la columna, tocándola por lotes de ID
+        with db.engine.begin() as conexion:
+            instalar_disparador_busqueda(conexion)
+        ultimo_id = db.session.query(func.max(CitCliente.id)).scalar() or 0
+        for desde in range(0, ultimo_id, lote):
+            db.session.execute(update(CitCliente).where(CitCliente.id > desde).where(CitCliente.id <= desde + lote).values(busqueda=""))
+            db.session.commit()
+        click.echo(f"Se actualizaron los clientes hasta el ID {ultimo_id}")
+        return
+    ultimo_id = 0
+    cantidad = 0
+    columnas = (CitCliente.id, CitCliente.nombres, CitCliente.apellido_primero, CitCliente.apellido_segundo, CitCliente.curp, CitCliente.email, CitCliente.busqueda)
+    while True:
+        renglones = db.session.query(*columnas).filter(CitCliente.id > ultimo_id).order_by(CitCliente.id).limit(lote).all()
+        if not renglones:
+            break
+        cambios = []
+        for renglon in renglones:
+            busqueda = concatenar(renglon.nombres, renglon.apellido_primero, renglon.apellido_segundo, renglon.curp, renglon.email)
+            if busqueda != renglon.busqueda:
+                cambios.append({"id": renglon.id, "busqueda": busqueda})
+        if cambios:
+            db.session.bulk_update_mappings(CitCliente, cambios)
+            db.session.commit()
+        cantidad += len(cambios)
+        ultimo_id = renglones[-1].id
+    click.echo(f"Se actualizaron {cantidad} clientes")
+
+
 @click.command()
 @click.argument("email", type=str)
 def agregar(email):
@@ -110,9 +162,6 @@ def eliminar_abandonados(test):
     """Eliminar clientes sin contraseña y sin citas"""
     click.echo("Eliminar clientes sin contraseña y sin citas")
 
-    # Inicializar el engine para ejecutar comandos SQL
-    engine = database.engine
-
     # Si esta en modo de pruebas, no se guardan los cambios
     if test is True:
 
@@ -124,11 +173,8 @@ def eliminar_abandonados(test):
                     AND cli.id NOT IN (SELECT cit_cliente_id FROM cit_clientes_recuperaciones WHERE cit_cliente_id = cli.id AND estatus = 'A') \
                     AND cli.contrasena_sha256 = ''"
         )
-        res = engine.execute(count_query)
-        count_cit_clientes = 0
-        if res:
-            for cantidad in res.columns("cantidad"):
-                count_cit_clientes = cantidad[0]
+        with db.engine.begin() as conexion:
+            count_cit_clientes = conexion.execute(count_query).scalar() or 0
         click.echo(f"MODO DE PRUEBAS: Se podrían eliminar {count_cit_clientes} clientes")
 
     else:  # Modo de realizar cambios
@@ -139,7 +185,8 @@ def eliminar_abandonados(test):
                 FROM cit_clientes_recuperaciones \
                 WHERE estatus = 'B'"
         )
-        res = engine.execute(borrado)
+        with db.engine.begin() as conexion:
+            conexion.execute(borrado)
 
         # Borrado de clientes sin SHA256 y sin citas
         borrado = text(
@@ -149,8 +196,8 @@ def eliminar_abandonados(test):
                     AND cli.id NOT IN (SELECT cit_cliente_id FROM cit_clientes_recuperaciones WHERE cit_cliente_id = cli.id) \
                     AND cli.contrasena_sha256 = ''"
         )
-        res = engine.execute(borrado)
-        if res:
+        with db.engine.begin() as conexion:
+            res = conexion.execute(borrado)
             click.echo(f"Se eliminaron {res.rowcount} clientes correctamente")
 
 
@@ -161,9 +208,6 @@ def eliminar_sin_cita(dias, test):
     """Eliminar clientes sin citas en un periodo de tiempo"""
     click.echo("Eliminar clientes sin citas en un periodo de tiempo")
 
-    # Inicializar el engine para ejecutar comandos SQL
-    engine = database.engine
-
     # Si esta en modo de pruebas, no se guardan los cambios
     if test is True:  # Modo de pruebas
 
@@ -183,9 +227,9 @@ def eliminar_sin_cita(dias, test):
                     AND pag.cit_cliente_id IS NULL\
                     AND cli.creado <= now() - INTERVAL '{dias} day'"
         )
-        resultado = engine.execute(count_query)
-        if resultado:
-            renglon = resultado.fetchone()
+        with db.engine.begin() as conexion:
+            renglon = conexion.execute(count_query).fetchone()
+        if renglon:
             cantidad = renglon["cantidad"]
             creado_hasta = renglon["creado_hasta"]
 
@@ -198,11 +242,7 @@ def eliminar_sin_cita(dias, test):
         creado_hasta = datetime.now() - timedelta(days=dias)
 
         # Consultar los clientes que se van a eliminar
-        db = database.SessionLocal()
-        results = db.query(CitCliente, CitCita, PagPago).outerjoin(CitCita).outerjoin(PagPago).filter(CitCita.cit_cliente_id == None).filter(PagPago.cit_cliente_id == None).filter(CitCliente.creado <= creado_hasta).all()
-
-        # Inicializar el engine
-        engine = database.engine
+        results = db.session.query(CitCliente, CitCita, PagPago).outerjoin(CitCita).outerjoin(PagPago).filter(CitCita.cit_cliente_id == None).filter(PagPago.cit_cliente_id == None).filter(CitCliente.creado <= creado_hasta).all()
 
         # Bucle para eliminar
         contador = 0
@@ -214,11 +254,14 @@ def eliminar_sin_cita(dias, test):
                     FROM cit_clientes_recuperaciones \
                     WHERE cit_cliente_id = {cliente.id}"
             )
-            engine.execute(cit_cilente_recuperacion_borrar)
 
             # Eliminar cliente
             sql = text(f"DELETE FROM {CitCliente.__tablename__} WHERE id = {cliente.id};")
-            engine.execute(sql)
+
+            # Ambos en la misma transacción
+            with db.engine.begin() as conexion:
+                conexion.execute(cit_cilente_recuperacion_borrar)
+                conexion.execute(sql)
 
             # Contador
             contador += 1
@@ -235,7 +278,7 @@ def cambiar_enviar_boletin_verdadero(dias, test):
     click.echo("Pone en verdadero enviar_boletin a los clientes con citas recientes")
 
     # Consultar clientes y citas
-    consulta = database.SessionLocal().query(CitCliente.id, CitCliente.email).select_from(CitCliente).join(CitCita)
+    consulta = db.session.query(CitCliente.id, CitCliente.email).select_from(CitCliente).join(CitCita)
 
     # Filtrar por los que han tenido citas en los últimos días
     consulta = consulta.filter(CitCita.creado >= datetime.now() - timedelta(days=dias))
@@ -300,17 +343,51 @@ def cambiar_enviar_boletin_falso(dias, test):
         click.echo(f"Se encontraron {cit_clientes.count()} clientes con enviar_boletin en verdadero")
         return
 
-    # Inicializar el engine para ejecutar comandos SQL
-    engine = database.engine
-
     # Actualizar los cliente con enviar_boletin en falso
     comando = update(CitCliente).where(CitCliente.estatus == "A").filter(CitCliente.enviar_boletin == True).values(enviar_boletin=False)
-    resultado = engine.execute(comando)
-    click.echo(f"Se actualizaron {resultado.rowcount} clientes con enviar_boletin en falso")
+    with db.engine.begin() as conexion:
+        resultado = conexion.execute(comando)
+        click.echo(f"Se actualizaron {resultado.rowcount} clientes con enviar_boletin en falso")
+
+
+@click.command()
+@click.option("--llave", default="curp", help="curp, email o nombre", type=click.Choice(list(LLAVES_DUPLICADOS)))
+@click.option("--salida", default="", help="Archivo para el reporte, .csv o .json", type=str)
+@click.option("--test", default=True, help="Modo de pruebas en el que no se guardan los cambios")
+def contar_duplicados(llave, salida, test):
+    """Cuenta los clientes repetidos por CURP, e-mail o nombre"""
+    click.echo(f"Cuenta los clientes repetidos por {llave}")
+
+    # Buscar los grupos de clientes con la misma llave
+    llaves = LLAVES_DUPLICADOS[llave]
+    duplicados = list(buscar_duplicados(CitCliente, list(llaves.values())))
+    sobrantes = [cit_cliente_id for duplicado in duplicados for cit_cliente_id in duplicado.sobrantes]
+    datos = [[duplicado.conservar, ", ".join(str(cit_cliente_id) for cit_cliente_id in duplicado.sobrantes), " ".join(duplicado.valores)] for duplicado in duplicados]
+    click.echo(tabulate(datos, headers=["Conservar", "Sobrantes", "Llave"]))
+    click.echo(f"Se encontraron {len(sobrantes)} clientes repetidos en {len(duplicados)} grupos")
+
+    # Guardar el reporte
+    if salida != "":
+        guardar_reporte(duplicados, list(llaves), salida)
+        click.echo(f"Reporte guardado en {salida}")
+
+    # Dar de baja los clientes sobrantes, se conserva el de menor ID
+    if test is True:
+        click.echo(f"MODO DE PRUEBAS: Se podrían eliminar {len(sobrantes)} clientes")
+        return
+    if llave == "nombre":
+        click.echo("No se eliminan clientes repetidos por nombre, pueden ser personas distintas")
+        return
+    omitidos = con_hijos(CitCliente, sobrantes, HIJOS_DUPLICADOS)
+    if omitidos:
+        click.echo(f"No se eliminan {len(omitidos)} clientes con citas o pagos activos: {', '.join(str(cit_cliente_id) for cit_cliente_id in omitidos)}")
+    click.echo(f"Se eliminaron {dar_de_baja(CitCliente, sobrantes, HIJOS_DUPLICADOS)} clientes")
 
 
+cli.add_command(actualizar_busqueda)
 cli.add_command(agregar)
 cli.add_command(cambiar_contrasena)
+cli.add_command(contar_duplicados)
 cli.add_command(cambiar_enviar_boletin_verdadero)
 cli.add_command(cambiar_enviar_boletin_falso)
 cli.add_command(eliminar_abandonados)
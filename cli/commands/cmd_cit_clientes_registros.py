@@ -11,12 +11,12 @@ import click
 from dotenv import load_dotenv
 from tabulate import tabulate
 
-from citas_admin.app import create_app
+from citas_admin.app import create_worker_app
 from citas_admin.extensions import db
 
 from citas_admin.blueprints.cit_clientes_registros.models import CitClienteRegistro
 
-app = create_app()
+app = create_worker_app()
 db.app = app
 
 load_dotenv()  # Take environment variables from .env
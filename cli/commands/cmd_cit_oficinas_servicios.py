@@ -5,13 +5,13 @@ Cit Oficinas-Servicios
 """
 import click
 
-from citas_admin.app import create_app
+from citas_admin.app import create_worker_app
 from citas_admin.extensions import db
 
 from citas_admin.blueprints.cit_categorias.models import CitCategoria
 from citas_admin.blueprints.distritos.models import Distrito
 
-app = create_app()
+app = create_worker_app()
 db.app = app
 
 
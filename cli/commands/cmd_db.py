@@ -8,8 +8,11 @@ Base de datos
 """
 import os
 import click
+from sqlalchemy import text
 
-from citas_admin.app import create_app
+from lib import particiones
+
+from citas_admin.app import create_worker_app
 from citas_admin.extensions import db
 
 from cli.commands.alimentar_autoridades import alimentar_autoridades
@@ -40,7 +43,7 @@ from cli.commands.respaldar_oficinas import respaldar_oficinas
 from cli.commands.respaldar_roles_permisos import respaldar_roles_permisos
 from cli.commands.respaldar_usuarios_roles import respaldar_usuarios_roles
 
-app = create_app()
+app = create_worker_app()
 db.app = app
 
 entorno_implementacion = os.environ.get("DEPLOYMENT_ENVIRONMENT", "develop").upper()
@@ -58,7 +61,13 @@ def inicializar():
         click.echo("PROHIBIDO: No se inicializa porque este es el servidor de producción.")
         return
     db.drop_all()
+    if particiones.es_postgresql():
+        db.session.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))  # Para los índices de búsqueda
+        db.session.commit()
     db.create_all()
+    if particiones.es_postgresql():
+        for tabla in particiones.tablas_particionadas():
+            particiones.convertir(tabla)
     click.echo("Termina inicializar.")
 
 
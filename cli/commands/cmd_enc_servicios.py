@@ -14,7 +14,9 @@ import click
 from dotenv import load_dotenv
 from tabulate import tabulate
 
-from citas_admin.app import create_app
+from lib import transiciones
+
+from citas_admin.app import create_worker_app
 from citas_admin.extensions import db
 
 from citas_admin.blueprints.cit_citas.models import CitCita
@@ -22,7 +24,7 @@ from citas_admin.blueprints.cit_clientes.models import CitCliente
 from citas_admin.blueprints.enc_servicios.models import EncServicio
 from citas_admin.blueprints.oficinas.models import Oficina
 
-app = create_app()
+app = create_worker_app()
 db.app = app
 
 load_dotenv()  # Take environment variables from .env
@@ -310,32 +312,19 @@ def cancelar(ctx, test):
     # Definir el creado_hasta a 7 dias antes
     creado_hasta = datetime.now() - timedelta(days=7)
 
-    # Consultar las encuestas PENDIENTE creadas antes de creado_hasta
-    encuestas = EncServicio.query.filter(EncServicio.creado <= creado_hasta).filter_by(estado="PENDIENTE").filter_by(estatus="A")
+    # Condiciones de las encuestas PENDIENTE creadas antes de creado_hasta
+    condiciones = [EncServicio.creado <= creado_hasta, EncServicio.estado == "PENDIENTE", EncServicio.estatus == "A"]
 
-    # Si la consulta no entrega nada, terminar
-    if encuestas.count() == 0:
-        click.echo("No hay citas para cancelar")
+    # Si esta en modo de pruebas, solo contar
+    if test:
+        click.echo(f"Modo de pruebas: Se pueden cancelar {transiciones.contar(EncServicio, condiciones)} encuestas de servicios")
         ctx.exit(0)
 
-    # Bucle en cada encuesta
+    # Cancelar por lotes
     contador = 0
-    for encuesta in encuestas.all():
-
-        # Si NO esta en modo de pruebas, cancelar la encuesta
-        if test is False:
-            encuesta.estado = "CANCELADO"
-            encuesta.estatus = "B"
-            encuesta.save()
-
-        # Incrementar el contador
-        contador += 1
-
-    # Si esta en modo de pruebas
-    if test:
-        click.echo(f"Modo de pruebas: Se pueden cancelar {contador} encuestas de servicios")
-    else:
-        click.echo(f"Se han cancelado {contador} encuestas de servicios")
+    for ids in transiciones.transicionar(EncServicio, condiciones, {"estado": "CANCELADO", "estatus": "B"}):
+        contador += len(ids)
+    click.echo(f"Se han cancelado {contador} encuestas de servicios")
 
     # Terminar
     ctx.exit(0)
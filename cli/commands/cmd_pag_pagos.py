@@ -9,12 +9,14 @@ from datetime import datetime, timedelta
 
 import click
 
+from lib import transiciones
+
 from citas_admin.blueprints.pag_pagos.models import PagPago
 
-from citas_admin.app import create_app
+from citas_admin.app import create_worker_app
 from citas_admin.extensions import db
 
-app = create_app()
+app = create_worker_app()
 db.app = app
 
 
@@ -91,13 +93,17 @@ def enviar_mensajes_comprobantes(ctx, before_creado, to_email=None):
 @click.command()
 @click.pass_context
 @click.option("--before_creado", default=120, help="Minutos antes de la hora actual", type=int)
-def cancelar_solicitados_expirados(ctx, before_creado):
+@click.option("--test", default=False, help="Modo de pruebas, solo cuenta los pagos", type=bool)
+def cancelar_solicitados_expirados(ctx, before_creado, test):
     """Cambia el estado a CANCELADO de los pagos SOLICITADOS creados antes de before_creado"""
     tiempo = datetime.now() - timedelta(minutes=before_creado)
     click.echo(f"Cancelar pagos en estado SOLICITADO creados antes del {tiempo.strftime('%Y-%m-%d %H:%M:%S')}")
 
     # Conteo de registros a afectar
-    pagos_count = PagPago.query.filter_by(estatus="A").filter_by(estado="SOLICITADO").filter(PagPago.creado <= tiempo).count()
+    pagos_count = transiciones.contar(PagPago, PagPago.condiciones_expirados(tiempo))
+    if test is True:
+        click.echo(f"MODO DE PRUEBA: Se cancelarían {pagos_count} pagos")
+        ctx.exit(0)
 
     # Agregar tarea en el fondo para cancelar los pagos
     app.task_queue.enqueue(
@@ -106,7 +112,7 @@ def cancelar_solicitados_expirados(ctx, before_creado):
     )
 
     # Mostrar resultado
-    click.echo(f"Se cancelaron {pagos_count} pagos")
+    click.echo(f"Se ha agregado la tarea para cancelar {pagos_count} pagos")
     ctx.exit(0)
 
 
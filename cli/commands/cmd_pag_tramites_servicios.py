@@ -9,12 +9,12 @@ import click
 
 from lib.safe_string import safe_clave, safe_string, safe_url
 
-from citas_admin.app import create_app
+from citas_admin.app import create_worker_app
 from citas_admin.extensions import db
 
 from citas_admin.blueprints.pag_tramites_servicios.models import PagTramiteServicio
 
-app = create_app()
+app = create_worker_app()
 db.app = app
 
 
@@ -0,0 +1,87 @@
+"""
+Particiones por mes de bitacoras, entradas_salidas y tareas
+
+- convertir: Partir por mes las tablas declaradas, copia sus renglones
+- crear: Crear las particiones de los meses siguientes, ejecutar cada mes
+- listar: Mostrar las particiones y sus renglones estimados
+- archivar: Escribir en archivos las particiones viejas y borrarlas
+"""
+from datetime import date
+import sys
+
+import click
+from dateutil.relativedelta import relativedelta
+from tabulate import tabulate
+
+from lib import particiones
+
+from citas_admin.app import create_worker_app
+from citas_admin.extensions import db
+
+app = create_worker_app()
+db.app = app
+
+
+@click.group()
+@click.pass_context
+def cli(ctx):
+    """Particiones"""
+    if not particiones.es_postgresql():
+        click.echo("ERROR: Las particiones solo se usan en PostgreSQL")
+        ctx.exit(1)
+
+
+@click.command()
+@click.option("--meses", default=particiones.MESES_ADELANTE, help="Meses adelante con particion", type=int)
+def convertir(meses):
+    """Partir por mes las tablas declaradas, copia sus renglones"""
+    for tabla in particiones.tablas_particionadas():
+        try:
+            convertida = particiones.convertir(tabla, meses)
+        except particiones.ParticionError as error:
+            click.echo(f"ERROR: {str(error)}")
+            sys.exit(1)
+        if convertida:
+            click.echo(f"Se partio {tabla.name}: {len(particiones.listar_particiones(tabla.name))} particiones")
+        else:
+            click.echo(f"La tabla {tabla.name} ya estaba partida")
+
+
+@click.command()
+@click.option("--meses", default=particiones.MESES_ADELANTE, help="Meses adelante con particion", type=int)
+def crear(meses):
+    """Crear las particiones de los meses siguientes"""
+    for tabla in particiones.tablas_particionadas():
+        creadas = particiones.crear_particiones(tabla.name, meses_adelante=meses)
+        click.echo(f"{tabla.name}: {', '.join(creadas) if creadas else 'no faltan particiones'}")
+
+
+@click.command()
+def listar():
+    """Mostrar las particiones y sus renglones estimados"""
+    for tabla in particiones.tablas_particionadas():
+        click.echo(f"{tabla.name}")
+        renglones = [[mes.strftime("%Y-%m"), nombre, cantidad] for mes, nombre, cantidad in particiones.listar_particiones(tabla.name)]
+        click.echo(tabulate(renglones, headers=["Mes", "Particion", "Renglones"]))
+        click.echo()
+
+
+@click.command()
+@click.option("--conservar", default=12, help="Meses que se conservan en la base de datos", type=int)
+@click.option("--directorio", required=True, help="Directorio para los archivos", type=click.Path(exists=True, file_okay=False, writable=True))
+@click.option("--test", default=True, help="Modo de pruebas en el que no se guardan los cambios")
+def archivar(conservar, directorio, test):
+    """Escribir en archivos CSV comprimidos las particiones viejas y borrarlas"""
+    antes_de = particiones.inicio_mes(date.today()) - relativedelta(months=conservar)
+    click.echo(f"Archivar las particiones anteriores a {antes_de.strftime('%Y-%m')}")
+    for tabla in particiones.tablas_particionadas():
+        for nombre, ruta, cantidad in particiones.archivar(tabla.name, antes_de, directorio, probar=test is True):
+            click.echo(f"{nombre}: {cantidad} renglones {'se escribirian' if test is True else 'se escribieron'} en {ruta}")
+    if test is True:
+        click.echo("Modo de pruebas, no se archivo nada")
+
+
+cli.add_command(convertir)
+cli.add_command(crear)
+cli.add_command(listar)
+cli.add_command(archivar)
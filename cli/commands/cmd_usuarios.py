@@ -10,13 +10,13 @@ import click
 
 from lib.pwgen import generar_api_key
 
-from citas_admin.app import create_app
+from citas_admin.app import create_worker_app
 from citas_admin.extensions import db
 
 from citas_admin.blueprints.usuarios.models import Usuario
 from citas_admin.extensions import pwd_context
 
-app = create_app()
+app = create_worker_app()
 db.app = app
 
 
@@ -13,8 +13,17 @@ DB_NAME = os.environ.get("DB_NAME", "pjecz_citas_v2")
 DB_SOCKET_DIR = os.environ.get("DB_SOCKET_DIR", "/cloudsql")
 CLOUD_SQL_CONNECTION_NAME = os.environ.get("CLOUD_SQL_CONNECTION_NAME", "none")
 
-# Google Cloud SQL a Minerva con PostgreSQL
-SQLALCHEMY_DATABASE_URI = f"postgresql+psycopg2://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+# Google Cloud SQL por el socket de Unix en App Engine, a Minerva con PostgreSQL por TCP
+if CLOUD_SQL_CONNECTION_NAME != "none":
+    SQLALCHEMY_DATABASE_URI = f"postgresql+psycopg2://{DB_USER}:{DB_PASS}@/{DB_NAME}?host={DB_SOCKET_DIR}/{CLOUD_SQL_CONNECTION_NAME}"
+else:
+    SQLALCHEMY_DATABASE_URI = f"postgresql+psycopg2://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+# Perfil del pool de conexiones: web, worker o batch; vacio para el que corresponde a cada proceso
+DB_PERFIL = os.environ.get("DB_PERFIL", "")
+
+# Conectar a traves de PgBouncer en modo transaccion
+DB_PGBOUNCER = os.environ.get("DB_PGBOUNCER", "0") == "1"
 
 # Always in False
 SQLALCHEMY_TRACK_MODIFICATIONS = False
@@ -29,6 +38,11 @@ TASK_QUEUE = os.environ.get("TASK_QUEUE", "pjecz_citas_v2")
 # Google Cloud Storage
 CLOUD_STORAGE_DEPOSITO = os.environ.get("CLOUD_STORAGE_DEPOSITO", "pjecz-informatica")
 
+# Almacen de archivos: google o local (un directorio para pruebas sin conexion) y duracion de las URL firmadas
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "google")
+STORAGE_DIRECTORIO = os.environ.get("STORAGE_DIRECTORIO", "almacen")
+STORAGE_URL_SEGUNDOS = int(os.environ.get("STORAGE_URL_SEGUNDOS", "300"))
+
 # Host para los vínculos en los mensajes
 HOST = os.environ.get("HOST", "")
 
@@ -42,3 +56,18 @@ LIMITE_CITAS_PENDIENTES = int(os.environ.get("LIMITE_CITAS_PENDIENTES", "0"))
 PAGO_VERIFY_URL = os.environ.get("PAGO_VERIFY_URL", "")
 PPA_SOLICITUD_VERIFY_URL = os.environ.get("PPA_SOLICITUD_VERIFY_URL", "")
 TDT_SOLICITUD_VERIFY_URL = os.environ.get("TDT_SOLICITUD_VERIFY_URL", "")
+
+# Contar las consultas SQL de cada peticion en el encabezado X-Consultas-SQL
+CONTAR_CONSULTAS_SQL = os.environ.get("CONTAR_CONSULTAS_SQL", "0") == "1"
+
+# Los listados sin filtros de tablas con mas renglones que este muestran el total estimado de pg_class
+ESTIMAR_TOTAL_DESDE = int(os.environ.get("ESTIMAR_TOTAL_DESDE", "1000000"))
+
+# Guardar en la sesion una instantanea del usuario para no consultarlo en cada peticion
+IDENTIDAD_EN_SESION = os.environ.get("IDENTIDAD_EN_SESION", "1") == "1"
+
+# Escribir las bitacoras al momento en lugar de enviarlas a Redis para la tarea bitacoras.tasks.vaciar
+AUDITORIA_SINCRONA = os.environ.get("AUDITORIA_SINCRONA", "0") == "1"
+
+# Cola de mensajes de Flask-SocketIO para el tablero en vivo de las oficinas, vacio para un solo proceso
+SOCKETIO_MESSAGE_QUEUE = os.environ.get("SOCKETIO_MESSAGE_QUEUE", REDIS_URL)
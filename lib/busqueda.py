@@ -0,0 +1,89 @@
+"""
+Búsqueda
+
+Las búsquedas de texto se hacen sobre una columna normalizada: sin acentos, en mayúsculas y con
+los campos concatenados, por ejemplo cit_clientes.busqueda con nombres, apellidos, CURP y email
+
+- normalizar prepara tanto el texto que se guarda en la columna como el que se busca
+- filtrar pide que cada palabra esté contenida en la columna (LIKE '%palabra%'), en PostgreSQL
+  lo resuelve el índice GIN con gin_trgm_ops de pg_trgm en lugar de recorrer la tabla
+- filtrar_campos es para los filtros de un campo, por ejemplo solo el email: cada palabra debe estar
+  en la columna de búsqueda, que usa el índice, y además en alguno de los campos
+- buscar además ordena por similarity() de pg_trgm y limita la cantidad de resultados
+
+En SQLite (pruebas) se registra una función similarity hecha en Python con los mismos trigramas.
+"""
+import re
+import sqlite3
+
+from sqlalchemy import event, func, or_
+from sqlalchemy.engine import Engine
+from unidecode import unidecode
+
+LIMITE = 20
+NO_PERMITIDOS = re.compile(r"[^A-Z0-9@._-]+")
+NO_ALFANUMERICOS = re.compile(r"[^a-z0-9]+")
+
+
+def normalizar(texto: str):
+    """Quitar acentos, pasar a mayúsculas y dejar solo letras, números y los caracteres de un email"""
+    if texto is None:
+        return ""
+    return NO_PERMITIDOS.sub(" ", unidecode(str(texto)).upper()).strip()
+
+
+def concatenar(*textos):
+    """Elaborar el valor de la columna de búsqueda con varios campos"""
+    return normalizar(" ".join(texto for texto in textos if texto))
+
+
+def filtrar(consulta, columna, texto: str):
+    """Filtrar para que cada palabra del texto esté contenida en la columna"""
+    for palabra in normalizar(texto).split():
+        consulta = consulta.filter(columna.contains(palabra, autoescape=True))
+    return consulta
+
+
+def filtrar_campos(consulta, columna, campos: list, texto: str):
+    """Filtrar para que cada palabra del texto esté en la columna de búsqueda y en alguno de los campos"""
+    for palabra in normalizar(texto).split():
+        consulta = consulta.filter(columna.contains(palabra, autoescape=True))
+        consulta = consulta.filter(or_(*[func.upper(campo).contains(palabra, autoescape=True) for campo in campos]))
+    return consulta
+
+
+def buscar(consulta, columna, texto: str, limite: int = LIMITE):
+    """Filtrar y ordenar por similitud, entrega una consulta con los mejores resultados"""
+    normalizado = normalizar(texto)
+    similitud = func.similarity(columna, normalizado)
+    return filtrar(consulta, columna, normalizado).add_columns(similitud.label("similitud")).order_by(similitud.desc()).limit(limite)
+
+
+def trigramas(texto: str):
+    """Conjunto de trigramas como los de pg_trgm: cada palabra en minúsculas con dos espacios antes y uno después"""
+    resultado = set()
+    for palabra in NO_ALFANUMERICOS.split(str(texto).lower()):
+        if palabra:
+            relleno = f"  {palabra} "
+            resultado.update(relleno[posicion : posicion + 3] for posicion in range(len(relleno) - 2))
+    return resultado
+
+
+def similitud(texto: str, otro: str):
+    """Trigramas en común entre trigramas en total, de 0 a 1, como similarity() de pg_trgm"""
+    if texto is None or otro is None:
+        return None
+    uno, dos = trigramas(texto), trigramas(otro)
+    if not uno or not dos:
+        return 0.0
+    return len(uno & dos) / len(uno | dos)
+
+
+def _registrar_en_sqlite(dbapi_connection, connection_record):
+    """Agregar la función similarity a las conexiones de SQLite"""
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.create_function("similarity", 2, similitud, deterministic=True)
+
+
+if not event.contains(Engine, "connect", _registrar_en_sqlite):
+    event.listen(Engine, "connect", _registrar_en_sqlite)
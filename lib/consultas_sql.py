@@ -0,0 +1,44 @@
+"""
+Consultas SQL
+
+Cuenta las sentencias SQL que ejecuta cada peticion y las entrega en el encabezado X-Consultas-SQL,
+sirve para detectar consultas N+1 al elaborar los listados.
+
+Tambien entrega en el encabezado X-Pool-SQL las metricas del pool de conexiones del proceso:
+conexiones ocupadas, desborde, veces que se agoto y los milisegundos que la peticion espero por una conexion.
+"""
+from flask import current_app, g, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from lib.database import ESPERA_PETICION, metricas_pool
+
+ENCABEZADO = "X-Consultas-SQL"
+ENCABEZADO_POOL = "X-Pool-SQL"
+
+
+def _contar_consulta(conn, cursor, statement, parameters, context, executemany):
+    """Contar una sentencia SQL en la peticion actual"""
+    if has_request_context():
+        g.consultas_sql = g.get("consultas_sql", 0) + 1
+
+
+def contar_consultas_sql(app):
+    """Agregar a la aplicacion el conteo de sentencias SQL por peticion"""
+    if not event.contains(Engine, "before_cursor_execute", _contar_consulta):
+        event.listen(Engine, "before_cursor_execute", _contar_consulta)
+
+    @app.before_request
+    def iniciar_conteo():
+        """Iniciar el conteo en cada peticion"""
+        g.consultas_sql = 0
+
+    @app.after_request
+    def agregar_encabezado(response):
+        """Entregar la cantidad de sentencias SQL en el encabezado"""
+        response.headers[ENCABEZADO] = str(g.get("consultas_sql", 0))
+        metricas = metricas_pool(current_app.extensions["sqlalchemy"].db.engine)
+        if metricas:
+            espera_ms = g.get(ESPERA_PETICION, 0.0) * 1000
+            response.headers[ENCABEZADO_POOL] = f"ocupadas={metricas['ocupadas']}; desborde={metricas['desborde']}; agotados={metricas['agotados']}; espera_ms={espera_ms:.1f}"
+        return response
@@ -0,0 +1,198 @@
+"""
+Correos
+
+Entrega de mensajes por correo electrónico para las tareas en el fondo
+
+- obtener_cartero entrega un Cartero por proceso, así se reutiliza la sesión HTTP con SendGrid
+- enviar_a_varios manda el mismo mensaje a hasta 1000 destinatarios por llamada (personalizations),
+  con sustituciones opcionales por destinatario, por ejemplo el nombre
+- enviar_lote manda mensajes distintos en paralelo con un límite de hilos
+- Las respuestas 429 y 5xx de SendGrid se reintentan con espera exponencial
+- MAIL_BACKEND elige a dónde van los mensajes:
+    - sendgrid: la API de SendGrid, por defecto; sin SENDGRID_API_KEY causa CorreoError y la tarea falla
+    - archivo: guarda cada mensaje como .eml en MAIL_DIRECTORIO, solo si se pide de forma explícita
+    - smtp: un servidor SMTP local para pruebas, como MailHog, en MAIL_SMTP_HOST y MAIL_SMTP_PORT
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from email.message import EmailMessage
+import os
+import smtplib
+import threading
+import uuid
+
+from dotenv import load_dotenv
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+load_dotenv()  # Take environment variables from .env
+
+SENDGRID_API_KEY = os.getenv("SENDGRID_API_KEY", "")
+SENDGRID_FROM_EMAIL = os.getenv("SENDGRID_FROM_EMAIL", "")
+SENDGRID_URL = "https://api.sendgrid.com/v3/mail/send"
+MAIL_BACKEND = os.getenv("MAIL_BACKEND", "sendgrid")
+MAIL_DIRECTORIO = os.getenv("MAIL_DIRECTORIO", "correos")
+MAIL_SMTP_HOST = os.getenv("MAIL_SMTP_HOST", "localhost")
+MAIL_SMTP_PORT = int(os.getenv("MAIL_SMTP_PORT", "1025"))
+MAIL_HILOS = int(os.getenv("MAIL_HILOS", "4"))
+
+DESTINATARIOS_POR_LLAMADA = 1000  # Límite de personalizations de SendGrid
+REINTENTOS = 5
+ESPERA_BASE = 1  # Segundos, se duplica en cada reintento
+
+_cartero = None
+_candado = threading.Lock()
+
+
+class CorreoError(Exception):
+    """Error al entregar un mensaje"""
+
+
+class BackendSendGrid:
+    """Entrega por la API de SendGrid con una sesión HTTP compartida"""
+
+    def __init__(self, api_key):
+        if api_key == "":
+            raise CorreoError("La variable SENDGRID_API_KEY NO ha sido declarada")
+        reintentos = Retry(
+            total=REINTENTOS,
+            backoff_factor=ESPERA_BASE,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=["POST"],
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        self.sesion = requests.Session()
+        self.sesion.headers.update({"Authorization": f"Bearer {api_key}"})
+        self.sesion.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=MAIL_HILOS, max_retries=reintentos))
+
+    def entregar(self, remitente, destinatarios, asunto, contenido, sustituciones=None):
+        """Entregar el mismo mensaje a varios destinatarios, cada uno en su personalization"""
+        personalizaciones = [{"to": [{"email": destinatario}]} for destinatario in destinatarios]
+        if sustituciones is not None:
+            for personalizacion, sustitucion in zip(personalizaciones, sustituciones):
+                personalizacion["substitutions"] = sustitucion
+        cuerpo = {
+            "personalizations": personalizaciones,
+            "from": {"email": remitente},
+            "subject": asunto,
+            "content": [{"type": "text/html", "value": contenido}],
+        }
+        try:
+            respuesta = self.sesion.post(SENDGRID_URL, json=cuerpo, timeout=30)
+        except requests.RequestException as error:
+            raise CorreoError(f"SendGrid no responde: {str(error)}") from error
+        if respuesta.status_code >= 300:
+            raise CorreoError(f"SendGrid respondió {respuesta.status_code}: {respuesta.text}")
+
+
+class BackendArchivo:
+    """Guarda cada mensaje como archivo .eml, para desarrollo y pruebas"""
+
+    def __init__(self, directorio):
+        self.directorio = directorio
+        os.makedirs(directorio, exist_ok=True)
+
+    def entregar(self, remitente, destinatarios, asunto, contenido, sustituciones=None):
+        """Guardar un archivo por destinatario"""
+        momento = datetime.now().strftime("%Y%m%d_%H%M%S")
+        for numero, destinatario in enumerate(destinatarios):
+            mensaje = _elaborar_email_message(remitente, destinatario, asunto, _sustituir(contenido, sustituciones, numero))
+            ruta = os.path.join(self.directorio, f"{momento}_{uuid.uuid4().hex[:8]}_{destinatario}.eml")
+            with open(ruta, "wb") as archivo:
+                archivo.write(bytes(mensaje))
+
+
+class BackendSMTP:
+    """Entrega a un servidor SMTP, pensado para un sumidero local de pruebas"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+
+    def entregar(self, remitente, destinatarios, asunto, contenido, sustituciones=None):
+        """Entregar con una conexión por llamada"""
+        try:
+            with smtplib.SMTP(self.host, self.port, timeout=30) as servidor:
+                for numero, destinatario in enumerate(destinatarios):
+                    servidor.send_message(_elaborar_email_message(remitente, destinatario, asunto, _sustituir(contenido, sustituciones, numero)))
+        except (OSError, smtplib.SMTPException) as error:
+            raise CorreoError(f"El servidor SMTP {self.host}:{self.port} falló: {str(error)}") from error
+
+
+class Cartero:
+    """Envía los mensajes con el backend elegido"""
+
+    def __init__(self, backend, remitente):
+        if remitente == "":
+            raise CorreoError("La variable SENDGRID_FROM_EMAIL NO ha sido declarada")
+        self.backend = backend
+        self.remitente = remitente
+
+    def enviar(self, destinatario, asunto, contenido):
+        """Enviar un mensaje a un destinatario"""
+        self.backend.entregar(self.remitente, [destinatario], asunto, contenido)
+
+    def enviar_a_varios(self, destinatarios, asunto, contenido, sustituciones=None):
+        """Enviar el mismo mensaje a muchos destinatarios, en grupos de DESTINATARIOS_POR_LLAMADA
+
+        - sustituciones: lista con un diccionario por destinatario, cada llave del contenido se cambia por su valor
+        """
+        for inicio in range(0, len(destinatarios), DESTINATARIOS_POR_LLAMADA):
+            fin = inicio + DESTINATARIOS_POR_LLAMADA
+            self.backend.entregar(self.remitente, destinatarios[inicio:fin], asunto, contenido, None if sustituciones is None else sustituciones[inicio:fin])
+
+    def enviar_lote(self, mensajes):
+        """Enviar en paralelo una lista de (destinatario, asunto, contenido)
+
+        Entrega una lista con None para cada mensaje enviado o el CorreoError si falló, en el mismo orden
+        """
+
+        def _enviar(mensaje):
+            try:
+                self.enviar(*mensaje)
+            except CorreoError as error:
+                return error
+            return None
+
+        if MAIL_HILOS <= 1 or len(mensajes) <= 1:
+            return [_enviar(mensaje) for mensaje in mensajes]
+        with ThreadPoolExecutor(max_workers=MAIL_HILOS) as ejecutor:
+            return list(ejecutor.map(_enviar, mensajes))
+
+
+def obtener_cartero():
+    """Entregar el Cartero de este proceso, lo crea la primera vez; causa CorreoError si falta configuración"""
+    global _cartero
+    with _candado:
+        if _cartero is None:
+            if MAIL_BACKEND == "sendgrid":
+                backend = BackendSendGrid(SENDGRID_API_KEY)
+            elif MAIL_BACKEND == "archivo":
+                backend = BackendArchivo(MAIL_DIRECTORIO)
+            elif MAIL_BACKEND == "smtp":
+                backend = BackendSMTP(MAIL_SMTP_HOST, MAIL_SMTP_PORT)
+            else:
+                raise CorreoError(f"La variable MAIL_BACKEND tiene un valor no reconocido: {MAIL_BACKEND}")
+            _cartero = Cartero(backend, SENDGRID_FROM_EMAIL)
+    return _cartero
+
+
+def _sustituir(contenido, sustituciones, numero):
+    """Aplicar localmente las sustituciones del destinatario indicado"""
+    if sustituciones is None:
+        return contenido
+    for llave, valor in sustituciones[numero].items():
+        contenido = contenido.replace(llave, valor)
+    return contenido
+
+
+def _elaborar_email_message(remitente, destinatario, asunto, contenido):
+    """Elaborar un EmailMessage en HTML"""
+    mensaje = EmailMessage()
+    mensaje["From"] = remitente
+    mensaje["To"] = destinatario
+    mensaje["Subject"] = asunto
+    mensaje.set_content(contenido, subtype="html")
+    return mensaje
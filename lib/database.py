@@ -1,33 +1,111 @@
 """
 Database
+
+Un solo motor de SQLAlchemy por proceso, el de Flask-SQLAlchemy, para la app web, las tareas en el fondo
+y la línea de comandos; BaseDatos lo crea con crear_motor según el perfil del proceso
+
+- web: varias peticiones a la vez por proceso, pool mediano con desborde y sentencias cortas
+- worker: RQ ejecuta una tarea a la vez, pool chico y sentencias largas
+- batch: la línea de comandos, una conexión y sin tiempo límite por sentencia
+- Con DB_PGBOUNCER (modo transacción) no se mandan parámetros de arranque, el tiempo límite
+  se fija con SET LOCAL al iniciar cada transacción
+- PoolMedido lleva las métricas del pool: conexiones ocupadas, desborde, espera por una conexión
+  y veces que se agotó; metricas_pool las entrega y la espera de cada petición queda en g
 """
-from pathlib import Path
-from sqlalchemy import create_engine
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+import threading
+import time
+
+from flask import g, has_request_context
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+APLICACION = "pjecz_citas_v2"
+ESPERA_PETICION = "espera_pool_sql"  # Segundos que la petición esperó por una conexión
+
+PERFILES = {
+    "web": {"pool_size": 5, "max_overflow": 10, "pool_timeout": 10, "pool_recycle": 1800, "tiempo_limite_ms": 30000},
+    "worker": {"pool_size": 2, "max_overflow": 2, "pool_timeout": 30, "pool_recycle": 1800, "tiempo_limite_ms": 600000},
+    "batch": {"pool_size": 1, "max_overflow": 1, "pool_timeout": 60, "pool_recycle": 3600, "tiempo_limite_ms": 0},
+}
+
+
+class PoolMedido(QueuePool):
+    """QueuePool que mide la espera por una conexión"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._candado = threading.Lock()
+        self.esperas = 0
+        self.espera_total = 0.0
+        self.espera_maxima = 0.0
+        self.agotados = 0
+
+    def _do_get(self):
+        inicio = time.perf_counter()
+        agotado = False
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            agotado = True
+            raise
+        finally:
+            espera = time.perf_counter() - inicio
+            with self._candado:
+                self.esperas += 1
+                self.espera_total += espera
+                self.espera_maxima = max(self.espera_maxima, espera)
+                self.agotados += int(agotado)
+            if has_request_context():
+                setattr(g, ESPERA_PETICION, g.get(ESPERA_PETICION, 0.0) + espera)
+
+    def metricas(self):
+        """Entregar las métricas del pool"""
+        return {
+            "tamano": self.size(),
+            "ocupadas": self.checkedout(),
+            "desborde": max(self.overflow(), 0),
+            "esperas": self.esperas,
+            "espera_promedio_ms": round(self.espera_total * 1000 / self.esperas, 3) if self.esperas else 0.0,
+            "espera_maxima_ms": round(self.espera_maxima * 1000, 3),
+            "agotados": self.agotados,
+        }
+
 
+def crear_motor(url, perfil: str = "web", pgbouncer: bool = False, **opciones):
+    """Crear el motor con las opciones del perfil, las opciones dadas tienen prioridad"""
+    if url.get_backend_name() != "postgresql":
+        return create_engine(url, **opciones)  # SQLite y otras conservan su pool por defecto
+    perfil_opciones = dict(PERFILES[perfil])
+    tiempo_limite_ms = perfil_opciones.pop("tiempo_limite_ms")
+    connect_args = {"application_name": f"{APLICACION}_{perfil}"}
+    if tiempo_limite_ms and not pgbouncer:
+        connect_args["options"] = f"-c statement_timeout={tiempo_limite_ms}"
+    motor_opciones = {"poolclass": PoolMedido, "pool_pre_ping": True, "connect_args": connect_args, **perfil_opciones}
+    motor_opciones.update(opciones)
+    motor = create_engine(url, **motor_opciones)
+    if tiempo_limite_ms and pgbouncer:
+        # PgBouncer rechaza el parámetro options y en modo transacción un SET afectaría a otros clientes
+        @event.listens_for(motor, "begin")
+        def fijar_tiempo_limite(conn):
+            conn.exec_driver_sql(f"SET LOCAL statement_timeout = {int(tiempo_limite_ms)}")
 
-# Configuration load
-if Path("instance/settings.py").exists():
-    from instance.settings import SQLALCHEMY_DATABASE_URI
-else:
-    from config.settings import SQLALCHEMY_DATABASE_URI
+    return motor
 
 
-# SQLAlchemy
-engine = create_engine(SQLALCHEMY_DATABASE_URI)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def metricas_pool(motor):
+    """Entregar las métricas del pool del motor, vacío si no es un PoolMedido"""
+    if isinstance(motor.pool, PoolMedido):
+        return motor.pool.metricas()
+    return {}
 
 
-# SQLAlchemy Base for models
-Base = declarative_base()
+class BaseDatos(SQLAlchemy):
+    """Flask-SQLAlchemy que crea su motor con crear_motor
 
+    El perfil y DB_PGBOUNCER llegan en SQLALCHEMY_ENGINE_OPTIONS, los pone la app al definirse
+    """
 
-# SQLAlchemy database session
-def get_db():
-    """Dependency"""
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+    def create_engine(self, sa_url, engine_opts):
+        return crear_motor(sa_url, **engine_opts)
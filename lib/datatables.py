@@ -1,7 +1,41 @@
 """
 Datatables
+
+- Filtro y filtrar_datatable aplican los filtros declarados que vengan en request.form
+- paginar_datatable entrega una pagina, el total y el cursor en una sola consulta
+    - Si el navegador envia el cursor de la pagina anterior se usa paginacion por llave,
+      de lo contrario se usa offset
+    - El cursor lleva la huella de los filtros y el orden con los que se elaboro, si cambian
+      se descarta y se usa offset
+    - En SQLite las fechas son texto y server_default=func.now() no guarda microsegundos,
+      la comparacion con el cursor no coincide con el orden, si se ordena por fechas se usa offset
+    - El total se calcula con una ventana count(*) over () en la misma consulta, o bien
+      con el estimado de pg_class.reltuples cuando se pide estimar, la consulta no tiene ningun filtro
+      (ni los de por defecto ni los del usuario) y el estimado pasa de ESTIMAR_TOTAL_DESDE;
+      el estimado de cada tabla se guarda ESTIMADO_SEGUNDOS en la memoria del proceso
+    - Las relaciones que usa el listado se cargan en la misma consulta (joinedload) o en una sola
+      consulta adicional (selectinload), y se pueden limitar las columnas (load_only)
 """
-from flask import request
+from datetime import date, datetime, time
+import hashlib
+import json
+import time as reloj
+
+from flask import current_app, request
+from sqlalchemy import BigInteger, cast, column, func, inspect, or_, select, table, tuple_
+from sqlalchemy.orm import joinedload, load_only, selectinload
+
+from lib import busqueda
+
+from citas_admin.extensions import db
+
+PG_CLASS = table("pg_class", column("oid"), column("relname"), column("reltuples"))
+PG_INHERITS = table("pg_inherits", column("inhrelid"), column("inhparent"))
+PARAMETROS_PAGINA = ("draw", "start", "length", "cursor", "_")
+ESTIMAR_TOTAL_DESDE = 1000000  # Se puede cambiar con la configuracion del mismo nombre
+ESTIMADO_SEGUNDOS = 300
+
+_estimados = {}  # Nombre de la tabla → (estimado, cuando se consulto)
 
 
 def get_datatable_parameters():
@@ -17,11 +51,239 @@ def get_datatable_parameters():
     return draw, start, rows_per_page
 
 
-def output_datatable_json(draw, total, data):
+def output_datatable_json(draw, total, data, cursor=None):
     """Entregar JSON"""
     return {
         "draw": draw,
         "iTotalRecords": total,
         "iTotalDisplayRecords": total,
         "aaData": data,
+        "cursor": cursor,
     }
+
+
+class Filtro:
+    """Filtro declarado para un parametro de request.form
+
+    - nombre: llave en request.form
+    - columnas: columna o lista de columnas a filtrar
+    - operador: igual, contiene, desde, hasta, fecha (el dia completo), palabras (cada palabra en alguna columna),
+      busqueda (cada palabra normalizada en una columna de busqueda, vea lib/busqueda.py)
+      o campos (como busqueda, la columna de busqueda va al final y cada palabra debe estar en alguna de las demas)
+    - limpiar: funcion para sanitizar el valor, por ejemplo safe_string
+    - defecto: valor a usar si no viene en request.form
+    - unir: modelo que se debe unir (join) para filtrar
+    - funcion: si se da, se llama como funcion(consulta, valor) en lugar del operador
+    """
+
+    def __init__(self, nombre, columnas=None, operador="igual", limpiar=None, defecto=None, unir=None, funcion=None):
+        self.nombre = nombre
+        self.columnas = columnas if isinstance(columnas, (list, tuple)) else [columnas]
+        self.operador = operador
+        self.limpiar = limpiar
+        self.defecto = defecto
+        self.unir = unir
+        self.funcion = funcion
+
+    def aplicar(self, consulta, valor):
+        """Aplicar el filtro a la consulta"""
+        if self.limpiar is not None:
+            valor = self.limpiar(valor)
+        if self.funcion is not None:
+            return self.funcion(consulta, valor)
+        columna = self.columnas[0]
+        if self.operador == "igual":
+            return consulta.filter(columna == valor)
+        if self.operador == "contiene":
+            return consulta.filter(columna.contains(valor))
+        if self.operador == "desde":
+            return consulta.filter(columna >= valor)
+        if self.operador == "hasta":
+            return consulta.filter(columna <= valor)
+        if self.operador == "fecha":
+            fecha = datetime.strptime(valor, "%Y-%m-%d")
+            return consulta.filter(columna >= datetime.combine(fecha, time(0, 0, 0))).filter(columna <= datetime.combine(fecha, time(23, 59, 59)))
+        if self.operador == "busqueda":
+            return busqueda.filtrar(consulta, columna, valor)
+        if self.operador == "campos":
+            return busqueda.filtrar_campos(consulta, self.columnas[-1], self.columnas[:-1], valor)
+        if self.operador == "palabras":
+            for palabra in valor.split(" "):
+                if palabra != "":
+                    consulta = consulta.filter(or_(*[c.contains(palabra) for c in self.columnas]))
+            return consulta
+        raise ValueError(f"Operador {self.operador} no reconocido")
+
+
+def filtrar_datatable(consulta, filtros):
+    """Aplicar los filtros declarados, entrega la consulta y si se filtro por algo distinto a los valores por defecto"""
+    filtrado = False
+    unidos = set()
+    for filtro in filtros:
+        valor = request.form.get(filtro.nombre, "")
+        if valor == "":
+            if filtro.defecto is None:
+                continue
+            valor = filtro.defecto
+        elif valor != filtro.defecto:
+            filtrado = True
+        if filtro.unir is not None and filtro.unir not in unidos:
+            consulta = consulta.join(filtro.unir)
+            unidos.add(filtro.unir)
+        consulta = filtro.aplicar(consulta, valor)
+    return consulta, filtrado
+
+
+def _a_json(valor):
+    """Convertir un valor de la llave del cursor a JSON"""
+    if isinstance(valor, (date, datetime, time)):
+        return valor.isoformat()
+    return valor
+
+
+def _de_json(columna, valor):
+    """Convertir un valor del cursor al tipo de su columna"""
+    try:
+        tipo = columna.type.python_type
+    except NotImplementedError:
+        return valor
+    if tipo is datetime:
+        return datetime.fromisoformat(valor)
+    if tipo is date:
+        return date.fromisoformat(valor)
+    if tipo is time:
+        return time.fromisoformat(valor)
+    return tipo(valor)
+
+
+def _huella(orden, descendente):
+    """Huella de los filtros y el orden de la peticion, todo request.form menos los parametros de la pagina"""
+    parametros = sorted((llave, valor) for llave, valor in request.form.items(multi=True) if llave not in PARAMETROS_PAGINA)
+    parametros.append(("orden", [str(c) for c in orden], descendente))
+    return hashlib.sha1(json.dumps(parametros, default=str).encode("utf8")).hexdigest()[:16]
+
+
+def _tomar_cursor(start, orden, huella):
+    """Tomar de request.form el cursor, solo si corresponde a este start y a los mismos filtros y orden"""
+    try:
+        cursor = json.loads(request.form.get("cursor", ""))
+        if int(cursor["start"]) != start or cursor.get("huella") != huella:
+            return None
+        if len(cursor["valores"]) != len(orden) or None in cursor["valores"]:
+            return None
+        return [_de_json(c, v) for c, v in zip(orden, cursor["valores"])]
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def _admite_cursor(orden):
+    """¿Se puede paginar por llave con estas columnas en esta base de datos?"""
+    if db.engine.dialect.name != "sqlite":
+        return True
+    for columna in orden:
+        try:
+            if columna.type.python_type in (date, datetime, time):
+                return False
+        except NotImplementedError:
+            pass
+    return True
+
+
+def _estimar_total(tabla: str):
+    """Estimado de renglones de pg_class, si la tabla esta partida (lib/particiones.py) se suman sus particiones"""
+    estimado, cuando = _estimados.get(tabla, (None, 0))
+    if estimado is None or reloj.monotonic() - cuando > ESTIMADO_SEGUNDOS:
+        particiones = select(PG_INHERITS.c.inhrelid).where(PG_INHERITS.c.inhparent == func.to_regclass(tabla))
+        consulta = select(func.coalesce(func.sum(func.greatest(cast(PG_CLASS.c.reltuples, BigInteger), 0)), 0)).where(or_(PG_CLASS.c.relname == tabla, PG_CLASS.c.oid.in_(particiones)))
+        estimado = int(db.session.execute(consulta).scalar())
+        _estimados[tabla] = (estimado, reloj.monotonic())
+    return estimado
+
+
+def _cargar_relacion(relacion):
+    """Opcion de carga para una relacion: joinedload si es de uno, selectinload si es de muchos"""
+    columnas = None
+    if isinstance(relacion, tuple):
+        relacion, columnas = relacion
+    if not hasattr(relacion, "property"):
+        return relacion  # Ya es una opcion de carga, por ejemplo joinedload(A.b).joinedload(B.c)
+    opcion = selectinload(relacion) if relacion.property.uselist else joinedload(relacion)
+    if columnas:
+        opcion = opcion.load_only(*columnas)
+    return opcion
+
+
+def paginar_datatable(consulta, orden, start, rows_per_page, descendente=False, estimar=False, relaciones=None, columnas=None):
+    """Entregar registros, total y cursor de una pagina en una sola consulta
+
+    - orden: lista de columnas del modelo para ordenar, se agrega la llave primaria como desempate
+    - descendente: ordenar todas las columnas de forma descendente
+    - estimar: en PostgreSQL usar pg_class.reltuples (de la tabla o de sus particiones) en lugar de contar,
+      solo si la consulta no tiene filtros y el estimado pasa de ESTIMAR_TOTAL_DESDE
+    - relaciones: relaciones que se usan al elaborar los renglones, por ejemplo [CitCita.oficina],
+      [(Bitacora.usuario, [Usuario.email])] para cargar solo algunas columnas de la relacion
+      o una opcion de carga como joinedload(Usuario.oficina).joinedload(Oficina.distrito)
+    - columnas: columnas del modelo que se usan al elaborar los renglones, las demas no se cargan
+    """
+
+    # Agregar la llave primaria para que el orden sea unico
+    modelo = consulta.column_descriptions[0]["entity"]
+    llave_primaria = getattr(modelo, inspect(modelo).primary_key[0].name)
+    orden = list(orden)
+    if not any(c is llave_primaria for c in orden):
+        orden.append(llave_primaria)
+
+    # Cargar las relaciones y solo las columnas que se usan
+    if relaciones:
+        consulta = consulta.options(*[_cargar_relacion(relacion) for relacion in relaciones])
+    if columnas:
+        consulta = consulta.options(load_only(*set(columnas + orden)))
+
+    # Estimar el total solo si ningun filtro acota los renglones y la tabla es grande
+    estimado = None
+    if estimar and consulta.whereclause is None and db.engine.dialect.name == "postgresql":
+        estimado = _estimar_total(modelo.__tablename__)
+        if estimado < current_app.config.get("ESTIMAR_TOTAL_DESDE", ESTIMAR_TOTAL_DESDE):
+            estimado = None
+
+    # Si viene el cursor de la pagina anterior, buscar a partir de la llave en lugar de usar offset
+    huella = _huella(orden, descendente)
+    valores = _tomar_cursor(start, orden, huella) if _admite_cursor(orden) else None
+    if valores is not None:
+        if descendente:
+            consulta = consulta.filter(tuple_(*orden) < tuple_(*valores))
+        else:
+            consulta = consulta.filter(tuple_(*orden) > tuple_(*valores))
+
+    # Total en la misma consulta con la ventana count(*) over (), si no se estima
+    paginada = consulta if estimado is not None else consulta.add_columns(func.count().over().label("datatable_total"))
+    paginada = paginada.order_by(*[c.desc() if descendente else c.asc() for c in orden])
+    if valores is None and start > 0:
+        paginada = paginada.offset(start)
+    if rows_per_page > 0:
+        paginada = paginada.limit(rows_per_page)
+    renglones = paginada.all()
+    registros = renglones if estimado is not None else [renglon[0] for renglon in renglones]
+
+    # Calcular el total
+    if not renglones:
+        total = 0 if start <= 0 else consulta.count() + (start if valores is not None else 0)
+    elif estimado is not None:
+        total = max(estimado, start + len(registros))
+    elif valores is not None:
+        total = start + renglones[0][1]
+    else:
+        total = renglones[0][1]
+
+    # El cursor es la llave del ultimo registro, sirve para pedir la siguiente pagina
+    cursor = None
+    if 0 < rows_per_page == len(registros):
+        ultimo = registros[-1]
+        cursor = {
+            "start": start + len(registros),
+            "huella": huella,
+            "valores": [_a_json(getattr(ultimo, c.key)) for c in orden],
+        }
+
+    # Entregar
+    return registros, total, cursor
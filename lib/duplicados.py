@@ -0,0 +1,111 @@
+"""
+Duplicados
+
+Encuentra registros activos repetidos con una sola consulta GROUP BY ... HAVING count(*) > 1
+
+- buscar_duplicados entrega los grupos en orden: los valores de la llave, el ID que se conserva (el menor)
+  y los ID sobrantes; las llaves pueden ser columnas o expresiones, por ejemplo func.upper(CitCliente.curp);
+  los registros con alguna llave NULL no se cuentan, NULL no es igual a nada
+- con_hijos entrega los sobrantes que tienen registros activos en otras tablas, por ejemplo citas o pagos
+- dar_de_baja cambia a estatus B los sobrantes con un UPDATE por lote, omite los que tienen hijos activos
+- guardar_reporte escribe los grupos en un archivo CSV o JSON según su extensión
+"""
+import csv
+from datetime import date, datetime
+from itertools import groupby
+import json
+
+from sqlalchemy import and_, exists, func, or_
+
+from citas_admin.extensions import db
+
+LOTE = 5000
+
+
+class Duplicado:
+    """Grupo de registros con la misma llave"""
+
+    def __init__(self, valores, conservar, sobrantes):
+        self.valores = valores
+        self.conservar = conservar
+        self.sobrantes = sobrantes
+
+    def como_diccionario(self, nombres):
+        """Entregar el grupo como diccionario, con las llaves por nombre"""
+        renglon = {nombre: _a_texto(valor) for nombre, valor in zip(nombres, self.valores)}
+        renglon["conservar"] = self.conservar
+        renglon["sobrantes"] = self.sobrantes
+        return renglon
+
+
+def buscar_duplicados(modelo, llaves, lote: int = LOTE):
+    """Entregar un generador de Duplicado, ordenados por el ID que se conserva"""
+
+    # Grupos con más de un registro activo, se conserva el menor ID
+    # Sin llaves NULL, así la unión usa igualdad y cada grupo encuentra a sus sobrantes
+    columnas = [llave.label(f"llave_{numero}") for numero, llave in enumerate(llaves)]
+    grupos = db.session.query(*columnas, func.min(modelo.id).label("conservar")).filter(modelo.estatus == "A", *[llave.isnot(None) for llave in llaves]).group_by(*llaves).having(func.count(modelo.id) > 1).subquery()
+
+    # Unir los grupos con sus registros sobrantes en la misma consulta
+    condiciones = [llave == grupos.c[f"llave_{numero}"] for numero, llave in enumerate(llaves)]
+    consulta = (
+        db.session.query(*[grupos.c[f"llave_{numero}"] for numero in range(len(llaves))], grupos.c.conservar, modelo.id)
+        .select_from(grupos)
+        .join(modelo, and_(*condiciones, modelo.id > grupos.c.conservar))
+        .filter(modelo.estatus == "A")
+        .order_by(grupos.c.conservar, modelo.id)
+        .yield_per(lote)
+    )
+
+    # Juntar los renglones consecutivos del mismo grupo
+    for conservar, renglones in groupby(consulta, key=lambda renglon: renglon[-2]):
+        renglones = list(renglones)
+        yield Duplicado(tuple(renglones[0][:-2]), conservar, [renglon[-1] for renglon in renglones])
+
+
+def con_hijos(modelo, ids: list, hijos: list, lote: int = LOTE):
+    """Entregar los ID que tienen registros activos en las llaves foráneas hijos, por ejemplo CitCita.cit_cliente_id"""
+    encontrados = []
+    for inicio in range(0, len(ids), lote):
+        consulta = db.session.query(modelo.id).filter(modelo.id.in_(ids[inicio : inicio + lote])).filter(_hay_hijos(modelo, hijos)).order_by(modelo.id)
+        encontrados.extend(renglon.id for renglon in consulta)
+    return encontrados
+
+
+def dar_de_baja(modelo, ids: list, hijos: list = None, lote: int = LOTE):
+    """Cambiar a estatus B los registros con los ID dados que no tengan hijos activos, entrega la cantidad"""
+    cantidad = 0
+    for inicio in range(0, len(ids), lote):
+        consulta = modelo.query.filter(modelo.id.in_(ids[inicio : inicio + lote])).filter_by(estatus="A")
+        if hijos:
+            consulta = consulta.filter(~_hay_hijos(modelo, hijos))  # En el mismo UPDATE, por si les agregan hijos mientras tanto
+        cantidad += consulta.update({"estatus": "B"}, synchronize_session=False)
+        db.session.commit()
+    return cantidad
+
+
+def _hay_hijos(modelo, hijos: list):
+    """Condición: el registro tiene hijos activos en alguna de las llaves foráneas"""
+    return or_(*[exists().where(hijo == modelo.id, hijo.class_.estatus == "A") for hijo in hijos])
+
+
+def guardar_reporte(duplicados: list, nombres: list, ruta: str):
+    """Escribir los grupos en CSV (los sobrantes separados por espacios) o en JSON"""
+    renglones = [duplicado.como_diccionario(nombres) for duplicado in duplicados]
+    if ruta.lower().endswith(".json"):
+        with open(ruta, "w", encoding="utf8") as archivo:
+            json.dump(renglones, archivo, ensure_ascii=False, indent=2)
+        return
+    with open(ruta, "w", encoding="utf8", newline="") as archivo:
+        escritor = csv.DictWriter(archivo, fieldnames=list(nombres) + ["conservar", "sobrantes"])
+        escritor.writeheader()
+        for renglon in renglones:
+            renglon["sobrantes"] = " ".join(str(sobrante) for sobrante in renglon["sobrantes"])
+            escritor.writerow(renglon)
+
+
+def _a_texto(valor):
+    """Convertir fechas a texto ISO para el reporte"""
+    if isinstance(valor, (date, datetime)):
+        return valor.isoformat()
+    return valor
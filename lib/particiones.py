@@ -0,0 +1,189 @@
+"""
+Particiones
+
+Las tablas que solo crecen (bitacoras, entradas_salidas y tareas) se declaran en su modelo con
+__table_args__ = {"info": {"particionar_por": "creado"}} y en PostgreSQL se parten por mes
+
+- convertir cambia la tabla a PARTITION BY RANGE (creado) con llave primaria (creado, id),
+  copia sus renglones y crea una partición por mes más una partición DEFAULT por si falta un mes;
+  todo en una sola transacción, si algo falla la tabla queda como estaba
+- crear_particiones agrega las particiones de los meses siguientes, debe ejecutarse cada mes
+- archivar escribe cada partición vieja en un archivo CSV comprimido, luego la separa y la borra
+
+Las particiones se llaman <tabla>_<año>_<mes>, por ejemplo bitacoras_2023_01.
+En otras bases de datos (SQLite) las tablas no se parten y estas funciones no hacen nada.
+"""
+import csv
+from datetime import date, datetime
+import gzip
+import os
+
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import text
+from sqlalchemy.schema import AddConstraint, CreateIndex
+
+from citas_admin.extensions import db
+
+MESES_ADELANTE = 3
+INFO = "particionar_por"
+
+
+class ParticionError(Exception):
+    """Error al partir o archivar una tabla"""
+
+
+def es_postgresql():
+    """Solo PostgreSQL tiene particiones declarativas"""
+    return db.engine.dialect.name == "postgresql"
+
+
+def tablas_particionadas():
+    """Entregar las tablas del modelo declaradas para partirse"""
+    return [tabla for tabla in db.Model.metadata.sorted_tables if INFO in tabla.info]
+
+
+def inicio_mes(fecha: date):
+    """Primer día del mes de la fecha"""
+    return date(fecha.year, fecha.month, 1)
+
+
+def nombre_particion(tabla: str, mes: date):
+    """Nombre de la partición del mes"""
+    return f"{tabla}_{mes.year:04d}_{mes.month:02d}"
+
+
+def _ejecutar(sentencia: str, **parametros):
+    """Ejecutar una sentencia SQL"""
+    return db.session.execute(text(sentencia), parametros)
+
+
+def esta_particionada(tabla: str):
+    """¿La tabla ya está partida?"""
+    return _ejecutar("SELECT relkind FROM pg_class WHERE oid = to_regclass(:tabla)", tabla=tabla).scalar() == "p"
+
+
+def listar_particiones(tabla: str):
+    """Entregar [(mes, nombre, renglones estimados)] de las particiones por mes, ordenadas por mes"""
+    consulta = _ejecutar(
+        "SELECT c.relname, c.reltuples FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = to_regclass(:tabla)",
+        tabla=tabla,
+    )
+    particiones = []
+    for nombre, renglones in consulta:
+        try:
+            mes = datetime.strptime(nombre[len(tabla) + 1 :], "%Y_%m").date()
+        except ValueError:
+            continue  # La partición DEFAULT
+        particiones.append((mes, nombre, max(int(renglones), 0)))
+    return sorted(particiones)
+
+
+def _crear_particion(tabla: str, mes: date):
+    """Crear la partición del mes, si la partición DEFAULT tiene renglones de ese mes los mueve"""
+    nombre = nombre_particion(tabla, mes)
+    desde, hasta = mes, mes + relativedelta(months=1)
+    if _ejecutar("SELECT to_regclass(:nombre)", nombre=nombre).scalar() is not None:
+        return False
+    defecto = f"{tabla}_default"
+    sobrantes = _ejecutar(f"SELECT count(*) FROM {defecto} WHERE creado >= :desde AND creado < :hasta", desde=desde, hasta=hasta).scalar()
+    if sobrantes:
+        _ejecutar(f"ALTER TABLE {tabla} DETACH PARTITION {defecto}")
+    _ejecutar(f"CREATE TABLE {nombre} PARTITION OF {tabla} FOR VALUES FROM ('{desde.isoformat()}') TO ('{hasta.isoformat()}')")
+    if sobrantes:
+        _ejecutar(f"INSERT INTO {tabla} SELECT * FROM {defecto} WHERE creado >= :desde AND creado < :hasta", desde=desde, hasta=hasta)
+        _ejecutar(f"DELETE FROM {defecto} WHERE creado >= :desde AND creado < :hasta", desde=desde, hasta=hasta)
+        _ejecutar(f"ALTER TABLE {tabla} ATTACH PARTITION {defecto} DEFAULT")
+    return True
+
+
+def crear_particiones(tabla: str, desde: date = None, meses_adelante: int = MESES_ADELANTE, confirmar: bool = True):
+    """Crear las particiones que falten desde el mes dado hasta meses_adelante, entrega las creadas
+
+    Con confirmar=False no hace commit, para usarse dentro de una transacción mayor como la de convertir
+    """
+    mes = inicio_mes(desde if desde is not None else date.today())
+    hasta = inicio_mes(date.today()) + relativedelta(months=meses_adelante)
+    creadas = []
+    while mes <= hasta:
+        if _crear_particion(tabla, mes):
+            creadas.append(nombre_particion(tabla, mes))
+        mes += relativedelta(months=1)
+    if confirmar:
+        db.session.commit()
+    return creadas
+
+
+def convertir(tabla, meses_adelante: int = MESES_ADELANTE):
+    """Cambiar una tabla del modelo a particiones por mes copiando sus renglones, entrega False si ya lo estaba"""
+    nombre = tabla.name
+    columna = tabla.info[INFO]
+    if esta_particionada(nombre):
+        return False
+    try:
+        _convertir(tabla, nombre, columna, meses_adelante)
+        db.session.commit()
+    except Exception as error:
+        db.session.rollback()  # En PostgreSQL el DDL es transaccional, la tabla original queda intacta
+        raise ParticionError(f"No se pudo partir {nombre}: {str(error)}") from error
+    return True
+
+
+def _convertir(tabla, nombre: str, columna: str, meses_adelante: int):
+    """Sentencias de convertir, sin commit"""
+    anterior = f"{nombre}_anterior"
+
+    # Liberar los nombres de la tabla, su llave primaria y sus índices
+    _ejecutar(f"ALTER TABLE {nombre} RENAME TO {anterior}")
+    _ejecutar(f"ALTER INDEX IF EXISTS {nombre}_pkey RENAME TO {anterior}_pkey")
+    for indice in tabla.indexes:
+        _ejecutar(f"ALTER INDEX IF EXISTS {indice.name} RENAME TO {indice.name}_anterior")
+
+    # Crear la tabla partida, la llave primaria debe incluir la columna de la partición
+    _ejecutar(f"CREATE TABLE {nombre} (LIKE {anterior} INCLUDING DEFAULTS) PARTITION BY RANGE ({columna})")
+    _ejecutar(f"ALTER TABLE {nombre} ADD PRIMARY KEY ({columna}, id)")
+    _ejecutar(f"CREATE INDEX ix_{nombre}_id ON {nombre} (id)")
+    for indice in tabla.indexes:
+        db.session.execute(CreateIndex(indice))
+    for restriccion in tabla.foreign_key_constraints:
+        db.session.execute(AddConstraint(restriccion))
+    secuencia = _ejecutar("SELECT pg_get_serial_sequence(:tabla, 'id')", tabla=anterior).scalar()
+    if secuencia is not None:
+        _ejecutar(f"ALTER SEQUENCE {secuencia} OWNED BY {nombre}.id")
+
+    # Crear las particiones desde el renglón más antiguo y copiar
+    _ejecutar(f"CREATE TABLE {nombre}_default PARTITION OF {nombre} DEFAULT")
+    primero = _ejecutar(f"SELECT min({columna}) FROM {anterior}").scalar()
+    crear_particiones(nombre, desde=primero.date() if primero is not None else None, meses_adelante=meses_adelante, confirmar=False)
+    _ejecutar(f"INSERT INTO {nombre} SELECT * FROM {anterior}")
+    _ejecutar(f"DROP TABLE {anterior}")
+
+
+def _escribir(ruta: str, columnas: list, renglones):
+    """Escribir los renglones en CSV comprimido con gzip"""
+    with gzip.open(ruta, "wt", encoding="utf8", newline="") as archivo:
+        escritor = csv.writer(archivo)
+        escritor.writerow(columnas)
+        for renglon in renglones:
+            escritor.writerow(renglon)
+        archivo.flush()
+        os.fsync(archivo.fileno())
+
+
+def archivar(tabla: str, antes_de: date, directorio: str, probar: bool = True):
+    """Archivar las particiones de los meses anteriores a antes_de, entrega [(nombre, ruta, renglones)]"""
+    archivadas = []
+    for mes, nombre, _ in listar_particiones(tabla):
+        if mes >= inicio_mes(antes_de):
+            break
+        ruta = os.path.join(directorio, f"{nombre}.csv.gz")
+        cantidad = _ejecutar(f"SELECT count(*) FROM {nombre}").scalar()
+        if not probar:
+            if os.path.exists(ruta):
+                raise ParticionError(f"Ya existe el archivo {ruta}")
+            resultado = db.session.execute(text(f"SELECT * FROM {nombre} ORDER BY creado, id").execution_options(stream_results=True))
+            _escribir(ruta, list(resultado.keys()), resultado)
+            _ejecutar(f"ALTER TABLE {tabla} DETACH PARTITION {nombre}")
+            _ejecutar(f"DROP TABLE {nombre}")
+            db.session.commit()
+        archivadas.append((nombre, ruta, cantidad))
+    return archivadas
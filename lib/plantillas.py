@@ -0,0 +1,66 @@
+"""
+Plantillas
+
+Registro de las plantillas Jinja2 de los mensajes que elaboran las tareas en el fondo
+
+- obtener_plantilla entrega la plantilla ya compilada, cada proceso tiene un Environment por blueprint
+  que guarda en memoria las plantillas que ya cargó, así no se vuelven a leer ni compilar por cada mensaje
+- Lo compilado también se guarda en PLANTILLAS_CACHE (FileSystemBytecodeCache), así un worker de RQ
+  recién creado solo carga el bytecode en lugar de compilar
+- precargar compila de una vez las plantillas email*.jinja2 de todos los blueprints
+"""
+import glob
+import os
+import tempfile
+import threading
+
+from dotenv import load_dotenv
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+
+load_dotenv()  # Take environment variables from .env
+
+BLUEPRINTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "citas_admin", "blueprints")
+PLANTILLAS_CACHE = os.getenv("PLANTILLAS_CACHE", os.path.join(tempfile.gettempdir(), "citas_admin_plantillas"))
+PLANTILLAS_PATRON = "email*.jinja2"
+
+_entornos = {}
+_candado = threading.Lock()
+
+
+def obtener_entorno(blueprint: str):
+    """Entregar el Environment de las plantillas del blueprint, lo crea la primera vez"""
+    with _candado:
+        entorno = _entornos.get(blueprint)
+        if entorno is None:
+            os.makedirs(PLANTILLAS_CACHE, exist_ok=True)
+            entorno = Environment(
+                loader=FileSystemLoader(os.path.join(BLUEPRINTS_DIR, blueprint, "templates", blueprint)),
+                bytecode_cache=FileSystemBytecodeCache(PLANTILLAS_CACHE),
+                auto_reload=False,  # Las plantillas no cambian mientras corre el worker
+                trim_blocks=True,
+                lstrip_blocks=True,
+            )
+            _entornos[blueprint] = entorno
+    return entorno
+
+
+def obtener_plantilla(blueprint: str, nombre: str):
+    """Entregar la plantilla compilada del blueprint"""
+    return obtener_entorno(blueprint).get_template(nombre)
+
+
+def precargar():
+    """Compilar las plantillas de los mensajes de todos los blueprints, entrega la lista de (blueprint, nombre)"""
+    cargadas = []
+    for ruta in sorted(glob.glob(os.path.join(BLUEPRINTS_DIR, "*", "templates", "*", PLANTILLAS_PATRON))):
+        nombre = os.path.basename(ruta)
+        blueprint = os.path.basename(os.path.dirname(ruta))
+        obtener_plantilla(blueprint, nombre)
+        cargadas.append((blueprint, nombre))
+    return cargadas
+
+
+def limpiar():
+    """Olvidar los Environment de este proceso, por ejemplo para medir la carga desde el bytecode"""
+    with _candado:
+        _entornos.clear()
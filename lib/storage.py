@@ -60,7 +60,7 @@ Defina el nombre guardado en el depósito y suba
             # Subir el archivo a la nube
             try:
                 storage.set_filename(hashed_id=cid_formato.encode_id(), description=descripcion)
-                storage.upload(archivo.stream.read())
+                storage.upload(archivo.stream)  # Se sube por partes, sin leerlo completo en memoria
                 cid_formato.archivo = archivo.filename  # Conservar el nombre original
                 cid_formato.url = storage.url
                 cid_formato.save()
@@ -107,19 +107,43 @@ Tenga en cuenta que...
             mensaje = set_task_error("No fue posible subir el archivo PDF a Google Storage.")
             bitacora.warning(mensaje, str(error))
 
+3) Almacenes
+
+STORAGE_BACKEND elige dónde quedan los archivos, obtener_almacen entrega uno por depósito y proceso
+
+- google: Google Cloud Storage con un solo cliente por proceso, así no se autentica ni abre conexiones
+  en cada llamada; sube por partes (resumible) desde un archivo abierto y descarga por partes o por rango
+- local: un directorio STORAGE_DIRECTORIO/depósito/ruta para probar y medir sin conexión
+
+Para mostrar un archivo sin que sus bytes pasen por la aplicación, la vista responde con entregar_archivo:
+con google redirige a una URL firmada que dura STORAGE_URL_SEGUNDOS, con local lo envía por partes.
+
+    return entregar_archivo(tdt_solicitud.identificacion_oficial_url)
+
 """
-import datetime
+from io import BytesIO
 import re
-from datetime import datetime, date
+import shutil
+import threading
+from datetime import datetime, date, timedelta
 from pathlib import Path
+from urllib.parse import quote, unquote
+
 from unidecode import unidecode
 
-from flask import current_app
-from google.cloud import storage
+from flask import current_app, redirect, send_file
+from werkzeug.exceptions import NotFound
 from werkzeug.utils import secure_filename
 
 from .time_to_text import mes_en_palabra
 
+PARTE_BYTES = 8 * 1024 * 1024  # Tamaño de cada parte al subir o descargar, múltiplo de 256 KB
+GOOGLE_URL = "https://storage.googleapis.com"
+
+_cliente = None
+_almacenes = {}
+_candado = threading.Lock()
+
 
 class NotAllowedExtesionError(Exception):
     """Exception raised when the extension is not allowed"""
@@ -137,6 +161,162 @@ class NotConfiguredError(Exception):
     """Exception raised when a environment variable is not configured"""
 
 
+def _storage_client():
+    """Cliente de Google Cloud Storage, uno por proceso"""
+    global _cliente
+    with _candado:
+        if _cliente is None:
+            from google.cloud import storage  # Se carga hasta que se usa, tarda en importarse
+
+            _cliente = storage.Client()
+        return _cliente
+
+
+class AlmacenGoogle:
+    """Depósito en Google Cloud Storage"""
+
+    def __init__(self, deposito: str):
+        self.deposito = deposito
+        self.prefijo = f"{GOOGLE_URL}/{deposito}/"
+
+    def _blob(self, ruta: str):
+        blob = _storage_client().bucket(self.deposito).blob(ruta)
+        blob.chunk_size = PARTE_BYTES  # Con chunk_size las subidas son resumibles y las descargas por partes
+        return blob
+
+    def subir(self, ruta: str, archivo, content_type: str):
+        """Subir desde un archivo abierto, entrega la URL pública"""
+        blob = self._blob(ruta)
+        blob.upload_from_file(archivo, content_type=content_type)
+        return blob.public_url
+
+    def subir_archivo(self, ruta: str, nombre_archivo: str, content_type: str):
+        """Subir un archivo del disco, entrega la URL pública"""
+        blob = self._blob(ruta)
+        blob.upload_from_filename(filename=nombre_archivo, content_type=content_type)
+        return blob.public_url
+
+    def descargar(self, ruta: str, destino, inicio: int = None, fin: int = None):
+        """Descargar por partes a un archivo abierto, opcionalmente solo los bytes de inicio a fin (inclusive)"""
+        self._blob(ruta).download_to_file(destino, start=inicio, end=fin)
+
+    def leer(self, ruta: str, inicio: int = None, fin: int = None):
+        """Entregar el contenido como bytes, opcionalmente solo los bytes de inicio a fin (inclusive)"""
+        return self._blob(ruta).download_as_bytes(start=inicio, end=fin)
+
+    def url_firmada(self, ruta: str, segundos: int):
+        """Entregar una URL firmada para descargar que vence en los segundos dados"""
+        from google.auth import credentials as google_credentials
+        from google.auth.transport import requests as google_requests
+
+        opciones = {"version": "v4", "expiration": timedelta(seconds=segundos), "method": "GET"}
+        credenciales = _storage_client()._credentials
+        if not isinstance(credenciales, google_credentials.Signing):
+            # En App Engine las credenciales no tienen llave privada, se firma con la API de IAM
+            if not credenciales.valid:
+                credenciales.refresh(google_requests.Request())
+            opciones["service_account_email"] = credenciales.service_account_email
+            opciones["access_token"] = credenciales.token
+        return self._blob(ruta).generate_signed_url(**opciones)
+
+    def ruta_de_url(self, url: str):
+        """Entregar la ruta en el depósito de una URL pública, None si es de otro lado"""
+        if url and url.startswith(self.prefijo):
+            return unquote(url[len(self.prefijo) :])
+        return None
+
+
+class AlmacenLocal:
+    """Depósito en un directorio local, para pruebas y mediciones sin conexión"""
+
+    def __init__(self, directorio: str, deposito: str):
+        self.deposito = deposito
+        self.directorio = Path(directorio, deposito).resolve()
+        self.prefijo = self.directorio.as_uri() + "/"
+
+    def archivo_local(self, ruta: str):
+        """Entregar la ruta en el disco, causa NotFound si se sale del depósito"""
+        archivo = (self.directorio / ruta.lstrip("/")).resolve()
+        if self.directorio not in archivo.parents:
+            raise NotFound()  # La ruta se sale del depósito
+        return archivo
+
+    def subir(self, ruta: str, archivo, content_type: str):
+        """Copiar por partes desde un archivo abierto, entrega la URL"""
+        destino = self.archivo_local(ruta)
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        with open(destino, "wb") as salida:
+            shutil.copyfileobj(archivo, salida, PARTE_BYTES)
+        return self.prefijo + quote(ruta.lstrip("/"))
+
+    def subir_archivo(self, ruta: str, nombre_archivo: str, content_type: str):
+        """Copiar un archivo del disco, entrega la URL"""
+        with open(nombre_archivo, "rb") as archivo:
+            return self.subir(ruta, archivo, content_type)
+
+    def descargar(self, ruta: str, destino, inicio: int = None, fin: int = None):
+        """Copiar por partes a un archivo abierto, opcionalmente solo los bytes de inicio a fin (inclusive)"""
+        with open(self.archivo_local(ruta), "rb") as archivo:
+            archivo.seek(inicio or 0)
+            restantes = None if fin is None else fin - (inicio or 0) + 1
+            while restantes is None or restantes > 0:
+                parte = archivo.read(PARTE_BYTES if restantes is None else min(PARTE_BYTES, restantes))
+                if not parte:
+                    break
+                destino.write(parte)
+                if restantes is not None:
+                    restantes -= len(parte)
+
+    def leer(self, ruta: str, inicio: int = None, fin: int = None):
+        """Entregar el contenido como bytes, opcionalmente solo los bytes de inicio a fin (inclusive)"""
+        with open(self.archivo_local(ruta), "rb") as archivo:
+            archivo.seek(inicio or 0)
+            return archivo.read(-1 if fin is None else fin - (inicio or 0) + 1)
+
+    def url_firmada(self, ruta: str, segundos: int):
+        """Sin URL firmada, entregar_archivo lo envía desde el directorio"""
+        return None
+
+    def ruta_de_url(self, url: str):
+        """Entregar la ruta en el depósito de una URL, None si es de otro lado"""
+        if url and url.startswith(self.prefijo):
+            return unquote(url[len(self.prefijo) :])
+        return None
+
+
+def obtener_almacen(deposito: str = None):
+    """Entregar el almacén del depósito (por defecto CLOUD_STORAGE_DEPOSITO), uno por proceso"""
+    if deposito is None:
+        try:
+            deposito = current_app.config["CLOUD_STORAGE_DEPOSITO"]
+        except KeyError as error:
+            raise NotConfiguredError from error
+    with _candado:
+        if deposito not in _almacenes:
+            if current_app.config.get("STORAGE_BACKEND", "google") == "local":
+                _almacenes[deposito] = AlmacenLocal(current_app.config.get("STORAGE_DIRECTORIO", "almacen"), deposito)
+            else:
+                _almacenes[deposito] = AlmacenGoogle(deposito)
+        return _almacenes[deposito]
+
+
+def entregar_archivo(url: str):
+    """Responder con el archivo de una URL guardada: redirige a una URL firmada o lo envía desde el directorio local"""
+    almacen = obtener_almacen()
+    ruta = almacen.ruta_de_url(url)
+    if ruta is None:
+        if not url:
+            raise NotFound()
+        return redirect(url)  # Es de otro depósito, se conserva el vínculo guardado
+    url_firmada = almacen.url_firmada(ruta, current_app.config.get("STORAGE_URL_SEGUNDOS", 300))
+    if url_firmada is not None:
+        return redirect(url_firmada)
+    archivo = almacen.archivo_local(ruta)
+    if not archivo.is_file():
+        raise NotFound()
+    return send_file(archivo, conditional=True)  # conditional atiende las peticiones con Range
+
+
 class GoogleCloudStorage:
     """Google Cloud Storage"""
 
@@ -213,7 +393,7 @@ class GoogleCloudStorage:
         return self.filename
 
     def upload(self, data):
-        """Upload to the cloud, returns the public URL"""
+        """Upload to the cloud, data can be bytes or a file-like object that is sent in parts, returns the public URL"""
         self.url = None
         if self.filename is None:
             raise NoneFilenameError
@@ -225,34 +405,16 @@ class GoogleCloudStorage:
         else:
             month_str = self.upload_date.strftime("%m")
         path_str = str(Path(self.base_directory, year_str, month_str, self.filename))
-        try:
-            bucket_name = current_app.config["CLOUD_STORAGE_DEPOSITO"]
-        except KeyError as error:
-            raise NotConfiguredError from error
-        storage_client = storage.Client()
-        bucket = storage_client.bucket(bucket_name)
-        blob = bucket.blob(path_str)
-        blob.upload_from_string(data, self.content_type)
-        self.url = blob.public_url
+        if isinstance(data, (bytes, str)):
+            data = BytesIO(data.encode() if isinstance(data, str) else data)
+        self.url = obtener_almacen().subir(path_str, data, self.content_type)
         return self.url
 
     def upload_from_filename(self, bucket_name, destination_blob_name, source_file_name, content_type):
         """Upload to the cloud, returns the public URL"""
-        self.url = None
-        storage_client = storage.Client()
-        bucket = storage_client.bucket(bucket_name)
-        blob = bucket.blob(destination_blob_name)
-        blob.upload_from_filename(filename=source_file_name, content_type=content_type)
-        self.url = blob.public_url
+        self.url = obtener_almacen(bucket_name).subir_archivo(destination_blob_name, source_file_name, content_type)
         return self.url
 
     def download_as_string(self, blob_name):
-        """Descarga un archivo como string"""
-        try:
-            bucket_name = current_app.config["CLOUD_STORAGE_DEPOSITO"]
-        except KeyError as error:
-            raise NotConfiguredError from error
-        storage_client = storage.Client()
-        bucket = storage_client.bucket(bucket_name)
-        blob = bucket.blob(blob_name)
-        return blob.download_as_string()
+        """Descarga un archivo como bytes"""
+        return obtener_almacen().leer(blob_name)
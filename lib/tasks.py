@@ -1,34 +1,103 @@
 """
 Tasks
+
+El progreso de las tareas en el fondo vive en Redis, en un hash tareas:progreso:<id> con
+progreso, mensaje y terminado; así reportar el avance no consulta ni escribe en la base de datos
+
+- set_task_progress y set_task_error escriben el hash con una sola llamada a Redis
+- La tabla tareas solo se actualiza, con un UPDATE sin consultar antes, al terminar la tarea o
+  si cambia el mensaje y pasaron SINCRONIZAR_SEGUNDOS desde la última vez
+- leer_progresos entrega el progreso de muchas tareas con una sola ida a Redis
 """
+import time
+
+from flask import current_app
+from redis.exceptions import RedisError
 from rq import get_current_job
-from citas_admin.blueprints.tareas.models import Tarea
+
+from citas_admin.extensions import db
+
+LLAVE = "tareas:progreso"
+EXPIRA_SEGUNDOS = 7 * 24 * 60 * 60  # Lo mismo que se muestran las tareas en proceso
+SINCRONIZAR_SEGUNDOS = 30
+DESCRIPCION_LARGO = 128  # Largo de la columna tareas.descripcion
+
+_sincronizadas = {}  # ID de la tarea → último mensaje, el escrito en la base de datos y cuándo
 
 
 def set_task_progress(progress: int, mensaje: str = None):
     """Cambiar el progreso de la tarea"""
     job = get_current_job()
     if job:
-        job.meta["progress"] = progress
-        job.save_meta()
-        tarea = Tarea.query.get(job.get_id())
-        if tarea:
-            if progress >= 100:
-                tarea.ha_terminado = True
-            if mensaje is not None:
-                tarea.descripcion = mensaje
-            tarea.save()
+        _guardar(job, progress, mensaje, terminado=progress >= 100)
 
 
 def set_task_error(mensaje: str):
     """Al fallar la tarea debe tomar el mensaje y terminarla"""
     job = get_current_job()
     if job:
-        job.meta["progress"] = 100
-        job.save_meta()
-        tarea = Tarea.query.get(job.get_id())
-        if tarea:
-            tarea.ha_terminado = True
-            tarea.descripcion = mensaje
-            tarea.save()
+        _guardar(job, 100, mensaje, terminado=True)
     return mensaje
+
+
+def _guardar(job, progreso: int, mensaje: str, terminado: bool):
+    """Escribir el progreso en Redis y, si corresponde, sincronizar la tabla tareas"""
+    tarea_id = job.id
+    campos = {"progreso": progreso, "terminado": int(terminado)}
+    if mensaje is not None:
+        campos["mensaje"] = mensaje
+    llave = f"{LLAVE}:{tarea_id}"
+    tuberia = job.connection.pipeline(transaction=False)
+    tuberia.hset(llave, mapping=campos)
+    tuberia.expire(llave, EXPIRA_SEGUNDOS)
+    tuberia.execute()
+
+    # Sincronizar solo al terminar o si hay un mensaje sin escribir y ya pasó el tiempo
+    estado = _sincronizadas.setdefault(tarea_id, {"momento": None, "mensaje": None, "escrito": None})
+    if mensaje is not None:
+        estado["mensaje"] = mensaje
+    pendiente = estado["mensaje"] != estado["escrito"]
+    momento = time.monotonic()
+    if terminado:
+        _sincronizadas.pop(tarea_id, None)
+    elif pendiente and (estado["momento"] is None or momento - estado["momento"] >= SINCRONIZAR_SEGUNDOS):
+        estado["momento"], estado["escrito"] = momento, estado["mensaje"]
+    else:
+        return
+    _sincronizar(tarea_id, estado["mensaje"] if pendiente else None, terminado)
+
+
+def _sincronizar(tarea_id: str, mensaje: str, terminado: bool):
+    """Actualizar el renglón de la tarea sin consultarlo"""
+    from citas_admin.blueprints.tareas.models import Tarea  # Aquí para no importar el modelo en un ciclo
+
+    valores = {}
+    if terminado:
+        valores["ha_terminado"] = True
+    if mensaje is not None:
+        valores["descripcion"] = mensaje[:DESCRIPCION_LARGO]
+    if valores:
+        Tarea.query.filter(Tarea.id == tarea_id).update(valores, synchronize_session=False)
+        db.session.commit()
+
+
+def leer_progresos(tareas_ids: list):
+    """Entregar {id: {"progreso", "mensaje", "terminado"}} de las tareas con progreso en Redis, con una sola ida"""
+    if not tareas_ids:
+        return {}
+    try:
+        tuberia = current_app.redis.pipeline(transaction=False)
+        for tarea_id in tareas_ids:
+            tuberia.hgetall(f"{LLAVE}:{tarea_id}")
+        respuestas = tuberia.execute()
+    except RedisError:
+        return {}
+    progresos = {}
+    for tarea_id, campos in zip(tareas_ids, respuestas):
+        if campos:
+            progresos[tarea_id] = {
+                "progreso": int(campos[b"progreso"]),
+                "mensaje": campos[b"mensaje"].decode() if b"mensaje" in campos else None,
+                "terminado": campos[b"terminado"] == b"1",
+            }
+    return progresos
@@ -0,0 +1,57 @@
+"""
+Transiciones
+
+Cambia de estado muchos registros a la vez, por ejemplo las citas PENDIENTES vencidas a INASISTENCIA,
+los pagos SOLICITADOS expirados o las encuestas PENDIENTES a CANCELADO
+
+- contar entrega cuántos registros cumplen las condiciones, para el modo de pruebas
+- transicionar hace un UPDATE por lote con los valores como parámetros y confirma cada lote,
+  entrega un generador con la lista de ID de cada lote para, por ejemplo, notificar por correo
+- Los lotes avanzan por ID (id > último), así el UPDATE siempre termina aunque los valores
+  no saquen a los registros de las condiciones, y cada lote bloquea pocos renglones
+- en_grupos parte una lista de ID para agregar una tarea por grupo en lugar de una por registro
+
+En PostgreSQL cada lote es UPDATE ... WHERE id IN (SELECT ... LIMIT ... FOR UPDATE SKIP LOCKED) RETURNING id,
+en otras bases de datos (SQLite) se consultan los ID y luego se actualizan en la misma transacción.
+"""
+from sqlalchemy import func, select
+
+from citas_admin.extensions import db
+
+LOTE = 5000
+
+
+def contar(modelo, condiciones: list):
+    """Entregar la cantidad de registros que cumplen las condiciones"""
+    return db.session.execute(select(func.count()).select_from(modelo.__table__).where(*condiciones)).scalar()
+
+
+def transicionar(modelo, condiciones: list, valores: dict, lote: int = LOTE):
+    """Cambiar por lotes los registros que cumplen las condiciones, entrega un generador con los ID de cada lote confirmado
+
+    - condiciones: expresiones de SQLAlchemy, por ejemplo [CitCita.estado == "PENDIENTE", CitCita.inicio <= fecha]
+    - valores: {columna: valor nuevo}, modificado se actualiza solo
+    """
+    tabla = modelo.__table__
+    es_postgresql = db.engine.dialect.name == "postgresql"
+    ultimo_id = 0
+    while True:
+        seleccion = select(tabla.c.id).where(*condiciones, tabla.c.id > ultimo_id).order_by(tabla.c.id).limit(lote)
+        if es_postgresql:
+            sentencia = tabla.update().where(tabla.c.id.in_(seleccion.with_for_update(skip_locked=True).scalar_subquery())).values(**valores).returning(tabla.c.id)
+            ids = sorted(renglon.id for renglon in db.session.execute(sentencia))
+        else:
+            ids = [renglon.id for renglon in db.session.execute(seleccion)]
+            if ids:
+                db.session.execute(tabla.update().where(tabla.c.id.in_(ids)).values(**valores))
+        db.session.commit()
+        if not ids:
+            break
+        yield ids
+        ultimo_id = ids[-1]
+
+
+def en_grupos(ids: list, tamano: int):
+    """Entregar un generador con la lista de ID partida en grupos del tamaño dado"""
+    for inicio in range(0, len(ids), tamano):
+        yield ids[inicio : inicio + tamano]
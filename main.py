@@ -2,9 +2,10 @@
 Google Cloud App Engine toma main.py
 """
 from citas_admin import app
+from citas_admin.extensions import socketio
 
 app = app.create_app()
 
 
 if __name__ == "__main__":
-    app.run()
+    socketio.run(app)
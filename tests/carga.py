@@ -0,0 +1,408 @@
+"""
+Prueba de carga de los escritorios de las oficinas
+
+Sobre una base de datos con datos de tests/generar_datos.py simula --escritorios personas atendiendo al mismo
+tiempo, cada una en un hilo con su propio usuario y oficina. Cada sesión es:
+
+1. Ingresar con correo y contraseña en /login
+2. Abrir el listado de citas, cit_citas.list_active
+3. Consultar --sondeos veces cit_citas.datatable_json, como lo hace la tabla al paginar y refrescar
+4. Pedir los horarios disponibles, cit_citas.horarios_json
+5. Abrir y enviar el formulario de la cita inmediata, cit_citas.new
+6. Abrir y enviar la asistencia de una cita PENDIENTE que ya pasó, cit_citas.assistance
+7. Salir
+
+Cada paso revisa el código de estado esperado y, si redirige, a dónde; es error cualquier otro código,
+cualquier redirección inesperada a /login (como las peticiones después de un ingreso fallido) y la falta
+del JSON esperado en datatable_json y horarios_json.
+
+Por cada ruta informa el histograma de milisegundos, los percentiles 50, 90 y 99, los errores y el promedio
+de sentencias SQL (del encabezado X-Consultas-SQL); al final las peticiones por segundo y las métricas del pool.
+
+Las peticiones van por el cliente de pruebas de Flask o, con --servidor, por HTTP a un servidor WSGI de werkzeug
+con hilos en este mismo proceso. Con --redis-local arranca un redis-server temporal para la cola de tareas y la
+disponibilidad, así no se toca el Redis de desarrollo. Los usuarios escritorioNNN@pjecz.gob.mx se crean
+la primera vez, todos con la contraseña CONTRASENA.
+
+Uso:
+
+    python -m tests.carga --escritorios 300 --sesiones 2
+    python -m tests.carga --servidor --redis-local --guardar carga.json
+"""
+import argparse
+from datetime import datetime
+import json
+import logging
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+from dotenv import load_dotenv
+from redis import Redis
+from redis.exceptions import RedisError
+import requests
+import rq
+from sqlalchemy import func
+from werkzeug.serving import make_server
+
+from lib.consultas_sql import ENCABEZADO, contar_consultas_sql
+from lib.database import metricas_pool
+
+from citas_admin.app import create_app
+from citas_admin.extensions import db, pwd_context
+
+from citas_admin.blueprints.cit_citas.models import CitCita
+from citas_admin.blueprints.cit_clientes.models import CitCliente
+from citas_admin.blueprints.cit_oficinas_servicios.models import CitOficinaServicio
+from citas_admin.blueprints.roles.models import Rol
+from citas_admin.blueprints.usuarios.models import Usuario
+from citas_admin.blueprints.usuarios_oficinas.models import UsuarioOficina
+from citas_admin.blueprints.usuarios_roles.models import UsuarioRol
+
+from tests.generar_datos import EMAIL_USUARIO
+
+CONTRASENA = "Escritorio2022"
+ESCRITORIOS = 300
+SESIONES = 2
+SONDEOS = 3
+PAUSA = 0.5
+RAMPA = 10
+LONGITUD = 25
+CUBETAS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+ANCHO_BARRA = 40
+
+
+class ClienteFlask:
+    """Peticiones por el cliente de pruebas de Flask, conserva las cookies"""
+
+    def __init__(self, app):
+        self.cliente = app.test_client()
+
+    def pedir(self, metodo: str, ruta: str, datos: dict = None):
+        """Entregar el código de estado, el encabezado de las sentencias SQL, el JSON si lo hay y la ruta a la que redirige"""
+        respuesta = self.cliente.open(ruta, method=metodo, data=datos)
+        return respuesta.status_code, respuesta.headers.get(ENCABEZADO), respuesta.get_json(silent=True), respuesta.headers.get("Location")
+
+
+class ClienteHttp:
+    """Peticiones HTTP a un servidor, conserva las cookies"""
+
+    def __init__(self, url_base: str):
+        self.url_base = url_base
+        self.sesion = requests.Session()
+
+    def pedir(self, metodo: str, ruta: str, datos: dict = None):
+        """Entregar el código de estado, el encabezado de las sentencias SQL, el JSON si lo hay y la ruta a la que redirige"""
+        respuesta = self.sesion.request(metodo, self.url_base + ruta, data=datos, allow_redirects=False, timeout=60)
+        contenido = respuesta.json() if respuesta.headers.get("Content-Type", "").startswith("application/json") else None
+        return respuesta.status_code, respuesta.headers.get(ENCABEZADO), contenido, respuesta.headers.get("Location")
+
+
+class Registro:
+    """Tiempos, sentencias SQL y errores por ruta, compartido por los hilos"""
+
+    def __init__(self):
+        self._candado = threading.Lock()
+        self.tiempos = {}
+        self.consultas = {}
+        self.errores = {}
+
+    def medir(self, cliente, nombre: str, metodo: str, ruta: str, datos: dict = None, esperado: int = 200, destino: str = None, llave: str = None):
+        """Hacer la petición y registrarla, entrega el JSON de la respuesta o None
+
+        - esperado: código de estado que debe responder
+        - destino: ruta a la que debe redirigir, sin ella cualquier redirección a /login es error
+        - llave: llave que debe traer el JSON de la respuesta
+        """
+        inicio = time.perf_counter()
+        try:
+            codigo, consultas, contenido, ubicacion = cliente.pedir(metodo, ruta, datos)
+        except Exception:  # pylint: disable=broad-except
+            codigo, consultas, contenido, ubicacion = 0, None, None, None
+        milisegundos = (time.perf_counter() - inicio) * 1000
+        ubicacion = urlsplit(ubicacion).path if ubicacion else None
+        if codigo != esperado:
+            es_error = True
+        elif destino is not None:
+            es_error = ubicacion != destino
+        else:
+            es_error = ubicacion is not None and ubicacion.startswith("/login")
+        if llave is not None and (not isinstance(contenido, dict) or llave not in contenido):
+            es_error = True
+        with self._candado:
+            self.tiempos.setdefault(nombre, []).append(milisegundos)
+            self.errores.setdefault(nombre, 0)
+            if consultas is not None:
+                self.consultas.setdefault(nombre, []).append(int(consultas))
+            if es_error:
+                self.errores[nombre] += 1
+        return contenido if not es_error else None
+
+
+def percentil(ordenados: list, por_ciento: float):
+    """Percentil de una lista ordenada"""
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * por_ciento / 100))]
+
+
+def preparar_escritorios(cantidad: int, sesiones: int):
+    """Crear los usuarios que falten y entregar por escritorio su correo, oficina, servicios y citas pasadas"""
+    rol = Rol.query.filter_by(nombre="ADMINISTRADOR").first()
+    plantilla = Usuario.find_by_identity(EMAIL_USUARIO)
+    if rol is None or plantilla is None:
+        print(f"! No existe el usuario {EMAIL_USUARIO}, primero ejecute tests/generar_datos.py")
+        sys.exit(1)
+
+    # Servicios de cada oficina
+    servicios = {}
+    for cit_oficina_servicio in CitOficinaServicio.query.filter_by(estatus="A").order_by(CitOficinaServicio.id):
+        servicios.setdefault(cit_oficina_servicio.oficina_id, []).append(cit_oficina_servicio.cit_servicio_id)
+    oficinas_ids = sorted(servicios)
+
+    # Usuarios, uno por escritorio, repartidos entre las oficinas
+    contrasena = pwd_context.hash(CONTRASENA)  # La misma para todos, hacerla una sola vez
+    escritorios = []
+    for numero in range(1, cantidad + 1):
+        email = f"escritorio{numero:03d}@pjecz.gob.mx"
+        oficina_id = oficinas_ids[(numero - 1) % len(oficinas_ids)]
+        usuario = Usuario.query.filter_by(email=email).first()
+        if usuario is None:
+            usuario = Usuario(
+                autoridad=plantilla.autoridad,
+                oficina_id=oficina_id,
+                email=email,
+                nombres="ESCRITORIO",
+                apellido_paterno=f"{numero:03d}",
+                api_key="",
+                api_key_expiracion=datetime(2000, 1, 1),
+                contrasena=contrasena,
+            )
+            db.session.add(usuario)
+            db.session.add(UsuarioRol(rol=rol, usuario=usuario, descripcion=f"{email} {rol.nombre}"))
+            db.session.add(UsuarioOficina(oficina_id=oficina_id, usuario=usuario, descripcion=f"{email} {oficina_id}"))
+        escritorios.append({"email": email, "oficina_id": oficina_id, "servicios": servicios[oficina_id]})
+    db.session.commit()
+
+    # Citas PENDIENTES que ya pasaron, para marcar su asistencia, sin repetir entre escritorios de la misma oficina
+    for oficina_id in oficinas_ids:
+        de_la_oficina = [datos for datos in escritorios if datos["oficina_id"] == oficina_id]
+        if not de_la_oficina:
+            continue
+        citas = CitCita.query.filter_by(oficina_id=oficina_id, estado="PENDIENTE", estatus="A").filter(CitCita.inicio <= datetime.now()).order_by(CitCita.inicio.desc()).limit(len(de_la_oficina) * sesiones).all()
+        for numero, datos in enumerate(de_la_oficina):
+            datos["citas"] = [(cit_cita.id, cit_cita.codigo_asistencia) for cit_cita in citas[numero :: len(de_la_oficina)]]
+    return escritorios
+
+
+def escritorio(cliente, registro: Registro, datos: dict, clientes: tuple, argumentos, retraso: float, semilla: int):
+    """Hilo de un escritorio, hace sus sesiones una tras otra"""
+    azar = random.Random(semilla)
+    time.sleep(retraso)
+    citas = list(datos["citas"])
+
+    def pausa():
+        if argumentos.pausa:
+            time.sleep(azar.uniform(0.5, 1.5) * argumentos.pausa)
+
+    for _ in range(argumentos.sesiones):
+        # Ingresar y abrir el listado
+        registro.medir(cliente, "POST /login", "POST", "/login", {"identidad": datos["email"], "contrasena": CONTRASENA}, esperado=302, destino="/")
+        registro.medir(cliente, "GET cit_citas.list_active", "GET", "/cit_citas")
+        pausa()
+
+        # Consultar la tabla varias veces, paginando
+        for sondeo in range(argumentos.sondeos):
+            registro.medir(cliente, "POST cit_citas.datatable_json", "POST", "/cit_citas/datatable_json", {"draw": sondeo + 1, "start": sondeo * LONGITUD, "length": LONGITUD}, llave="aaData")
+            pausa()
+
+        # Horarios disponibles y la cita inmediata
+        servicio_id = azar.choice(datos["servicios"])
+        ruta = f"/cit_citas/horarios/{datos['oficina_id']}/{servicio_id}"
+        horarios = (registro.medir(cliente, "GET cit_citas.horarios_json", "GET", ruta, llave="results") or {}).get("results", [])
+        cit_cliente_id = azar.randint(*clientes)
+        registro.medir(cliente, "GET cit_citas.new", "GET", f"/cit_citas/nueva/{cit_cliente_id}")
+        pausa()
+        if horarios:
+            formulario = {"oficina_id": datos["oficina_id"], "servicio_id": servicio_id, "horario": azar.choice(horarios)["value"]}
+            registro.medir(cliente, "POST cit_citas.new", "POST", f"/cit_citas/nueva/{cit_cliente_id}", formulario, esperado=302, destino="/cit_citas")
+            pausa()
+
+        # Marcar la asistencia de una cita que ya pasó
+        if citas:
+            cit_cita_id, codigo = citas.pop()
+            registro.medir(cliente, "GET cit_citas.assistance", "GET", f"/cit_citas/asistencia/{cit_cita_id}")
+            pausa()
+            registro.medir(cliente, "POST cit_citas.assistance", "POST", f"/cit_citas/asistencia/{cit_cita_id}", {"cita_id": cit_cita_id, "codigo": codigo}, esperado=302, destino=f"/cit_citas/{cit_cita_id}")
+
+        # Salir
+        registro.medir(cliente, "GET /logout", "GET", "/logout", esperado=302, destino="/login")
+
+
+def resumir(registro: Registro, segundos: float, sesiones: int):
+    """Entregar por ruta los percentiles, errores, sentencias SQL e histograma, y los totales"""
+    rutas = {}
+    for nombre, tiempos in registro.tiempos.items():
+        ordenados = sorted(tiempos)
+        consultas = registro.consultas.get(nombre, [])
+        histograma = {}
+        anterior = 0
+        for cubeta in CUBETAS:
+            histograma[f"<={cubeta}"] = sum(1 for tiempo in ordenados if anterior < tiempo <= cubeta)
+            anterior = cubeta
+        histograma[f">{CUBETAS[-1]}"] = sum(1 for tiempo in ordenados if tiempo > CUBETAS[-1])
+        rutas[nombre] = {
+            "peticiones": len(ordenados),
+            "errores": registro.errores[nombre],
+            "p50": round(percentil(ordenados, 50), 1),
+            "p90": round(percentil(ordenados, 90), 1),
+            "p99": round(percentil(ordenados, 99), 1),
+            "maximo": round(ordenados[-1], 1),
+            "sql_promedio": round(sum(consultas) / len(consultas), 1) if consultas else None,
+            "sql_maximo": max(consultas) if consultas else None,
+            "histograma": histograma,
+        }
+    peticiones = sum(ruta["peticiones"] for ruta in rutas.values())
+    totales = {
+        "peticiones": peticiones,
+        "errores": sum(ruta["errores"] for ruta in rutas.values()),
+        "segundos": round(segundos, 1),
+        "peticiones_por_segundo": round(peticiones / segundos, 1),
+        "sesiones_por_minuto": round(sesiones * 60 / segundos, 1),
+    }
+    return rutas, totales
+
+
+def mostrar(rutas: dict, totales: dict, pool: dict):
+    """Mostrar la tabla de percentiles y los histogramas"""
+    print(f"{'Ruta':<34} | {'Peticiones':>10} | {'Errores':>7} | {'P50':>8} | {'P90':>8} | {'P99':>8} | {'Máximo':>8} | {'SQL':>5}")
+    print(f"{'':-^110}")
+    for nombre, ruta in rutas.items():
+        sql = f"{ruta['sql_promedio']:>5.1f}" if ruta["sql_promedio"] is not None else f"{'':>5}"
+        print(f"{nombre:<34} | {ruta['peticiones']:>10} | {ruta['errores']:>7} | {ruta['p50']:>8.1f} | {ruta['p90']:>8.1f} | {ruta['p99']:>8.1f} | {ruta['maximo']:>8.1f} | {sql}")
+    for nombre, ruta in rutas.items():
+        print("")
+        print(f"{nombre}, milisegundos")
+        cubetas = list(ruta["histograma"].items())
+        ocupadas = [numero for numero, (_, cantidad) in enumerate(cubetas) if cantidad]
+        mayor = max(cantidad for _, cantidad in cubetas)
+        for cubeta, cantidad in cubetas[ocupadas[0] : ocupadas[-1] + 1]:  # Sin las cubetas vacías de los extremos
+            print(f"    {cubeta:>7} | {cantidad:>7} | {'#' * round(cantidad * ANCHO_BARRA / mayor)}")
+    print("")
+    print(f"{totales['peticiones']} peticiones en {totales['segundos']} s: {totales['peticiones_por_segundo']} por segundo, {totales['sesiones_por_minuto']} sesiones por minuto, {totales['errores']} errores")
+    if pool:
+        print("Pool: " + ", ".join(f"{llave} {valor}" for llave, valor in pool.items()))
+
+
+def iniciar_redis_local(app):
+    """Arrancar un redis-server temporal en un puerto libre y conectar a él la app, entrega el proceso"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        puerto = sock.getsockname()[1]
+    try:
+        proceso = subprocess.Popen(["redis-server", "--port", str(puerto), "--save", "", "--appendonly", "no"], stdout=subprocess.DEVNULL)
+    except FileNotFoundError:
+        print("! No se encontró redis-server, instálelo o quite --redis-local")
+        sys.exit(1)
+    app.config["REDIS_URL"] = f"redis://127.0.0.1:{puerto}"
+    app.redis = Redis.from_url(app.config["REDIS_URL"])
+    app.task_queue = rq.Queue(app.config["TASK_QUEUE"], connection=app.redis, default_timeout=1920)
+    for _ in range(50):
+        try:
+            app.redis.ping()
+            return proceso
+        except RedisError:
+            time.sleep(0.1)
+    proceso.terminate()
+    print("! No respondió el redis-server temporal")
+    sys.exit(1)
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description="Prueba de carga de los escritorios de las oficinas")
+    parser.add_argument("--escritorios", type=int, default=ESCRITORIOS, help="Personas atendiendo al mismo tiempo")
+    parser.add_argument("--sesiones", type=int, default=SESIONES, help="Sesiones de cada escritorio")
+    parser.add_argument("--sondeos", type=int, default=SONDEOS, help="Consultas a datatable_json por sesión")
+    parser.add_argument("--pausa", type=float, default=PAUSA, help="Segundos promedio entre pasos, 0 para no pausar")
+    parser.add_argument("--rampa", type=float, default=RAMPA, help="Segundos en los que van llegando los escritorios")
+    parser.add_argument("--semilla", type=int, default=2022)
+    parser.add_argument("--servidor", action="store_true", help="Por HTTP a un servidor WSGI en lugar del cliente de pruebas")
+    parser.add_argument("--redis-local", action="store_true", help="Arrancar un redis-server temporal")
+    parser.add_argument("--guardar", default="", help="Archivo JSON donde escribir los resultados")
+    argumentos = parser.parse_args()
+
+    # Inicializar, el ingreso es con contraseña y sin CSRF
+    load_dotenv()  # Take environment variables from .env
+    os.environ["FIREBASE_APIKEY"] = ""
+    app = create_app()
+    app.config["WTF_CSRF_ENABLED"] = False
+    db.app = app
+    if not app.config["CONTAR_CONSULTAS_SQL"]:
+        contar_consultas_sql(app)
+    redis_local = iniciar_redis_local(app) if argumentos.redis_local else None
+
+    # Preparar los escritorios
+    with app.app_context():
+        escritorios = preparar_escritorios(argumentos.escritorios, argumentos.sesiones)
+        clientes = db.session.query(func.min(CitCliente.id), func.max(CitCliente.id)).one()
+    if clientes[0] is None:
+        print("! No hay clientes, primero ejecute tests/generar_datos.py")
+        sys.exit(1)
+
+    # Servidor WSGI con hilos en este proceso
+    servidor = None
+    if argumentos.servidor:
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+        servidor = make_server("127.0.0.1", 0, app, threaded=True)
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+        url_base = f"http://127.0.0.1:{servidor.server_port}"
+        print(f"Servidor en {url_base}")
+
+    # Un hilo por escritorio, van llegando durante la rampa
+    modo = "servidor" if argumentos.servidor else "cliente de pruebas"
+    print(f"{argumentos.escritorios} escritorios con {argumentos.sesiones} sesiones cada uno, {modo}")
+    registro = Registro()
+    hilos = []
+    for numero, datos in enumerate(escritorios):
+        cliente = ClienteHttp(url_base) if servidor else ClienteFlask(app)
+        retraso = argumentos.rampa * numero / len(escritorios)
+        hilo = threading.Thread(target=escritorio, args=(cliente, registro, datos, clientes, argumentos, retraso, argumentos.semilla + numero))
+        hilos.append(hilo)
+    inicio = time.perf_counter()
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    segundos = time.perf_counter() - inicio
+
+    # Terminar
+    if servidor:
+        servidor.shutdown()
+    with app.app_context():
+        pool = metricas_pool(db.engine)
+    if redis_local:
+        redis_local.terminate()
+
+    # Informar y guardar
+    rutas, totales = resumir(registro, segundos, argumentos.escritorios * argumentos.sesiones)
+    mostrar(rutas, totales, pool)
+    if argumentos.guardar:
+        with open(argumentos.guardar, "w", encoding="utf8") as archivo:
+            resultados = {
+                "fecha": datetime.now().isoformat(timespec="seconds"),
+                "modo": modo,
+                "parametros": vars(argumentos),
+                "totales": totales,
+                "pool": pool,
+                "rutas": rutas,
+            }
+            json.dump(resultados, archivo, indent=2, ensure_ascii=False)
+        print(f"Resultados en {argumentos.guardar}")
+
+
+if __name__ == "__main__":
+    main()
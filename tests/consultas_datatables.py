@@ -0,0 +1,136 @@
+"""
+Consultas SQL de los listados DataTables
+
+Llama a cada datatable_json pidiendo 1 renglon y luego LONGITUD renglones,
+si la cantidad de sentencias SQL crece con los renglones hay un problema N+1.
+Termina con codigo de salida 1 si encuentra alguno, si alguna ruta pasa de su presupuesto
+de sentencias SQL (X-Consultas-SQL), si no tiene acceso a alguna ruta o si alguna entrega
+menos de 2 renglones, porque con uno solo no se nota el N+1.
+Tambien pide la segunda pagina con el cursor de la primera y con offset, deben ser iguales
+en renglones y total, sin filtros y con los de COMPARAR_FILTROS.
+
+Necesita Redis, sin él la identidad del usuario se elabora en cada petición y las sentencias
+SQL no corresponden a las de producción, por eso termina de inmediato si no lo alcanza.
+
+No pide nada, por defecto usa el usuario de los datos sintéticos; así lo ejecuta CI
+con una base de datos SQLite cargada con tests.generar_datos
+
+    python -m tests.generar_datos --reiniciar --clientes 2000 --bitacoras 2000 --encuestas 500 --pagos 500 --minimo 30
+    python -m tests.consultas_datatables
+    python -m tests.consultas_datatables usuario@correo.com
+"""
+import argparse
+import json
+import sys
+
+from dotenv import load_dotenv
+from redis.exceptions import RedisError
+
+from lib.consultas_sql import ENCABEZADO, contar_consultas_sql
+
+from citas_admin.app import create_app
+from citas_admin.extensions import db
+
+from citas_admin.blueprints.usuarios.models import Usuario
+
+from tests.generar_datos import EMAIL_USUARIO
+
+LONGITUD = 25
+PRESUPUESTO = 1  # Sentencias SQL por petición de cualquier listado
+PRESUPUESTOS = {}  # Ruta → sentencias SQL por petición, para los listados que necesiten más
+COMPARAR_FILTROS = {"/cit_clientes/datatable_json": {"nombre_completo": "MARIA"}}  # Ruta → filtros para comparar también
+
+
+def contar(cliente, ruta, longitud):
+    """Entregar la cantidad de sentencias SQL y de renglones de una peticion"""
+    respuesta = cliente.post(ruta, data={"draw": 1, "start": 0, "length": longitud})
+    if respuesta.status_code != 200:
+        return None, None
+    return int(respuesta.headers[ENCABEZADO]), len(respuesta.json["aaData"])
+
+
+def comparar_paginas(cliente, ruta, filtros):
+    """¿Es la segunda pagina con el cursor de la primera igual a la misma pagina con offset?"""
+    datos = {"draw": 1, "start": 0, "length": LONGITUD, **filtros}
+    primera = cliente.post(ruta, data=datos).json
+    if not primera.get("cursor"):
+        return True  # Cabe en una pagina
+    con_cursor = cliente.post(ruta, data={**datos, "start": LONGITUD, "cursor": json.dumps(primera["cursor"])}).json
+    con_offset = cliente.post(ruta, data={**datos, "start": LONGITUD}).json
+    return con_cursor["aaData"] == con_offset["aaData"] and con_cursor["iTotalRecords"] == con_offset["iTotalRecords"]
+
+
+def main():
+    """Main function"""
+
+    # Argumentos
+    parser = argparse.ArgumentParser(description="Consultas SQL de los listados DataTables")
+    parser.add_argument("email", nargs="?", default=EMAIL_USUARIO, help="Usuario con el que se hacen las peticiones")
+    args = parser.parse_args()
+
+    # Inicializar
+    load_dotenv()  # Take environment variables from .env
+    app = create_app()
+    app.config["WTF_CSRF_ENABLED"] = False
+    db.app = app
+    if not app.config["CONTAR_CONSULTAS_SQL"]:
+        contar_consultas_sql(app)
+    try:
+        app.redis.ping()
+    except RedisError as error:
+        print(f"! No se alcanza Redis en {app.config['REDIS_URL']}: {error}")
+        sys.exit(1)
+
+    # Usuario con el que se hacen las peticiones
+    with app.app_context():
+        usuario = Usuario.find_by_identity(args.email)
+        if usuario is None:
+            print(f"! No existe el usuario {args.email}")
+            sys.exit(1)
+        usuario_id = usuario.id
+
+    # Iniciar sesion
+    cliente = app.test_client()
+    with cliente.session_transaction() as sesion:
+        sesion["_user_id"] = str(usuario_id)
+        sesion["_fresh"] = True
+
+    # Bucle por las rutas datatable_json
+    rutas = sorted(regla.rule for regla in app.url_map.iter_rules() if regla.endpoint.endswith(".datatable_json") and not regla.arguments)
+    problemas = 0
+    print(f"{'Ruta':<48} | {'SQL 1':>5} | {'SQL N':>5} | {'N':>3} | {'Max':>3}")
+    print(f"{'':-^78}")
+    contar(cliente, rutas[0], 1)  # La primera petición elabora la identidad en la sesión, no se cuenta
+    for ruta in rutas:
+        consultas_uno, _ = contar(cliente, ruta, 1)
+        consultas_varios, renglones = contar(cliente, ruta, LONGITUD)
+        if consultas_uno is None or consultas_varios is None:
+            print(f"{ruta:<48} | sin acceso")
+            problemas += 1
+            continue
+        presupuesto = PRESUPUESTOS.get(ruta, PRESUPUESTO)
+        marca = ""
+        if renglones < 2:
+            marca = " <- Menos de 2 renglones"
+            problemas += 1
+        elif consultas_varios > consultas_uno:
+            marca = " <- N+1"
+            problemas += 1
+        elif max(consultas_uno, consultas_varios) > presupuesto:
+            marca = " <- Excede"
+            problemas += 1
+        elif not all(comparar_paginas(cliente, ruta, filtros) for filtros in [{}, COMPARAR_FILTROS.get(ruta)] if filtros is not None):
+            marca = " <- Cursor distinto a offset"
+            problemas += 1
+        print(f"{ruta:<48} | {consultas_uno:>5} | {consultas_varios:>5} | {renglones:>3} | {presupuesto:>3}{marca}")
+    print(f"{'':-^78}")
+
+    # Terminar con error si hay problemas
+    if problemas > 0:
+        print(f"! {problemas} listados sin acceso, con menos de 2 renglones, con consultas por cada renglon, que exceden su presupuesto o con cursor distinto a offset")
+        sys.exit(1)
+    print("Ningún listado hace consultas por cada renglón ni excede su presupuesto, los cursores coinciden con offset")
+
+
+if __name__ == "__main__":
+    main()
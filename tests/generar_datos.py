@@ -0,0 +1,483 @@
+"""
+Generar datos sintéticos a escala de producción
+
+Carga en la base de datos de SQLALCHEMY_DATABASE_URI (PostgreSQL local o SQLite) con una semilla fija,
+así dos ejecuciones con los mismos argumentos producen los mismos datos:
+
+- Catálogos: materia, distritos con su autoridad, oficinas con domicilio, categorías, servicios
+  y los servicios de cada oficina
+- Módulos, el rol ADMINISTRADOR con todos los permisos y un usuario para los benchmarks
+- Clientes, citas (pasadas con su estado y futuras PENDIENTES), bitácoras, encuestas y pagos
+- Al final completa con --minimo renglones cada tabla con listado que haya quedado con menos,
+  así tests.consultas_datatables prueba todos los listados con más de una página
+
+Los registros masivos se insertan por lotes con INSERT de SQLAlchemy Core, sin crear objetos del ORM.
+En PostgreSQL se crean las particiones mensuales de bitacoras y al final se ajustan las secuencias.
+
+Uso, con la base de datos vacía o con --reiniciar para borrar y crear las tablas:
+
+    python -m tests.generar_datos --reiniciar
+    python -m tests.generar_datos --reiniciar --clientes 10000 --bitacoras 5000 --encuestas 2000 --pagos 1000
+"""
+import argparse
+from datetime import date, datetime, time, timedelta
+import os
+import random
+import re
+import sys
+import time as reloj
+
+from dotenv import load_dotenv
+from sqlalchemy import func, select, text
+
+from lib import particiones
+from lib.busqueda import concatenar
+
+from citas_admin.app import BLUEPRINTS, BLUEPRINTS_DIR, create_worker_app
+from citas_admin.extensions import db
+
+from citas_admin.blueprints.autoridades.models import Autoridad
+from citas_admin.blueprints.bitacoras.models import Bitacora
+from citas_admin.blueprints.boletines.models import Boletin
+from citas_admin.blueprints.cit_categorias.models import CitCategoria
+from citas_admin.blueprints.cit_citas.models import CitCita
+from citas_admin.blueprints.cit_citas_documentos.models import CitCitaDocumento
+from citas_admin.blueprints.cit_clientes.models import CitCliente
+from citas_admin.blueprints.cit_clientes_recuperaciones.models import CitClienteRecuperacion
+from citas_admin.blueprints.cit_clientes_registros.models import CitClienteRegistro
+from citas_admin.blueprints.cit_dias_inhabiles.models import CitDiaInhabil
+from citas_admin.blueprints.cit_horas_bloqueadas.models import CitHoraBloqueada
+from citas_admin.blueprints.cit_oficinas_servicios.models import CitOficinaServicio
+from citas_admin.blueprints.cit_servicios.models import CitServicio
+from citas_admin.blueprints.distritos.models import Distrito
+from citas_admin.blueprints.domicilios.models import Domicilio
+from citas_admin.blueprints.enc_servicios.models import EncServicio
+from citas_admin.blueprints.enc_sistemas.models import EncSistema
+from citas_admin.blueprints.entradas_salidas.models import EntradaSalida
+from citas_admin.blueprints.materias.models import Materia
+from citas_admin.blueprints.modulos.models import Modulo
+from citas_admin.blueprints.municipios.models import Municipio
+from citas_admin.blueprints.oficinas.models import Oficina
+from citas_admin.blueprints.pag_pagos.models import PagPago
+from citas_admin.blueprints.pag_tramites_servicios.models import PagTramiteServicio
+from citas_admin.blueprints.permisos.models import Permiso
+from citas_admin.blueprints.ppa_solicitudes.models import PpaSolicitud
+from citas_admin.blueprints.roles.models import Rol
+from citas_admin.blueprints.tareas.models import Tarea
+from citas_admin.blueprints.tdt_partidos.models import TdtPartido
+from citas_admin.blueprints.tdt_solicitudes.models import TdtSolicitud
+from citas_admin.blueprints.usuarios.models import Usuario
+from citas_admin.blueprints.usuarios_oficinas.models import UsuarioOficina
+from citas_admin.blueprints.usuarios_roles.models import UsuarioRol
+
+LOTE = 10000
+EMAIL_USUARIO = "benchmark@pjecz.gob.mx"
+MODULO_PATRON = re.compile(r'^MODULO = "([A-Z ]+)"', re.MULTILINE)
+
+NOMBRES = ["JUAN", "MARIA", "JOSE", "GUADALUPE", "FRANCISCO", "ROSA", "ANTONIO", "ANA", "JESUS", "LAURA", "MIGUEL", "PATRICIA", "PEDRO", "SOFIA", "LUIS", "VERONICA"]
+APELLIDOS = ["HERNANDEZ", "GARCIA", "MARTINEZ", "LOPEZ", "GONZALEZ", "RODRIGUEZ", "PEREZ", "SANCHEZ", "RAMIREZ", "CRUZ", "FLORES", "GOMEZ", "MORALES", "VAZQUEZ", "REYES", "JIMENEZ"]
+CATEGORIAS = ["COMUN", "EXPEDIENTES", "ORIENTACION"]
+HORAS = [time(hora, minuto) for hora in range(8, 15) for minuto in (0, 15, 30, 45)]
+
+# Estados de las citas pasadas y su peso, las futuras siempre están PENDIENTES
+ESTADOS_PASADAS = {"ASISTIO": 60, "INASISTENCIA": 20, "CANCELO": 12, "PENDIENTE": 8}
+ESTADOS_ENCUESTAS = {"CONTESTADO": 40, "PENDIENTE": 45, "CANCELADO": 15}
+ESTADOS_PAGOS = {"PAGADO": 55, "SOLICITADO": 20, "CANCELADO": 10, "FALLIDO": 5, "ENTREGADO": 10}
+
+
+def elegir(azar, pesos: dict):
+    """Elegir una llave de un diccionario de pesos"""
+    return azar.choices(list(pesos), weights=list(pesos.values()))[0]
+
+
+def insertar(modelo, renglones):
+    """Insertar los renglones (un generador de diccionarios) por lotes, entrega la cantidad"""
+    tabla = modelo.__table__
+    cantidad = 0
+    lote = []
+    for renglon in renglones:
+        lote.append(renglon)
+        if len(lote) >= LOTE:
+            db.session.execute(tabla.insert(), lote)
+            db.session.commit()
+            cantidad += len(lote)
+            lote = []
+    if lote:
+        db.session.execute(tabla.insert(), lote)
+        db.session.commit()
+        cantidad += len(lote)
+    return cantidad
+
+
+def siguiente_id(modelo):
+    """Primer ID libre de la tabla, los renglones masivos llevan su ID para relacionarse sin consultar"""
+    return (db.session.execute(select(func.max(modelo.id))).scalar() or 0) + 1
+
+
+def nombres_modulos():
+    """Los nombres de los módulos, tomados de la constante MODULO de las vistas de cada blueprint"""
+    nombres = set()
+    for nombre in BLUEPRINTS:
+        with open(os.path.join(BLUEPRINTS_DIR, nombre, "views.py"), encoding="utf8") as archivo:
+            nombres.update(MODULO_PATRON.findall(archivo.read()))
+    return sorted(nombres)
+
+
+def generar_catalogos(azar, distritos: int, oficinas_por_distrito: int, servicios: int):
+    """Catálogos, módulos, permisos y el usuario de los benchmarks; entrega las oficinas con sus servicios y el usuario"""
+    materia = Materia(nombre="CIVIL")
+    db.session.add(materia)
+    categorias = [CitCategoria(nombre=nombre) for nombre in CATEGORIAS]
+    db.session.add_all(categorias)
+    db.session.flush()
+    cit_servicios = []
+    for numero in range(1, servicios + 1):
+        cit_servicio = CitServicio(
+            cit_categoria=categorias[numero % len(categorias)],
+            clave=f"SRV{numero:03d}",
+            descripcion=f"SERVICIO {numero}",
+            duracion=time(0, azar.choice((15, 30, 45))),
+            documentos_limite=azar.randint(0, 5),
+            dias_habilitados="01234",
+        )
+        cit_servicios.append(cit_servicio)
+    db.session.add_all(cit_servicios)
+    oficinas = []
+    autoridad = None
+    for numero_distrito in range(1, distritos + 1):
+        distrito = Distrito(clave=f"DJ{numero_distrito:02d}", nombre=f"DISTRITO JUDICIAL {numero_distrito}", nombre_corto=f"DISTRITO {numero_distrito}", es_distrito_judicial=True)
+        db.session.add(distrito)
+        autoridad = Autoridad(distrito=distrito, materia=materia, clave=f"AUT{numero_distrito:02d}", descripcion=f"AUTORIDAD {numero_distrito}", organo_jurisdiccional="NO DEFINIDO")
+        db.session.add(autoridad)
+        for numero_oficina in range(1, oficinas_por_distrito + 1):
+            clave = f"OF{numero_distrito:02d}{numero_oficina:02d}"
+            domicilio = Domicilio(estado="COAHUILA", municipio=f"MUNICIPIO {numero_distrito}", calle=f"CALLE {numero_oficina}", cp=25000 + numero_distrito)
+            oficina = Oficina(
+                distrito=distrito,
+                domicilio=domicilio,
+                clave=clave,
+                descripcion=f"OFICINA {clave}",
+                descripcion_corta=clave,
+                puede_agendar_citas=True,
+                apertura=time(8, 0),
+                cierre=time(15, 0),
+                limite_personas=azar.randint(2, 6),
+            )
+            db.session.add(oficina)
+            ofrecidos = azar.sample(cit_servicios, k=max(1, len(cit_servicios) // 2))
+            db.session.add_all(CitOficinaServicio(oficina=oficina, cit_servicio=cit_servicio, descripcion=f"{clave} {cit_servicio.clave}") for cit_servicio in ofrecidos)
+            oficinas.append((oficina, ofrecidos))
+    db.session.add(PagTramiteServicio(clave="PAG001", descripcion="COPIAS CERTIFICADAS", costo=100, url=""))
+
+    # Módulos, el rol con todos los permisos y el usuario de los benchmarks
+    rol = Rol(nombre="ADMINISTRADOR")
+    db.session.add(rol)
+    for nombre in nombres_modulos():
+        modulo = Modulo(nombre=nombre, nombre_corto=nombre.title(), icono="mdi:folder", ruta="/" + nombre.lower().replace(" ", "_"), en_navegacion=False)
+        db.session.add(modulo)
+        db.session.add(Permiso(rol=rol, modulo=modulo, nombre=f"{rol.nombre} {nombre}", nivel=Permiso.ADMINISTRAR))
+    usuario = Usuario(
+        autoridad=autoridad,
+        oficina=oficinas[0][0],
+        email=EMAIL_USUARIO,
+        nombres="BENCHMARK",
+        apellido_paterno="USUARIO",
+        api_key="",
+        api_key_expiracion=datetime(2000, 1, 1),
+        contrasena="",
+    )
+    db.session.add(usuario)
+    db.session.add(UsuarioRol(rol=rol, usuario=usuario, descripcion=f"{EMAIL_USUARIO} {rol.nombre}"))
+    db.session.add(UsuarioOficina(oficina=oficinas[0][0], usuario=usuario, descripcion=f"{EMAIL_USUARIO} {oficinas[0][0].clave}"))
+    db.session.commit()
+    return [(oficina.id, [cit_servicio.id for cit_servicio in ofrecidos]) for oficina, ofrecidos in oficinas], usuario
+
+
+def generar_clientes(azar, primer_id: int, cantidad: int, hoy: date, dias: int):
+    """Clientes con CURP y email únicos"""
+    for numero in range(cantidad):
+        cliente_id = primer_id + numero
+        nombres, apellido_primero, apellido_segundo = azar.choice(NOMBRES), azar.choice(APELLIDOS), azar.choice(APELLIDOS + [""])
+        curp = f"{apellido_primero[:2]}{nombres[0]}{cliente_id:010d}XXX"[:18]
+        email = f"cliente{cliente_id}@ejemplo.com"
+        yield {
+            "id": cliente_id,
+            "nombres": nombres,
+            "apellido_primero": apellido_primero,
+            "apellido_segundo": apellido_segundo,
+            "curp": curp,
+            "telefono": f"844{azar.randint(1000000, 9999999)}",
+            "email": email,
+            "contrasena_md5": "",
+            "contrasena_sha256": "x" * 64,
+            "renovacion": hoy + timedelta(days=azar.randint(0, 365)),
+            "limite_citas_pendientes": 3,
+            "busqueda": concatenar(nombres, apellido_primero, apellido_segundo, curp, email),
+            "autoriza_mensajes": azar.random() < 0.9,
+            "enviar_boletin": azar.random() < 0.3,
+            "es_adulto_mayor": azar.random() < 0.1,
+            "es_mujer": azar.random() < 0.5,
+            "creado": datetime.combine(hoy - timedelta(days=azar.randint(0, dias)), time(azar.randint(0, 23), azar.randint(0, 59))),
+        }
+
+
+def generar_citas(azar, clientes: range, citas_por_cliente: int, oficinas: list, hoy: date, dias: int):
+    """Citas de cada cliente, de dias atrás a 30 días adelante"""
+    for cliente_id in clientes:
+        for _ in range(azar.randint(0, 2 * citas_por_cliente)):
+            oficina_id, servicios_ids = azar.choice(oficinas)
+            fecha = hoy + timedelta(days=azar.randint(-dias, 30))
+            if fecha.weekday() > 4:
+                fecha -= timedelta(days=fecha.weekday() - 4)  # Recorrer el fin de semana al viernes
+            inicio = datetime.combine(fecha, azar.choice(HORAS))
+            estado = elegir(azar, ESTADOS_PASADAS) if inicio < datetime.now() else "PENDIENTE"
+            yield {
+                "cit_cliente_id": cliente_id,
+                "cit_servicio_id": azar.choice(servicios_ids),
+                "oficina_id": oficina_id,
+                "inicio": inicio,
+                "termino": inicio + timedelta(minutes=15),
+                "notas": "",
+                "estado": estado,
+                "asistencia": estado == "ASISTIO",
+                "codigo_asistencia": f"{azar.randint(0, 9999):04d}",
+                "cancelar_antes": inicio - timedelta(days=1),
+                "creado": inicio - timedelta(days=azar.randint(1, 20), minutes=azar.randint(0, 600)),
+            }
+
+
+def generar_bitacoras(azar, cantidad: int, modulos_ids: list, usuario_id: int, hoy: date, dias: int):
+    """Bitácoras repartidas en los últimos días"""
+    for numero in range(cantidad):
+        yield {
+            "modulo_id": azar.choice(modulos_ids),
+            "usuario_id": usuario_id,
+            "descripcion": f"Evento sintético {numero}",
+            "url": f"/cit_citas/{azar.randint(1, 1000000)}",
+            "creado": datetime.combine(hoy - timedelta(days=azar.randint(0, dias)), time(azar.randint(7, 19), azar.randint(0, 59))),
+        }
+
+
+def generar_encuestas(azar, cantidad: int, clientes: range, oficinas: list, con_oficina: bool):
+    """Encuestas de servicio (con oficina) o de sistema"""
+    for _ in range(cantidad):
+        estado = elegir(azar, ESTADOS_ENCUESTAS)
+        contestada = estado == "CONTESTADO"
+        renglon = {
+            "cit_cliente_id": azar.choice(clientes),
+            "respuesta_01": azar.randint(1, 5) if contestada else None,
+            "estado": estado,
+        }
+        if con_oficina:
+            renglon.update({"oficina_id": azar.choice(oficinas)[0], "respuesta_02": azar.randint(1, 5) if contestada else None, "respuesta_03": azar.randint(1, 5) if contestada else None})
+        yield renglon
+
+
+def generar_pagos(azar, cantidad: int, clientes: range, distritos: dict, pag_tramite_servicio_id: int, hoy: date, dias: int):
+    """Pagos de trámites en los últimos días"""
+    for _ in range(cantidad):
+        distrito_id, autoridad_id = azar.choice(list(distritos.items()))
+        creado = datetime.combine(hoy - timedelta(days=azar.randint(0, dias)), time(azar.randint(7, 19), azar.randint(0, 59)))
+        yield {
+            "autoridad_id": autoridad_id,
+            "distrito_id": distrito_id,
+            "cit_cliente_id": azar.choice(clientes),
+            "pag_tramite_servicio_id": pag_tramite_servicio_id,
+            "caducidad": creado.date() + timedelta(days=30),
+            "cantidad": 1,
+            "estado": elegir(azar, ESTADOS_PAGOS),
+            "total": 100,
+            "creado": creado,
+        }
+
+
+def completar_listados(azar, minimo: int, usuario, clientes: range, hoy: date):
+    """Completar con minimo renglones activos las tablas con listado que quedaron con menos, entrega la cantidad agregada"""
+    agregados = 0
+
+    def completar(modelo, crear):
+        """Agregar los renglones que le faltan al modelo, crear recibe el número y entrega el objeto"""
+        nonlocal agregados
+        existentes = modelo.query.filter_by(estatus="A").count()
+        for numero in range(existentes + 1, minimo + 1):
+            db.session.add(crear(numero))
+            agregados += 1
+        db.session.commit()
+
+    completar(Materia, lambda numero: Materia(nombre=f"MATERIA {numero}"))
+    completar(CitCategoria, lambda numero: CitCategoria(nombre=f"CATEGORIA {numero}"))
+    completar(Rol, lambda numero: Rol(nombre=f"ROL {numero}"))
+    completar(PagTramiteServicio, lambda numero: PagTramiteServicio(clave=f"PAG{numero:03d}", descripcion=f"TRAMITE {numero}", costo=100, url=""))
+    completar(Distrito, lambda numero: Distrito(clave=f"DX{numero:02d}", nombre=f"DISTRITO {numero}", nombre_corto=f"DISTRITO {numero}", es_distrito_judicial=False))
+    completar(Domicilio, lambda numero: Domicilio(estado="COAHUILA", municipio=f"MUNICIPIO {numero}", calle=f"CALLE {numero}", cp=26000 + numero))
+    distritos, materias, domicilios = Distrito.query.all(), Materia.query.all(), Domicilio.query.all()
+    completar(
+        Autoridad,
+        lambda numero: Autoridad(
+            distrito=azar.choice(distritos),
+            materia=azar.choice(materias),
+            clave=f"AUX{numero:02d}",
+            descripcion=f"AUTORIDAD {numero}",
+            organo_jurisdiccional="NO DEFINIDO",
+        ),
+    )
+    completar(
+        Oficina,
+        lambda numero: Oficina(
+            distrito=azar.choice(distritos),
+            domicilio=azar.choice(domicilios),
+            clave=f"OX{numero:03d}",
+            descripcion=f"OFICINA SIN CITAS {numero}",
+            descripcion_corta=f"OX{numero:03d}",
+            apertura=time(8, 0),
+            cierre=time(15, 0),
+            limite_personas=1,
+        ),
+    )
+    autoridades, oficinas, roles = Autoridad.query.all(), Oficina.query.all(), Rol.query.all()
+    completar(
+        Usuario,
+        lambda numero: Usuario(
+            autoridad=azar.choice(autoridades),
+            oficina=azar.choice(oficinas),
+            email=f"listado{numero:03d}@pjecz.gob.mx",
+            nombres=f"LISTADO {numero}",
+            apellido_paterno="USUARIO",
+            api_key="",
+            api_key_expiracion=datetime(2000, 1, 1),
+            contrasena="",
+        ),
+    )
+    usuarios = Usuario.query.filter(Usuario.id != usuario.id).all()
+    completar(UsuarioRol, lambda numero: UsuarioRol(rol=azar.choice(roles), usuario=usuarios[numero % len(usuarios)], descripcion=f"USUARIO ROL {numero}"))
+    completar(UsuarioOficina, lambda numero: UsuarioOficina(oficina=azar.choice(oficinas), usuario=usuarios[numero % len(usuarios)], descripcion=f"USUARIO OFICINA {numero}"))
+    completar(EntradaSalida, lambda numero: EntradaSalida(usuario=usuario, tipo=azar.choice(list(EntradaSalida.TIPOS)), direccion_ip=f"10.0.0.{numero}"))
+    completar(Tarea, lambda numero: Tarea(id=f"{azar.getrandbits(128):032x}", usuario=usuario, nombre="tests.generar_datos", descripcion=f"Tarea sintética {numero}", ha_terminado=True))
+    completar(Boletin, lambda numero: Boletin(envio_programado=datetime.combine(hoy + timedelta(days=numero), time(9, 0)), estado="BORRADOR", asunto=f"BOLETIN {numero}"))
+    completar(CitDiaInhabil, lambda numero: CitDiaInhabil(fecha=hoy + timedelta(days=numero), descripcion=f"DIA INHABIL {numero}"))
+    completar(
+        CitHoraBloqueada,
+        lambda numero: CitHoraBloqueada(oficina=azar.choice(oficinas), fecha=hoy + timedelta(days=numero), inicio=time(14, 0), termino=time(15, 0), descripcion=f"HORA BLOQUEADA {numero}"),
+    )
+    completar(Municipio, lambda numero: Municipio(nombre=f"MUNICIPIO {numero}"))
+    completar(TdtPartido, lambda numero: TdtPartido(nombre=f"PARTIDO {numero}", siglas=f"P{numero:03d}"))
+    if not clientes:
+        return agregados
+    citas_ids = [cit_cita_id for (cit_cita_id,) in db.session.query(CitCita.id).limit(minimo)]
+    completar(CitCitaDocumento, lambda numero: CitCitaDocumento(cit_cita_id=azar.choice(citas_ids), descripcion=f"DOCUMENTO {numero}"))
+    completar(
+        CitClienteRecuperacion,
+        lambda numero: CitClienteRecuperacion(cit_cliente_id=azar.choice(clientes), expiracion=datetime.combine(hoy + timedelta(days=1), time(0, 0)), cadena_validar=f"{azar.getrandbits(128):032x}"),
+    )
+    completar(
+        CitClienteRegistro,
+        lambda numero: CitClienteRegistro(
+            nombres=azar.choice(NOMBRES),
+            apellido_primero=azar.choice(APELLIDOS),
+            curp=f"XXXX{numero:014d}",
+            email=f"registro{numero}@ejemplo.com",
+            expiracion=datetime.combine(hoy + timedelta(days=1), time(0, 0)),
+            cadena_validar=f"{azar.getrandbits(128):032x}",
+        ),
+    )
+    completar(PpaSolicitud, lambda numero: PpaSolicitud(autoridad=azar.choice(autoridades), cit_cliente_id=azar.choice(clientes), caducidad=hoy + timedelta(days=30)))
+    municipios, partidos = Municipio.query.all(), TdtPartido.query.all()
+    completar(
+        TdtSolicitud,
+        lambda numero: TdtSolicitud(
+            cit_cliente_id=azar.choice(clientes),
+            municipio=azar.choice(municipios),
+            tdt_partido=azar.choice(partidos),
+            cargo=azar.choice(list(TdtSolicitud.CARGOS)),
+            principio=azar.choice(list(TdtSolicitud.PRINCIPIOS)),
+            caducidad=hoy + timedelta(days=30),
+        ),
+    )
+    return agregados
+
+
+def ajustar_secuencias(modelos):
+    """En PostgreSQL poner cada secuencia en el ID máximo, porque los renglones se insertaron con su ID"""
+    if not particiones.es_postgresql():
+        return
+    for modelo in modelos:
+        tabla = modelo.__tablename__
+        db.session.execute(text(f"SELECT setval(pg_get_serial_sequence('{tabla}', 'id'), COALESCE((SELECT MAX(id) FROM {tabla}), 1))"))
+    db.session.commit()
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description="Generar datos sintéticos a escala de producción")
+    parser.add_argument("--semilla", type=int, default=2022)
+    parser.add_argument("--distritos", type=int, default=14)
+    parser.add_argument("--oficinas-por-distrito", type=int, default=6)
+    parser.add_argument("--servicios", type=int, default=30)
+    parser.add_argument("--clientes", type=int, default=1000000)
+    parser.add_argument("--citas-por-cliente", type=int, default=4, help="Promedio, cada cliente tiene de 0 al doble")
+    parser.add_argument("--bitacoras", type=int, default=2000000)
+    parser.add_argument("--encuestas", type=int, default=300000, help="De servicio y otras tantas de sistema")
+    parser.add_argument("--pagos", type=int, default=200000)
+    parser.add_argument("--dias", type=int, default=365, help="Días hacia atrás de los datos")
+    parser.add_argument("--minimo", type=int, default=30, help="Renglones que al menos tiene cada tabla con listado")
+    parser.add_argument("--reiniciar", action="store_true", help="Borrar y crear las tablas antes de cargar")
+    argumentos = parser.parse_args()
+
+    # Inicializar
+    load_dotenv()  # Take environment variables from .env
+    os.environ.setdefault("DB_PERFIL", "batch")
+    if os.environ.get("DEPLOYMENT_ENVIRONMENT", "develop").upper() == "PRODUCTION":
+        print("PROHIBIDO: No se generan datos en el servidor de producción.")
+        sys.exit(1)
+    app = create_worker_app()
+    app.app_context().push()
+    db.app = app
+    azar = random.Random(argumentos.semilla)
+    hoy = date.today()
+
+    # Preparar las tablas
+    if argumentos.reiniciar:
+        db.drop_all()
+        if particiones.es_postgresql():
+            db.session.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            db.session.commit()
+        db.create_all()
+        if particiones.es_postgresql():
+            for tabla in particiones.tablas_particionadas():
+                particiones.convertir(tabla)
+    if Usuario.query.filter_by(email=EMAIL_USUARIO).first() is not None:
+        print("! Ya hay datos generados, use --reiniciar o una base de datos vacía")
+        sys.exit(1)
+    if particiones.es_postgresql():
+        particiones.crear_particiones(Bitacora.__tablename__, desde=hoy - timedelta(days=argumentos.dias))
+
+    # Bucle por cada paso
+    print(f"Base de datos: {db.engine.url.render_as_string(hide_password=True)}")
+    oficinas, usuario = generar_catalogos(azar, argumentos.distritos, argumentos.oficinas_por_distrito, argumentos.servicios)
+    distritos = {autoridad.distrito_id: autoridad.id for autoridad in Autoridad.query.all()}
+    modulos_ids = [modulo.id for modulo in Modulo.query.all()]
+    primer_cliente = siguiente_id(CitCliente)
+    clientes = range(primer_cliente, primer_cliente + argumentos.clientes)
+    pasos = [("bitacoras", lambda: insertar(Bitacora, generar_bitacoras(azar, argumentos.bitacoras, modulos_ids, usuario.id, hoy, argumentos.dias)))]
+    if clientes:
+        pasos += [
+            ("cit_clientes", lambda: insertar(CitCliente, generar_clientes(azar, primer_cliente, argumentos.clientes, hoy, argumentos.dias))),
+            ("cit_citas", lambda: insertar(CitCita, generar_citas(azar, clientes, argumentos.citas_por_cliente, oficinas, hoy, argumentos.dias))),
+            ("enc_servicios", lambda: insertar(EncServicio, generar_encuestas(azar, argumentos.encuestas, clientes, oficinas, True))),
+            ("enc_sistemas", lambda: insertar(EncSistema, generar_encuestas(azar, argumentos.encuestas, clientes, oficinas, False))),
+            ("pag_pagos", lambda: insertar(PagPago, generar_pagos(azar, argumentos.pagos, clientes, distritos, PagTramiteServicio.query.first().id, hoy, argumentos.dias))),
+        ]
+    pasos.append(("listados", lambda: completar_listados(azar, argumentos.minimo, usuario, clientes, hoy)))
+    for nombre, paso in pasos:
+        inicio = reloj.perf_counter()
+        cantidad = paso()
+        segundos = reloj.perf_counter() - inicio
+        print(f"  {nombre:<16} {cantidad:>10} renglones en {segundos:8.1f} s ({cantidad / max(segundos, 0.001):,.0f} por segundo)")
+    ajustar_secuencias([CitCliente])
+
+    # Mensaje final
+    print(f"Listo, el usuario para los benchmarks es {EMAIL_USUARIO}")
+
+
+if __name__ == "__main__":
+    main()
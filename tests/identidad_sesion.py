@@ -0,0 +1,83 @@
+"""
+Consultas SQL por petición con y sin la identidad en la sesión
+
+Llama REPETICIONES veces a cit_citas.datatable_json con IDENTIDAD_EN_SESION apagado y luego encendido,
+e informa el promedio de sentencias SQL y de milisegundos por petición.
+La primera petición con la identidad encendida elabora la instantánea, las demás ya no consultan al usuario.
+
+    python -m tests.identidad_sesion usuario@correo.com [repeticiones]
+"""
+import sys
+import time
+
+from dotenv import load_dotenv
+
+from lib.consultas_sql import ENCABEZADO, contar_consultas_sql
+
+from citas_admin.app import create_app
+from citas_admin.extensions import db
+
+from citas_admin.blueprints.usuarios.models import Usuario
+
+RUTA = "/cit_citas/datatable_json"
+LONGITUD = 10
+REPETICIONES = 50
+
+
+def medir(cliente, repeticiones):
+    """Entregar el promedio de sentencias SQL y de milisegundos por petición"""
+    consultas = 0
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        respuesta = cliente.post(RUTA, data={"draw": 1, "start": 0, "length": LONGITUD})
+        if respuesta.status_code != 200:
+            print(f"! La petición a {RUTA} respondió {respuesta.status_code}")
+            sys.exit(1)
+        consultas += int(respuesta.headers[ENCABEZADO])
+    return consultas / repeticiones, (time.perf_counter() - inicio) * 1000 / repeticiones
+
+
+def main():
+    """Main function"""
+
+    # Inicializar
+    load_dotenv()  # Take environment variables from .env
+    app = create_app()
+    app.config["WTF_CSRF_ENABLED"] = False
+    db.app = app
+    if not app.config["CONTAR_CONSULTAS_SQL"]:
+        contar_consultas_sql(app)
+    repeticiones = int(sys.argv[2]) if len(sys.argv) > 2 else REPETICIONES
+
+    # Usuario con el que se hacen las peticiones
+    email = sys.argv[1] if len(sys.argv) > 1 else input("Correo electrónico del usuario: ")
+    with app.app_context():
+        usuario = Usuario.find_by_identity(email)
+        if usuario is None:
+            print(f"! No existe el usuario {email}")
+            sys.exit(1)
+        usuario_id = usuario.id
+
+    # Iniciar sesion
+    cliente = app.test_client()
+    with cliente.session_transaction() as sesion:
+        sesion["_user_id"] = str(usuario_id)
+        sesion["_fresh"] = True
+
+    # Medir sin y con la identidad en la sesión
+    print(f"{RUTA} con {LONGITUD} renglones, {repeticiones} repeticiones")
+    print(f"{'Identidad en la sesion':<24} | {'SQL/peticion':>12} | {'ms/peticion':>11}")
+    print(f"{'':-^54}")
+    resultados = {}
+    for identidad_en_sesion in (False, True):
+        app.config["IDENTIDAD_EN_SESION"] = identidad_en_sesion
+        medir(cliente, 1)  # Calentar cachés y elaborar la instantánea
+        resultados[identidad_en_sesion] = medir(cliente, repeticiones)
+        consultas, milisegundos = resultados[identidad_en_sesion]
+        print(f"{'Si' if identidad_en_sesion else 'No':<24} | {consultas:>12.1f} | {milisegundos:>11.1f}")
+    print(f"{'':-^54}")
+    print(f"Ahorro: {resultados[False][0] - resultados[True][0]:.1f} sentencias SQL por petición")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Rendimiento de las plantillas de los mensajes
+
+Por cada plantilla email*.jinja2 mide:
+
+- Compilar: crear el Environment y compilar la plantilla, como se hacía antes por cada mensaje
+- Bytecode: crear el Environment y cargar la plantilla desde PLANTILLAS_CACHE, como un worker de RQ recién creado
+- Render: elaborar el mensaje con la plantilla del registro lib.plantillas
+
+Uso: python tests/plantillas_rendimiento.py [repeticiones]
+"""
+import sys
+import time
+
+from dotenv import load_dotenv
+from jinja2 import Environment, FileSystemLoader, meta
+
+from lib import plantillas
+
+REPETICIONES = 200
+
+
+class Ficticio:
+    """Valor de relleno para cualquier variable de la plantilla: atributos, llamadas y ciclos"""
+
+    def __getattr__(self, nombre):
+        return self
+
+    def __call__(self, *args, **kwargs):
+        return self
+
+    def __iter__(self):
+        return iter([])
+
+    def __str__(self):
+        return "Ficticio"
+
+
+def medir(funcion, repeticiones):
+    """Entrega las veces por segundo que se ejecuta la función"""
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        funcion()
+    return repeticiones / (time.perf_counter() - inicio)
+
+
+def main():
+    """Main function"""
+
+    # Inicializar
+    load_dotenv()  # Take environment variables from .env
+    repeticiones = int(sys.argv[1]) if len(sys.argv) > 1 else REPETICIONES
+
+    print("=====================================================")
+    print("=== RENDIMIENTO DE LAS PLANTILLAS DE LOS MENSAJES ===")
+    print("=====================================================")
+    print(f"Bytecode en {plantillas.PLANTILLAS_CACHE}")
+    print(f"Repeticiones: {repeticiones}")
+    print("")
+
+    # Compilar todas las plantillas, esto llena el bytecode en disco
+    cargadas = plantillas.precargar()
+
+    print("- Blueprint     | Plantilla                  | Compilar/s | Bytecode/s |   Render/s -")
+    print("----------------------------------------------------------------------------------")
+    for blueprint, nombre in cargadas:
+        entorno = plantillas.obtener_entorno(blueprint)
+        fuente = entorno.loader.get_source(entorno, nombre)[0]
+        contexto = {variable: Ficticio() for variable in meta.find_undeclared_variables(entorno.parse(fuente))}
+
+        # Como antes: un Environment nuevo y compilar por cada mensaje
+        def compilar():
+            Environment(loader=FileSystemLoader(entorno.loader.searchpath), trim_blocks=True, lstrip_blocks=True).get_template(nombre).render(**contexto)
+
+        # Worker recién creado: Environment nuevo, pero con el bytecode en disco
+        def bytecode():
+            plantillas.limpiar()
+            plantillas.obtener_plantilla(blueprint, nombre).render(**contexto)
+
+        # Con el registro ya cargado
+        plantilla = plantillas.obtener_plantilla(blueprint, nombre)
+
+        def render():
+            plantilla.render(**contexto)
+
+        por_compilar = medir(compilar, repeticiones)
+        por_bytecode = medir(bytecode, repeticiones)
+        por_render = medir(render, repeticiones)
+        print(f"  {blueprint:<13} | {nombre:<26} | {por_compilar:>10.0f} | {por_bytecode:>10.0f} | {por_render:>10.0f}")
+    print("----------------------------------------------------------------------------------")
+
+
+if __name__ == "__main__":
+    main()
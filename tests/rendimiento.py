@@ -0,0 +1,259 @@
+"""
+Micro-benchmarks de los caminos críticos
+
+Sobre una base de datos con datos de tests/generar_datos.py mide cada camino crítico:
+
+- horarios_json de una oficina y servicio
+- Cada datatable_json pidiendo 25 renglones
+- La actualización de cit_citas_stats (incremental y reconstruyendo)
+- refresh_report de cit_clientes
+- marcar_inasistencia en modo de pruebas
+- Elaborar 200 mensajes de inasistencia con la plantilla compilada
+
+Por cada uno informa mínimo, mediana, promedio y percentil 95 en milisegundos. Con --guardar escribe los resultados
+en JSON junto con el commit, y con --comparar revisa contra un JSON anterior y termina con error si alguna mediana
+creció más de --tolerancia por ciento.
+
+Los archivos se guardan con STORAGE_BACKEND=local, así refresh_report no sube nada a Google Storage.
+
+Uso:
+
+    python -m tests.rendimiento --guardar rendimiento-antes.json
+    python -m tests.rendimiento --comparar rendimiento-antes.json --tolerancia 20
+"""
+import argparse
+from datetime import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from dotenv import load_dotenv
+from sqlalchemy import func, select
+from sqlalchemy.orm import joinedload
+
+os.environ.setdefault("STORAGE_BACKEND", "local")
+os.environ.setdefault("STORAGE_DIRECTORIO", os.path.join(tempfile.gettempdir(), "citas_admin_rendimiento"))
+
+from lib.plantillas import obtener_plantilla
+
+from citas_admin.app import create_app
+from citas_admin.extensions import db
+
+from citas_admin.blueprints.cit_citas.models import CitCita
+from citas_admin.blueprints.cit_oficinas_servicios.models import CitOficinaServicio
+from citas_admin.blueprints.usuarios.models import Usuario
+
+from tests.generar_datos import EMAIL_USUARIO
+
+REPETICIONES = 10
+CALENTAMIENTO = 1
+LONGITUD = 25
+MENSAJES = 200
+TABLAS = ("cit_clientes", "cit_citas", "bitacoras", "enc_servicios", "enc_sistemas", "pag_pagos")
+
+_benchmarks = {}
+
+
+class BenchmarkError(Exception):
+    """El camino medido no respondió como se esperaba"""
+
+
+def benchmark(nombre: str):
+    """Registrar una función que recibe el contexto y entrega lo que se va a medir"""
+
+    def registrar(preparar):
+        _benchmarks[nombre] = preparar
+        return preparar
+
+    return registrar
+
+
+def revisar(respuesta):
+    """Causar BenchmarkError si la petición no fue exitosa, por ejemplo por falta de permiso"""
+    if respuesta.status_code != 200:
+        raise BenchmarkError(f"respondió {respuesta.status_code}")
+    return respuesta
+
+
+@benchmark("horarios_json")
+def horarios_json(contexto):
+    """Horarios disponibles de una oficina y servicio"""
+    ruta = f"/cit_citas/horarios/{contexto['oficina_id']}/{contexto['cit_servicio_id']}"
+    return lambda: revisar(contexto["cliente"].get(ruta))
+
+
+@benchmark("cit_citas_stats.actualizar")
+def cit_citas_stats_actualizar(contexto):
+    """Actualizar cit_citas_diarias con lo que cambió"""
+    from citas_admin.blueprints.cit_citas_stats.tasks import actualizar
+
+    return actualizar
+
+
+@benchmark("cit_citas_stats.actualizar(reconstruir)")
+def cit_citas_stats_reconstruir(contexto):
+    """Reconstruir cit_citas_diarias completa"""
+    from citas_admin.blueprints.cit_citas_stats.tasks import actualizar
+
+    return lambda: actualizar(reconstruir=True)
+
+
+@benchmark("cit_clientes.refresh_report")
+def cit_clientes_refresh_report(contexto):
+    """Elaborar el reporte de avisos de los clientes"""
+    from citas_admin.blueprints.cit_clientes.tasks import refresh_report
+
+    return refresh_report
+
+
+@benchmark("cit_citas.marcar_inasistencia(test)")
+def cit_citas_marcar_inasistencia(contexto):
+    """Contar las citas que se marcarían como INASISTENCIA, sin cambiarlas para poder repetir"""
+    from citas_admin.blueprints.cit_citas.tasks import marcar_inasistencia
+
+    return lambda: marcar_inasistencia(test=True)
+
+
+@benchmark(f"plantillas.email_no_assistance x{MENSAJES}")
+def plantillas_email_no_assistance(contexto):
+    """Consultar las citas con sus clientes y elaborar los mensajes, como enviar_inasistencias"""
+    plantilla = obtener_plantilla("cit_citas", "email_no_assistance.jinja2")
+
+    def elaborar():
+        citas = CitCita.query.options(joinedload(CitCita.cit_cliente)).filter(CitCita.estado == "INASISTENCIA").order_by(CitCita.id).limit(MENSAJES).all()
+        fecha_elaboracion = datetime.now().strftime("%d/%b/%Y %I:%M %p")
+        return [plantilla.render(fecha_elaboracion=fecha_elaboracion, cit_cliente=cit_cita.cit_cliente, cit_cita=cit_cita) for cit_cita in citas]
+
+    return elaborar
+
+
+def registrar_datatables(app):
+    """Un benchmark por cada ruta datatable_json"""
+    for ruta in sorted(regla.rule for regla in app.url_map.iter_rules() if regla.endpoint.endswith(".datatable_json") and not regla.arguments):
+        _benchmarks[f"datatable_json {ruta}"] = lambda contexto, ruta=ruta: lambda: revisar(contexto["cliente"].post(ruta, data={"draw": 1, "start": 0, "length": LONGITUD}))
+
+
+def medir(funcion, repeticiones: int, calentamiento: int):
+    """Ejecutar la función y entregar sus tiempos en milisegundos"""
+    for _ in range(calentamiento):
+        funcion()
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    tiempos.sort()
+    return {
+        "minimo": round(tiempos[0], 3),
+        "mediana": round(statistics.median(tiempos), 3),
+        "promedio": round(statistics.mean(tiempos), 3),
+        "p95": round(tiempos[min(len(tiempos) - 1, int(len(tiempos) * 0.95))], 3),
+        "repeticiones": repeticiones,
+    }
+
+
+def obtener_commit():
+    """Commit actual, vacío si no está en un repositorio git"""
+    resultado = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=False)
+    return resultado.stdout.strip()
+
+
+def comparar(anterior: dict, actual: dict, tolerancia: float):
+    """Mostrar la diferencia de las medianas, entrega los nombres que crecieron más de la tolerancia"""
+    print("")
+    print(f"Comparado con {anterior.get('commit', '?')} del {anterior.get('fecha', '?')}")
+    regresiones = []
+    for nombre, resultado in actual["resultados"].items():
+        previo = anterior["resultados"].get(nombre)
+        if previo is None or previo["mediana"] == 0:
+            continue
+        cambio = (resultado["mediana"] - previo["mediana"]) * 100 / previo["mediana"]
+        marca = ""
+        if cambio > tolerancia:
+            marca = " <- regresión"
+            regresiones.append(nombre)
+        print(f"{nombre:<60} | {previo['mediana']:>10.1f} | {resultado['mediana']:>10.1f} | {cambio:>+7.1f} %{marca}")
+    return regresiones
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description="Micro-benchmarks de los caminos críticos")
+    parser.add_argument("--repeticiones", type=int, default=REPETICIONES)
+    parser.add_argument("--calentamiento", type=int, default=CALENTAMIENTO)
+    parser.add_argument("--filtro", default="", help="Solo los benchmarks que contienen este texto")
+    parser.add_argument("--guardar", default="", help="Archivo JSON donde escribir los resultados")
+    parser.add_argument("--comparar", default="", help="Archivo JSON con resultados anteriores")
+    parser.add_argument("--tolerancia", type=float, default=20, help="Por ciento que puede crecer una mediana")
+    argumentos = parser.parse_args()
+
+    # Inicializar
+    load_dotenv()  # Take environment variables from .env
+    app = create_app()
+    app.config["WTF_CSRF_ENABLED"] = False
+    db.app = app
+    registrar_datatables(app)
+
+    # Contexto: el usuario de los benchmarks, una oficina con un servicio y los conteos de las tablas
+    with app.app_context():
+        usuario = Usuario.find_by_identity(EMAIL_USUARIO)
+        if usuario is None:
+            print(f"! No existe el usuario {EMAIL_USUARIO}, primero ejecute tests/generar_datos.py")
+            sys.exit(1)
+        cit_oficina_servicio = CitOficinaServicio.query.filter_by(estatus="A").order_by(CitOficinaServicio.id).first()
+        contexto = {"oficina_id": cit_oficina_servicio.oficina_id, "cit_servicio_id": cit_oficina_servicio.cit_servicio_id}
+        conteos = {tabla: db.session.execute(select(func.count()).select_from(db.metadata.tables[tabla])).scalar() for tabla in TABLAS}
+        dialecto = db.engine.dialect.name
+        usuario_id = usuario.id
+    cliente = app.test_client()
+    with cliente.session_transaction() as sesion:
+        sesion["_user_id"] = str(usuario_id)
+        sesion["_fresh"] = True
+    contexto["cliente"] = cliente
+
+    # Bucle por los benchmarks
+    print(f"Base de datos {dialecto}: " + ", ".join(f"{tabla} {cantidad:,}" for tabla, cantidad in conteos.items()))
+    print(f"{'Benchmark':<60} | {'Mínimo':>10} | {'Mediana':>10} | {'P95':>10}")
+    print(f"{'':-^98}")
+    resultados = {}
+    for nombre, preparar in _benchmarks.items():
+        if argumentos.filtro not in nombre:
+            continue
+        funcion = preparar(contexto)  # Fuera del contexto de la app, los módulos de las tareas empujan el suyo al importarse
+        try:
+            with app.app_context():
+                resultado = medir(funcion, argumentos.repeticiones, argumentos.calentamiento)
+        except BenchmarkError as error:
+            print(f"{nombre:<60} | {error}")
+            continue
+        resultados[nombre] = resultado
+        print(f"{nombre:<60} | {resultado['minimo']:>10.1f} | {resultado['mediana']:>10.1f} | {resultado['p95']:>10.1f}")
+    actual = {
+        "commit": obtener_commit(),
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "base_datos": dialecto,
+        "conteos": conteos,
+        "resultados": resultados,
+    }
+
+    # Guardar y comparar
+    if argumentos.guardar:
+        with open(argumentos.guardar, "w", encoding="utf8") as archivo:
+            json.dump(actual, archivo, indent=2, ensure_ascii=False)
+        print(f"Resultados en {argumentos.guardar}")
+    if argumentos.comparar:
+        with open(argumentos.comparar, encoding="utf8") as archivo:
+            regresiones = comparar(json.load(archivo), actual, argumentos.tolerancia)
+        if regresiones:
+            print(f"! {len(regresiones)} benchmarks crecieron más del {argumentos.tolerancia:.0f} %")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
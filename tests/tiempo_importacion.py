@@ -0,0 +1,71 @@
+"""
+Tiempo de arranque de la app web y de la app para tareas y línea de comandos
+
+Ejecuta cada escenario en un proceso nuevo con python -X importtime, como un arranque en frío
+de App Engine o de un worker de RQ, y por cada uno informa:
+
+- La mediana en milisegundos del tiempo acumulado de las importaciones de primer nivel
+- Los módulos de primer nivel que más tardan
+
+Con --maximo-web y --maximo-worker termina con error si la mediana pasa del límite, así lo revisa CI.
+
+Uso: python tests/tiempo_importacion.py [--repeticiones 5] [--maximo-web 0] [--maximo-worker 0]
+"""
+import argparse
+import re
+import statistics
+import subprocess
+import sys
+
+ESCENARIOS = {
+    "web": "from citas_admin.app import create_app; create_app()",
+    "worker": "from citas_admin.app import create_worker_app; create_worker_app()",
+}
+LINEA = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+MAS_LENTOS = 8
+REPETICIONES = 5
+
+
+def medir(codigo: str):
+    """Ejecutar el código en un proceso nuevo, entrega {módulo de primer nivel: microsegundos acumulados}"""
+    resultado = subprocess.run([sys.executable, "-X", "importtime", "-c", codigo], capture_output=True, text=True, check=False)
+    if resultado.returncode != 0:
+        print(resultado.stderr[-2000:])
+        sys.exit(1)
+    modulos = {}
+    for renglon in resultado.stderr.splitlines():
+        coincidencia = LINEA.match(renglon)
+        if coincidencia is not None and coincidencia.group(3) == " ":
+            modulos[coincidencia.group(4)] = int(coincidencia.group(2))
+    return modulos
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description="Tiempo de importación de la app web y del worker")
+    parser.add_argument("--repeticiones", type=int, default=REPETICIONES)
+    parser.add_argument("--maximo-web", type=float, default=0, help="Milisegundos, 0 para no revisar")
+    parser.add_argument("--maximo-worker", type=float, default=0, help="Milisegundos, 0 para no revisar")
+    argumentos = parser.parse_args()
+    maximos = {"web": argumentos.maximo_web, "worker": argumentos.maximo_worker}
+
+    excedidos = []
+    for escenario, codigo in ESCENARIOS.items():
+        mediciones = [medir(codigo) for _ in range(argumentos.repeticiones)]
+        totales = [sum(modulos.values()) / 1000 for modulos in mediciones]
+        mediana = statistics.median(totales)
+        print(f"{escenario}: {mediana:.0f} ms (mínimo {min(totales):.0f}, máximo {max(totales):.0f})")
+        ultima = mediciones[-1]
+        for modulo in sorted(ultima, key=ultima.get, reverse=True)[:MAS_LENTOS]:
+            print(f"    {ultima[modulo] / 1000:8.1f} ms  {modulo}")
+        if maximos[escenario] and mediana > maximos[escenario]:
+            excedidos.append(f"{escenario} tarda {mediana:.0f} ms, el máximo es {maximos[escenario]:.0f} ms")
+
+    if excedidos:
+        for excedido in excedidos:
+            print(f"! {excedido}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()